@@ -173,7 +173,7 @@ sys.path.append(USHhafs)
 ########################################################################
 # Load and set up the produtil package.
 import hafs.launcher, hafs.prelaunch
-import tcutil.revital, tcutil.numerics, tcutil.rocoto
+import tcutil.revital, tcutil.numerics, tcutil.rocoto, tcutil.vitalsindex
 from tcutil.numerics import to_datetime, to_timedelta
 from tcutil.rocoto import entity_quote
 
@@ -440,16 +440,6 @@ if loghere:
 ########################################################################
 # Parse the tcvitals
 
-def check_test_vitals(vl):
-    """!This is a replacement for tcutil.storminfo.name_number_okay for
-    use with TEST storms and internal stormids.  It allows through
-    only the storm numbers matching stormnum, regardless of the
-    storm name (usually TEST and UNKNOWN would be dropped)."""
-    logger.info('Keeping only storm number %s in vitals'%(stid,))
-    for vital in vl:
-        if vital.stormid3.upper()==stid.upper():
-            yield vital
-
 if parse_tcvitals:
     logger.info('Getting list of tcvitals files.')
     syndatdir=conf.getdir('syndat')
@@ -459,28 +449,22 @@ if parse_tcvitals:
         when=to_datetime(cycle)
         vitfile=os.path.join(syndatdir,when.strftime(vitpattern))
         fileset.add(vitfile)
-    revit=tcutil.revital.Revital(logger=logger)
-    logger.info('List of files to scan: '+(','.join(fileset)))
-    revit.readfiles(fileset,raise_all=False)
     if renumber:
         logger.info('Renumber invest cycles.')
-        if weak_invest is not None:
-            revit.renumber(threshold=int(weak_invest))
-        else:
-            revit.renumber()
+        mode='renumber:%d'%(int(weak_invest) if weak_invest is not None else 0)
     elif stid[0]=='8':
         logger.info('Fake stormid requested.  Running limited clean-up.')
-        revit.clean_up_vitals(name_number_checker=check_test_vitals)
+        mode='test:%s'%(stid,)
     else:
         logger.info('Not renumbering invest cycles.  Will just clean.')
-        revit.clean_up_vitals()
-
+        mode='clean'
+    # The index is reused by later invocations until a file changes.
+    index=tcutil.vitalsindex.VitalsIndex(
+        conf.getstr('dir','vitals_index','') or None,logger=logger)
+    stids=mslist if mslist else [stid]
     tcvset = set()
-    if mslist:
-        for ms_id in mslist:
-            tcvset.update([ vit.when.strftime('%Y%m%d%H') for vit in revit.each(ms_id) ])
-    else:
-        tcvset.update([ vit.when.strftime('%Y%m%d%H') for vit in revit.each(stid) ])
+    for tcvlist in index.cycles(fileset,mode,stids).values():
+        tcvset.update(tcvlist)
     notok = cycleset - tcvset
     okset = cycleset - notok
     if not multistorm or mslist:
@@ -26,6 +26,21 @@
 # * archive=hpsz:/path/to/archive.tar.gz --- a two-step process.  The
 #   first step uses tar -czf to create an on-disk archive in a staging
 #   area.  The second step copies that archive to tape using "hsi put"
+#
+# The [archive] section controls how the archive is written, by
+# hafs.archive.Archiver:
+#
+# * members=N --- split the COM files into N size-balanced member tar
+#   files, named like archive.p001.tar.gz (default: 1, one archive)
+# * threads=N --- write up to N members at once (default: members)
+# * compressor=pigz --- compress with this program (tar -I) instead of
+#   tar -z; pigz compresses with several threads (default: tar -z)
+# * verify=yes --- on a rerun, check the checksums of members already
+#   in the manifest before skipping them (default: yes)
+#
+# Members that were written by an earlier run, with unchanged files,
+# are skipped.  This is recorded in a manifest next to the archive
+# (or in WORKhafs for htar archives).
 
 import sys, os, glob
 
@@ -40,11 +55,32 @@ else:
     sys.path.append(guess_USHhafs)
 
 import produtil.setup, produtil.log, produtil.run, produtil.cd
-import hafs.launcher
+import hafs.launcher, hafs.archive
 from produtil.log import postmsg, jlogger
 from produtil.run import batchexe, checkrun, run
 from produtil.cd import NamedDir
 
+def archiver(conf,path,manifest,logger,**kwargs):
+    """!Makes a hafs.archive.Archiver using the [archive] section options.
+    @param conf the hafs.config.HAFSConfig
+    @param path the archive path
+    @param manifest the manifest file
+    @param logger the logging.Logger for messages
+    @param kwargs the tar or htar program"""
+    members=1
+    threads=None
+    compressor=None
+    verify=True
+    if conf.has_section('archive'):
+        members=conf.getint('archive','members',1)
+        threads=conf.getstr('archive','threads','').strip()
+        threads=int(threads) if threads else None
+        compressor=conf.getstr('archive','compressor','') or None
+        verify=conf.getbool('archive','verify',True)
+    return hafs.archive.Archiver(path,manifest,compressor=compressor,
+        members=members,threads=threads,verify=verify,logger=logger,
+        **kwargs)
+
 def main_disk():
     """!Main program for disk archiving.
 
@@ -70,9 +106,7 @@ def main_disk():
                 'disabled.')
         return
     with NamedDir(conf.getdir('com')):
-        flist=[ filename+'\n' for filename in glob.glob('*') ]
-        flist.sort()
-        files=''.join(flist)
+        files=sorted(glob.glob('*'))
         assert(len(files)>0)
         if archive.lower()=='none':
             postmsg('Archiving is disabled: archive=none')
@@ -83,10 +117,6 @@ def main_disk():
                 adir=os.path.dirname(path)
                 if not os.path.exists(adir):
                     produtil.fileop.makedirs(adir,logger=logger)
-            flags='-cvp'
-            if path[-3:]=='.gz' or path[-4:]=='.tgz':
-                flags+='z'
-            cmd=batchexe(conf.getexe('tar'))[flags+'f',path,'-T','-'] << files
         elif archive[0:5]=='hpss:':
             logger.info('HPSS archiving enabled.')
             logger.info('Nothing to do in the disk archiving step.')
@@ -96,15 +126,12 @@ def main_disk():
             return
         elif archive[0:5]=='hpsz:':
             path=conf.strinterp('config','{WORKhafs}/stage-archive.tar.gz')
-            flags='-cvp'
-            if path[-3:]=='.gz' or path[-4:]=='.tgz':
-                flags+='z'
-            cmd=batchexe(conf.getexe('tar'))[flags+'f',path,'-T','-'] << files
         else:
             jlogger.error('Ignoring invalid archive method %s in %s'
                           %(archive[0:4],archive))
             return
-        checkrun(cmd,logger=logger)
+        archiver(conf,path,path+'.manifest',logger,
+                 tar=conf.getexe('tar')).archive(files)
         donefile=path+'.done'
         with open(donefile,'wt') as f:
             f.write('hafs_archive disk step completed\n')
@@ -136,9 +163,7 @@ def main_tape():
                 'disabled.')
         return
     with NamedDir(conf.getdir('com')):
-        flist=[ filename+'\n' for filename in glob.glob('*') ]
-        flist.sort()
-        files=''.join(flist)
+        files=sorted(glob.glob('*'))
         assert(len(files)>0)
 
         if archive.lower()=='none':
@@ -164,15 +189,22 @@ def main_tape():
 
         if archive[0:5]=='hpss:':
             path=archive[5:]
-            flags='-cvp'
-            cmd=batchexe(conf.getexe('htar'))[flags+'f',path,'-L','-'] << files
+            manifest=conf.strinterp('config','{WORKhafs}/htar-archive.manifest')
+            archiver(conf,path,manifest,logger,
+                     htar=conf.getexe('htar')).archive(files)
         elif archive[0:5]=='hpsz:':
-
+            # Copy each member written by the disk step to tape.
             topath=archive[5:]
             frompath=conf.strinterp('config',
                                     '{WORKhafs}/stage-archive.tar.gz')
-            cmd=batchexe(conf.getexe('hsi'))['put',frompath,':',topath]
-        checkrun(cmd,logger=logger)
+            staged=hafs.archive.ArchiveManifest(frompath+'.manifest',logger)
+            if not staged.members:
+                staged.members={ '': { 'path':frompath } }
+            for tag in sorted(staged.members):
+                cmd=batchexe(conf.getexe('hsi'))[
+                    'put',staged.members[tag]['path'],':',
+                    hafs.archive.member_path(topath,tag)]
+                checkrun(cmd,logger=logger)
     postmsg('hafs_archive tape step completed')
 
 if __name__=='__main__':
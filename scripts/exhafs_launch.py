@@ -114,6 +114,47 @@ section.option=value -- override conf options on the command line
 Aborting due to incorrect arguments.''')
     sys.exit(2)
 
+def finish_storm(conf):
+    """!Writes the holdvars, start file and storm_info file of one
+    launched storm, and sends the NCO alerts for them.  This may run in
+    a worker process of hafs.launcher.launch_storms.
+    @param conf the storm's hafs.launcher.HAFSLauncher"""
+    logger=logging.getLogger('exhafs_launch')
+    if os.environ.get('RUN_ENVIR','DEV').upper()=='NCO':
+        message=conf.strinterp('wcoss_fcst_nco','{messages}/message{storm_num}')
+        alert_type=conf.strinterp('config','{RUN}_MESSAGE').upper()
+        if os.path.exists(message):
+            alert=produtil.dbnalert.DBNAlert(['MODEL',alert_type,'{job}',message])
+            alert()
+
+    holdvars=conf.strinterp('dir','{com}/{stormlabel}.holdvars.txt')
+    logger.info(holdvars+': write holdvars here')
+    with open(holdvars,'wt') as f:
+        f.write(conf.make_holdvars())
+
+    holdvars2=conf.strinterp('dir','{com}/{out_prefix}.{RUN}.holdvars.txt')
+    logger.info(holdvars2+': copy holdvars here as well')
+    deliver_file(holdvars, holdvars2, keep=True, logger=logger)
+
+    if conf.has_option('config','startfile'):
+        startfile=conf.getstr('config','startfile')
+        logger.info(startfile+': Write holdvars and conf location here.')
+        startcontents=conf.strinterp('config',startdata,holdvars=holdvars)
+        with open(startfile,'wt') as f:
+            f.write(startcontents)
+
+    # Generate storm_info file
+    fstorm_info=conf.strinterp('dir','{com}/{out_prefix}.{RUN}.storm_info')
+    storm_info=conf.strinterp('config','{vit[stormname]}{vit[stormid3]}').lower()
+    logger.info(fstorm_info+': write storm_info here')
+    with open(fstorm_info,'wt') as f:
+        f.write(storm_info)
+    if os.environ.get('RUN_ENVIR','DEV').upper()=='NCO':
+        alert_type=conf.strinterp('config','{RUN}_ASCII').upper()
+        if os.path.exists(fstorm_info):
+            alert=produtil.dbnalert.DBNAlert(['MODEL',alert_type,'{job}',fstorm_info])
+            alert()
+
 def main():
     """!Processes configuration information and passes on to the
     hafs.launcher module to create the initial directory structure and
@@ -210,52 +251,25 @@ def main():
     # Note: First pass in loop, global_storm_num
     # will be 1 if this is a region hafs run or 2
     # if this is multistorm hafs run.
-    for i,stid in enumerate(stids):
-        global_storm_num += 1
-        if stid != fake_stid:
-            conf=hafs.launcher.launch(infiles,cycle,stid,moreopts[i],case_root,
-                                      prelaunch=hafs.launcher.prelaunch,
-                                      fakestorm_conf=fakestorm_conf,
-                                      storm_num=global_storm_num)
-        else:
-            conf=fakestorm_conf
-
+    if go_since_multistorm_sids:
+        # The real storms are launched concurrently.  Their storm
+        # numbers are decided here, in order, before any is launched.
+        real=[ (stid,moreopts[i],global_storm_num+1+i)
+               for (i,stid) in enumerate(stids) if stid != fake_stid ]
+        hafs.launcher.launch_storms(
+            infiles,cycle,[ r[0] for r in real ],[ r[1] for r in real ],
+            case_root,fakestorm_conf,[ r[2] for r in real ],
+            prelaunch=hafs.launcher.prelaunch,finish=finish_storm,
+            logger=logger)
+        conf=fakestorm_conf
         conf.sanity_check()
-
-        if os.environ.get('RUN_ENVIR','DEV').upper()=='NCO':
-            message=conf.strinterp('wcoss_fcst_nco','{messages}/message{storm_num}')
-            alert_type=conf.strinterp('config','{RUN}_MESSAGE').upper()
-            if os.path.exists(message):
-                alert=produtil.dbnalert.DBNAlert(['MODEL',alert_type,'{job}',message])
-                alert()
-
-        holdvars=conf.strinterp('dir','{com}/{stormlabel}.holdvars.txt')
-        logger.info(holdvars+': write holdvars here')
-        with open(holdvars,'wt') as f:
-            f.write(conf.make_holdvars())
-
-        holdvars2=conf.strinterp('dir','{com}/{out_prefix}.{RUN}.holdvars.txt')
-        logger.info(holdvars2+': copy holdvars here as well')
-        deliver_file(holdvars, holdvars2, keep=True, logger=logger)
-
-        if conf.has_option('config','startfile'):
-            startfile=conf.getstr('config','startfile')
-            logger.info(startfile+': Write holdvars and conf location here.')
-            startcontents=conf.strinterp('config',startdata,holdvars=holdvars)
-            with open(startfile,'wt') as f:
-                f.write(startcontents)
-
-        # Generate storm_info file
-        fstorm_info=conf.strinterp('dir','{com}/{out_prefix}.{RUN}.storm_info')
-        storm_info=conf.strinterp('config','{vit[stormname]}{vit[stormid3]}').lower()
-        logger.info(fstorm_info+': write storm_info here')
-        with open(fstorm_info,'wt') as f:
-            f.write(storm_info)
-        if os.environ.get('RUN_ENVIR','DEV').upper()=='NCO':
-            alert_type=conf.strinterp('config','{RUN}_ASCII').upper()
-            if os.path.exists(fstorm_info):
-                alert=produtil.dbnalert.DBNAlert(['MODEL',alert_type,'{job}',fstorm_info])
-                alert()
+        finish_storm(conf)
+    else:
+        conf=hafs.launcher.launch(infiles,cycle,stids[0],moreopts[0],case_root,
+                                  prelaunch=hafs.launcher.prelaunch,
+                                  storm_num=global_storm_num+1)
+        conf.sanity_check()
+        finish_storm(conf)
 
     Gsi=conf.getbool('config','run_gsi')
     if Gsi: set_ecflow_event('Analysis',logger)
@@ -246,7 +246,9 @@ mkdir -p dropsonde
 cd dropsonde
 # Deal with tempdrop drifting
 analdate="${yr}-${mn}-${dy}_${cyc}:00:00"
-${USHhafs}/hafs_format_sonde.py -d ${TANK:?}/ldmdata/obs/upperair/sonde -c ${analdate}
+# Optional: a sonde file index (JSON) reused by later cycles
+${USHhafs}/hafs_format_sonde.py -d ${TANK:?}/ldmdata/obs/upperair/sonde -c ${analdate} \
+  ${SONDE_INDEX:+-i ${SONDE_INDEX}}
 status=$?
 if [[ $status -ne 0 ]]; then
   echo "WARNING: ${USHhafs}/hafs_format_sonde.py with exit code of $status. Continue ..."
@@ -14,6 +14,8 @@
 #   and storm information.
 # * hafs.input --- obtains input data from disk, FTP, SSH or tape to meet
 #   the input data requirements given by each tasks' inputiter() iterator.
+# * hafs.prefetch --- plans the inputs of all tasks of a cycle and fetches
+#   them in the order the tasks need them.
 # * hafs.vortexinit --- relocates, resizes and modifies the intensity of
 #   the tropical cyclone vortex.
 # * hafs.bufrprep --- converts data dumps to bufr files for input to GSI
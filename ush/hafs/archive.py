@@ -0,0 +1,267 @@
+#! /usr/bin/env python3
+
+"""!Archives COM directory outputs as one or more member tar files.
+
+The Archiver splits a list of files into size-balanced members and
+writes them concurrently, either to disk with tar (optionally through
+a multi-threaded compressor such as pigz) or to tape with htar.  Each
+finished member is recorded in an ArchiveManifest: a JSON file with
+the size, modification time and name of every archived file, and the
+size and SHA-256 checksum of the member tar file.  When the archive
+job is rerun, members that are already in the manifest, with the same
+files and an intact tar file, are skipped.
+
+With one member (the default) the archive has the same name as it
+always had.  With more, the member number is inserted before the
+extension:
+@code{.unparsed}
+  /path/to/archive.tar.gz   ==>   /path/to/archive.p001.tar.gz
+                                  /path/to/archive.p002.tar.gz ...
+@endcode"""
+
+##@var __all__
+# Symbols exported by "from hafs.archive import *"
+__all__=['plan_members','member_path','ArchiveManifest','Archiver']
+
+import os, json, hashlib, threading, tempfile, time, logging
+import concurrent.futures
+from produtil.run import batchexe, checkrun
+
+##@var extensions
+# Archive file extensions, longest first, that member tags are
+# inserted before.
+extensions=[ '.tar.gz', '.tar', '.tgz' ]
+
+def member_path(path,tag):
+    """!Returns the path to an archive member.
+    @param path the archive path, such as /path/to/archive.tar.gz
+    @param tag the member tag, such as ".p001", or "" for the archive itself
+    @returns the path with the tag inserted before the extension"""
+    for ext in extensions:
+        if path.endswith(ext):
+            return path[:-len(ext)]+tag+ext
+    return path+tag
+
+def file_state(filename):
+    """!Returns [filename,size,mtime] for a file.  This is what the
+    manifest stores to decide if a file changed since it was archived.
+    @param filename the file, relative to the archived directory"""
+    s=os.stat(filename)
+    return [ filename, int(s.st_size), int(s.st_mtime) ]
+
+def plan_members(files,nmembers):
+    """!Splits files into at most nmembers groups of nearly equal
+    total size.  The largest files are placed first, each in the
+    group with the smallest total so far.  The result only depends on
+    the file names and sizes, so a rerun gets the same groups.
+    @param files a list of file names
+    @param nmembers the number of groups
+    @returns a list of sorted lists of file names; empty groups are
+      omitted"""
+    nmembers=max(1,int(nmembers))
+    sized=sorted([ (os.path.getsize(f),f) for f in files ],
+                 key=lambda sf: (-sf[0],sf[1]))
+    totals=[0]*nmembers
+    groups=[ list() for i in range(nmembers) ]
+    for (size,filename) in sized:
+        i=totals.index(min(totals))
+        totals[i]+=size
+        groups[i].append(filename)
+    return [ sorted(group) for group in groups if group ]
+
+def sha256_file(filename,blocksize=4194304):
+    """!Returns the SHA-256 checksum of a file as a hex string.
+    @param filename the file to read
+    @param blocksize read this many bytes at a time"""
+    h=hashlib.sha256()
+    with open(filename,'rb') as f:
+        while True:
+            block=f.read(blocksize)
+            if not block: break
+            h.update(block)
+    return h.hexdigest()
+
+class ArchiveManifest(object):
+    """!Records which archive members were written successfully.
+
+    The manifest is a JSON file mapping from each member tag to the
+    list of files archived in it ([name,size,mtime] each), the member
+    path, and for on-disk members, the size and SHA-256 checksum of
+    the tar file.  It is rewritten atomically after each member
+    finishes, so a job that fails part way still records the members
+    that are complete."""
+    def __init__(self,filename,logger=None):
+        """!Reads the manifest, if it exists.
+        @param filename the manifest file
+        @param logger a logging.Logger for messages"""
+        self.filename=filename
+        self.logger=logger
+        self._lock=threading.Lock()
+        self.members=dict()
+        try:
+            with open(filename,'rt') as f:
+                data=json.load(f)
+            if isinstance(data,dict) and isinstance(data.get('members',None),dict):
+                self.members=data['members']
+        except FileNotFoundError:
+            pass
+        except (EnvironmentError,ValueError) as e:
+            if logger is not None:
+                logger.warning('%s: ignoring unreadable manifest: %s'
+                               %(filename,str(e)))
+
+    ##@var filename
+    # The manifest file
+
+    ##@var members
+    # A dict mapping from member tag to information about the member
+
+    def is_done(self,tag,states,verify=True):
+        """!Returns True if a member was archived with exactly these
+        files, unchanged, and (if verify is True) its on-disk tar file
+        still has the recorded size and checksum.
+        @param tag the member tag
+        @param states a list of file_state() of the files in the member
+        @param verify if True, check the tar file checksum"""
+        entry=self.members.get(tag,None)
+        if entry is None or entry.get('files',None)!=states:
+            return False
+        if 'sha256' not in entry or not verify:
+            return True
+        path=entry.get('path','')
+        try:
+            if os.path.getsize(path)!=entry.get('size',-1):
+                return False
+            return sha256_file(path)==entry['sha256']
+        except EnvironmentError as e:
+            if self.logger is not None:
+                self.logger.info('%s: cannot verify: %s'%(path,str(e)))
+            return False
+
+    def record(self,tag,path,states,checksum=True):
+        """!Records a successfully written member and saves the manifest.
+        @param tag the member tag
+        @param path the member tar file
+        @param states a list of file_state() of the files in the member
+        @param checksum if True, path is on disk: record its size and
+          checksum"""
+        entry={ 'path':path, 'files':states }
+        if checksum:
+            entry['size']=os.path.getsize(path)
+            entry['sha256']=sha256_file(path)
+        with self._lock:
+            self.members[tag]=entry
+            self.save()
+
+    def save(self):
+        """!Writes the manifest atomically."""
+        dirname=os.path.dirname(self.filename) or '.'
+        (fd,tmp)=tempfile.mkstemp(prefix=os.path.basename(self.filename)+'.',
+                                  dir=dirname)
+        try:
+            with os.fdopen(fd,'wt') as f:
+                json.dump({'members':self.members},f,indent=1,sort_keys=True)
+                f.write('\n')
+            os.chmod(tmp,0o644)
+            os.rename(tmp,self.filename)
+        except:
+            os.unlink(tmp)
+            raise
+
+class Archiver(object):
+    """!Writes an archive of files in the current directory as
+    concurrently written, size-balanced member tar files."""
+    def __init__(self,path,manifest,tar=None,htar=None,compressor=None,
+                 members=1,threads=None,verify=True,logger=None):
+        """!Archiver constructor.
+
+        Exactly one of tar or htar must be given.
+        @param path the archive path.  For tar, a name ending in .gz
+          or .tgz is compressed.
+        @param manifest the ArchiveManifest filename
+        @param tar the tar program, to write the archive to disk
+        @param htar the htar program, to write the archive to tape
+        @param compressor a compression program for tar -I, such as
+          "pigz"; if None, tar -z is used for compressed archives
+        @param members the number of members to split the files into
+        @param threads the number of members to write at once; the
+          default is one per member
+        @param verify if True, check the tar file checksums of members
+          that are already in the manifest before skipping them
+        @param logger a logging.Logger for messages"""
+        if (tar is None) == (htar is None):
+            raise TypeError('Archiver: specify exactly one of tar or htar')
+        self.path=path
+        self.tar=tar
+        self.htar=htar
+        self.compressor=compressor
+        self.members=max(1,int(members))
+        self.threads=max(1,int(threads if threads else self.members))
+        self.verify=verify
+        self.logger=logger if logger is not None \
+            else logging.getLogger('archive')
+        self.manifest=ArchiveManifest(manifest,self.logger)
+
+    ##@var path
+    # The archive path
+
+    ##@var manifest
+    # The ArchiveManifest of members already written
+
+    def _command(self,mpath,files):
+        """!Internal function; do not call directly.  Returns the
+        produtil.prog.Runner that writes one member.
+        @param mpath the member path
+        @param files the list of files in the member"""
+        filelist=''.join([ f+'\n' for f in files ])
+        if self.htar is not None:
+            return batchexe(self.htar)['-cvpf',mpath,'-L','-'] << filelist
+        compress=mpath.endswith('.gz') or mpath.endswith('.tgz')
+        if compress and self.compressor:
+            return batchexe(self.tar)['-cvpf',mpath,'-I',self.compressor,
+                                      '-T','-'] << filelist
+        flags='-cvpzf' if compress else '-cvpf'
+        return batchexe(self.tar)[flags,mpath,'-T','-'] << filelist
+
+    def _write(self,tag,files):
+        """!Internal function; do not call directly.  Writes one
+        member unless the manifest shows it is already done.
+        @param tag the member tag
+        @param files the list of files in the member
+        @returns the member path"""
+        mpath=member_path(self.path,tag)
+        states=[ file_state(f) for f in files ]
+        if self.manifest.is_done(tag,states,verify=self.verify):
+            self.logger.info('%s: already archived and verified; skipping'
+                             %(mpath,))
+            return mpath
+        start=time.time()
+        self.logger.info('%s: archiving %d files'%(mpath,len(files)))
+        checkrun(self._command(mpath,files),logger=self.logger)
+        self.manifest.record(tag,mpath,states,checksum=self.htar is None)
+        self.logger.info('%s: done in %.1f seconds'%(mpath,time.time()-start))
+        return mpath
+
+    def _write_all(self,work):
+        """!Internal function; do not call directly.  Writes members
+        concurrently and raises the first failure after all finish.
+        @param work a list of (tag,files) tuples
+        @returns the list of member paths"""
+        if not work: return list()
+        with concurrent.futures.ThreadPoolExecutor(
+                max_workers=min(self.threads,len(work))) as pool:
+            futures=[ pool.submit(self._write,tag,files)
+                      for (tag,files) in work ]
+        return [ future.result() for future in futures ]
+
+    def archive(self,files):
+        """!Archives files, split into members.
+        @param files the list of files, relative to the current directory
+        @returns the list of member paths"""
+        plan=plan_members(files,self.members)
+        if len(plan)==1 and self.members==1:
+            work=[ ('',plan[0]) ]
+        else:
+            work=[ ('.p%03d'%(i+1),members)
+                   for (i,members) in enumerate(plan) ]
+        return self._write_all(work)
@@ -152,6 +152,9 @@ class WaveInitFailed(HAFSError):
     """!Raised when the wave initialization failes."""
 class WW3InputError(WaveInitFailed):
     """!Raised when the wavewatch 3 cannot find necessary input."""
+class WW3PointFileError(WW3InputError):
+    """!Raised when a wavewatch 3 point output file, or a spectral
+    file made from it, cannot be read."""
 
 ########################################################################
 # COUPLING EXCEPTIONS
@@ -0,0 +1,173 @@
+#! /usr/bin/env python3
+
+"""!Caches the parent grid that the launcher uses to place the nest.
+
+To compute the storm-following nest location, the launcher generates
+the parent grid with hafs_utils_make_hgrid.x or
+hafs_utils_regional_esg_grid.x (and ncks), only to find the grid point
+nearest to the storm.  The grid only depends on the generator's
+arguments, so the GridCache stores the compute-grid longitudes and
+latitudes in a shared directory, in a numpy .npz file named after a
+hash of those arguments and of the executable's size and modification
+time.  Later launches with the same configuration reuse them.  The
+grid is centered on the domain center, so this only helps when the
+center is fixed in the configuration (domlat and domlon); the
+launcher does not use the cache when the center follows the storm.
+
+@code
+cache=GridCache('/path/to/grid_cache',logger)
+key=cache_key(['hafs_utils_make_hgrid.x','--nlon',1024,...])
+with cache.lock(key):
+    lonlat=cache.get(key)
+    if lonlat is None:
+        ... generate the grid ...
+        lonlat=cache.put(key,lon,lat)
+@endcode
+
+The cache is advisory: an unreadable entry is treated as missing.
+Each use of an entry updates its modification time, and prune()
+deletes entries that have not been used for a given time.
+This module requires numpy; it is imported when an entry is read or
+written."""
+
+##@var __all__
+# Symbols exported by "from hafs.gridcache import *"
+__all__=['cache_key','GridCache']
+
+import os, json, hashlib, tempfile, logging, time
+import produtil.fileop, produtil.locking
+
+def cache_key(params,executables=()):
+    """!Returns the cache key of a grid.
+    @param params a JSON-serializable description of everything the
+      grid depends on, such as the generator arguments
+    @param executables paths to programs that generate the grid; their
+      size and modification time are part of the key, so a rebuilt
+      program invalidates the cache
+    @returns a hexadecimal string"""
+    stats=list()
+    for exe in executables:
+        try:
+            st=os.stat(exe)
+            stats.append([exe,int(st.st_size),int(st.st_mtime_ns)])
+        except EnvironmentError:
+            stats.append([exe,None,None])
+    text=json.dumps([params,stats],sort_keys=True,default=str)
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+class GridCache(object):
+    """!A directory of cached grid longitudes and latitudes, one .npz
+    file per cache key."""
+    def __init__(self,directory,logger=None):
+        """!GridCache constructor.
+        @param directory the cache directory; it is created if needed
+        @param logger a logging.Logger for messages"""
+        self.directory=directory
+        self.logger=logger if logger is not None \
+            else logging.getLogger('gridcache')
+
+    ##@var directory
+    # The cache directory
+
+    def path(self,key):
+        """!Returns the path to the cache entry for a key."""
+        return os.path.join(self.directory,'grid.%s.npz'%(key,))
+
+    def lock(self,key):
+        """!Returns a produtil.locking.LockFile that serializes the
+        generation of the grid for a key, so concurrent launches
+        generate it only once.
+        @param key the cache key"""
+        produtil.fileop.makedirs(self.directory,logger=self.logger)
+        return produtil.locking.LockFile(
+            os.path.join(self.directory,'grid.%s.lock'%(key,)),
+            logger=self.logger,blocking=True,timeout=1800)
+
+    def get(self,key):
+        """!Returns the cached (lon,lat) numpy arrays for a key, or None.
+        @param key the cache key"""
+        path=self.path(key)
+        if not os.path.exists(path):
+            return None
+        import numpy as np
+        try:
+            with np.load(path) as data:
+                lonlat=(data['lon'],data['lat'])
+        except (EnvironmentError,ValueError,KeyError) as e:
+            self.logger.warning('%s: ignoring unreadable grid cache entry: %s'
+                                %(path,str(e)))
+            return None
+        self.logger.info('%s: using cached grid'%(path,))
+        try:
+            os.utime(path)
+        except EnvironmentError:
+            pass
+        return lonlat
+
+    def put(self,key,lon,lat):
+        """!Stores the longitudes and latitudes of a grid.  The entry is
+        written to a temporary file and renamed, so readers never see a
+        partial entry.
+        @param key the cache key
+        @param lon,lat arrays of longitudes and latitudes
+        @returns (lon,lat) as numpy arrays"""
+        import numpy as np
+        lon=np.asarray(lon)
+        lat=np.asarray(lat)
+        produtil.fileop.makedirs(self.directory,logger=self.logger)
+        path=self.path(key)
+        try:
+            (fd,tmp)=tempfile.mkstemp(prefix='.grid.',suffix='.npz',
+                                      dir=self.directory)
+            try:
+                with os.fdopen(fd,'wb') as f:
+                    np.savez(f,lon=lon,lat=lat)
+                os.chmod(tmp,0o644)
+                os.rename(tmp,path)
+            except:
+                os.unlink(tmp)
+                raise
+            self.logger.info('%s: cached grid'%(path,))
+        except EnvironmentError as e:
+            self.logger.warning('%s: cannot write grid cache entry: %s'
+                                %(path,str(e)))
+        return (lon,lat)
+
+    def prune(self,max_age):
+        """!Deletes entries that were not used for a while.  Entries
+        whose lock is held are skipped, and lock files are kept, since
+        other launches may be waiting on them.
+        @param max_age minimum seconds since an entry was last used
+        @returns the number of entries deleted"""
+        cutoff=time.time()-max_age
+        try:
+            with os.scandir(self.directory) as it:
+                names=[ e.name for e in it if e.name.endswith('.npz') ]
+        except FileNotFoundError:
+            return 0
+        removed=0
+        for name in names:
+            path=os.path.join(self.directory,name)
+            try:
+                if os.lstat(path).st_mtime>=cutoff: continue
+            except EnvironmentError:
+                continue
+            if name.startswith('.'):
+                # An interrupted put()
+                produtil.fileop.remove_file(path,logger=self.logger)
+                removed+=1
+                continue
+            key=name[len('grid.'):-len('.npz')]
+            try:
+                with produtil.locking.LockFile(
+                        os.path.join(self.directory,'grid.%s.lock'%(key,)),
+                        logger=self.logger,max_tries=1,giveup_quiet=True):
+                    if os.lstat(path).st_mtime>=cutoff: continue
+                    self.logger.info('%s: removing unused grid'%(path,))
+                    produtil.fileop.remove_file(path,logger=self.logger)
+                    removed+=1
+            except produtil.locking.LockHeld:
+                pass
+            except EnvironmentError as e:
+                self.logger.warning('%s: cannot remove: %s'%(path,str(e)))
+        return removed
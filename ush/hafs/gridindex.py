@@ -0,0 +1,288 @@
+#! /usr/bin/env python3
+
+"""!Spatial index of a curvilinear latitude-longitude grid.
+
+Finding the grid point nearest to a location by computing the
+distance to every point costs a pass over the whole grid for every
+query.  A GridIndex converts the grid points to unit vectors once and
+keeps them in a k-d tree, so each query after that takes O(log n)
+time.  The nearest point by straight-line (chord) distance between
+unit vectors is also the nearest by great-circle distance.
+
+@code
+index=hafs.gridindex.cached(lat,lon,directory='/path/to/cache')
+(j,i)=index.nearest(25.3,-75.1)
+(jmin,jmax,imin,imax)=index.bbox(corner_lats,corner_lons,pad=2)
+if index.contains(25.3,-75.1): ...
+@endcode
+
+The k-d tree is scipy.spatial.cKDTree.  Without scipy, the queries
+are answered by a vectorized search over all points, with the same
+results.  Indexes can be saved to disk with save() and read back with
+load(); cached() does that automatically, keyed by a checksum of the
+grid coordinates, and also keeps them in memory for the rest of the
+process.  Computing the checksum reads the whole grid, so callers that
+read the coordinates from a file should pass the file as the source:
+the checksum is then computed once per file, when its index is first
+needed, and later calls only stat the file.  Saved indexes are numpy
+.npz files of the unit vectors, read without unpickling, so a shared
+index directory cannot be used to run code in the jobs that read it;
+the k-d tree is rebuilt when an index is loaded.  This module requires
+numpy."""
+
+##@var __all__
+# Symbols exported by "from hafs.gridindex import *"
+__all__=['GridIndex','cached','checksum','source_key','to_xyz']
+
+import os, hashlib, tempfile, threading, logging
+
+##@var _memory
+# Indexes built or loaded by cached() in this process, keyed by checksum
+_memory=dict()
+
+##@var _aliases
+# Mapping from source_key() to the checksum of the grid read from
+# that source
+_aliases=dict()
+
+##@var _lock
+# Protects _memory and _aliases
+_lock=threading.Lock()
+
+def to_xyz(lat,lon):
+    """!Converts latitudes and longitudes in degrees to unit vectors.
+    @param lat,lon scalars or arrays of the same shape
+    @returns an array of shape (...,3)"""
+    import numpy as np
+    lat=np.radians(np.asarray(lat,dtype=np.float64))
+    lon=np.radians(np.asarray(lon,dtype=np.float64))
+    coslat=np.cos(lat)
+    return np.stack([coslat*np.cos(lon),coslat*np.sin(lon),np.sin(lat)],
+                    axis=-1)
+
+class GridIndex(object):
+    """!A spatial index of the points of a two-dimensional grid."""
+    def __init__(self,lat,lon):
+        """!Builds the index.
+        @param lat,lon two-dimensional arrays of the latitudes and
+          longitudes of the grid points, in degrees"""
+        import numpy as np
+        lat=np.asarray(lat)
+        lon=np.asarray(lon)
+        if lat.shape!=lon.shape or lat.ndim!=2:
+            raise ValueError('GridIndex: lat and lon must be 2D arrays of '
+                             'the same shape, not %s and %s'
+                             %(lat.shape,lon.shape))
+        self._setup(lat.shape,to_xyz(lat,lon).reshape(-1,3))
+
+    def _setup(self,shape,xyz):
+        """!Internal function; do not call directly.  Sets the shape
+        and unit vectors, and builds the k-d tree."""
+        self.shape=tuple(shape)
+        self.xyz=xyz
+        try:
+            from scipy.spatial import cKDTree
+            self.tree=cKDTree(self.xyz)
+        except ImportError:
+            self.tree=None
+
+    ##@var shape
+    # The (ny,nx) shape of the grid
+
+    ##@var xyz
+    # The unit vectors of the grid points, in C order
+
+    ##@var tree
+    # The scipy.spatial.cKDTree of xyz, or None if scipy is not available
+
+    def _query(self,xyz):
+        """!Internal function; do not call directly.  Returns the flat
+        indexes of the points nearest to some unit vectors, and the
+        chord distances to them."""
+        import numpy as np
+        xyz=np.atleast_2d(xyz)
+        if self.tree is not None:
+            (dist,flat)=self.tree.query(xyz)
+            return (np.atleast_1d(flat),np.atleast_1d(dist))
+        flat=np.empty(len(xyz),dtype=np.intp)
+        for (n,v) in enumerate(xyz):
+            flat[n]=np.argmax(self.xyz.dot(v))
+        dist=np.sqrt(np.sum((self.xyz[flat]-xyz)**2,axis=-1))
+        return (flat,dist)
+
+    def nearest(self,lat,lon):
+        """!Finds the grid points nearest to one or more locations.
+        @param lat,lon a location in degrees, or arrays of locations
+        @returns (j,i) indexes of the nearest grid point: ints for a
+          scalar location, or arrays for arrays of locations"""
+        import numpy as np
+        (flat,dist)=self._query(to_xyz(lat,lon).reshape(-1,3))
+        (j,i)=np.unravel_index(flat,self.shape)
+        if np.ndim(lat)==0 and np.ndim(lon)==0:
+            return (int(j[0]),int(i[0]))
+        return (j.reshape(np.shape(lat)),i.reshape(np.shape(lat)))
+
+    def bbox(self,lat,lon,pad=0):
+        """!Returns the index ranges of the smallest subset of the grid
+        that contains the points nearest to some locations.
+        @param lat,lon arrays of locations in degrees, such as the
+          corners of another grid
+        @param pad extra points to add on each side, within the grid
+        @returns (jmin,jmax,imin,imax), where jmax and imax are one past
+          the last index, as for a slice"""
+        (j,i)=self.nearest(lat,lon)
+        (ny,nx)=self.shape
+        return (max(int(j.min())-pad,0),min(int(j.max())+1+pad,ny),
+                max(int(i.min())-pad,0),min(int(i.max())+1+pad,nx))
+
+    def contains(self,lat,lon):
+        """!Is a location within the grid's domain?  A location is
+        inside if its nearest grid point is an interior point, or if it
+        is an edge point no farther from the location than half the
+        distance to the adjacent interior point.
+        @param lat,lon a location in degrees"""
+        import numpy as np
+        xyz=to_xyz(lat,lon).reshape(-1,3)
+        (flat,dist)=self._query(xyz)
+        (j,i)=np.unravel_index(int(flat[0]),self.shape)
+        (ny,nx)=self.shape
+        if 0<j<ny-1 and 0<i<nx-1:
+            return True
+        jin=min(max(j,1),ny-2) if ny>2 else j
+        iin=min(max(i,1),nx-2) if nx>2 else i
+        spacing=np.sqrt(np.sum((self.xyz[flat[0]]
+                -self.xyz[np.ravel_multi_index((jin,iin),self.shape)])**2))
+        return bool(dist[0]<=spacing/2)
+
+    def within(self,lat,lon,radius):
+        """!Finds the grid points within a great-circle distance of a
+        location.
+        @param lat,lon the location in degrees
+        @param radius the distance in radians on the unit sphere
+        @returns (j,i) arrays of the indexes of the points"""
+        import numpy as np
+        v=to_xyz(lat,lon)
+        chord=2*np.sin(min(float(radius),np.pi)/2)
+        if self.tree is not None:
+            flat=np.asarray(sorted(self.tree.query_ball_point(v,chord)),
+                            dtype=np.intp)
+        else:
+            flat=np.nonzero(np.sum((self.xyz-v)**2,axis=-1)<=chord**2)[0]
+        return np.unravel_index(flat,self.shape)
+
+    def save(self,filename):
+        """!Writes the index to a numpy .npz file, atomically.
+        @param filename the file"""
+        import numpy as np
+        dirname=os.path.dirname(os.path.abspath(filename))
+        (fd,tmp)=tempfile.mkstemp(prefix='.gridindex.',dir=dirname)
+        try:
+            with os.fdopen(fd,'wb') as f:
+                np.savez(f,shape=np.asarray(self.shape,dtype=np.int64),
+                         xyz=self.xyz)
+            os.chmod(tmp,0o644)
+            os.rename(tmp,filename)
+        except:
+            os.unlink(tmp)
+            raise
+
+    @staticmethod
+    def load(filename):
+        """!Reads an index written by save().
+        @param filename the file
+        @returns a GridIndex
+        @raise ValueError if the file is not a valid index"""
+        import numpy as np
+        with np.load(filename,allow_pickle=False) as data:
+            shape=tuple([ int(n) for n in data['shape'] ])
+            xyz=np.asarray(data['xyz'],dtype=np.float64)
+        if len(shape)!=2 or xyz.shape!=(shape[0]*shape[1],3):
+            raise ValueError('%s: not a GridIndex'%(filename,))
+        index=GridIndex.__new__(GridIndex)
+        index._setup(shape,xyz)
+        return index
+
+def checksum(lat,lon):
+    """!Returns a checksum of grid coordinates, used as the key of
+    cached indexes.
+    @param lat,lon arrays of latitudes and longitudes"""
+    import numpy as np
+    h=hashlib.sha256()
+    for a in (lat,lon):
+        a=np.ascontiguousarray(a,dtype=np.float64)
+        h.update(repr(a.shape).encode('ascii'))
+        h.update(a.data)
+    return h.hexdigest()
+
+def source_key(source):
+    """!Returns a key that identifies the version of a file that grid
+    coordinates were read from, without reading the file.
+    @param source the file name, or a tuple of the file name and
+      strings that identify the coordinates within it, such as
+      variable names
+    @returns a tuple of the file's absolute path, size, modification
+      time, inode and device, and the other items of source, or None
+      if the file cannot be stat'ed"""
+    if isinstance(source,str): source=(source,)
+    filename=os.path.abspath(source[0])
+    try:
+        st=os.stat(filename)
+    except EnvironmentError:
+        return None
+    return (filename,st.st_size,st.st_mtime_ns,st.st_ino,st.st_dev)+\
+        tuple([ str(s) for s in source[1:] ])
+
+def cached(lat,lon,directory=None,logger=None,source=None):
+    """!Returns the GridIndex of a grid, building it only if it was not
+    already built in this process or saved in the directory.
+    @param lat,lon two-dimensional arrays of the grid point latitudes
+      and longitudes, in degrees
+    @param directory optional: a directory for saved indexes
+    @param logger a logging.Logger for messages
+    @param source optional: the file the coordinates were read from,
+      as for source_key().  The coordinates are then only hashed the
+      first time this version of the file is seen in this process."""
+    import numpy as np
+    if logger is None:
+        logger=logging.getLogger('gridindex')
+    alias=None if source is None else source_key(source)
+    key=None
+    if alias is not None:
+        with _lock:
+            key=_aliases.get(alias,None)
+    if key is None:
+        key=checksum(lat,lon)
+        if alias is not None:
+            with _lock:
+                _aliases[alias]=key
+    with _lock:
+        index=_memory.get(key,None)
+    if index is not None:
+        return index
+    path=None
+    if directory:
+        path=os.path.join(directory,'gridindex.%s.npz'%(key,))
+        if os.path.exists(path):
+            try:
+                index=GridIndex.load(path)
+                if index.shape!=np.shape(lat):
+                    raise ValueError('grid shape is %s, not %s'%(
+                        index.shape,np.shape(lat)))
+                logger.info('%s: loaded grid index'%(path,))
+            except (EnvironmentError,ValueError,KeyError) as e:
+                logger.warning('%s: ignoring unreadable grid index: %s'
+                               %(path,str(e)))
+                index=None
+    if index is None:
+        index=GridIndex(lat,lon)
+        if path is not None:
+            try:
+                os.makedirs(directory,exist_ok=True)
+                index.save(path)
+                logger.info('%s: saved grid index'%(path,))
+            except EnvironmentError as e:
+                logger.warning('%s: cannot save grid index: %s'
+                               %(path,str(e)))
+    with _lock:
+        _memory[key]=index
+    return index
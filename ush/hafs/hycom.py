@@ -4,14 +4,14 @@
 
 import re, sys, os, glob, datetime, math, fractions, collections, subprocess
 import tarfile
-import produtil.fileop, produtil.log
+import produtil.fileop, produtil.log, produtil.sharedstage
 import produtil.cluster
 import tcutil.numerics, hafs.input, hafs.namelist
 import hafs.hafstask, hafs.exceptions
 import time, shutil
 from produtil.cd import NamedDir
 from produtil.fileop import make_symlink, isnonempty, remove_file, \
-    deliver_file, gribver, wait_for_files
+    deliver_file, deliver_files, gribver, wait_for_files
 from produtil.datastore import FileProduct, COMPLETED, RUNNING, FAILED
 from produtil.run import *
 from produtil.log import jlogger
@@ -184,29 +184,52 @@ class HYCOMInit1(hafs.hafstask.HAFSTask):
         if not outdir:
             outdir=os.path.join(self.workdir,rtofs_atime.strftime('rtofs.%Y%m%d'))
 
-        # Get data:
+        # Get data.  With a shared stage, only the first storm of this
+        # cycle extracts it, and the others link to its files.
+        shared=self.confstr('RTOFS_SHARED_STAGE','')
+        if zerostat==0 and shared:
+            stage=produtil.sharedstage.SharedStage(
+                shared,'rtofs.%s.t%02dz'%(rtofs_ymd,cyc.hour),logger=logger,
+                timeout=self.confint('rtofs_stage_timeout',3600))
+            stage.stage(lambda path: self.get_rtofs(path,rtofs_atime,dir0,
+                                                    cyc.hour,logger))
+            stage.link_into(outdir)
+            produtil.sharedstage.prune(
+                shared,self.confint('rtofs_stage_max_age',172800),logger)
+        else:
+            with NamedDir(outdir,keep=True,logger=logger,rm_first=False) as d:
+                if zerostat==0:
+                    self.get_rtofs(outdir,rtofs_atime,dir0,cyc.hour,logger)
+
+    def get_rtofs(self,outdir,rtofs_atime,dir0,cychour,logger):
+        """!Runs hafs_get_rtofs in the current directory to extract the
+        RTOFS data of one cycle from the day's RTOFS files.
+        @param outdir the directory that receives the extracted files
+        @param rtofs_atime the RTOFS analysis time
+        @param dir0 the directory with the day's RTOFS files
+        @param cychour the cycle hour
+        @param logger a logging.Logger for log messages"""
         ni=hafs.namelist.NamelistInserter(self.conf,self.section)
-        with NamedDir(outdir,keep=True,logger=logger,rm_first=False) as d:
-            parmin=self.confstrinterp('{PARMhycom}/hafs_get_rtofs.nml.in')
-            parmout='get_rtofs.nml'
-
-            # from PDY (loc0)
-            if zerostat==0:
-                lastleadtimetoday=0
-                #-org: starthr=cyc.hour-24
-                # need to change it into
-                starthr=cyc.hour
-                endhr=cyc.hour
-                #endhr=cyc.hour+18
-                logger.info('FRDa: dir0=%s starthr=%d endhr=%d lastleadtimetoday=%d'%(repr(dir0),starthr,endhr,lastleadtimetoday))
-                with open(parmin,'rt') as inf:
-                    with open(parmout,'wt') as outf:
-                        outf.write(ni.parse(inf,logger,parmin,atime=rtofs_atime,
-                            INDIR1=dir0,INDIR2=dir0,INDIR3=dir0,
-                            STARTHR=starthr,ENDHR=endhr,
-                            LAST_LEAD_TIME_TODAY=18))
-                checkrun(mpirun(mpi(self.getexe('hafs_get_rtofs')),allranks=True),logger=logger)
-                os.rename('get_rtofs.nml','get_rtofs.nml.0')
+        parmin=self.confstrinterp('{PARMhycom}/hafs_get_rtofs.nml.in')
+        parmout='get_rtofs.nml'
+
+        # from PDY (loc0)
+        lastleadtimetoday=0
+        #-org: starthr=cyc.hour-24
+        # need to change it into
+        starthr=cychour
+        endhr=cychour
+        #endhr=cyc.hour+18
+        logger.info('FRDa: dir0=%s starthr=%d endhr=%d lastleadtimetoday=%d'%(repr(dir0),starthr,endhr,lastleadtimetoday))
+        with open(parmin,'rt') as inf:
+            with open(parmout,'wt') as outf:
+                outf.write(ni.parse(inf,logger,parmin,atime=rtofs_atime,
+                    INDIR1=dir0,INDIR2=dir0,INDIR3=dir0,
+                    RTOFS_STAGE=outdir,
+                    STARTHR=starthr,ENDHR=endhr,
+                    LAST_LEAD_TIME_TODAY=18))
+        checkrun(mpirun(mpi(self.getexe('hafs_get_rtofs')),allranks=True),logger=logger)
+        os.rename('get_rtofs.nml','get_rtofs.nml.0')
 
     def run(self):
         """Runs the hycom initialization for hycominit1.  Raises an exception if
@@ -261,10 +284,10 @@ class HYCOMInit1(hafs.hafstask.HAFSTask):
                                  keep=True,logger=logger)
 
                 # Deliver restart files to intercom
-                for(prodname,prod) in self.restart_out.items():
-                    (local,ab)=prodname.split('.')
-                    locintercom=self.timestr('{intercom}/hycominit/'+prodname)
-                    deliver_file(prodname,locintercom,keep=True,logger=logger)
+                deliver_files([ (prodname,self.timestr(
+                            '{intercom}/hycominit/'+prodname))
+                                for prodname in self.restart_out ],
+                              keep=True,logger=logger)
 
                 # Make the flag file to indicate we're done.
                #done=self.timestr('{com}/{out_prefix}.{RUN}.hycominit1.done')
@@ -435,6 +458,29 @@ export gridno={gridno}\n'''.format(**self.__dict__))
             self.__rtofs_inputs_ymd=inputs
         return self.__rtofs_inputs_ymd
 
+    def untar_rtofs(self,tgzfile,logger):
+        """!Extracts an RTOFS .tgz file into the current directory.  If
+        RTOFS_SHARED_STAGE is set, the file is extracted only once, by
+        the first storm of the cycle that needs it, and the others
+        link to the extracted files.
+        @param tgzfile the .tgz file
+        @param logger a logging.Logger for log messages"""
+        def extract(path):
+            with tarfile.open(tgzfile,'r:gz') as tgz:
+                tgz.extractall(path)
+        shared=self.confstr('RTOFS_SHARED_STAGE','')
+        if not shared:
+            extract('.')
+            return
+        key=self.timestr('rtofs.{aYMD}.')+os.path.basename(tgzfile)[:-4]
+        stage=produtil.sharedstage.SharedStage(
+            shared,key,logger=logger,
+            timeout=self.confint('rtofs_stage_timeout',3600))
+        stage.stage(extract)
+        stage.link_into('.')
+        produtil.sharedstage.prune(
+            shared,self.confint('rtofs_stage_max_age',172800),logger)
+
     def rtofs_subset_bdry_init(self,logger):
         inputs=self.rtofs_inputs_ymd
         logger.info('RI: inputsymd=%s'%(repr(inputs)))
@@ -497,8 +543,7 @@ export gridno={gridno}\n'''.format(**self.__dict__))
            produtil.fileop.make_symlink(rtofsa,archva,force=True,logger=logger)
         elif os.path.exists(rtofsatgz):
            logger.info('File %s exists, untar it into %s'%(rtofsatgz,archva))
-           with tarfile.open(rtofsatgz,'r:gz') as tgz:
-              tgz.extractall()
+           self.untar_rtofs(rtofsatgz,logger)
         else:
            logger.critical('FATAL ERROR: Neither %s nor %s exists'%(rtofsa,rtofsatgz))
            raise
@@ -545,8 +590,7 @@ subregion %s
            produtil.fileop.make_symlink(rtofs_restart_a,restart_in_a,force=True,logger=logger)
         elif os.path.exists(rtofs_restart_atgz):
            logger.info('File %s exists, untar it into %s'%(rtofs_restart_atgz,restart_in_a))
-           with tarfile.open(rtofs_restart_atgz,'r:gz') as tgz:
-              tgz.extractall()
+           self.untar_rtofs(rtofs_restart_atgz,logger)
         else:
            logger.critical('FATAL ERROR: Neither %s nor %s exists'%(rtofs_restart_a,rtofs_restart_atgz))
            raise
@@ -806,9 +850,9 @@ class HYCOMInit2(hafs.hafstask.HAFSTask):
 
                 # Deliver the forcing files to intercom
                 produtil.fileop.makedirs(self.timestr('{intercom}/hycominit'),logger=logger)
-                for (name,prod) in self.forcing_products.items():
-                    locintercom=self.timestr('{intercom}/hycominit/'+name)
-                    deliver_file(name,locintercom,keep=True,logger=logger)
+                deliver_files([ (name,self.timestr('{intercom}/hycominit/'+name))
+                                for name in self.forcing_products ],
+                              keep=True,logger=logger)
 
                 # Deliver limits to com
                #self.limits.deliver(frominfo='./limits')
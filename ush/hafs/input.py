@@ -12,13 +12,13 @@ in priority order, obtaining the input data."""
 
 ##@var __all__
 # Symbols exported by "from hafs.input import *"
-__all__=["DataCatalog","InputSource",'in_date_range']
+__all__=["DataCatalog","InputSource",'LocationTemplate','in_date_range']
 
 import collections, os, ftplib, tempfile, configparser, urllib.parse, stat, \
-    re, threading, time, datetime, io
+    re, threading, time, datetime, io, string
 import produtil.run, produtil.cluster, produtil.fileop, produtil.cd, \
-    produtil.workpool, produtil.listing
-import tcutil.numerics, hafs.exceptions
+    produtil.workpool, produtil.listing, produtil.checksum
+import tcutil.numerics, hafs.exceptions, hafs.config
 
 from produtil.run import alias, batchexe, checkrun, ExitStatusException, run
 from produtil.fileop import deliver_file, isnonempty, make_symlink, makedirs
@@ -26,6 +26,98 @@ from tcutil.numerics import to_datetime, to_datetime_rel, to_timedelta
 from hafs.exceptions import InputSourceBadType,PartialTransfer,\
     UnsupportedTransfer
 from produtil.log import jlogger
+from hafs.config import FCST_KEYS, ANL_KEYS, ANL_M6_KEYS, ANL_P6_KEYS, \
+    TIME_DIFF_KEYS
+
+##@var caching
+# If False, DataCatalog does not compile location templates or
+# remember the locations it found.
+caching=True
+
+##@var cache_size
+# Maximum number of entries in each cache of a DataCatalog.  A cache
+# that grows beyond this is emptied.
+cache_size=20000
+
+##@var _dynamic_keys
+# Variables that DataCatalog.parse() always receives as keyword
+# arguments, in addition to the time keys.
+_dynamic_keys=frozenset(['vit','oldvit','ENV'])
+
+##@var _time_keys
+# All variables computed from the analysis and forecast times
+_time_keys=frozenset(FCST_KEYS)|frozenset(ANL_KEYS)|frozenset(ANL_M6_KEYS)|\
+    frozenset(ANL_P6_KEYS)|frozenset(TIME_DIFF_KEYS)
+
+##@var _field_key
+# Matches the variable name at the start of a format field, such as
+# "vit" in "vit[stormid3]"
+_field_key=re.compile(r'[^.\[]*')
+
+def _remember(cache,key,value):
+    """!Internal function; do not call directly.  Stores a value in
+    one of the DataCatalog caches, emptying it first if it is full.
+    @param cache the cache dict
+    @param key,value the key and value to store
+    @returns value"""
+    if len(cache)>=cache_size:
+        cache.clear()
+    cache[key]=value
+    return value
+
+class LocationTemplate(object):
+    """!A dataset or item location of a DataCatalog with every
+    configuration variable already expanded.  What remains is a
+    str.format template over the time keys and keyword arguments of
+    hafs.config.HAFSConfig.timestrinterp(), which only needs the time
+    strings that the template actually uses."""
+    def __init__(self,text,timekeys):
+        """!LocationTemplate constructor.  Use DataCatalog.compile()
+        instead of calling this directly.
+        @param text the str.format template
+        @param timekeys the time keys used in the template"""
+        self.text=text
+        self.timekeys=frozenset(timekeys)
+    ##@var text
+    # The str.format template
+
+    ##@var timekeys
+    # The time keys (such as aYMD or fahr) used in the template
+
+    def format(self,atime,ftime,kwargs,conf):
+        """!Expands the template.
+        @param atime,ftime the analysis and forecast times, as
+          datetime.datetime objects
+        @param kwargs keyword arguments, as for timestrinterp()
+        @param conf the hafs.config.HAFSConfig, for the vitals
+        @returns the expanded string"""
+        fields=dict()
+        for key in self.timekeys:
+            if key in FCST_KEYS:
+                fields[key]=ftime.strftime(FCST_KEYS[key])
+            elif key in ANL_KEYS:
+                fields[key]=atime.strftime(ANL_KEYS[key])
+            elif key in ANL_M6_KEYS:
+                am6=atime-datetime.timedelta(0,3600*6)
+                fields[key]=am6.strftime(ANL_M6_KEYS[key])
+            elif key in ANL_P6_KEYS:
+                ap6=atime+datetime.timedelta(0,3600*6)
+                fields[key]=ap6.strftime(ANL_P6_KEYS[key])
+            else:
+                (ihours,iminutes)=tcutil.numerics.fcst_hr_min(ftime,atime)
+                if key=='fahr':
+                    fields[key]=int(ihours)
+                elif key=='fahrmin':
+                    fields[key]=int(iminutes)
+                else:
+                    fields[key]=int(ihours*60+iminutes)
+        fields['ENV']=hafs.config.ENVIRONMENT
+        if 'syndat' in conf.__dict__:
+            fields['vit']=conf.syndat.__dict__
+        if 'oldsyndat' in conf.__dict__:
+            fields['oldvit']=conf.oldsyndat.__dict__
+        fields.update(kwargs)
+        return self.text.format(**fields)
 
 ########################################################################
 def in_date_range(t,trange):
@@ -169,6 +261,14 @@ class DataCatalog(object):
       print gpm
     @endcode
     which prints "/com/gfs/prod/gdas.20190918/gdas1.t00z.gpm.tm00.bufr_d"
+
+    Expanding a location with the full configuration interpolation is
+    slow, and input lists ask for the same items at many forecast
+    times.  Hence the DataCatalog compiles each dataset and item
+    location into a LocationTemplate the first time it is needed, and
+    remembers each location it found.  The caches assume the
+    configuration does not change while the DataCatalog is in use;
+    call clear_cache() if it does.
     """
     def __init__(self,conf,section,anltime):
         """!DataCatalog constructor
@@ -181,6 +281,8 @@ class DataCatalog(object):
                             'string.')
         self.section=section
         self.anltime=to_datetime(anltime)
+        self._templates=dict()
+        self._located=dict()
     ##@var section
     # The section used for dataset and item locations in conf.
 
@@ -191,6 +293,113 @@ class DataCatalog(object):
     # The default analysis time for parse() and locate() if none is
     # specified.
 
+    ##@var _templates
+    # Compiled LocationTemplate objects, or None for templates that
+    # cannot be compiled, keyed by the template and keyword names
+
+    ##@var _located
+    # Results of locate(), keyed by its normalized arguments
+
+    def clear_cache(self):
+        """!Forgets all compiled templates and found locations.  Call
+        this if the configuration changes."""
+        self._templates.clear()
+        self._located.clear()
+
+    def _inline(self,text,names,timekeys,depth):
+        """!Internal function; do not call directly.  Expands the
+        configuration variables in a template, as the
+        hafs.config.ConfTimeFormatter would, leaving the time keys and
+        keyword arguments for str.format.
+        @param text the template
+        @param names the keyword argument names
+        @param timekeys a set to receive the time keys used
+        @param depth the recursion depth
+        @returns the str.format template
+        @raise ValueError,KeyError if the template cannot be compiled"""
+        if depth>=configparser.MAX_INTERPOLATION_DEPTH:
+            raise ValueError('Maximum interpolation depth exceeded')
+        conf=self.conf
+        out=list()
+        for (literal,field,spec,conv) in string.Formatter().parse(text):
+            if literal:
+                out.append(literal.replace('{','{{').replace('}','}}'))
+            if field is None:
+                continue
+            key=_field_key.match(field).group(0)
+            if not key or key.isdigit() or '{' in (spec or ''):
+                raise ValueError('%s: cannot compile'%(field,))
+            if key in names or key in _dynamic_keys or key in _time_keys:
+                if key in _time_keys and key not in names:
+                    timekeys.add(key)
+                out.append('{%s%s%s}'%(field,'!'+conv if conv else '',
+                                       ':'+spec if spec else ''))
+                continue
+            if key!=field or spec or conv:
+                raise ValueError('%s: cannot compile'%(field,))
+            (section,sep,nkey)=key.partition('/')
+            if not sep:
+                (section,nkey)=(self.section,key)
+            elif not section:
+                section=self.section
+            value=None
+            if conf.has_option(section,nkey):
+                value=conf.getraw(section,nkey)
+            elif conf.has_option(section,'@inc'):
+                for osec in conf.getraw(section,'@inc').split(','):
+                    if conf.has_option(osec,nkey):
+                        value=conf.getraw(osec,nkey)
+            if value is None:
+                if conf.has_option('config',nkey):
+                    value=conf.getraw('config',nkey)
+                elif conf.has_option('dir',nkey):
+                    value=conf.getraw('dir',nkey)
+            if value is None or '%' in value:
+                raise KeyError(nkey)
+            if '{' in value:
+                out.append(self._inline(value,names,timekeys,depth+1))
+            else:
+                out.append(value.replace('{','{{').replace('}','}}'))
+        return ''.join(out)
+
+    def compile(self,string,names=()):
+        """!Compiles a dataset or item location into a LocationTemplate.
+        @param string the dataset or item name
+        @param names the names of the keyword arguments that will be
+          given to parse()
+        @returns the LocationTemplate, or None if the location uses a
+          feature that only the full configuration interpolation
+          supports, such as quoted literals or % interpolation"""
+        if self.conf.quoted_literals:
+            return None
+        timekeys=set()
+        try:
+            text=self._inline('{'+string+'}',frozenset(names),timekeys,0)
+        except (ValueError,KeyError,configparser.Error):
+            return None
+        return LocationTemplate(text,timekeys)
+
+    def _expand(self,string,atime,ftime,kwargs):
+        """!Internal function; do not call directly.  Expands a dataset
+        or item location with its LocationTemplate if possible, or with
+        hafs.config.HAFSConfig.timestrinterp() otherwise."""
+        if caching and not any([ isinstance(v,str) and ('{' in v or '%' in v)
+                                 for v in kwargs.values() ]):
+            key=(string,frozenset(kwargs))
+            try:
+                template=self._templates[key]
+            except KeyError:
+                template=_remember(self._templates,key,
+                                   self.compile(string,key[1]))
+            if template is not None:
+                try:
+                    return template.format(atime,ftime,kwargs,self.conf)
+                except (KeyError,IndexError,AttributeError,TypeError,
+                        ValueError):
+                    pass # timestrinterp will report the error
+        return self.conf.timestrinterp(
+            self.section,"{"+string+"}",ftime,atime,**kwargs)
+
     def __repr__(self):
         """!A string representation of this DataCatalog"""
         if isinstance(self.anltime,datetime.datetime):
@@ -255,8 +464,7 @@ class DataCatalog(object):
             logger.info(
                 'parsing {%s} with ftime=%s atime=%s in section %s'
                 %(str(string),repr(ftime),repr(atime),repr(self.section)))
-        return self.conf.timestrinterp(
-            self.section,"{"+string+"}",ftime,atime,**kwargs)
+        return self._expand(string,atime,ftime,kwargs)
     def locate(self,dataset,item,atime=None,ftime=None,logger=None,
                dates=None,**kwargs):
         """!Find the location of a requested piece of data.
@@ -289,6 +497,27 @@ class DataCatalog(object):
             logger.info(
                 'locate item=%s atime=%s ftime=%s in dataset=%s'
                 %(repr(item),repr(atime),repr(ftime),repr(dataset)))
+        key=None
+        if caching:
+            at=to_datetime(self.anltime if atime is None else atime)
+            ft=at if ftime is None else to_datetime_rel(ftime,at)
+            key=(dataset,item,at,ft,dates,tuple(sorted(kwargs.items())))
+            try:
+                result=self._located[key]
+                if logger is not None:
+                    logger.info('result (remembered) => %s'%(repr(result),))
+                return result
+            except TypeError:
+                key=None # unhashable keyword argument
+            except KeyError:
+                pass
+        result=self._locate(dataset,item,atime,ftime,logger,dates,kwargs)
+        if key is not None:
+            _remember(self._located,key,result)
+        return result
+    def _locate(self,dataset,item,atime,ftime,logger,dates,kwargs):
+        """!Internal function; do not call directly.  Implements
+        locate() without the cache of found locations."""
         ds=self.parse(dataset,atime=atime,ftime=ftime,logger=logger,
                       dates=dates,**kwargs)
         if ds is None: return None
@@ -954,7 +1183,14 @@ class InputSource(object):
                                 logger.info('%s: already processing this'%(tgt,))
                             continue
                         if os.path.exists(tgt) and skip_existing:
-                            if logger is not None:
+                            # A file whose checksum record no longer
+                            # matches was changed or truncated after
+                            # delivery, so it is fetched again.
+                            if produtil.checksum.check(tgt) is False:
+                                if logger is not None:
+                                    logger.info('%s: changed since it was '
+                                                'delivered; fetch again'%(tgt,))
+                            elif logger is not None:
                                 logger.info('%s: already exists'%(tgt,))
                                 done.add(i)
                                 continue
@@ -1056,3 +1292,44 @@ class InputSource(object):
                         logger.warning(
                             'Exception while closing stream %s: %s'
                             %(key,str(e)),exc_info=True)
+
+########################################################################
+def benchmark(conf,section,atime,items,hours=126,step=3,repeat=100):
+    """!Compares the time taken to resolve a full input list with and
+    without the DataCatalog caches.  Each repetition creates a new
+    DataCatalog, as each task does, and locates every item at every
+    forecast hour from 0 through hours.  Checks that both methods
+    find the same locations.
+    @param conf the hafs.config.HAFSConfig
+    @param section the DataCatalog section
+    @param atime the analysis time
+    @param items a list of (dataset,item,kwargs) tuples
+    @param hours the last forecast hour
+    @param step hours between forecast times
+    @param repeat how many times to resolve the input list with each
+      method
+    @returns a dict with the seconds per input list for "cached" and
+      "uncached" and their ratio as "speedup"
+    @raise AssertionError if the locations differ"""
+    global caching
+    results=dict()
+    outputs=dict()
+    saved=caching
+    try:
+        for (name,enable) in ( ('uncached',False), ('cached',True) ):
+            caching=enable
+            start=time.time()
+            for i in range(repeat):
+                dc=DataCatalog(conf,section,atime)
+                outputs[name]=[ dc.locate(dataset,item,ftime=hour*3600,
+                                          **kwargs)
+                                for (dataset,item,kwargs) in items
+                                for hour in range(0,hours+1,step) ]
+            results[name]=(time.time()-start)/repeat
+    finally:
+        caching=saved
+    if outputs['cached']!=outputs['uncached']:
+        raise AssertionError('%s: cached and uncached locations differ'
+                             %(section,))
+    results['speedup']=results['uncached']/max(results['cached'],1e-9)
+    return results
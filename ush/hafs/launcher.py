@@ -17,14 +17,14 @@ tcvitals generation."""
 
 ##@var __all__
 # All symbols exported by "from hafs.launcher import *"
-__all__=['load','launch','HAFSLauncher','parse_launch_args','multistorm_parse_args']
+__all__=['load','launch','launch_storms','HAFSLauncher','parse_launch_args',
+         'multistorm_parse_args']
 
-import os, re, sys, collections, random
-import numpy as np
-import xarray as xr
+import os, re, sys, collections, random, time
+import concurrent.futures
 import produtil.fileop, produtil.run, produtil.log
 import tcutil.revital, tcutil.storminfo, tcutil.numerics
-import hafs.config
+import hafs.config, hafs.gridcache
 import hafs.prelaunch
 
 from random import Random
@@ -637,6 +637,96 @@ def launch(file_list,cycle,stid,moreopt,case_root,init_dirs=True,
 
     return conf
 
+def _launch_storm(file_list,cycle,stid,moreopt,case_root,fakestorm_conf,
+                  storm_num,prelaunch,finish):
+    """!Internal function; do not call directly.  Launches one real
+    storm of a multistorm run, possibly in a worker process.
+
+    @param fakestorm_conf the fake storm's HAFSLauncher, or the path to
+      its conf file if this is a worker process
+    @returns a tuple (confloc,seconds) of the storm's conf file and the
+      time spent launching it"""
+    start=time.time()
+    if isinstance(fakestorm_conf,str):
+        fakestorm_confloc=fakestorm_conf
+        fakestorm_conf=HAFSLauncher()
+        fakestorm_conf.read(fakestorm_confloc)
+    conf=launch(file_list,cycle,stid,moreopt,case_root,prelaunch=prelaunch,
+                fakestorm_conf=fakestorm_conf,storm_num=storm_num)
+    conf.sanity_check()
+    if finish is not None:
+        finish(conf)
+    return (conf.getloc('CONFhafs'),time.time()-start)
+
+# Multistorm
+def launch_storms(file_list,cycle,stids,moreopts,case_root,fakestorm_conf,
+                  storm_nums,prelaunch=None,finish=None,workers=None,
+                  logger=None):
+    """!Launches the real storms of a multistorm run concurrently.
+
+    Each storm is launched by launch(), then sanity checked and passed
+    to the finish function, in a separate process.  The storms only
+    share the fake storm's conf, which is read from its conf file by
+    each process, and write to their own directories and their own
+    storm*.conf file in the fake storm's com.  The storm numbers are
+    decided by the caller before anything is launched, so the result
+    does not depend on which storm finishes first.
+
+    @param file_list,cycle,case_root,prelaunch passed to launch()
+    @param stids the real storm IDs
+    @param moreopts the moreopt argument to launch() for each storm
+    @param fakestorm_conf the fake storm's HAFSLauncher, which must
+      already have been launched
+    @param storm_nums the global storm number of each storm
+    @param finish optional: a function to call on each storm's conf
+      after the sanity check, such as one that writes the holdvars.
+      It must be a module-level function, so it can be sent to a
+      worker process.
+    @param workers the number of processes.  Default: [launch] workers
+      from the fake storm conf, or if that is 0, one per storm up to
+      the number of processors.  With 1, the storms are launched one
+      after another in this process.
+    @param logger a logging.Logger for the timing report
+    @returns a list of the storms' HAFSLauncher objects, in the order
+      of stids.  If workers were used, each is reloaded by load()."""
+    if logger is None: logger=fakestorm_conf.log()
+    if workers is None:
+        workers=fakestorm_conf.getint('launch','workers',0)
+    workers=max(1,min(len(stids),int(workers or os.cpu_count() or 1)))
+    start=time.time()
+    confs=list()
+    if workers<=1:
+        for i,stid in enumerate(stids):
+            t0=time.time()
+            conf=launch(file_list,cycle,stid,moreopts[i],case_root,
+                        prelaunch=prelaunch,fakestorm_conf=fakestorm_conf,
+                        storm_num=storm_nums[i])
+            conf.sanity_check()
+            if finish is not None:
+                finish(conf)
+            logger.info('Multistorm %s: storm%d launched in %.1f seconds'
+                        %(stid,storm_nums[i],time.time()-t0))
+            confs.append(conf)
+    else:
+        fakestorm_confloc=fakestorm_conf.getloc('CONFhafs')
+        logger.info('Multistorm: launching %d storms with %d processes'
+                    %(len(stids),workers))
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) \
+                as pool:
+            futures=[ pool.submit(_launch_storm,file_list,cycle,stid,
+                                  moreopts[i],case_root,fakestorm_confloc,
+                                  storm_nums[i],prelaunch,finish)
+                      for (i,stid) in enumerate(stids) ]
+            results=[ future.result() for future in futures ]
+        for (i,stid) in enumerate(stids):
+            (confloc,seconds)=results[i]
+            logger.info('Multistorm %s: storm%d launched in %.1f seconds'
+                        %(stid,storm_nums[i],seconds))
+            confs.append(load(confloc))
+    logger.info('Multistorm: launched %d storms in %.1f seconds'
+                %(len(stids),time.time()-start))
+    return confs
+
 class HAFSLauncher(HAFSConfig):
     """!A replacement for the hafs.config.HAFSConfig used throughout
     the HAFS system.  You should never need to instantiate one of
@@ -674,6 +764,7 @@ class HAFSLauncher(HAFSConfig):
             cenlo=self.getfloat('config','domlon')
             logger.info('Domain center is already set to lat=%g lon=%g'
                         %(cenla,cenlo))
+            self.set('config','domain_center_from_storm','no')
             return
         parent_domain_center=self.getstr('config','parent_domain_center','storm')
         if parent_domain_center=='storm':
@@ -683,6 +774,7 @@ class HAFSLauncher(HAFSConfig):
 
         self.set('config','domlat',cenla)
         self.set('config','domlon',cenlo)
+        self.set('config','domain_center_from_storm','yes')
         logger.info('Decided on domain center lat=%g lon=%g'%(cenla,cenlo))
 
     def choose_vitbase(self,storm_num=None):
@@ -1011,21 +1103,10 @@ class HAFSLauncher(HAFSConfig):
         if stnum>=50:
             logger.info('%s: Not renumbering invests because %d>=50.'
                         %(STID,stnum))
-            unrenumbered=revital.copy()
-            unrenumbered.discard_except(keep_condition)
-            unrenumbered.clean_up_vitals()
-            renumbered=unrenumbered
         else:
             logger.info('%s: Renumber and unrenumber invests.'%(STID,))
-            unrenumbered=revital.copy()
-            unrenumbered.renumber(unrenumber=True)
-            unrenumbered.discard_except(keep_condition)
-            unrenumbered.clean_up_vitals()
-            renumbered=unrenumbered.copy()
-            renumbered.swap_numbers()
-            renumbered.clean_up_vitals()
-            unrenumbered.mirror_renumbered_vitals()
-            unrenumbered.clean_up_vitals()
+        (renumbered,unrenumbered)=revital.storm_views(
+            keep_condition,renumber=stnum<50)
 
         # Find the current cycle's vitals:
         for vit in renumbered.each(STID):
@@ -1482,51 +1563,61 @@ class HAFSLauncher(HAFSConfig):
             WORKhafs=self.getstr('dir','WORKhafs','work')
             EXEChafs=self.getstr('dir','EXEChafs','exec')
 
-            # Run make_hgrid.x or regional_esg_grid.x to generate the parent tile grid file
-            with NamedDir(os.path.join(WORKhafs, 'launch/make_hgrid'),logger=logger,rm_first=True) as d:
-                if gtype=='nest':
-                    executable=os.path.join(EXEChafs, 'hafs_utils_make_hgrid.x')
-                    cmd=exe(executable)['--grid_type gnomonic_ed --nlon', 2*int(cres[1:]), '--grid_name', cres+'_grid',
-                                          '--do_schmidt --stretch_factor', stretch_fac,
-                                          '--target_lon', target_lon, '--target_lat', target_lat]
-                    checkrun(cmd,logger=logger)
-                    deliver_file(cres+'_grid.tile6.nc', './parent_grid.tile.halo0.nc', keep=True, logger=logger)
-                elif gtype=='regional' and nest_grids > 1 and not regional_esg=='yes':
-                    executable=os.path.join(EXEChafs, 'hafs_utils_make_hgrid.x')
-                    cmd=exe(executable)['--grid_type gnomonic_ed --nlon', 2*int(cres[1:]), '--grid_name', cres+'_grid',
-                                          '--do_schmidt --stretch_factor', stretch_fac,
-                                          '--target_lon', target_lon, '--target_lat', target_lat,
-                                          '--nest_grids', 1, '--parent_tile', parent_tile[0],
-                                          '--istart_nest', istart_nest[0], '--jstart_nest', jstart_nest[0],
-                                          '--iend_nest', iend_nest[0], '--jend_nest', jend_nest[0],
-                                          '--halo 0 --great_circle_algorithm']
-                    checkrun(cmd,logger=logger)
-                    deliver_file(cres+'_grid.tile7.nc', './parent_grid.tile.halo0.nc', keep=True, logger=logger)
-                elif gtype=='regional' and nest_grids > 1 and regional_esg=='yes':
-                    executable=os.path.join(EXEChafs, 'hafs_utils_regional_esg_grid.x')
-                    # generate regional esg parent grid
-                    lx=int(idim_nest[0])+halop2*2
-                    ly=int(jdim_nest[0])+halop2*2
+            # Describe the parent tile grid, and how to generate it
+            if gtype=='nest':
+                executable=os.path.join(EXEChafs, 'hafs_utils_make_hgrid.x')
+                args=['--grid_type gnomonic_ed --nlon', 2*int(cres[1:]), '--grid_name', cres+'_grid',
+                      '--do_schmidt --stretch_factor', stretch_fac,
+                      '--target_lon', target_lon, '--target_lat', target_lat]
+                gridfile=cres+'_grid.tile6.nc'
+            elif gtype=='regional' and nest_grids > 1 and not regional_esg=='yes':
+                executable=os.path.join(EXEChafs, 'hafs_utils_make_hgrid.x')
+                args=['--grid_type gnomonic_ed --nlon', 2*int(cres[1:]), '--grid_name', cres+'_grid',
+                      '--do_schmidt --stretch_factor', stretch_fac,
+                      '--target_lon', target_lon, '--target_lat', target_lat,
+                      '--nest_grids', 1, '--parent_tile', parent_tile[0],
+                      '--istart_nest', istart_nest[0], '--jstart_nest', jstart_nest[0],
+                      '--iend_nest', iend_nest[0], '--jend_nest', jend_nest[0],
+                      '--halo 0 --great_circle_algorithm']
+                gridfile=cres+'_grid.tile7.nc'
+            elif gtype=='regional' and nest_grids > 1 and regional_esg=='yes':
+                executable=os.path.join(EXEChafs, 'hafs_utils_regional_esg_grid.x')
+                # generate regional esg parent grid
+                lx=int(idim_nest[0])+halop2*2
+                ly=int(jdim_nest[0])+halop2*2
+                namelist=(f'&regional_grid_nml\n'
+                          f'  plon = {target_lon}\n'
+                          f'  plat = {target_lat}\n'
+                          f'  pazi = {pazi}\n'
+                          f'  delx = {delx_nest[0]}\n'
+                          f'  dely = {dely_nest[0]}\n'
+                          f'  lx = {-lx}\n'
+                          f'  ly = {-ly}\n'
+                          f'/')
+                # Subset into a halo0 grid using nco ncks an alternative way is to use hafs_shave.x
+                args=['-O',
+                      '-d', f'nx,{2*halop2},{2*(lx-halop2)-1}',
+                      '-d', f'ny,{2*halop2},{2*(ly-halop2)-1}',
+                      '-d', f'nxp,{2*halop2},{2*(lx-halop2)}',
+                      '-d', f'nyp,{2*halop2},{2*(ly-halop2)}',
+                      './regional_grid.nc', './parent_grid.tile.halo0.nc']
+                gridfile=None
+            else:
+                executable=None
+                logger.warning('Unsupported gtype.')
+
+            def generate_grid():
+                # Run make_hgrid.x or regional_esg_grid.x to generate the parent tile grid file
+                if executable is None:
+                    pass
+                elif gridfile is not None:
+                    checkrun(exe(executable)[args],logger=logger)
+                    deliver_file(gridfile, './parent_grid.tile.halo0.nc', keep=True, logger=logger)
+                else:
                     with open('./regional_grid.nml','w') as f:
-                        f.write(f'&regional_grid_nml\n')
-                        f.write(f'  plon = {target_lon}\n')
-                        f.write(f'  plat = {target_lat}\n')
-                        f.write(f'  pazi = {pazi}\n')
-                        f.write(f'  delx = {delx_nest[0]}\n')
-                        f.write(f'  dely = {dely_nest[0]}\n')
-                        f.write(f'  lx = {-lx}\n')
-                        f.write(f'  ly = {-ly}\n')
-                        f.write(f'/')
-                    cmd=exe(executable)
-                    checkrun(cmd,logger=logger)
-                    # Subset into a halo0 grid using nco ncks an alternative way is to use hafs_shave.x
-                    cmd=exe('ncks')['-O',
-                                    '-d', f'nx,{2*halop2},{2*(lx-halop2)-1}',
-                                    '-d', f'ny,{2*halop2},{2*(ly-halop2)-1}',
-                                    '-d', f'nxp,{2*halop2},{2*(lx-halop2)}',
-                                    '-d', f'nyp,{2*halop2},{2*(ly-halop2)}',
-                                    './regional_grid.nc', './parent_grid.tile.halo0.nc']
-                    checkrun(cmd,logger=logger)
+                        f.write(namelist)
+                    checkrun(exe(executable),logger=logger)
+                    checkrun(exe('ncks')[args],logger=logger)
                     # An alternative way is to use hafs_shave.x to shave the grid into halo0
                    #with open('./input.shave.grid.halo0','w') as f:
                    #    f.write(' '.join(map(str, [idim_nest[0], jdim_nest[0],halo0,
@@ -1534,8 +1625,37 @@ class HAFSLauncher(HAFSConfig):
                    #executable=os.path.join(EXEChafs, 'hafs_utils_shave.x')
                    #cmd=exe(executable)<'./input.shave.grid.halo0'
                    #checkrun(cmd,logger=logger)
+                # xarray is slow to import, and only needed here.
+                import xarray as xr
+                with xr.open_dataset('./parent_grid.tile.halo0.nc') as grid:
+                    return (grid.x[::2,::2].values,grid.y[::2,::2].values)
+
+            with NamedDir(os.path.join(WORKhafs, 'launch/make_hgrid'),logger=logger,rm_first=True) as d:
+                # The compute grid (not the super grid) lon/lat only
+                # depend on the generator and its arguments, so they
+                # can be reused by later launches.  That only happens
+                # when the domain center is fixed: a storm-centered
+                # grid is different every cycle.
+                grid_cache=self.getstr('dir','grid_cache','')
+                if grid_cache and self.getbool(
+                        'config','domain_center_from_storm',False):
+                    logger.info('Domain center follows the storm; not '
+                                'using the grid cache.')
+                    grid_cache=''
+                if grid_cache and executable is not None:
+                    cache=hafs.gridcache.GridCache(grid_cache,logger=logger)
+                    key=hafs.gridcache.cache_key(
+                        [gtype,args,namelist if gridfile is None else None],
+                        [executable])
+                    with cache.lock(key):
+                        lonlat=cache.get(key)
+                        if lonlat is None:
+                            lonlat=cache.put(key,*generate_grid())
+                    cache.prune(self.getint('dir','grid_cache_max_age',
+                                            1209600))
                 else:
-                    logger.warning('Unsupported gtype.')
+                    lonlat=generate_grid()
+                (lon,lat)=lonlat
 
                 # Get storm center lon/lat from tmpvit
                 tmpvit=os.path.join(WORKhafs,'tmpvit')
@@ -1544,9 +1664,10 @@ class HAFSLauncher(HAFSConfig):
                     syndat=tcutil.storminfo.parse_tcvitals(f,logger,raise_all=True)
                     syndat=syndat[0]
                 # Search the nearest index location to the storm center on the compute grid (not on the super grid)
-                grid=xr.open_dataset('./parent_grid.tile.halo0.nc')
-                dist=np.sqrt(np.mod((grid.x[::2,::2]-syndat.lon),360.)**2 + (grid.y[::2,::2]-syndat.lat)**2)
-                # Note: xloc is dim2, yloc is dim1 in the grid xarray
+                # numpy is slow to import, and only needed here.
+                import numpy as np
+                dist=np.sqrt(np.mod((lon-syndat.lon),360.)**2 + (lat-syndat.lat)**2)
+                # Note: xloc is dim2, yloc is dim1 in the grid
                 yloc,xloc=np.where(dist==dist.min())
                 logger.info(f'Storm center at compute grid: xloc={xloc}, yloc={yloc}')
                 icenter=2*xloc[0]
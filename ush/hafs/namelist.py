@@ -20,9 +20,16 @@ namelist files from HAFSConfig sections:
 In addition, this module provides two functions to_fortnml and
 from_fortnml to convert between in-memory Python objects and strings
 suitable for pasting in a Fortran namelist to achieve the same value
-in Fortran."""
+in Fortran.
 
-import collections,re,fractions,datetime,configparser,io,logging
+Conversions with to_fortnml and from_fortnml are memoized, templates
+given to NamelistInserter are tokenized only once, and the sections of
+a Conf2Namelist are shared between copies until one copy modifies
+them.  That makes it cheap to derive many nearly identical namelists
+(per domain, lead time or ensemble member) from one base namelist.
+Set the module variable "caching" to False to turn this off."""
+
+import collections,re,fractions,datetime,configparser,io,logging,functools
 import tcutil.numerics
 
 from configparser import NoOptionError,NoSectionError
@@ -37,6 +44,69 @@ __all__=['to_fortnml','from_fortnml','Conf2Namelist','NamelistInserter']
 # used for efficiency in a few places that need an empty dict()
 emptydict=dict()
 
+##@var caching
+# If False, to_fortnml, from_fortnml, NamelistInserter.parse and
+# Conf2Namelist.make_namelist do not use their caches.
+caching=True
+
+##@var cache_size
+# Maximum number of entries in each of the module's caches.  A cache
+# that grows beyond this is emptied.
+cache_size=20000
+
+##@var _fortnml_cache
+# Memoized results of to_fortnml, keyed by _fortnml_key()
+_fortnml_cache=dict()
+
+##@var _from_fortnml_cache
+# Memoized results of from_fortnml, keyed by the input string
+_from_fortnml_cache=dict()
+
+##@var _section_cache
+# Memoized text of Conf2Namelist sections, keyed by the section name,
+# sorter and the _fortnml_key() of each value.
+_section_cache=dict()
+
+def cmp(a,b):
+    """!The Python 2 cmp function, the default sorter for namelist
+    sections and variables.
+    @param a,b the objects to compare
+    @returns -1, 0 or 1 if a is less than, equal to, or greater than b"""
+    return (a>b)-(a<b)
+
+def _fortnml_key(py):
+    """!Internal function; do not call directly.  Returns a hashable
+    key that identifies the value and type of a namelist value, or
+    None if the value cannot be memoized.  Floats and datetimes are
+    keyed by their repr, since equal values (0.0 and -0.0, or times in
+    different time zones) can have different namelist text.
+    @param py the value"""
+    def scalar(x):
+        t=type(x)
+        if t is float or t is datetime.datetime: return (t,repr(x))
+        return (t,x)
+    t=type(py)
+    if t is list or t is tuple:
+        key=(t,tuple([ scalar(x) for x in py ]))
+    else:
+        key=scalar(py)
+    try:
+        hash(key)
+    except TypeError:
+        return None
+    return key
+
+def _remember(cache,key,value):
+    """!Internal function; do not call directly.  Stores a value in
+    one of the module's caches, emptying it first if it is full.
+    @param cache the cache dict
+    @param key,value the key and value to store
+    @returns value"""
+    if len(cache)>=cache_size:
+        cache.clear()
+    cache[key]=value
+    return value
+
 class NamelistRecursion(Exception):
     """!used to indicate namelist recursion
 
@@ -70,7 +140,15 @@ def to_fortnml(py,exc_hint=''):
     @param py       the object to convert
     @param exc_hint prepended to exception messages when exceptions are
                     raised.  Should contain file and line information."""
+    key=_fortnml_key(py) if caching else None
+    if key is not None:
+        try:
+            return _fortnml_cache[key]
+        except KeyError: pass
     try:
+        if key is not None:
+            return _remember(_fortnml_cache,key,
+                             __to_fortnml_impl(py,exc_hint=exc_hint))
         return __to_fortnml_impl(py,exc_hint=exc_hint)
     except NamelistRecursion:
         s=repr(py)
@@ -130,6 +208,19 @@ def from_fortnml(py):
     as a list of lists).
     @param py the string to convert
     @return the Python object"""
+    if caching and isinstance(py,str):
+        try:
+            value=_from_fortnml_cache[py]
+        except KeyError:
+            value=_remember(_from_fortnml_cache,py,_from_fortnml_impl(py))
+        return list(value) if isinstance(value,list) else value
+    return _from_fortnml_impl(py)
+
+def _from_fortnml_impl(py):
+    """!Internal function; do not call directly.  This is the
+    implementation of from_fortnml, without the cache.
+    @param py the string to convert
+    @return the Python object"""
     out=[]
     islist=False
     for match in fortnml_parse.finditer(py):
@@ -221,11 +312,11 @@ class NamelistInserter(object):
 
     ## @var nlfalse
     #  regular expression that matches false values
-    nlfalse=re.compile('\A(?i)(?:f.*|.false.|n|no|0*[1-9][0-9]*)\Z')
+    nlfalse=re.compile('(?i)\A(?:f.*|.false.|n|no|0*[1-9][0-9]*)\Z')
 
     ## @var nltrue
     #  regular expression that matches true values
-    nltrue=re.compile('\A(?i)(?:t.*|.true.|y|yes|0)\Z')
+    nltrue=re.compile('(?i)\A(?:t.*|.true.|y|yes|0)\Z')
 
     ## @var comment
     #  regular expression that matches comments
@@ -247,6 +338,90 @@ class NamelistInserter(object):
     ##@var _section
     #  the section to read, sent to __init__(conf,section)
 
+    ##@var _templates
+    # Cache of templates tokenized by compile(), keyed by their lines.
+    _templates=dict()
+
+    @staticmethod
+    def compile(line_iterable):
+        """!Tokenizes a namelist template.
+
+        Splits the template into the literal text to copy to the
+        output and the @<...@> insertions.  The result is cached, so
+        later calls with the same lines do not tokenize them again.
+        Syntax errors are returned as insertions with an error message
+        so that parse() can report them.
+
+        @param line_iterable an iterator over the lines of the template
+        @returns a list whose elements are either strings of literal
+          text or tuples (iline,typ,var,sub,error) of an insertion: the
+          line number, output type, variable, subscript (or None) and
+          syntax error message (or None)"""
+        lines=tuple(line_iterable)
+        if caching:
+            try:
+                return NamelistInserter._templates[lines]
+            except KeyError: pass
+        items=list()
+        literal=list()
+        def insertion(item):
+            if literal:
+                items.append(''.join(literal))
+                del literal[:]
+            items.append(item)
+        iline=0
+        for line in lines:
+            line=line.rstrip()
+            iline+=1
+            linepart=line
+            m=NamelistInserter.comment.match(linepart)
+            comment=''
+            if m:
+                code=m.group('code')
+                comment=m.group('comment')
+                if not code:
+                    literal.append(line+'\n')
+                    continue
+                linepart=code
+            while len(linepart)>0:
+                m=NamelistInserter.find_ltgt.match(linepart)
+                if m:
+                    pre=m.group('pre')
+                    typ=m.group('typ')
+                    var=m.group('var')
+                    sub=m.group('sub')
+                    rest=m.group('rest')
+                    if rest:
+                        assert(linepart!=rest)
+                        linepart=rest
+                    else:
+                        linepart=''
+                    if pre: literal.append(pre)
+                    if typ is None: typ='*'
+                    error=None
+                    if not typ:    error='no output type specified'
+                    elif not var:  error='no variable specified'
+                    elif len(typ)!=1:
+                        error='output type must be one of: bdfilsu, not %s'%(
+                            typ,)
+                    elif typ not in 'bdfilrsuBDFILRSU*':
+                        error='invalid type %s specified: only bdfilsu are '\
+                            'allowed'%(typ,)
+                    insertion((iline,typ,var,sub,error))
+                else:
+                    # No more <typ:val> on this line.  Write the rest.
+                    literal.append(linepart)
+                    linepart=''
+            if comment:
+                literal.append(comment.rstrip()+'\n')
+            else:
+                literal.append('\n')
+        if literal:
+            items.append(''.join(literal))
+        if caching:
+            _remember(NamelistInserter._templates,lines,items)
+        return items
+
     def parse(self,line_iterable,logger=None,source='<internal>',
               raise_all=True,atime=None,ftime=None,**kwargs):
         """!Generates the namelist, returning it as a string.
@@ -282,133 +457,96 @@ class NamelistInserter(object):
         def synerr(what):
             if logger is not None:
                 logger.warning('%s:%d: syntax error: %s'%(source,iline,what))
-        for line in line_iterable:
-            line=line.rstrip()
-            iline+=1
-            linepart=line
-            m=NamelistInserter.comment.match(linepart)
-            comment=''
-            if m:
-                code=m.group('code')
-                comment=m.group('comment')
-                if not code:
-                    out.write(line+'\n')
+        for item in NamelistInserter.compile(line_iterable):
+            if isinstance(item,str):
+                out.write(item)
+                continue
+            (iline,typ,var,sub,error)=item
+            if error:
+                synerr(error)
+                continue
+            try:
+                if var in kwargs:
+                    val=kwargs[var]
+                elif atime is not None:
+                    val=conf.timestrinterp(
+                        section,'{'+var+'}',ftime=ftime,
+                        atime=atime,**kwargs)
+                else:
+                    val=conf.strinterp(
+                        section,'{'+var+'}',**kwargs)
+            except(KeyError,TypeError,ValueError,NoOptionError,
+                   NoSectionError) as e:
+                if logger is not None:
+                    logger.warning(
+                        '%s:%d: cannot find variable %s'
+                        %(source,iline,var))
+                if raise_all: raise
+                continue
+            if sub:
+                try:
+                    newval=val[sub]
+                    val=newval
+                except (TypeError,KeyError,ValueError,HAFSError) as e:
+                    if logger is not None:
+                        logger.warning('%s:%d: %s[%s]: %s'%(
+                                source,iline,var,sub,str(e)),
+                                       exc_info=True)
+                    if raise_all: raise
                     continue
-                linepart=code
-            while len(linepart)>0:
-                m=NamelistInserter.find_ltgt.match(linepart)
-                if m:
-                    pre=m.group('pre')
-                    typ=m.group('typ')
-                    var=m.group('var')
-                    sub=m.group('sub')
-                    rest=m.group('rest')
-                    if rest:
-                        assert(linepart!=rest)
-                        linepart=rest
+            try:
+                if typ in 'rRfF':   typval=float(val)
+                elif typ in 'iI': typval=int(val)
+                elif typ in 'bBlL':
+                    if isinstance(val,bool):
+                        typval=val
+                    elif isinstance(val,str):
+                        if NamelistInserter.nlfalse.match(val):
+                            typval=False
+                        elif NamelistInserter.nltrue.match(val):
+                            typval=True
+                        else:
+                            raise ValueError(
+                                '%s is not a valid logical'
+                                %(repr(val),))
                     else:
-                        linepart=''
-                    if pre: out.write(pre)
-                    if typ is None: typ='*'
-                    if not typ:    synerr('no output type specified')
-                    elif not var:  synerr('no variable specified')
-                    elif len(typ)!=1:
-                        synerr('output type must be one of: bdfilsu, not %s'
-                               %(typ,))
-                    elif typ not in 'bdfilrsuBDFILRSU*':
-                        synerr('invalid type %s specified: only bdfilsu are '
-                               'allowed'%(typ,))
+                        typval=bool(val)
+                elif typ in 'dD':
+                    dval=from_fortnml(val)
+                    if atime is not None:
+                        typval=to_datetime_rel(dval,atime)
                     else:
-                        try:
-                            if var in kwargs:
-                                val=kwargs[var]
-                            elif atime is not None:
-                                val=conf.timestrinterp(
-                                    section,'{'+var+'}',ftime=ftime,
-                                    atime=atime,**kwargs)
-                            else:
-                                val=conf.strinterp(
-                                    section,'{'+var+'}',**kwargs)
-                        except(KeyError,TypeError,ValueError,NoOptionError,
-                               NoSectionError) as e:
-                            if logger is not None:
-                                logger.warning(
-                                    '%s:%d: cannot find variable %s'
-                                    %(source,iline,var))
-                            if raise_all: raise
-                            continue
-                        if sub:
-                            try:
-                                newval=val[sub]
-                                val=newval
-                            except (TypeError,KeyError,ValueError,HAFSError) as e:
-                                if logger is not None:
-                                    logger.warning('%s:%d: %s[%s]: %s'%(
-                                            source,iline,var,sub,str(e)),
-                                                   exc_info=True)
-                                if raise_all: raise
-                                continue
-                        try:
-                            if typ in 'rRfF':   typval=float(val)
-                            elif typ in 'iI': typval=int(val)
-                            elif typ in 'bBlL':
-                                if isinstance(val,bool):
-                                    typval=val
-                                elif isinstance(val,str):
-                                    if NamelistInserter.nlfalse.match(val):
-                                        typval=False
-                                    elif NamelistInserter.nltrue.match(val):
-                                        typval=True
-                                    else:
-                                        raise ValueError(
-                                            '%s is not a valid logical'
-                                            %(repr(val),))
-                                else:
-                                    typval=bool(val)
-                            elif typ in 'dD':
-                                dval=from_fortnml(val)
-                                if atime is not None:
-                                    typval=to_datetime_rel(dval,atime)
-                                else:
-                                    typval=to_datetime(dval)
-                            elif typ=='*':
-                                typval=from_fortnml(val)
-                            else: # types u and s
-                                typval=str(val)
-                        except (TypeError,KeyError,ValueError) as e:
-                            if logger is not None:
-                                logger.warning(
-                                    '%s:%d: cannot convert %s to type=%s: %s'
-                                    %(source,iline,repr(val),typ,str(e)),
-                                    exc_info=True)
-                            if raise_all: raise
-                            continue
-                        if sub: fromthis='%s[%s]'%(var,sub)
-                        else: fromthis=var
-                        try:
-                            if typ in 'bdfilrsBDFILRS*':
-                                writeme=to_fortnml(
-                                    typval,exc_hint=fromthis+':')
-                            else: # type u
-                                writeme=str(typval)
-                        except (TypeError,KeyError,ValueError) as e:
-                            if logger is not None:
-                                logger.warning(
-                                    '%s:%d: <%s:%s>=%s: error converting to '
-                                    'string: %s'
-                                    %(source,iline,typ,fromthis,repr(typval),
-                                      str(e)),exc_info=True)
-                            if raise_all: raise
-                            continue
-                        out.write(writeme)
-                else:
-                    # No more <typ:val> on this line.  Write the rest.
-                    out.write(linepart)
-                    linepart=''
-            if comment:
-                out.write(comment.rstrip()+'\n')
-            else:
-                out.write('\n')
+                        typval=to_datetime(dval)
+                elif typ=='*':
+                    typval=from_fortnml(val)
+                else: # types u and s
+                    typval=str(val)
+            except (TypeError,KeyError,ValueError) as e:
+                if logger is not None:
+                    logger.warning(
+                        '%s:%d: cannot convert %s to type=%s: %s'
+                        %(source,iline,repr(val),typ,str(e)),
+                        exc_info=True)
+                if raise_all: raise
+                continue
+            if sub: fromthis='%s[%s]'%(var,sub)
+            else: fromthis=var
+            try:
+                if typ in 'bdfilrsBDFILRS*':
+                    writeme=to_fortnml(
+                        typval,exc_hint=fromthis+':')
+                else: # type u
+                    writeme=str(typval)
+            except (TypeError,KeyError,ValueError) as e:
+                if logger is not None:
+                    logger.warning(
+                        '%s:%d: <%s:%s>=%s: error converting to '
+                        'string: %s'
+                        %(source,iline,typ,fromthis,repr(typval),
+                          str(e)),exc_info=True)
+                if raise_all: raise
+                continue
+            out.write(writeme)
         return out.getvalue()
 
 class Conf2Namelist(object):
@@ -483,12 +621,12 @@ physics.bl_pbl_physics=3'''
 
     ##@var nlfalse
     # detects false Fortran logical constants
-    nlfalse=re.compile('\A(?i)(?:f.*|.false.)\Z')
+    nlfalse=re.compile('(?i)\A(?:f.*|.false.)\Z')
     """A regular expression from re.compile, to detect false Fortran logical values."""
 
     ##@var nltrue
     # detects true Fortran logical constants
-    nltrue=re.compile('\A(?i)(?:t.*|.true.)\Z')
+    nltrue=re.compile('(?i)\A(?:t.*|.true.)\Z')
     """A regular expression from re.compile, to detect true Fortran logical values."""
 
     ##@var TRAIT
@@ -516,6 +654,10 @@ physics.bl_pbl_physics=3'''
     ##@var nl
     # A dict of dicts used to store namelist information
 
+    ##@var _shared
+    # Names of the sections in nl whose dicts may be shared with
+    # another Conf2Namelist.  They are copied before being modified.
+
     def __init__(self,conf=None,section=None,section_sorter=None,
                  var_sorters=None,logger=None,nl=None,morevars=None):
         """!Conf2Namelist constructor
@@ -537,6 +679,7 @@ physics.bl_pbl_physics=3'''
             expanding strings This is simply passed to conf.items.
             See the HAFSConfig documentation for details."""
         if morevars is None: morevars=emptydict
+        self._shared=set()
         self.section_sorter=None
         self.var_sorters=var_sorters
         if self.section_sorter is None:
@@ -586,6 +729,17 @@ physics.bl_pbl_physics=3'''
         for section in args:
             self.nl[str(section).lower()]
         return self
+    def _writable(self,section):
+        """!Internal function; do not call directly.  Returns the dict
+        for the given namelist, copying it first if it is shared with
+        another Conf2Namelist.
+        @param section the lower-case namelist name"""
+        sd=self.nl[section]
+        if section in self._shared:
+            sd=sd.copy()
+            self.nl[section]=sd
+            self._shared.discard(section)
+        return sd
     def nl_set(self,section,var,data):
         """!Sets a variable in a namelist
 
@@ -602,22 +756,23 @@ physics.bl_pbl_physics=3'''
                  isinstance(data,fractions.Fraction) ):
             raise TypeError('%s: invalid type for namelist (value=%s)'
                             %(data.__class__.__name__,repr(data)))
-        self.nl[str(section).lower()][str(var).lower()]=data
+        self._writable(str(section).lower())[str(var).lower()]=data
     def nl_del(self,section,var):
         """!Removes a variable from a namelist.
 
         Removes a variable from a namelist
         @param section the namelist
         @param var the variable to delete"""
-        try:
-            del self.nl[str(section).lower()][var]
-        except KeyError: pass
+        s=str(section).lower()
+        if s in self.nl and var in self.nl[s]:
+            del self._writable(s)[var]
     # Multistorm - jtf
     def nl_del_sect(self,section):
         """Removes a namelist section from the namelist"""
         try:
             del self.nl[str(section).lower()]
         except KeyError: pass
+        self._shared.discard(str(section).lower())
     def nl_have(self,section,var):
         """!does this namelist have this variable?
 
@@ -756,8 +911,10 @@ physics.bl_pbl_physics=3'''
         When copying into a target Conf2Namelist, only values that are
         not already in that namelist will be copied.  The copy has its
         own data structures, so modifying the copy will not modify the
-        original.  Optionally, you can copy only a subset of this
-        object:
+        original.  A full copy (no subsets and no target) shares the
+        namelist dicts with this object until either one modifies
+        them, so it costs little more than the number of namelists.
+        Optionally, you can copy only a subset of this object:
 
         @param section_subset = a callable object that returns True
           for each section to be kept
@@ -769,14 +926,21 @@ physics.bl_pbl_physics=3'''
         into this one."""
         if other is None:
             other=Conf2Namelist(None,None)
+            if section_subset is None and var_subset is None and caching:
+                for s,sd in self.nl.items():
+                    other.nl[s]=sd
+                self._shared.update(self.nl.keys())
+                other._shared.update(self.nl.keys())
+                return other
         for s,sd in self.nl.items():
             if section_subset is None or section_subset(s):
                 outdict=other.nl[s]
                 for var,value in sd.items():
                     if var_subset is None or var_subset(s,var):
-                        try:
-                            junk=outdict[var]
-                        except KeyError:
+                        if var not in outdict:
+                            # The target's dict may still be shared
+                            # with the namelist it was copied from.
+                            outdict=other._writable(s)
                             outdict[var]=value
         return other
     def remove_traits(self):
@@ -785,6 +949,7 @@ physics.bl_pbl_physics=3'''
         @return self"""
         if Conf2Namelist.TRAIT in self.nl:
             del(self.nl[Conf2Namelist.TRAIT])
+            self._shared.discard(Conf2Namelist.TRAIT)
         return self
     def __str__(self):
         """!synonym for make_namelist()
@@ -807,41 +972,75 @@ physics.bl_pbl_physics=3'''
           absent, self.namelist_sorter(sectionname) is used
         @param morevars a dict of additional variables which override
           values set in self.nl"""
-        out=''
+        out=list()
         if section_sorter is None:
             section_sorter=self.section_sorter
 
-        sd=None
-        def getvar(var):
-            if morevars is not None and var in morevars:
-                return morevars[var]
-            else:
-                return sd[var]
-
-        for sec in sorted(iter(self.nl.keys()),section_sorter):
+        for sec in sorted(iter(self.nl.keys()),
+                          key=functools.cmp_to_key(section_sorter)):
             sd=self.nl[sec]
-            if sec==Conf2Namelist.TRAIT:
-                out+='! Traits:\n'
-            else:
-                out+='&%s\n'%(sec,)
+            sorter=None
             if sd:
-                sorter=None
                 if var_sorters is not None and sec in var_sorters:
                     sorter=var_sorters[sec]
                 if sorter is None:
                     sorter=self.namelist_sorter(sec)
-                if sec==Conf2Namelist.TRAIT:
-                    out+="\n".join('!  %s = %s,'%(var,to_fortnml(getvar(var),
-                        exc_hint='%s%%%s='%(str(sec),str(var)))) \
-                            for var in sorted(list(sd.keys()),sorter))
-                else:
-                    out+="\n".join('  %s = %s,'%(var,to_fortnml(getvar(var),
-                        exc_hint='%s%%%s='%(str(sec),str(var)))) \
-                            for var in sorted(list(sd.keys()),sorter))
+            out.append(self._make_section(sec,sd,sorter,morevars))
+        return ''.join(out)
+    def _make_section(self,sec,sd,sorter,morevars):
+        """!Internal function; do not call directly.  Generates the
+        text of one namelist for make_namelist().  The text is
+        memoized by the namelist name, sorter, and the names, types
+        and values of its variables, so an unchanged namelist is not
+        sorted or converted again.
+        @param sec the namelist name
+        @param sd the dict of variables in that namelist
+        @param sorter the cmp-like function to sort the variables
+        @param morevars a dict of values that override those in sd"""
+        def getvar(var):
+            if morevars is not None and var in morevars:
+                return morevars[var]
+            else:
+                return sd[var]
+
+        key=None
+        if caching:
+            key=[sec,sorter]
+            for var in sd.keys():
+                vkey=_fortnml_key(getvar(var))
+                if vkey is None:
+                    key=None
+                    break
+                key.append((var,vkey))
+            if key is not None:
+                key=tuple(key)
+                try:
+                    return _section_cache[key]
+                except (KeyError,TypeError): pass
+
+        out=''
+        if sec==Conf2Namelist.TRAIT:
+            out+='! Traits:\n'
+        else:
+            out+='&%s\n'%(sec,)
+        if sd:
+            ordered=sorted(list(sd.keys()),key=functools.cmp_to_key(sorter))
             if sec==Conf2Namelist.TRAIT:
-                out+='\n\n'
+                out+="\n".join('!  %s = %s,'%(var,to_fortnml(getvar(var),
+                    exc_hint='%s%%%s='%(str(sec),str(var)))) \
+                        for var in ordered)
             else:
-                out+="\n/\n\n"
+                out+="\n".join('  %s = %s,'%(var,to_fortnml(getvar(var),
+                    exc_hint='%s%%%s='%(str(sec),str(var)))) \
+                        for var in ordered)
+        if sec==Conf2Namelist.TRAIT:
+            out+='\n\n'
+        else:
+            out+="\n/\n\n"
+        if key is not None:
+            try:
+                _remember(_section_cache,key,out)
+            except TypeError: pass # unhashable sorter
         return out
     def namelist_sorter(self,section):
         """!return a sorting function for the variables in a namelist
@@ -855,7 +1054,7 @@ physics.bl_pbl_physics=3'''
         if self.var_sorters is not None:
             if section in self.var_sorters:
                 return self.var_sorters[section]
-        return lambda x,y: cmp(x,y)
+        return cmp
     def set_sorters(self,section_sorter,var_sorters):
         """!sets the sorting algorithms for namelists and  variables
 
@@ -877,3 +1076,62 @@ physics.bl_pbl_physics=3'''
         self.section_sorter=cmp if section_sorter is None else section_sorter
         self.var_sorters=var_sorters
         return self
+
+def benchmark(filename,repeat=100):
+    """!Compares the time taken to derive and write many nearly
+    identical namelists with and without the caches of this module.
+    The namelist file is read into a Conf2Namelist.  Then, repeat
+    times, that is copied, one variable is changed (as for a new
+    ensemble member or lead time), and the namelist is generated.
+    Values that are not valid namelist values, such as template
+    variables, are kept as strings.  Checks that both methods produce
+    the same output.
+    @param filename the Fortran namelist file
+    @param repeat how many namelists to derive with each method
+    @returns a dict with the seconds per namelist for "cached" and
+      "uncached" and their ratio as "speedup"
+    @raise AssertionError if the outputs differ"""
+    global caching
+    import time
+    base=Conf2Namelist()
+    section=None
+    with open(filename,'rt') as f:
+        for line in f:
+            code=NamelistInserter.comment.match(line.strip()).group('code')
+            code=code.strip().rstrip(',')
+            if code.startswith('&'):
+                section=code[1:].strip()
+                base.nl_section(section)
+            elif code=='/':
+                section=None
+            elif section and '=' in code:
+                (var,value)=code.split('=',1)
+                try:
+                    value=from_fortnml(value)
+                except (NamelistValueError,NamelistRecursion):
+                    value=value.strip()
+                base.nl_set(section,var.strip(),value)
+    if not base.nl:
+        raise NamelistValueError('%s: no namelists found'%(filename,))
+    first=sorted(base.nl.keys())[0]
+    var=sorted(base.nl[first].keys())[0] if base.nl[first] else 'member'
+    results=dict()
+    outputs=dict()
+    saved=caching
+    try:
+        for (name,enable) in ( ('uncached',False), ('cached',True) ):
+            caching=enable
+            outputs[name]=list()
+            start=time.time()
+            for i in range(repeat):
+                derived=base.copy()
+                derived.nl_set(first,var,i)
+                outputs[name].append(derived.make_namelist())
+            results[name]=(time.time()-start)/repeat
+    finally:
+        caching=saved
+    if outputs['cached']!=outputs['uncached']:
+        raise AssertionError('%s: cached and uncached output differ'
+                             %(filename,))
+    results['speedup']=results['uncached']/max(results['cached'],1e-9)
+    return results
@@ -0,0 +1,255 @@
+#! /usr/bin/env python3
+
+"""!Plans and drives the fetching of the inputs of many tasks.
+
+Each hafs.hafstask.HAFSTask declares the data it needs in its
+inputiter() iterator.  An InputPlan gathers those declarations from
+every task of a cycle (and of every storm, in a multistorm run),
+removes duplicates by their destination file, and fetches them task by
+task in the order the tasks run.  The inputs of the first task are
+fetched first, and that task is marked ready as soon as its own
+required inputs are present, without waiting for inputs that only
+later tasks need.
+
+@code
+plan=hafs.prefetch.InputPlan(logger)
+plan.add(ww3init,target_dc,order=10)
+plan.add(ocninit,target_dc,order=20)
+plan.fetch(hafs.input.InputSource(conf,'input_sources',conf.cycle,
+                                  htar=htar,hsi=hsi),
+           realtime=False,readydir='/path/to/inputs_ready')
+# Later, in the ww3init job, or in a workflow file dependency:
+if plan.ready('ww3init'): ...
+@endcode
+
+With a readydir, fetch() creates an empty TASKNAME.ready file there
+for each task whose inputs are present, so workflow dependencies
+(such as a rocoto datadep) can start each job as soon as its own
+inputs arrive."""
+
+##@var __all__
+# Symbols exported by "from hafs.prefetch import *"
+__all__=['InputPlan','PlannedInput']
+
+import os, logging, tempfile
+import hafs.input
+
+class PlannedInput(object):
+    """!One destination file in an InputPlan, and the tasks that need
+    it."""
+    def __init__(self,target,request,target_dc,order):
+        """!PlannedInput constructor.
+        @param target the destination file
+        @param request the dict from the first task's inputiter() that
+          produces it
+        @param target_dc the DataCatalog that gives its destination
+        @param order the order of the first task that needs it"""
+        self.target=target
+        self.request=request
+        self.target_dc=target_dc
+        self.order=order
+        self.optional=bool(request.get('optional',False))
+        self.tasks=list()
+
+    ##@var target
+    # The destination file
+
+    ##@var request
+    # The inputiter() dict sent to hafs.input.InputSource.get
+
+    ##@var target_dc
+    # The hafs.input.DataCatalog that gives the destination
+
+    ##@var order
+    # The lowest order of the tasks that need this input
+
+    ##@var optional
+    # True if no task requires this input.  Each task's own inputs may
+    # still be optional for it; see InputPlan.missing()
+
+    ##@var tasks
+    # Names of the tasks that need this input
+
+    def present(self):
+        """!Is the destination file present?"""
+        return os.path.exists(self.target)
+
+class InputPlan(object):
+    """!The inputs of many tasks, without duplicates, ordered by the
+    first task that needs each one."""
+    def __init__(self,logger=None):
+        """!InputPlan constructor.
+        @param logger a logging.Logger for log messages"""
+        self._logger=logger if logger is not None \
+            else logging.getLogger('prefetch')
+        self._inputs=dict()
+        self._tasks=dict()
+        self._order=dict()
+        self._optional=dict()
+
+    ##@var _inputs
+    # Mapping from destination file to PlannedInput
+
+    ##@var _tasks
+    # Mapping from task name to the list of its destination files
+
+    ##@var _order
+    # Mapping from task name to its order
+
+    ##@var _optional
+    # Mapping from task name to the set of its optional destination files
+
+    def add_inputs(self,taskname,inputs,target_dc,order=None):
+        """!Adds the inputs of one task.
+        @param taskname the task name, which must be unique in the plan
+        @param inputs an iterable of dicts, as from an inputiter()
+        @param target_dc the hafs.input.DataCatalog that gives the
+          destination of each input
+        @param order a number; tasks with lower numbers get their
+          inputs first.  Default: after all tasks added so far.
+        @returns the number of inputs the task needs that no earlier
+          task needed"""
+        if taskname in self._tasks:
+            raise ValueError('%s: task is already in the input plan'
+                             %(taskname,))
+        if order is None:
+            order=max(self._order.values())+1 if self._order else 0
+        self._order[taskname]=order
+        targets=list()
+        optional=set()
+        added=0
+        for d in inputs:
+            tgt=target_dc.locate(**d)
+            if tgt is None:
+                self._logger.info('%s: no destination for %s'%(
+                    taskname,hafs.input.strsrc(d)))
+                continue
+            if tgt in targets:
+                continue
+            targets.append(tgt)
+            if d.get('optional',False):
+                optional.add(tgt)
+            planned=self._inputs.get(tgt,None)
+            if planned is None:
+                planned=PlannedInput(tgt,dict(d),target_dc,order)
+                self._inputs[tgt]=planned
+                added+=1
+            elif order<planned.order:
+                planned.order=order
+            if not d.get('optional',False) and planned.optional:
+                planned.optional=False
+                planned.request.pop('optional',None)
+            planned.tasks.append(taskname)
+        self._tasks[taskname]=targets
+        self._optional[taskname]=optional
+        self._logger.info('%s: %d inputs, %d not needed by other tasks yet'
+                          %(taskname,len(targets),added))
+        return added
+
+    def add(self,task,target_dc,order=None):
+        """!Adds the inputs of an hafs.hafstask.HAFSTask.
+        @param task the task
+        @param target_dc the hafs.input.DataCatalog that gives the
+          destination of each input
+        @param order the task order; see add_inputs()"""
+        return self.add_inputs(task.taskname,task.inputiter(),target_dc,
+                               order)
+
+    def tasks(self):
+        """!Returns the task names in the order their inputs are fetched."""
+        return sorted(self._tasks.keys(),
+                      key=lambda t: (self._order[t],t))
+
+    def inputs(self,taskname=None):
+        """!Returns PlannedInput objects in fetching order.
+        @param taskname optional: only return the inputs of this task"""
+        if taskname is not None:
+            return [ self._inputs[tgt] for tgt in self._tasks[taskname] ]
+        result=list()
+        seen=set()
+        for task in self.tasks():
+            for tgt in self._tasks[task]:
+                if tgt not in seen:
+                    seen.add(tgt)
+                    result.append(self._inputs[tgt])
+        return result
+
+    def missing(self,taskname):
+        """!Returns the required inputs of a task that are not present.
+        @param taskname the task name"""
+        optional=self._optional[taskname]
+        return [ p for p in self.inputs(taskname)
+                 if p.target not in optional and not p.present() ]
+
+    def ready(self,taskname):
+        """!Are the required inputs of a task present?
+        @param taskname the task name"""
+        return not self.missing(taskname)
+
+    def readyfile(self,readydir,taskname):
+        """!Returns the path of a task's readiness file.
+        @param readydir the directory of readiness files
+        @param taskname the task name"""
+        return os.path.join(readydir,'%s.ready'%(taskname,))
+
+    def mark_ready(self,readydir,taskname):
+        """!Creates a task's readiness file, if its inputs are present.
+        @param readydir the directory of readiness files
+        @param taskname the task name
+        @returns True if the task is ready"""
+        if not self.ready(taskname):
+            return False
+        path=self.readyfile(readydir,taskname)
+        if not os.path.exists(path):
+            os.makedirs(readydir,exist_ok=True)
+            (fd,tmp)=tempfile.mkstemp(prefix='.%s.'%(taskname,),dir=readydir)
+            os.close(fd)
+            os.chmod(tmp,0o644)
+            os.rename(tmp,path)
+            self._logger.info('%s: inputs are ready'%(path,))
+        return True
+
+    def fetch(self,source,realtime=False,readydir=None,skip_existing=True):
+        """!Fetches the inputs, task by task, in task order.
+
+        Each task's inputs that were not already requested for an
+        earlier task are sent to source.get() in one batch.  After
+        each batch, every task whose required inputs are present is
+        marked ready, so a task may also become ready early if
+        another task needed the same inputs.
+        @param source the hafs.input.InputSource
+        @param realtime True for FORECAST mode, False for HISTORY mode
+        @param readydir optional: the directory of readiness files
+        @param skip_existing passed to hafs.input.InputSource.get
+        @returns a dict mapping from task name to True if the task is
+          ready or False otherwise"""
+        logger=self._logger
+        status=dict()
+        requested=set()
+        for task in self.tasks():
+            batch=[ p for p in self.inputs(task) if p.target not in requested ]
+            requested.update([ p.target for p in batch ])
+            # One InputSource.get per destination DataCatalog, keeping
+            # the order of the task's inputs.
+            groups=list()
+            for p in batch:
+                if groups and groups[-1][0] is p.target_dc:
+                    groups[-1][1].append(p.request)
+                else:
+                    groups.append((p.target_dc,[p.request]))
+            if batch:
+                logger.info('%s: fetch %d inputs'%(task,len(batch)))
+            for (target_dc,data) in groups:
+                source.get(data,target_dc,realtime=realtime,logger=logger,
+                           skip_existing=skip_existing)
+            for other in self.tasks():
+                if status.get(other,False):
+                    continue
+                if readydir is not None:
+                    status[other]=self.mark_ready(readydir,other)
+                else:
+                    status[other]=self.ready(other)
+            if not status[task]:
+                logger.warning('%s: missing inputs: %s'%(task,', '.join(
+                    [ p.target for p in self.missing(task) ])))
+        return status
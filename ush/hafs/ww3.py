@@ -4,16 +4,17 @@
 
 __all__ = ['WW3Init', 'WW3Post']
 
-import os, sys, re
+import os, sys, re, time, shutil, tarfile, threading
 import produtil.datastore, produtil.fileop, produtil.cd, produtil.run, produtil.log
 import produtil.dbnalert
 import tcutil.numerics
 import hafs.hafstask, hafs.exceptions
-import hafs.namelist, hafs.input
+import hafs.namelist, hafs.input, hafs.ww3point
 import hafs.launcher, hafs.config
 
 from produtil.datastore import FileProduct, RUNNING, COMPLETED, FAILED, UpstreamFile
-from produtil.fileop import make_symlink, deliver_file, wait_for_files
+from produtil.fileop import make_symlink, deliver_file, deliver_files, \
+    wait_for_files
 from produtil.dbnalert import DBNAlert
 from produtil.cd import NamedDir, TempDir
 from produtil.run import mpi, mpirun, run, runstr, checkrun, exe, bigexe, alias
@@ -376,11 +377,10 @@ class WW3Init(hafs.hafstask.HAFSTask):
 
     def _copy_log(self):
         logger=self.log()
-        for lf in [ 'ww3_grid.log', 'ww3_prep_wind.log', 'ww3_prep_curr.log',
-                    'ww3_strt.log', 'ww3_untarbdy.log', 'ww3_bound.log' ]:
-            comloc=self.icstr('{com}/{out_prefix}.{RUN}.{lf}.ww3',lf=lf)
-            if os.path.exists(lf):
-                deliver_file(lf,comloc,keep=True,logger=logger)
+        deliver_files([ (lf,self.icstr('{com}/{out_prefix}.{RUN}.{lf}.ww3',lf=lf))
+            for lf in [ 'ww3_grid.log', 'ww3_prep_wind.log', 'ww3_prep_curr.log',
+                        'ww3_strt.log', 'ww3_untarbdy.log', 'ww3_bound.log' ]
+            if os.path.exists(lf) ],keep=True,logger=logger)
 
     def get_ww3bdy_inputs(self):
         """!Obtains WW3 input boundary condition data, links or copies to ww3init dir.
@@ -540,7 +540,9 @@ class WW3Post(hafs.hafstask.HAFSTask):
         redirect=self.confbool('redirect',True)
         self.state=RUNNING
         # The line below makes a DBNAlert object, which can be reused for the later alerts.
-        alerter=produtil.dbnalert.DBNAlert(['MODEL','{type}','{job}','{location}'])
+        # The alerts are sent in the background while the post continues.
+        alerter=produtil.dbnalert.DBNAlert(['MODEL','{type}','{job}','{location}'],
+                                           dispatcher=produtil.dbnalert.dispatcher())
         modelrun=self.icstr('{RUN}').upper()
         try:
             with NamedDir(self.workdir,keep=True,logger=logger,rm_first=True) as d:
@@ -585,68 +587,35 @@ class WW3Post(hafs.hafstask.HAFSTask):
                 if self.pntstep>0:
                     make_symlink(self.getexe('ww3_outp'),'ww3_outp',force=True,logger=logger)
                     # Need to get information about the total number of buoys and their IDs
-                    self.make_outp_info_inp(logger)
-                    cmd=exe('./ww3_outp')
-                    cmd = cmd>='ww3_outp_info.log'
-                    checkrun(cmd,logger=logger)
-                    fname='ww3_outp_info.log'
-                    with open(fname) as f:
-                        ww3_outp_info = f.readlines()
-                    indices = [i for i, elem in enumerate(ww3_outp_info) if '----------' in elem]
-                    buoys=ww3_outp_info[indices[0]+1:indices[1]-2]
+                    buoys=self.ww3_points(logger)
+                    # Each shard is one ww3_outp run for a range of buoys,
+                    # so out_pnt.ww3 is read once per shard, not per buoy.
+                    nshards=self.confint('ww3_outp_shards',0,section='ww3post')
+                    if nshards<=0: nshards=int(os.environ.get('TOTAL_TASKS','1'))
+                    shards=hafs.ww3point.shard_points(len(buoys),nshards)
+                    logger.info('ww3_outp: %d buoys in %d shards'%(len(buoys),len(shards)))
                     # For point bullitin output
                     if ww3_outp_bull_post == 'yes':
-                        filebull=[]
-                        filecbull=[]
-                        filecsbull=[]
-                        filelog=[]
-                        commands=list()
-                        for i, buoy in enumerate(buoys):
-                            ipnt=i+1
-                            buoyid=buoy.split()[0]
-                            buoylon=buoy.split()[1]
-                            buoylat=buoy.split()[2]
-                            logger.info('ww3_outp_bull for buoy: %i, %s, %s, %s'%(ipnt,buoyid,buoylon,buoylat))
-                            with NamedDir('ww3outpbull.%s'%(buoyid,),keep=True,logger=logger) as nameddir:
-                                self.make_outp_bull_inp(ipnt,logger)
-                                make_symlink('../mod_def.ww3','mod_def.ww3',force=True,logger=logger)
-                                make_symlink('../out_pnt.ww3','out_pnt.ww3',force=True,logger=logger)
-                                make_symlink(self.getexe('ww3_outp'),'ww3_outp',force=True,logger=logger)
+                        def collect_bull(ishard,sharddir):
+                            filebull=[]
+                            filecbull=[]
+                            filecsbull=[]
+                            for ipnt in shards[ishard]:
+                                (buoyid,buoylon,buoylat)=buoys[ipnt-1]
+                                logger.info('ww3_outp_bull for buoy: %i, %s, %s, %s'%(ipnt,buoyid,buoylon,buoylat))
                                 buoybull=buoyid+'.bull'
                                 buoycbull=buoyid+'.cbull'
-                                buoycsv=buoyid+'.csv'
                                 buoycsbull=buoyid+'.csbull'
-                                buoylog='ww3_outp_bull_'+buoyid+'.log'
+                                os.rename(os.path.join(sharddir,buoybull),buoybull)
+                                os.rename(os.path.join(sharddir,buoycbull),buoycbull)
+                                os.rename(os.path.join(sharddir,buoyid+'.csv'),buoycsbull)
                                 filebull.append(buoybull)
                                 filecbull.append(buoycbull)
                                 filecsbull.append(buoycsbull)
-                                filelog.append(buoylog)
-                                cmd=('cd '+nameddir.dirname+' && '+
-                                    './ww3_outp > ../'+buoylog+' && '+
-                                    'mv '+buoybull+' ../ && '+
-                                    'mv '+buoycbull+' ../ && '+
-                                    'mv '+buoycsv+' ../'+buoycsbull+' && '+
-                                    'cd ../')
-                                commands.append(cmd)
-                        cmdfname='command.file.ww3outpbull'
-                        with open(cmdfname,'wt') as cfpf:
-                            cfpf.write('\n'.join(commands))
-                        threads=os.environ['TOTAL_TASKS']
-                        logger.info('ww3_outp_bull total threads: %s ',threads)
-                        mpiserial_path=os.environ.get('MPISERIAL','*MISSING*')
-                        if mpiserial_path=='*MISSING*':
-                            mpiserial_path=self.getexe('mpiserial')
-                        cmd2=mpirun(mpi(mpiserial_path)['-m',cmdfname],allranks=True)
-                        checkrun(cmd2)
-                        # Tar the outputs and diliver to com dir
-                        cmd=exe('tar')['-cvf', 'ww3_bull.tar'][filebull]
-                        checkrun(cmd,logger=logger)
-                        cmd=exe('tar')['-cvf', 'ww3_cbull.tar'][filecbull]
-                        checkrun(cmd,logger=logger)
-                        cmd=exe('tar')['-cvf', 'ww3_csbull.tar'][filecsbull]
-                        checkrun(cmd,logger=logger)
-                        cmd=exe('cat')[filelog] >> 'ww3_outp_bull.log'
-                        checkrun(cmd,logger=logger)
+                            return [filebull,filecbull,filecsbull]
+                        # Tar the outputs as the shards finish and diliver to com dir
+                        self._run_outp_shards('bull',shards,self.make_outp_bull_inp,collect_bull,
+                                              ['ww3_bull.tar','ww3_cbull.tar','ww3_csbull.tar'],logger)
                         (prod,localpath)=self._products['ww3outpbull']
                         prod.deliver(frominfo=localpath,location=prod.location,logger=logger,copier=None)
                         alerter(location=prod.location, type=modelrun+'_WW3TAR')
@@ -658,46 +627,20 @@ class WW3Post(hafs.hafstask.HAFSTask):
                         alerter(location=prod.location, type=modelrun+'_WW3TAR')
                     # For point spec output
                     if ww3_outp_spec_post == 'yes':
-                        fileout=[]
-                        filelog=[]
-                        commands=list()
                         ww3tstr=self.conf.cycle.strftime('%y%m%d%H')
-                        for i, buoy in enumerate(buoys):
-                            ipnt=i+1
-                            buoyid=buoy.split()[0]
-                            buoylon=buoy.split()[1]
-                            buoylat=buoy.split()[2]
-                            logger.info('ww3_outp_spec for buoy: %i, %s, %s, %s'%(ipnt,buoyid,buoylon,buoylat))
-                            with NamedDir('ww3outpspec.%s'%(buoyid,),keep=True,logger=logger) as nameddir:
-                                self.make_outp_spec_inp(ipnt,logger)
-                                make_symlink('../mod_def.ww3','mod_def.ww3',force=True,logger=logger)
-                                make_symlink('../out_pnt.ww3','out_pnt.ww3',force=True,logger=logger)
-                                make_symlink(self.getexe('ww3_outp'),'ww3_outp',force=True,logger=logger)
-                                buoyspc='ww3.'+ww3tstr+'.spc'
-                                buoyout=buoyid+'.spc'
-                                buoylog='ww3_outp_spec_'+buoyid+'.log'
-                                fileout.append(buoyout)
-                                filelog.append(buoylog)
-                                cmd=('cd '+nameddir.dirname+' && '+
-                                    './ww3_outp > ../'+buoylog+' && '+
-                                    'mv '+buoyspc+' ../'+buoyout+' && '+
-                                    'cd ../')
-                                commands.append(cmd)
-                        cmdfname='command.file.ww3outpspec'
-                        with open(cmdfname,'wt') as cfpf:
-                            cfpf.write('\n'.join(commands))
-                        threads=os.environ['TOTAL_TASKS']
-                        logger.info('ww3_outp_spec total threads: %s ',threads)
-                        mpiserial_path=os.environ.get('MPISERIAL','*MISSING*')
-                        if mpiserial_path=='*MISSING*':
-                            mpiserial_path=self.getexe('mpiserial')
-                        cmd2=mpirun(mpi(mpiserial_path)['-m',cmdfname],allranks=True)
-                        checkrun(cmd2)
-                        # Tar the outputs and deliver to com dir
-                        cmd=exe('tar')['-cvf', 'ww3_spec.tar'][fileout]
-                        checkrun(cmd,logger=logger)
-                        cmd=exe('cat')[filelog] >> 'ww3_outp_spec.log'
-                        checkrun(cmd,logger=logger)
+                        buoyspc='ww3.'+ww3tstr+'.spc'
+                        def collect_spec(ishard,sharddir):
+                            # Split the shard's spectral file into one file per buoy
+                            buoyout=list()
+                            for ipnt in shards[ishard]:
+                                (buoyid,buoylon,buoylat)=buoys[ipnt-1]
+                                logger.info('ww3_outp_spec for buoy: %i, %s, %s, %s'%(ipnt,buoyid,buoylon,buoylat))
+                                buoyout.append(buoyid+'.spc')
+                            hafs.ww3point.split_spectra(os.path.join(sharddir,buoyspc),buoyout)
+                            return [buoyout]
+                        # Tar the outputs as the shards finish and deliver to com dir
+                        self._run_outp_shards('spec',shards,self.make_outp_spec_inp,collect_spec,
+                                              ['ww3_spec.tar'],logger)
                         (prod,localpath)=self._products['ww3outpspec']
                         prod.deliver(frominfo=localpath,location=prod.location,logger=logger,copier=None)
                         alerter(location=prod.location, type=modelrun+'_WW3TAR')
@@ -727,6 +670,10 @@ class WW3Post(hafs.hafstask.HAFSTask):
                     checkrun(cmd,logger=logger)
                     (prod,localpath)=self._products['ww3ounpspec']
                     prod.deliver(frominfo=localpath,location=prod.location,logger=logger,copier=self.__copy_ncks)
+            # Wait for the queued alerts before reporting completion.
+            failed=produtil.dbnalert.dispatcher().flush()
+            if failed:
+                logger.error('%d dbn_alerts failed'%(failed,))
             self.state=COMPLETED
         except Exception as e:
             self.state=FAILED
@@ -734,6 +681,111 @@ class WW3Post(hafs.hafstask.HAFSTask):
             raise
             sys.exit(2)
 
+    def _run_outp_shards(self,kind,shards,make_inp,collect,tarnames,logger):
+        """Runs ww3_outp for each shard of buoys through mpiserial, and
+        builds the product tar files while it runs.  Each shard command
+        creates a marker file when it succeeds.  While mpiserial runs in
+        a background thread, this polls the markers, calls collect for
+        each finished shard, appends the files it returns to the tar
+        files, and appends the shard's log to ww3_outp_<kind>.log.  The
+        tar files are complete soon after the last shard finishes.
+
+        kind - "bull" or "spec"; used in file and directory names
+        shards - list of lists of point numbers from hafs.ww3point.shard_points
+        make_inp - function make_inp(ipnts,logger) that writes ww3_outp.inp
+        collect - function collect(ishard,sharddir) that moves the shard's
+            outputs to the current directory and returns a list with one
+            list of files for each tar file in tarnames
+        tarnames - the tar files to create"""
+        commands=list()
+        pending=dict()
+        for ishard,ipnts in enumerate(shards):
+            sharddir='ww3outp%s.%03d'%(kind,ishard)
+            shardlog='ww3_outp_%s.%03d.log'%(kind,ishard)
+            marker=sharddir+'.done'
+            produtil.fileop.remove_file(marker,logger=logger)
+            with NamedDir(sharddir,keep=True,logger=logger) as nameddir:
+                make_inp(ipnts,logger)
+                make_symlink('../mod_def.ww3','mod_def.ww3',force=True,logger=logger)
+                make_symlink('../out_pnt.ww3','out_pnt.ww3',force=True,logger=logger)
+                make_symlink(self.getexe('ww3_outp'),'ww3_outp',force=True,logger=logger)
+                cmd=('cd '+nameddir.dirname+' && '+
+                    './ww3_outp > ../'+shardlog+' && '+
+                    'touch ../'+marker+' && '+
+                    'cd ../')
+                commands.append(cmd)
+            pending[ishard]=(sharddir,shardlog,marker)
+        cmdfname='command.file.ww3outp'+kind
+        with open(cmdfname,'wt') as cfpf:
+            cfpf.write('\n'.join(commands))
+        threads=os.environ['TOTAL_TASKS']
+        logger.info('ww3_outp_%s total threads: %s ',kind,threads)
+        mpiserial_path=os.environ.get('MPISERIAL','*MISSING*')
+        if mpiserial_path=='*MISSING*':
+            mpiserial_path=self.getexe('mpiserial')
+        cmd2=mpirun(mpi(mpiserial_path)['-m',cmdfname],allranks=True)
+
+        failure=list()
+        def runner():
+            try:
+                checkrun(cmd2)
+            except Exception as e:
+                failure.append(e)
+        thread=threading.Thread(target=runner,name='ww3outp'+kind)
+        thread.daemon=True
+
+        tars=[ tarfile.open(tarname,'w',format=tarfile.GNU_FORMAT)
+               for tarname in tarnames ]
+        try:
+            with open('ww3_outp_%s.log'%(kind,),'ab') as logf:
+                thread.start()
+                while pending:
+                    running=thread.is_alive()
+                    for ishard in sorted(pending):
+                        (sharddir,shardlog,marker)=pending[ishard]
+                        if not os.path.exists(marker): continue
+                        del pending[ishard]
+                        for tar,files in zip(tars,collect(ishard,sharddir)):
+                            for filename in files:
+                                tar.add(filename,arcname=filename)
+                        with open(shardlog,'rb') as f:
+                            shutil.copyfileobj(f,logf)
+                    if pending and not running:
+                        break
+                    if pending:
+                        time.sleep(1)
+                thread.join()
+        finally:
+            for tar in tars:
+                tar.close()
+        if failure:
+            raise failure[0]
+        if pending:
+            raise hafs.exceptions.WW3PointFileError(
+                'ww3_outp did not finish for shards: %s'%(
+                    ', '.join([ pending[i][0] for i in sorted(pending) ]),))
+
+    def ww3_points(self,logger):
+        """Returns a list of (buoyid,lon,lat) for all points in
+        out_pnt.ww3, in point number order.  The list is read from the
+        file header.  If that fails, ww3_outp is run to list the
+        points, and the list is scraped from its log."""
+        try:
+            return hafs.ww3point.read_points('out_pnt.ww3')
+        except (hafs.exceptions.WW3PointFileError,EnvironmentError) as e:
+            logger.warning('Cannot read buoys from out_pnt.ww3 (%s); '
+                           'running ww3_outp to list them.'%(str(e),))
+        self.make_outp_info_inp(logger)
+        cmd=exe('./ww3_outp')
+        cmd = cmd>='ww3_outp_info.log'
+        checkrun(cmd,logger=logger)
+        fname='ww3_outp_info.log'
+        with open(fname) as f:
+            ww3_outp_info = f.readlines()
+        indices = [i for i, elem in enumerate(ww3_outp_info) if '----------' in elem]
+        buoys=ww3_outp_info[indices[0]+1:indices[1]-2]
+        return [ tuple(buoy.split()[0:3]) for buoy in buoys ]
+
     def make_grib_inp(self,logger):
         # Prepare ww3_grib.inp
         ni=hafs.namelist.NamelistInserter(self.conf,self.section)
@@ -777,6 +829,12 @@ class WW3Post(hafs.hafstask.HAFSTask):
                 of.write(ni.parse(nf,logger=logger,source=ounp_spec_inp,
                                   raise_all=True,atime=self.conf.cycle,**invars))
 
+    def _outp_points(self,ipnts):
+        """Returns the point number list for a ww3_outp.inp file: one
+        point number per line."""
+        if isinstance(ipnts,int): ipnts=[ipnts]
+        return '\n'.join([ '%d'%(int(ipnt),) for ipnt in ipnts ])
+
     def make_outp_info_inp(self,logger):
         # Prepare ww3_outp.inp
         ni=hafs.namelist.NamelistInserter(self.conf,self.section)
@@ -791,8 +849,8 @@ class WW3Post(hafs.hafstask.HAFSTask):
                 of.write(ni.parse(nf,logger=logger,source=outp_info_inp,
                                   raise_all=True,atime=self.conf.cycle,**invars))
 
-    def make_outp_bull_inp(self,ipnt,logger):
-        # Prepare ww3_outp.inp
+    def make_outp_bull_inp(self,ipnts,logger):
+        # Prepare ww3_outp.inp for one point number or a list of them
         ni=hafs.namelist.NamelistInserter(self.conf,self.section)
         outp_bull_inp=self.confstr('outp_bull_inp','')
         if not outp_bull_inp: outp_bull_inp=self.icstr('{PARMww3}/ww3_outp_bull.inp_tmpl')
@@ -800,15 +858,15 @@ class WW3Post(hafs.hafstask.HAFSTask):
         invars=dict()
         invars.update(PNT_BEG=atime.strftime('%Y%m%d %H%M%S'),
                       PNT_DT=int(self.pntstep),
-                      PNT_NUM=int(ipnt),
+                      PNT_NUM=self._outp_points(ipnts),
                       RUN_BEG=atime.strftime('%Y%m%d %H%M%S'))
         with open(outp_bull_inp,'rt') as nf:
             with open('ww3_outp.inp','wt') as of:
                 of.write(ni.parse(nf,logger=logger,source=outp_bull_inp,
                                   raise_all=True,atime=self.conf.cycle,**invars))
 
-    def make_outp_spec_inp(self,ipnt,logger):
-        # Prepare ww3_outp.inp
+    def make_outp_spec_inp(self,ipnts,logger):
+        # Prepare ww3_outp.inp for one point number or a list of them
         ni=hafs.namelist.NamelistInserter(self.conf,self.section)
         outp_spec_inp=self.confstr('outp_spec_inp','')
         if not outp_spec_inp: outp_spec_inp=self.icstr('{PARMww3}/ww3_outp_spec.inp_tmpl')
@@ -816,7 +874,7 @@ class WW3Post(hafs.hafstask.HAFSTask):
         invars=dict()
         invars.update(PNT_BEG=atime.strftime('%Y%m%d %H%M%S'),
                       PNT_DT=int(self.pntstep),
-                      PNT_NUM=int(ipnt),
+                      PNT_NUM=self._outp_points(ipnts),
                       RUN_BEG=atime.strftime('%Y%m%d %H%M%S'))
         with open(outp_spec_inp,'rt') as nf:
             with open('ww3_outp.inp','wt') as of:
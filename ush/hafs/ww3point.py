@@ -0,0 +1,173 @@
+#! /usr/bin/env python3
+
+"""!Reads WAVEWATCH III point output files for the wave post.
+
+The WW3 point output file (out_pnt.ww3) starts with a header that
+lists every output point.  The functions here read that header, split
+the points into shards for ww3_outp, and split the spectral transfer
+file that ww3_outp writes for several points into one file per point.
+That lets the wave post run ww3_outp once per shard, instead of once
+per buoy, without changing the products:
+
+* read_points -- the point names and locations from out_pnt.ww3,
+  without running ww3_outp
+* shard_points -- contiguous groups of point numbers, one per ww3_outp run
+* split_spectra -- splits a multi-point spectral file into single-point
+  files identical to those from a single-point ww3_outp run"""
+
+##@var __all__
+# Symbols exported by "from hafs.ww3point import *"
+__all__=['read_points','shard_points','split_spectra']
+
+import re, struct
+from hafs.exceptions import WW3PointFileError
+
+##@var point_file_id
+# The identification string at the start of a WW3 point output file
+point_file_id=b'WAVEWATCH III POINT OUTPUT FILE'
+
+##@var spectra_header
+# Matches the first line of a spectral transfer file.  The third
+# number is the number of points in the file.
+spectra_header=re.compile(r"""\A(?P<pre>'WAVEWATCH III SPECTRA'\s*\d+\s*\d+)(?P<npts>\s*\d+)(?P<post>.*)\Z""",re.S)
+
+##@var spectra_time
+# Matches the line that starts each output time in a spectral transfer file
+spectra_time=re.compile(r'\A\d{8} \d{6}\s*\Z')
+
+def _read_record(f,endian,filename,maxlen=None):
+    """!Internal function; do not call directly.  Reads one Fortran
+    sequential unformatted record with four-byte record markers.
+    @param f the open binary file
+    @param endian "<" or ">" for little or big endian markers
+    @param filename the file name for error messages
+    @param maxlen if not None, the longest record allowed
+    @returns the record contents as bytes"""
+    head=f.read(4)
+    if len(head)!=4:
+        raise WW3PointFileError('%s: unexpected end of file'%(filename,))
+    (length,)=struct.unpack(endian+'i',head)
+    if length<0 or ( maxlen is not None and length>maxlen ):
+        raise WW3PointFileError('%s: corrupt Fortran record marker'
+                                %(filename,))
+    data=f.read(length)
+    tail=f.read(4)
+    if len(data)!=length or tail!=head:
+        raise WW3PointFileError('%s: corrupt Fortran record marker'
+                                %(filename,))
+    return data
+
+def read_points(filename):
+    """!Reads the list of output points from a WW3 point output file.
+
+    Only the first two records are read: the file identification
+    with the number of points, and the point locations and names.
+    The byte order is detected from the record markers, and the
+    length of the point names (which differs between WW3 versions) is
+    deduced from the record length.
+
+    @param filename the out_pnt.ww3 file
+    @returns a list of (name,lon,lat) tuples, in point number order
+      (the first tuple is point 1)
+    @raise WW3PointFileError if the file is not a WW3 point output file"""
+    with open(filename,'rb') as f:
+        ident=None
+        for endian in '<>':
+            f.seek(0)
+            try:
+                ident=_read_record(f,endian,filename,maxlen=4096)
+                break
+            except WW3PointFileError: pass
+        if ident is None or not ident.startswith(point_file_id) \
+                or len(ident)<len(point_file_id)+12:
+            raise WW3PointFileError('%s: not a WW3 point output file'
+                                    %(filename,))
+        (nk,nth,nopts)=struct.unpack(endian+'3i',ident[-12:])
+        if nopts<=0:
+            return list()
+        locs=_read_record(f,endian,filename)
+    namelen=(len(locs)-8*nopts)//nopts
+    if namelen<=0 or len(locs)!=8*nopts+namelen*nopts:
+        raise WW3PointFileError('%s: cannot find the names of %d points in '
+                                'a %d byte record'%(filename,nopts,len(locs)))
+    xy=struct.unpack(endian+'%df'%(2*nopts),locs[0:8*nopts])
+    points=list()
+    for i in range(nopts):
+        start=8*nopts+i*namelen
+        name=locs[start:start+namelen].decode('ascii','replace').strip()
+        points.append((name,xy[2*i],xy[2*i+1]))
+    return points
+
+def shard_points(npoints,nshards):
+    """!Splits point numbers 1..npoints into contiguous shards of
+    nearly equal size.
+    @param npoints the number of points
+    @param nshards the requested number of shards; at most npoints
+      shards are returned
+    @returns a list of lists of one-based point numbers"""
+    nshards=max(1,min(int(nshards),npoints))
+    shards=list()
+    first=1
+    for ishard in range(nshards):
+        count=npoints//nshards+(1 if ishard<npoints%nshards else 0)
+        if count>0:
+            shards.append(list(range(first,first+count)))
+        first+=count
+    return shards
+
+def split_spectra(filename,targets):
+    """!Splits a multi-point spectral transfer file into one file per
+    point.
+
+    The file from ww3_outp (output type 1, subtype 3) has a header
+    with the number of points, frequencies and directions, followed
+    by each output time and, for each time, one block per point in
+    the order the points were requested.  Each target file gets the
+    header, with the number of points changed to one, and that
+    point's block at every time.  This is what ww3_outp writes when
+    it is run for that point alone.
+
+    @param filename the spectral file from ww3_outp
+    @param targets a list of output filenames, one per point, in the
+      order the points were requested from ww3_outp
+    @raise WW3PointFileError if the file does not contain the expected
+      number of points at every time"""
+    with open(filename,'rt') as f:
+        lines=f.readlines()
+    if not lines:
+        raise WW3PointFileError('%s: empty spectral file'%(filename,))
+    m=spectra_header.match(lines[0])
+    if not m:
+        raise WW3PointFileError('%s: not a WW3 spectral file'%(filename,))
+    npts=int(m.group('npts'))
+    if npts!=len(targets):
+        raise WW3PointFileError('%s: has %d points, not %d'
+                                %(filename,npts,len(targets)))
+    width=len(m.group('npts'))
+    header=[ m.group('pre')+'%*d'%(width,1)+m.group('post') ]
+    iline=1
+    while iline<len(lines) and not spectra_time.match(lines[iline]):
+        header.append(lines[iline])
+        iline+=1
+    outputs=[ list(header) for target in targets ]
+    while iline<len(lines):
+        timeline=lines[iline]
+        iline+=1
+        blocks=list()
+        while iline<len(lines) and not spectra_time.match(lines[iline]):
+            if lines[iline].lstrip().startswith("'"):
+                blocks.append([])
+            if not blocks:
+                raise WW3PointFileError('%s:%d: data before the first '
+                                        'point'%(filename,iline+1))
+            blocks[-1].append(lines[iline])
+            iline+=1
+        if len(blocks)!=npts:
+            raise WW3PointFileError('%s: %s: %d points instead of %d'%(
+                    filename,timeline.strip(),len(blocks),npts))
+        for (output,block) in zip(outputs,blocks):
+            output.append(timeline)
+            output.extend(block)
+    for (target,output) in zip(targets,outputs):
+        with open(target,'wt') as f:
+            f.write(''.join(output))
@@ -0,0 +1,156 @@
+#! /usr/bin/env python3
+################################################################################
+# Script Name: hafs_benchmark.py
+# Authors: NECP/EMC Hurricane Project Team and UFS Hurricane Application Team
+# Abstract:
+#   This script runs the benchmarks that compare optimized code paths in
+#   the produtil and hafs packages against the original implementations.
+################################################################################
+##@namespace ush.hafs_benchmark
+# Runs the benchmarks of the produtil and hafs packages.
+#
+# Each benchmark compares an optimized code path with the original
+# one, checks that both give the same result, and prints the time per
+# call of each.  It is called as follows:
+# @code[.sh]
+#  hafs_benchmark.py [-n repeat] benchmark [arguments]
+# @endcode
+#
+# Benchmarks:
+# * atparse file [VAR=value ...] --- render an ATParser template with
+#   produtil.atparse.benchmark.  Variables not given on the command line
+#   are taken from the environment.
+# * namelist file --- derive namelists from a Fortran namelist file with
+#   hafs.namelist.benchmark, such as parm/forecast/regional/input.nml.tmp
+# * input section YYYYMMDDHH dataset:item[,VAR=value ...] ...
+#   file.conf ... [section.option=value ...] --- resolve the locations
+#   of the items from section at every third forecast hour through 126
+#   with hafs.input.benchmark.  The configuration is read from the conf
+#   files, such as parm/hafs_input.conf and parm/system.conf, and then
+#   the section.option=value overrides are applied.  The data
+#   directories, such as COMINgfs and COMINgdas, are usually set by
+#   parm/hafs.conf and parm/system.conf; without those, give them as
+#   overrides.  The files need not exist.  For example:
+#   @code[.sh]
+#    hafs_benchmark.py input fcst_PROD2021 2021082700 gfs:gfs_gribA \
+#       gfs:gfs_gribB enkf:enkf_sfg,enkfmem=1 ../parm/hafs_input.conf \
+#       dir.COMINgfs=/path/to/com/gfs dir.COMINgdas=/path/to/com/gfs
+#   @endcode
+# * atcf file --- read the CARQ entries of an A deck with
+#   tcutil.storminfo.parse_carq and with the columns of
+#   tcutil.atcf.ATCFDeck, using tcutil.atcf.benchmark
+
+import sys, os, getopt
+
+if 'USHhafs' in os.environ:
+    sys.path.append(os.environ['USHhafs'])
+elif 'HOMEhafs' in os.environ:
+    sys.path.append(os.path.join(os.environ['HOMEhafs'],'ush'))
+else:
+    guess_HOMEhafs=os.path.dirname(os.path.dirname(
+            os.path.realpath(__file__)))
+    guess_USHhafs=os.path.join(guess_HOMEhafs,'ush')
+    sys.path.append(guess_USHhafs)
+
+def report(name,results):
+    """!Prints the results of one benchmark.
+    @param name the benchmark name
+    @param results a dict mapping from method name to seconds per call,
+      and "speedup" to the ratio of the original to the optimized time"""
+    for method in sorted(results):
+        if method=='speedup': continue
+        print('%s: %-12s %12.3f ms'%(name,method,results[method]*1000.0))
+    print('%s: speedup      %12.2fx'%(name,results['speedup']))
+
+def bench_atparse(args,repeat):
+    """!Benchmarks produtil.atparse compiled templates.
+    @param args the template file followed by VAR=value assignments
+    @param repeat number of times to render the template"""
+    import produtil.atparse
+    if not args:
+        sys.stderr.write('atparse: specify a template file\n')
+        sys.exit(2)
+    varhash=dict(os.environ)
+    for arg in args[1:]:
+        (var,value)=arg.split('=',1)
+        varhash[var]=value
+    report('atparse',produtil.atparse.benchmark(args[0],varhash,repeat))
+
+def bench_namelist(args,repeat):
+    """!Benchmarks the hafs.namelist caches.
+    @param args the namelist file
+    @param repeat number of namelists to derive"""
+    import hafs.namelist
+    if len(args)!=1:
+        sys.stderr.write('namelist: specify one namelist file\n')
+        sys.exit(2)
+    report('namelist',hafs.namelist.benchmark(args[0],repeat))
+
+def bench_input(args,repeat):
+    """!Benchmarks the hafs.input.DataCatalog caches.
+    @param args the section, analysis time, dataset:item specifications,
+      conf files and section.option=value overrides
+    @param repeat number of times to resolve the input list"""
+    import hafs.config, hafs.input
+    if len(args)<3:
+        sys.stderr.write('input: specify a section, a cycle, items and '
+                         'conf files\n')
+        sys.exit(2)
+    conf=hafs.config.HAFSConfig()
+    items=list()
+    overrides=list()
+    for arg in args[2:]:
+        if ':' not in arg.partition('=')[0]:
+            if '=' in arg:
+                (secopt,_,value)=arg.partition('=')
+                (sec,_,opt)=secopt.partition('.')
+                if not sec or not opt:
+                    sys.stderr.write('input: %s: overrides must be '
+                                     'section.option=value\n'%(arg,))
+                    sys.exit(2)
+                overrides.append((sec,opt,value))
+            else:
+                conf.read(arg)
+            continue
+        (spec,_,more)=arg.partition(',')
+        (dataset,item)=spec.split(':',1)
+        kwargs=dict()
+        for assign in more.split(',') if more else []:
+            (var,value)=assign.split('=',1)
+            kwargs[var]=int(value) if value.isdigit() else value
+        items.append((dataset,item,kwargs))
+    for (sec,opt,value) in overrides:
+        if not conf.has_section(sec): conf.add_section(sec)
+        conf.set(sec,opt,value)
+    report('input',hafs.input.benchmark(conf,args[0],args[1],items,
+                                        repeat=repeat))
+
+def bench_atcf(args,repeat):
+    """!Benchmarks the tcutil.atcf columnar deck reader.
+    @param args the A deck file
+    @param repeat number of times to read the file"""
+    import tcutil.atcf
+    if len(args)!=1:
+        sys.stderr.write('atcf: specify one A deck file\n')
+        sys.exit(2)
+    report('atcf',tcutil.atcf.benchmark(args[0],repeat))
+
+##@var benchmarks
+# Mapping from benchmark name to the function that runs it.
+benchmarks={ 'atparse':bench_atparse, 'namelist':bench_namelist,
+             'input':bench_input, 'atcf':bench_atcf }
+
+def main():
+    """!Main program.  Parses arguments and runs the benchmark."""
+    (optlist,args)=getopt.getopt(sys.argv[1:],'n:')
+    repeat=None
+    for opt,val in optlist:
+        if opt=='-n': repeat=max(1,int(val))
+    if not args or args[0] not in benchmarks:
+        sys.stderr.write('Usage: %s [-n repeat] (%s) [arguments]\n'%(
+                sys.argv[0],'|'.join(sorted(benchmarks))))
+        sys.exit(2)
+    benchmarks[args[0]](args[1:],repeat or 100)
+
+if __name__=='__main__':
+    main()
@@ -33,13 +33,16 @@
 
 import argparse
 import collections
+import concurrent.futures
 import datetime
+import json
 import logging
 import numpy
 import os
 import string
 import sys
 import tarfile
+import tempfile
 import contextlib
 
 from contextlib import closing
@@ -86,6 +89,11 @@ class FormatSonde(object):
         self.srchstrs=['UZNT','UZPN','UZPA']
         self.flag_list=['CCA']
         self.max_offset_seconds=int(2*84600)
+        self.index=SondeIndex(filename=getattr(self.opts_obj,'index',None),
+            srchstrs=self.srchstrs,stripmeta=self.stripmeta)
+        self.workers=getattr(self.opts_obj,'workers',None) or \
+            os.cpu_count() or 1
+        self.tempdrop_list=list()
     def check_timestamp(self,file_timestamp,timestamps):
         """
         DESCRIPTION:
@@ -137,30 +145,28 @@ class FormatSonde(object):
         DESCRIPTION:
 
         This method loops through each key within an input Python
-        dictionary containing all observations (data) and returns
-        character strings denote the locations of observations to be
-        formatted.
+        dictionary containing the indexed headers of all observations
+        (data) and returns character strings denote the locations of
+        observations to be formatted.
 
         INPUT VARIABLES:
 
-        * data; a Python dictionary containing key and value pairs for
-          all observations within the respective files to be
-          processed.
+        * data; a Python dictionary containing key (timestamp) and
+          value (SondeIndex entry of the respective file) pairs.
 
         OUTPUT VARIABLES:
 
-        * outinfostrs; a Python dictionary containing key (timestamp)
-          and value (TEMP-DROP sonde observation headers) pairs.
+        * outinfostrs; a Python list of the TEMP-DROP sonde
+          observation headers to be processed.
 
         """
         infostrs=dict()
         for key in sorted(data.keys()):
             infostrs[key]=list()
-            for srchstr in self.srchstrs:
-                for item in data[key]:
-                    if srchstr in item:
-                        infostrs[key].append(item.strip())
-            kwargs={'infostrs':infostrs[key],'data':data[key]}
+            for (isrch,srchstr) in enumerate(self.srchstrs):
+                for (item,found) in data[key]['headers']:
+                    if isrch in found:
+                        infostrs[key].append(item)
             infostrs[key]=self.get_obsinfo(infostrs[key],data[key])
             flag_infostrs=list()
             for item in list(infostrs[key].keys()):
@@ -177,25 +183,16 @@ class FormatSonde(object):
                 for flag_item in self.flag_list:
                     if flag_item in item:
                         string=item.replace(flag_item,'').rstrip()
-                        for ifs in list(infostr.keys()):
-                            if string==ifs:
-                                msn1=infostr[ifs]['mission']
-                                obs1=infostr[ifs]['obid']
-                                msn2=infostr[string]['mission']
-                                obs2=infostr[string]['obid']
-                                if (msn1==msn2) and (obs1==obs2):
-                                    rmvinfostrs.append(string)
+                        if string in infostr:
+                            rmvinfostrs.append(string)
         msg=('Removing the following unique message header(s):\n %s\n'%\
             set(rmvinfostrs))
         self.logger.info(msg=msg)
         outinfostrs=list()
         for key in sorted(data.keys()):
-            outstrs=list()
             for item in list(infostrs[key].keys()):
                 if item not in rmvinfostrs:
-                    outstrs.append(item)
                     outinfostrs.append(item)
-            infostrs[key]=outstrs
         msg=('The following %d TEMP-DROP sonde message headers will be processed:\n%s\n'%\
             (len(outinfostrs),outinfostrs))
         self.logger.info(msg=msg)
@@ -258,50 +255,56 @@ class FormatSonde(object):
                     break
         filedict=collections.OrderedDict(sorted(filedict.items()))
         return filedict
-    def formatsondes(self):
+    def formatsonde(self,infile,data):
         """
         DESCRIPTION:
 
-        This method formats TEMP-DROP messages (observations) in
-        accordance with the expectations of the tempdrop_sonde
-        executable.
+        This method writes a TEMP-DROP message (observation) to a file
+        and formats it in accordance with the expectations of the
+        tempdrop_sonde executable.
+
+        INPUT VARIABLES:
+
+        * infile; a Python string specifying the path to the file to
+          contain the TEMP-DROP message; the formatted message is
+          written to the same path with '.mod' appended.
+
+        * data; a Python list of the TEMP-DROP message strings.
+
+        OUTPUT VARIABLES:
+
+        * outfile; a Python string specifying the path to the
+          formatted file.
 
         """
         srchstrs=['REL','SPG','SPL']
         excldstrs=['62626','REL','SPG','SPL']
-        for infile in self.tempdrop_list:
-            if os.path.exists(infile):
-                with open(infile,'rb') as inf:
-                    data=inf.read().decode("utf-8", "ignore")
-                outfile=('%s.mod'%infile)
-                datan=list()
-                data.replace('\r','')
-                data=data.split('\n')
-                data=[_f for _f in data if _f]
-                for item in data:
-                    item=self.stripmeta(instr=item)
-                    datan.append(item)
-                data=datan
-                with open(outfile,'w') as outf:
-                    for item in data:
-                        if any(s in item for s in excldstrs):
+        data=[self.stripmeta(instr=item) for item in data]
+        with open(infile,'wt+') as f:
+            for item in data:
+                f.write('%s\n'%item)
+        outfile=('%s.mod'%infile)
+        data=[self.stripmeta(instr=item) for item in data if item]
+        with open(outfile,'w') as outf:
+            for item in data:
+                if any(s in item for s in excldstrs):
+                    pass
+                else:
+                    outf.write('%s\n'%item)
+            for (i,item) in enumerate(data):
+                for srchstr in srchstrs:
+                    if srchstr in item:
+                        try:
+                            nstr=data[i]+data[i+1]
+                            nstr=self.stripmeta(instr=nstr)
+                            indx=nstr.index(srchstr)
+                            sstr=nstr[indx:indx+23]
+                            sstr=self.stripmeta(instr=sstr)
+                            outf.write('%s\n'%sstr)
+                        except IndexError:
+                            print('INFO: continue next srchstr')
                             pass
-                        else:
-                            outf.write('%s\n'%item)
-                    outdata=list()
-                    for (i,item) in enumerate(data):
-                        for srchstr in srchstrs:
-                            if srchstr in item:
-                                try:
-                                    nstr=data[i]+data[i+1]
-                                    nstr=self.stripmeta(instr=nstr)
-                                    indx=nstr.index(srchstr)
-                                    sstr=nstr[indx:indx+23]
-                                    sstr=self.stripmeta(instr=sstr)
-                                    outf.write('%s\n'%sstr)
-                                except IndexError:
-                                    print('INFO: continue next srchstr')
-                                    pass
+        return outfile
     def get_obsinfo(self,infostrs,data):
         """
         DESCRIPTION:
@@ -314,8 +317,8 @@ class FormatSonde(object):
 
         * infostrs; a Python list of observation header strings.
 
-        * data; a Python list of all observations collected by driver
-          level of script.
+        * data; the SondeIndex entry of the file containing the
+          observations.
 
         OUTPUT VARIABLES:
 
@@ -325,29 +328,17 @@ class FormatSonde(object):
 
         """
         obsdict=dict()
-        whitelist=['OB']
         for infostr in infostrs:
-            obsdict[infostr]=dict()
-            lnidx=0
-            for (i,item) in enumerate(data):
-                if infostr in item:
-                    lnidx=i
-                    break
-            for (i,item) in enumerate(data[lnidx::]):
-                if 'OB' in item:
-                    obsitem=item.split().index('OB')
-                    obsdict[infostr]['obid']=item.split()[obsitem+1]
-                    obsdict[infostr]['mission']=item.split()[1]
-                    break
+            obsdict[infostr]=dict(data['obsinfo'].get(infostr,{}))
         return obsdict
     def read_sondefiles(self,filedict):
         """
         DESCRIPTION:
 
-        This method collects all observations contained within the
-        files to be processed (filedict keys) and returns a Python
-        dictionary containing key (timestamp) and value (observations)
-        pairs.
+        This method collects the indexed message headers of the files
+        to be processed (filedict keys) and returns a Python
+        dictionary containing key (timestamp) and value (index entry)
+        pairs; only new or changed files are read.
 
         INPUT VARIABLES:
 
@@ -357,22 +348,21 @@ class FormatSonde(object):
         OUTPUT VARIABLES:
 
         * data; a Python dictionary containing key (timestamp) and
-          values (observations collected from the respective input
-          file) pairs.
+          values (SondeIndex entry of the respective input file)
+          pairs.
 
         """
         data=dict()
+        sources=dict()
         for infile in list(filedict.keys()):
             msg=('Processing file %s.'%infile)
             self.logger.info(msg=msg)
-            year=filedict[infile][0:4]
-            month=filedict[infile][4:6]
-            day=filedict[infile][6:8]
-            lnidx=0
-           #with open(infile,'rb') as f:
-            with open(infile,'rb') as f:
-                infdata=f.read().decode("utf-8", "ignore")
-            data[filedict[infile]]=infdata.split('\n')
+            # As before, the last file for each timestamp is used.
+            data[filedict[infile]]=self.index.entry(infile)
+            sources[filedict[infile]]=infile
+        self.index.prune(paths=filedict.keys())
+        self.index.save()
+        self.sources=sources
         return data
     def sondedump(self):
         """
@@ -386,38 +376,36 @@ class FormatSonde(object):
             specified data path) are prefixed with a timestamp
             (assuming the UNIX format) as %Y%m%d.
 
-        (2) Reads all relevant sonde files and compiles a Python list
-            of observations within the respective files.'
+        (2) Reads the TEMP-DROP message headers of the relevant sonde
+            files from the index, reading only new or changed files.
 
-        (3) Finds all TEMP-DROP sonde observations; this is done by
-            identifying header strings throughout the respective
-            file(s).
+        (3) Finds all TEMP-DROP sonde observations to be processed.
 
         (4) Loops though all collect TEMP-DROP sonde observation
-            headers and prepares individual files for all identified
-            TEMP-DROP observations.
+            headers and assigns a file name to each identified
+            TEMP-DROP observation.
+
+        OUTPUT VARIABLES:
+
+        * jobs; a Python list of (outfile, source file, message)
+          tuples, where the message is the location of the TEMP-DROP
+          message in the source file.
 
         """
         # Collect sonde files relevant for the current cycle.
         filedict=self.find_sondefiles()
 
-        # Collect sonde file observations.
+        # Collect sonde file message headers.
         data=self.read_sondefiles(filedict=filedict)
 
         # Collect all relevant sonde observations.
         infostrs=self.collect_sondes(data=data)
 
-        # Create concatenated list of sonde observations.
-        infodata=dict()
-        for timestamp in sorted(data.keys()):
-            infodata[timestamp]=list()
-            for item in data[timestamp]:
-                item=self.stripmeta(instr=item)
-                infodata[timestamp].append(item)
-
-        # Loop through all timestamps and prepare individual files for
-        # each observation.
-        for infostr in set(infostrs):
+        # Loop through all timestamps and assign a file name to each
+        # observation.
+        jobs=list()
+        reserved=set()
+        for infostr in sorted(set(infostrs)):
             infostr=self.stripmeta(instr=infostr)
             mission_id=infostr.split()[1]
             timestr=infostr.split()[2]
@@ -425,25 +413,21 @@ class FormatSonde(object):
             for timestamp in timestamps:
                 year=timestamp[0:4]
                 month=timestamp[4:6]
-                timestrday=timestr[0:2]
                 fts=('%s%s%s'%(year,month,timestr))
                 kwargs={'file_timestamp':fts,'timestamps':timestamps}
                 value=self.check_timestamp(**kwargs)
                 if value is not None:
                     fts=value
-                idxs=[idx for idx, e in enumerate(infodata[timestamp]) if infostr==e]
-                for idx in idxs:
-                    lnidx=idx
+                for message in data[timestamp]['messages'].get(infostr,[]):
                     outfile=('%s.%s'%(fts,mission_id))
                     i=1
-                    while os.path.isfile(outfile):
-                        if os.path.isfile(outfile):
-                            outfile=('%s.%s.%s'%(fts,mission_id,i))
-                            i=i+1
-                    tdkwargs={'outfile':outfile,'infostr':infostr,'data':\
-                        infodata[timestamp],'lnidx':lnidx}
-                    self.write_tempdrop(**tdkwargs)
+                    while outfile in reserved or os.path.isfile(outfile):
+                        outfile=('%s.%s.%s'%(fts,mission_id,i))
+                        i=i+1
+                    reserved.add(outfile)
+                    jobs.append((outfile,self.sources[timestamp],message))
                     self.tempdrop_list.append(outfile)
+        return jobs
     def stripmeta(self,instr):
         """
         DESCRIPTION:
@@ -467,68 +451,86 @@ class FormatSonde(object):
             instr=outstr
         outstr=outstr.replace('\r','')
         return outstr
-    def write_tempdrop(self,outfile,infostr,data,lnidx):
+    def write_tempdrop(self,outfile,infile,message):
         """
         DESCRIPTION:
 
-        This method parses a list of strings and writes a given
-        TEMP-DROP message to a user specified file.
+        This method reads a given TEMP-DROP message from a sonde file,
+        writes it to a user specified file and formats it.
 
         INPUT VARIABLES:
 
         * outfile; a Python string specifying the path to the output
           file to contain the TEMP-DROP message.
 
-        * infostr; a Python string specifying the TEMP-DROP message
-          header (e.g., UZNT10 KNHC 250600).
+        * infile; a Python string specifying the sonde file.
+
+        * message; a Python list [start,end,count] of the byte offsets
+          and number of lines of the TEMP-DROP message in the sonde
+          file.
+
+        OUTPUT VARIABLES:
 
-        * infdata; a Python list of data strings to be parsed using
-          the infostr information.
+        * modfile; a Python string specifying the path to the
+          formatted file.
 
         """
-        strtmsg=lnidx
-        for (i,item) in enumerate(data[strtmsg::],1):
-            if ';' in item:
-                lnidx=i
-                break
-            if not item.strip():
-                lnidx=i
-                break
-        endmsg=strtmsg+lnidx
-        msg=('Writing TEMP-DROP message to %s; data block: [%s,%s]' %\
-            (outfile,strtmsg,endmsg))
+        data=self.index.read_message(infile,message)
+        msg=('Writing TEMP-DROP message from %s to %s; %d lines' %\
+            (infile,outfile,len(data)))
         self.logger.info(msg=msg)
-        with open(outfile,'wt+') as f:
-            for item in data[strtmsg:endmsg]:
-                item=self.stripmeta(instr=item)
-                f.write('%s\n'%item)
-    def build_tarball(self):
+        return self.formatsonde(outfile,data)
+    def build_tarball(self,jobs):
         """
         DESCRIPTION:
 
         This method performs the following tasks:
 
-        (1) Write all newly created TEMP-DROP formatted files (if any) in a
-            tarball called 'dropsonde.<cycle>.tar'; for example,
-            'dropsonde.2017091106.tar'.
+        (1) Writes and formats the TEMP-DROP messages in parallel.
+
+        (2) Adds each TEMP-DROP formatted file to a tarball called
+            'dropsonde.<cycle>.tar' (for example,
+            'dropsonde.2017091106.tar') as soon as it is written,
+            followed by any other formatted files in the working
+            directory.
+
+        INPUT VARIABLES:
+
+        * jobs; a Python list of (outfile, source file, message)
+          tuples from sondedump.
 
         """
         cycle=datetime.datetime.strftime(self.dateobj,'%Y%m%d%H')
         filename=('dropsonde.%s.tar'%cycle)
-        tempdrop_list_mod=list()
-        workpath=os.getcwd()
-        filenames=os.listdir(workpath)
-        for item in filenames:
-            if '.mod' in item:
-                tempdrop_list_mod.append(item)
-        if tempdrop_list_mod:
-            with closing(tarfile.open(filename,'w')) as tar:
-                for item in tempdrop_list_mod:
-                    if os.path.isfile(item):
-                        tar.add(item,arcname=os.path.basename(item),\
-                            recursive=False)
-                        print(item)
-                       #os.remove(item)
+        tar=None
+        added=set()
+        def add(item):
+            if item in added or not os.path.isfile(item):
+                return
+            if tar is None:
+                return
+            tar.add(item,arcname=os.path.basename(item),recursive=False)
+            added.add(item)
+            print(item)
+        workers=max(1,min(int(self.workers),len(jobs) or 1))
+        try:
+            with concurrent.futures.ThreadPoolExecutor(
+                    max_workers=workers) as pool:
+                futures=[pool.submit(self.write_tempdrop,*job) for job in jobs]
+                for future in concurrent.futures.as_completed(futures):
+                    item=future.result()
+                    if tar is None:
+                        tar=tarfile.open(filename,'w')
+                    add(item)
+            leftover=sorted([item for item in os.listdir(os.getcwd())
+                             if '.mod' in item and item not in added])
+            if leftover and tar is None:
+                tar=tarfile.open(filename,'w')
+            for item in leftover:
+                add(item)
+        finally:
+            if tar is not None:
+                tar.close()
     def run(self):
         """
         DESCRIPTION:
@@ -536,22 +538,237 @@ class FormatSonde(object):
         This method performs the following tasks:
 
         (1) Collects observations from external files (possibly)
-            containing TEMP-DROP messages.
+            containing TEMP-DROP messages, using the persistent
+            message header index.
 
         (2) Formats (any) TEMP-DROP messages in accordance with the
-            expectations of the tempdrop_sonde executable.
+            expectations of the tempdrop_sonde executable, in
+            parallel, and streams them into a tarball.
 
         (3) Creates a formatted list of TEMP-DROP message files (e.g.,
             observations) to be processed (and in accordance with the
             expectations of the) tempdrop_sonde executable.
 
-        (4) Build a tarball for the newly created TEMP-DROP formatted files
-
         """
-        self.sondedump()
-        self.formatsondes()
+        jobs=self.sondedump()
+        self.build_tarball(jobs)
         self.createfilelist()
-        self.build_tarball()
+
+#----
+
+class SondeIndex(object):
+    """
+    DESCRIPTION:
+
+    This is the base-class object for the persistent index of
+    TEMP-DROP message headers in the sonde files.  Each file is read
+    once; its index entry is reused for as long as the file size and
+    modification time do not change.  When a file index (JSON) is
+    given, the entries are saved and reused by later cycles.
+
+    Each index entry contains the following:
+
+    * headers; a Python list of [header, found] pairs for each line
+      containing one of the search strings, where the header is the
+      stripped line and found is the list of indices of the search
+      strings it contains.
+
+    * obsinfo; a Python dictionary containing key (header) and value
+      (mission and observation identifications) pairs; these come
+      from the first line containing 'OB' at or after the first line
+      containing the header.
+
+    * messages; a Python dictionary containing key (header, without
+      meta-characters) and value (list of [start,end,count] byte
+      offsets and number of lines of each TEMP-DROP message) pairs.
+
+    INPUT VARIABLES:
+
+    * filename; a Python string specifying the path to the index
+      file; if None, the index is not saved.
+
+    * srchstrs; a Python list of TEMP-DROP message header search
+      strings.
+
+    * stripmeta; a Python function that strips meta-characters from
+      a string.
+
+    """
+    def __init__(self,filename,srchstrs,stripmeta):
+        """
+        DESCRIPTION:
+
+        Creates a new SondeIndex object.
+
+        """
+        self.filename=filename
+        self.srchstrs=srchstrs
+        self.stripmeta=stripmeta
+        self.files=dict()
+        self.changed=False
+        if filename and os.path.exists(filename):
+            try:
+                with open(filename,'rt') as f:
+                    data=json.load(f)
+                if isinstance(data,dict) and data.get('srchstrs')==srchstrs:
+                    self.files=data.get('files',dict())
+            except (EnvironmentError,ValueError) as e:
+                print('INFO: ignoring unreadable sonde index %s: %s'%\
+                    (filename,str(e)))
+    def entry(self,path):
+        """
+        DESCRIPTION:
+
+        This method returns the index entry of a sonde file, reading
+        the file only if it is new or has changed.
+
+        INPUT VARIABLES:
+
+        * path; a Python string specifying the path to the sonde file.
+
+        """
+        st=os.stat(path)
+        key=os.path.abspath(path)
+        entry=self.files.get(key,None)
+        if entry is not None and entry.get('size')==st.st_size and \
+                entry.get('mtime')==st.st_mtime_ns:
+            return entry
+        entry=self.scan(path)
+        entry['size']=st.st_size
+        entry['mtime']=st.st_mtime_ns
+        self.files[key]=entry
+        self.changed=True
+        return entry
+    def scan(self,path):
+        """
+        DESCRIPTION:
+
+        This method reads a sonde file and builds its index entry.
+
+        INPUT VARIABLES:
+
+        * path; a Python string specifying the path to the sonde file.
+
+        """
+        with open(path,'rb') as f:
+            raw=f.read()
+        blines=raw.split(b'\n')
+        offsets=list()
+        offset=0
+        for bline in blines:
+            offsets.append(offset)
+            offset+=len(bline)+1
+        lines=[bline.decode('utf-8','ignore') for bline in blines]
+        headers=list()
+        hdridx=list()
+        for (i,item) in enumerate(lines):
+            found=[isrch for (isrch,srchstr) in enumerate(self.srchstrs)
+                   if srchstr in item]
+            if found:
+                headers.append([item.strip(),found])
+                hdridx.append(i)
+        obsinfo=dict()
+        for (header,found) in headers:
+            if header in obsinfo:
+                continue
+            obsinfo[header]=dict()
+            lnidx=0
+            for i in hdridx:
+                if header in lines[i]:
+                    lnidx=i
+                    break
+            for item in lines[lnidx::]:
+                if 'OB' in item:
+                    words=item.split()
+                    if 'OB' in words and words.index('OB')+1<len(words):
+                        obsinfo[header]['obid']=words[words.index('OB')+1]
+                        obsinfo[header]['mission']=words[1]
+                    break
+        messages=dict()
+        wanted=set([self.stripmeta(instr=header) for (header,found) in headers])
+        if wanted:
+            stripped=[self.stripmeta(instr=item) for item in lines]
+            for (strtmsg,item) in enumerate(stripped):
+                if item not in wanted:
+                    continue
+                lnidx=strtmsg
+                for (i,line) in enumerate(stripped[strtmsg::],1):
+                    if ';' in line or not line.strip():
+                        lnidx=i
+                        break
+                endmsg=min(strtmsg+lnidx,len(lines))
+                end=offsets[endmsg] if endmsg<len(lines) else len(raw)
+                messages.setdefault(item,list()).append(
+                    [offsets[strtmsg],end,endmsg-strtmsg])
+        return {'headers':headers,'obsinfo':obsinfo,'messages':messages}
+    def read_message(self,path,message):
+        """
+        DESCRIPTION:
+
+        This method reads a TEMP-DROP message from a sonde file.
+
+        INPUT VARIABLES:
+
+        * path; a Python string specifying the path to the sonde file.
+
+        * message; a Python list [start,end,count] from the index
+          entry.
+
+        OUTPUT VARIABLES:
+
+        * data; a Python list of the TEMP-DROP message strings.
+
+        """
+        (start,end,count)=message
+        with open(path,'rb') as f:
+            f.seek(start)
+            data=f.read(end-start).decode('utf-8','ignore')
+        return data.split('\n')[0:count]
+    def prune(self,paths):
+        """
+        DESCRIPTION:
+
+        This method drops the index entries of files that no longer
+        exist or are not among the files being processed, so the
+        index does not grow from one cycle to the next.
+
+        INPUT VARIABLES:
+
+        * paths; a Python iterable of the paths to the sonde files
+          being processed.
+
+        """
+        keep=set([os.path.abspath(path) for path in paths])
+        for key in list(self.files.keys()):
+            if key not in keep or not os.path.exists(key):
+                del self.files[key]
+                self.changed=True
+    def save(self):
+        """
+        DESCRIPTION:
+
+        This method writes the index file, if one was given and the
+        index changed; the file is replaced atomically.
+
+        """
+        if not self.filename or not self.changed:
+            return
+        dirname=os.path.dirname(os.path.abspath(self.filename))
+        try:
+            (fd,tmp)=tempfile.mkstemp(prefix='.sonde_index.',dir=dirname)
+            try:
+                with os.fdopen(fd,'wt') as f:
+                    json.dump({'srchstrs':self.srchstrs,'files':self.files},f)
+                os.chmod(tmp,0o644)
+                os.rename(tmp,self.filename)
+            except:
+                os.unlink(tmp)
+                raise
+            self.changed=False
+        except EnvironmentError as e:
+            print('INFO: cannot write sonde index %s: %s'%\
+                (self.filename,str(e)))
+
 #----
 
 class FormatSondeError(Exception):
@@ -651,6 +868,10 @@ class FormatSondeOptions(object):
             'formatted as (assuming UNIX convention) %Y-%m-%d_%H:%M:%S.',default=None)
         self.parser.add_argument('-d','--datapath',help='The path to the sonde files '\
             'containing TEMP-DROP observations.',default=None)
+        self.parser.add_argument('-i','--index',help='Optional: the sonde file '\
+            'index (JSON), reused by later cycles.',default=None)
+        self.parser.add_argument('-w','--workers',help='Optional: the number of '\
+            'TEMP-DROP messages to format at once.',type=int,default=None)
         self.opts_obj=lambda:None
     def run(self):
         """
@@ -666,6 +887,13 @@ class FormatSondeOptions(object):
         -d; The path to the sonde files containing TEMP-DROP
             observations.
 
+        -i; Optional: the sonde file index (JSON); sonde files whose
+            size and modification time did not change since they
+            were indexed are not read again.
+
+        -w; Optional: the number of TEMP-DROP messages to format at
+            once.
+
         OUTPUT VARIABLES:
 
         * opts_obj; a Python object containing the user command line
@@ -682,6 +910,8 @@ class FormatSondeOptions(object):
                 raise FormatSondeError(msg=msg)
             else:
                 setattr(opts_obj,item,value)
+        for item in ['index','workers']:
+            setattr(opts_obj,item,getattr(args,item))
         return opts_obj
 
 #----
@@ -0,0 +1,180 @@
+#! /usr/bin/env python3
+################################################################################
+# Script Name: hafs_importtime.py
+# Authors: NECP/EMC Hurricane Project Team and UFS Hurricane Application Team
+# Abstract:
+#   This script measures the Python import (startup) cost of the HAFS
+#   entry points and fails if it regresses relative to a saved baseline.
+################################################################################
+##@namespace ush.hafs_importtime
+# Measures and tracks the import-time cost of HAFS entry points.
+#
+# Each entry point (scripts/exhafs_*.py and the ush/*.py helpers) is
+# parsed, and the modules it imports at module level are imported in a
+# fresh interpreter under "python -X importtime".  The cumulative time
+# of those imports, minus the interpreter's own startup imports, is the
+# startup cost of that entry point.  The best of several repeats is
+# reported.
+#
+# @code[.sh]
+#  hafs_importtime.py [options] [entry_point.py ...]
+# @endcode
+#
+# Options:
+# * -n N --- repeat each measurement N times and keep the best (default: 5)
+# * -b file --- compare against this baseline JSON file
+# * -s --- save the measurements to the baseline file instead of comparing
+# * -t fraction --- allowed relative slowdown (default: 0.25)
+# * -m msec --- allowed absolute slowdown in milliseconds (default: 20)
+#
+# The exit status is 0 on success, 1 if any entry point is slower
+# than its baseline by more than the allowed slowdown, and 2 if any
+# entry point could not be imported.
+
+import sys, os, ast, json, subprocess, getopt, glob
+
+##@var HOMEhafs
+# The HAFS installation directory, guessed from the location of this script.
+HOMEhafs=os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+##@var USHhafs
+# The HAFS ush directory, which holds the produtil, hafs and tcutil packages.
+USHhafs=os.path.join(HOMEhafs,'ush')
+
+def default_entry_points():
+    """!Returns the list of entry points to measure when none are
+    given on the command line: every Python script in scripts/ and
+    the top level of ush/."""
+    found=sorted(glob.glob(os.path.join(HOMEhafs,'scripts','exhafs_*.py')))
+    found.extend(sorted(glob.glob(os.path.join(USHhafs,'*.py'))))
+    return [ f for f in found if os.path.basename(f)!='hafs_importtime.py' ]
+
+def module_imports(filename):
+    """!Returns a list of module names imported at module level by the
+    given Python file.  Imports inside functions, and those inside
+    "if __name__=='__main__'" blocks, are not startup cost and are
+    ignored.  Relative imports are ignored.
+    @param filename the Python file to parse"""
+    with open(filename,'rt') as f:
+        tree=ast.parse(f.read(),filename)
+    modules=list()
+    def add(name):
+        if name and name not in modules:
+            modules.append(name)
+    def scan(body):
+        for node in body:
+            if isinstance(node,ast.Import):
+                for alias in node.names:
+                    add(alias.name)
+            elif isinstance(node,ast.ImportFrom):
+                if not node.level:
+                    add(node.module)
+            elif isinstance(node,(ast.Try,ast.If)):
+                if isinstance(node,ast.If) and '__main__' in ast.dump(node.test):
+                    continue
+                scan(node.body)
+                scan(node.orelse)
+                for handler in getattr(node,'handlers',[]):
+                    scan(handler.body)
+    scan(tree.body)
+    return modules
+
+def run_importtime(modules):
+    """!Imports the given modules in a new interpreter with "python -X
+    importtime" and returns a dict mapping each top-level imported
+    module name to its cumulative import time in microseconds.
+    @param modules a list of module names; an empty list measures the
+      interpreter startup alone"""
+    code='import sys; sys.path.insert(0,%r)'%(USHhafs,)
+    if modules:
+        code+='; import '+', '.join(modules)
+    env=dict(os.environ)
+    env.pop('PYTHONPROFILEIMPORTTIME',None)
+    proc=subprocess.run([sys.executable,'-X','importtime','-c',code],
+                        stdout=subprocess.PIPE,stderr=subprocess.PIPE,
+                        env=env,cwd=USHhafs,universal_newlines=True)
+    if proc.returncode!=0:
+        lines=[ l for l in proc.stderr.splitlines()
+                if not l.startswith('import time:') ]
+        raise ImportError(lines[-1] if lines else 'exit status %d'
+                          %(proc.returncode,))
+    times=dict()
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:'): continue
+        fields=line[len('import time:'):].split('|')
+        if len(fields)!=3: continue
+        name=fields[2].rstrip()[1:]
+        if name.startswith(' ') or not fields[1].strip().isdigit():
+            continue # nested import or header line
+        times[name]=int(fields[1])
+    return times
+
+def measure(modules,startup,repeat):
+    """!Returns the best-of-repeat import time in microseconds of the
+    given modules, not counting modules imported by the interpreter
+    startup.
+    @param modules a list of module names
+    @param startup a set of module names imported at startup
+    @param repeat number of measurements"""
+    best=None
+    for i in range(repeat):
+        times=run_importtime(modules)
+        total=sum([ t for (name,t) in times.items() if name not in startup ])
+        if best is None or total<best: best=total
+    return best
+
+def main():
+    """!Main program.  Parses arguments, measures every entry point,
+    and compares with or saves the baseline."""
+    (optlist,args)=getopt.getopt(sys.argv[1:],'n:b:st:m:')
+    repeat=5
+    baseline=None
+    save=False
+    tolerance=0.25
+    slack=20000
+    for opt,val in optlist:
+        if   opt=='-n': repeat=max(1,int(val))
+        elif opt=='-b': baseline=val
+        elif opt=='-s': save=True
+        elif opt=='-t': tolerance=float(val)
+        elif opt=='-m': slack=int(float(val)*1000)
+    if save and baseline is None:
+        sys.stderr.write('%s: -s requires -b\n'%(sys.argv[0],))
+        sys.exit(2)
+
+    entry_points=args if args else default_entry_points()
+    startup=set(run_importtime([]).keys())
+
+    results=dict()
+    failed=list()
+    for filename in entry_points:
+        name=os.path.relpath(os.path.realpath(filename),HOMEhafs)
+        try:
+            results[name]=measure(module_imports(filename),startup,repeat)
+            print('%-45s %9.1f ms'%(name,results[name]/1000.0))
+        except (ImportError,SyntaxError,EnvironmentError) as e:
+            print('%-45s    FAILED %s'%(name,str(e)))
+            failed.append(name)
+
+    if save:
+        with open(baseline,'wt') as f:
+            json.dump(results,f,indent=1,sort_keys=True)
+            f.write('\n')
+        print('%s: saved %d entry points'%(baseline,len(results)))
+    elif baseline is not None:
+        with open(baseline,'rt') as f:
+            old=json.load(f)
+        regressed=list()
+        for name in sorted(results):
+            if name not in old: continue
+            if results[name]>old[name]*(1.0+tolerance)+slack:
+                regressed.append(name)
+                print('%s: REGRESSED from %.1f ms to %.1f ms'%(
+                        name,old[name]/1000.0,results[name]/1000.0))
+        if regressed:
+            sys.exit(1)
+    if failed:
+        sys.exit(2)
+
+if __name__=='__main__':
+    main()
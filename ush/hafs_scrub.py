@@ -1,6 +1,7 @@
 #! /usr/bin/env python3
 
-import logging, os, shutil, sys
+import logging, os, shutil, sys, time, threading, tempfile, socket
+import concurrent.futures
 
 if 'USHhafs' in os.environ:
     sys.path.append(os.environ['USHhafs'])
@@ -38,24 +39,111 @@ from produtil.log import jlogger
 # * any filesystem mount point
 # * $USHhafs, $EXhafs, $PARMhafs, $HOMEhafs
 # * $FIXgsi, $FIXhafs
+#
+# Trees are walked with os.scandir and deleted by a pool of threads,
+# which helps on parallel filesystems where each unlink is a metadata
+# server round trip.  Like shutil.rmtree, every directory is opened
+# with O_NOFOLLOW relative to its parent's file descriptor, and its
+# entries are removed relative to its own, so replacing a directory
+# with a symbolic link during the scrub cannot redirect the deletion.
+# These environment variables control it:
+# * HAFS_SCRUB_THREADS --- number of deletion threads (default: 8)
+# * HAFS_SCRUB_RATE --- maximum unlink and rmdir calls per second, to
+#   limit the load on the metadata server (default: 0, no limit)
+# * HAFS_SCRUB_TRASH --- a trash directory on the same filesystem,
+#   which may be shared by many scrub jobs.  If set, each tree is first
+#   renamed into a new subdirectory of the trash that belongs to this
+#   run, so it disappears at once, and that subdirectory is deleted
+#   afterwards.  Trees that cannot be renamed are deleted in place.
+# * HAFS_SCRUB_DETACH --- if YES, this run's trash is emptied by a
+#   detached background process and the script returns as soon as the
+#   trees are renamed.  That process is killed if the job's allocation
+#   ends first.
+# * HAFS_SCRUB_TRASH_AGE --- every run also deletes entries of the
+#   trash that are older than this many seconds, which were left by
+#   runs that were killed (default: 86400).  Only the run.*
+#   subdirectories this script creates are considered.
+#
+# The number of files, directories and bytes removed, and the rates,
+# are logged at the end.
 
 class WillNotDelete(Exception):
     """!Raised by various safety checks if someone tries to delete
     something they should not, such as "/"."""
 
+class RateLimiter(object):
+    """!Limits the rate of operations shared between threads.  Each
+    call to wait() blocks until another operation is allowed."""
+    def __init__(self,rate):
+        """!Constructor for RateLimiter
+        @param rate maximum operations per second; zero or None means
+          no limit"""
+        self.interval=1.0/rate if rate else 0.0
+        self.__lock=threading.Lock()
+        self.__next=time.time()
+    def wait(self):
+        """!Waits until the next operation is allowed."""
+        if not self.interval: return
+        with self.__lock:
+            now=time.time()
+            start=max(now,self.__next)
+            self.__next=start+self.interval
+        if start>now:
+            time.sleep(start-now)
+
 class Deleter(object):
     """!Recursive directory deleter with safeguards to prevent
     accidental deletion of certain critical directories."""
-    def __init__(self,logger):
+    def __init__(self,logger,threads=8,rate=None,trash=None,
+                 count_bytes=True,trash_age=86400):
         """!Constructor for Deleter
-        @param logger a logging.Logger for log messages"""
+        @param logger a logging.Logger for log messages
+        @param threads number of threads that delete files
+        @param rate maximum unlink and rmdir calls per second, or None
+          for no limit
+        @param trash optional: a directory, on the same filesystem as
+          the trees, into which trees are renamed before deletion
+        @param count_bytes if True, lstat each file to count the bytes
+          removed
+        @param trash_age entries of the trash older than this many
+          seconds are deleted by every run"""
         self.__logger=logger
         self.__rmtrees=set()
         self.__rmdirs=set()
         self.badflag=False
+        self.threads=max(1,int(threads))
+        self.limiter=RateLimiter(rate)
+        self.trash=trash
+        self.trash_age=trash_age
+        self.run_trash=None
+        self.count_bytes=count_bytes
+        self.max_open_dirs=max(64,16*self.threads)
+        self.__open_dirs=0
+        self.__stats_lock=threading.Lock()
+        self.files=0
+        self.dirs=0
+        self.bytes=0
     ##@var badflag
     # If True, then at least one directory had trouble being deleted
 
+    ##@var max_open_dirs
+    # Maximum number of directories held open while deleting before
+    # subdirectories are deleted in the current thread instead of
+    # being passed to other threads
+
+    ##@var run_trash
+    # The subdirectory of the trash that holds the trees renamed by
+    # this run, or None if there is none yet
+
+    ##@var files
+    # Number of files, symbolic links and other non-directories removed
+
+    ##@var dirs
+    # Number of directories removed
+
+    ##@var bytes
+    # Number of bytes in the files removed, if count_bytes is True
+
     @property
     def logger(self):
         """!Returns the logging.Logger used for log messages"""
@@ -103,9 +191,9 @@ class Deleter(object):
     def _rmtree_onerr(self,function,path,exc_info):
         """!Internal function used to log errors.
 
-        This is an internal implementation function called by
-        shutil.rmtree when an underlying function call failed.  See
-        the Python documentation of shutil.rmtree for details.
+        This is an internal implementation function called when an
+        underlying function call failed.  The arguments are the same as
+        those of the shutil.rmtree onerror function.
         @param function the funciton that failed
         @param path the path to the function that caused problems
         @param exc_info the exception information
@@ -115,6 +203,104 @@ class Deleter(object):
                 str(path),str(function),str(exc_info)))
         self.badflag=True
 
+    def _count(self,files=0,dirs=0,nbytes=0):
+        """!Adds to the statistics of removed files.
+        @protected"""
+        with self.__stats_lock:
+            self.files+=files
+            self.dirs+=dirs
+            self.bytes+=nbytes
+
+    def _open_dir(self,node):
+        """!Opens a directory of a tree without following symbolic
+        links, relative to its parent's file descriptor.
+        @protected
+        @param node a [fd,name,parent,pending] list; fd is set
+        @returns True if it was opened"""
+        parent=node[2]
+        try:
+            node[0]=os.open(node[1],os.O_RDONLY|os.O_DIRECTORY|os.O_NOFOLLOW,
+                            dir_fd=None if parent is None else parent[0])
+        except EnvironmentError as e:
+            self._rmtree_onerr(os.open,node[1],sys.exc_info())
+            return False
+        with self.__stats_lock:
+            self.__open_dirs+=1
+        return True
+
+    def _rmdir_up(self,node):
+        """!Removes a directory whose contents are gone, and then any
+        ancestors within the tree whose contents are now gone too.
+        @protected
+        @param node a [fd,name,parent,pending] list; fd is the open
+          directory, or None if it could not be opened, and pending is
+          the number of subdirectories not yet removed"""
+        while node is not None:
+            parent=node[2]
+            if node[0] is not None:
+                os.close(node[0])
+                with self.__stats_lock:
+                    self.__open_dirs-=1
+                self.limiter.wait()
+                try:
+                    os.rmdir(node[1],dir_fd=None if parent is None
+                             else parent[0])
+                    self._count(dirs=1)
+                except EnvironmentError as e:
+                    self._rmtree_onerr(os.rmdir,node[1],sys.exc_info())
+            if parent is None: return
+            with self.__stats_lock:
+                parent[3]-=1
+                if parent[3]>0: return
+            node=parent
+
+    def _rmdir_contents(self,pool,node,futures):
+        """!Deletes the non-directories in one directory and then its
+        subdirectories, some in other threads of the pool.  The
+        directory is removed when the last of its subdirectories is
+        removed.  Subdirectories are handled in this thread once
+        max_open_dirs directories are open.
+        @protected
+        @param pool the concurrent.futures.Executor
+        @param node a [fd,name,parent,pending] list
+        @param futures a list to which new futures are appended"""
+        if not self._open_dir(node):
+            node[3]=0
+            self._rmdir_up(node)
+            return
+        fd=node[0]
+        subdirs=list()
+        try:
+            with os.scandir(fd) as it:
+                for entry in it:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            subdirs.append(entry.name)
+                            continue
+                        size=entry.stat(follow_symlinks=False).st_size \
+                            if self.count_bytes else 0
+                        self.limiter.wait()
+                        os.unlink(entry.name,dir_fd=fd)
+                        self._count(files=1,nbytes=size)
+                    except EnvironmentError as e:
+                        self._rmtree_onerr(os.unlink,entry.name,
+                                           sys.exc_info())
+        except EnvironmentError as e:
+            self._rmtree_onerr(os.scandir,node[1],sys.exc_info())
+        if not subdirs:
+            self._rmdir_up(node)
+            return
+        node[3]=len(subdirs)
+        for subdir in subdirs:
+            child=[None,subdir,node,0]
+            with self.__stats_lock:
+                inline=self.__open_dirs>=self.max_open_dirs
+            if inline:
+                self._rmdir_contents(pool,child,futures)
+            else:
+                futures.append(pool.submit(self._rmdir_contents,pool,
+                                           child,futures))
+
     def rmtree(self,tree):
         """!Deletes the tree, if possible.
         @protected
@@ -123,12 +309,97 @@ class Deleter(object):
             # If it is a file, special file or symlink we can just
             # delete it via unlink:
             os.unlink(tree)
+            self._count(files=1)
             return
         except EnvironmentError as e:
             pass
         # We get here for directories.
-        self.logger.info('%s: rmtree'%(tree,))
-        shutil.rmtree(tree,ignore_errors=False,onerror=self._rmtree_onerr)
+        self.logger.info('%s: rmtree with %d threads'%(tree,self.threads))
+        futures=list()
+        with concurrent.futures.ThreadPoolExecutor(
+                max_workers=self.threads) as pool:
+            futures.append(pool.submit(self._rmdir_contents,pool,
+                                       [None,tree,None,0],futures))
+            # The list grows while the tasks run; wait for all of them.
+            iwait=0
+            while iwait<len(futures):
+                futures[iwait].result()
+                iwait+=1
+
+    def to_trash(self,tree):
+        """!Renames the tree into this run's subdirectory of the trash
+        directory, so it disappears at once and can be deleted later by
+        empty_trash().
+        @protected
+        @param tree the directory tree
+        @returns True if it was renamed, or False if it must be deleted
+          in place (no trash, or trash on a different filesystem)"""
+        if not self.trash or not os.path.isdir(tree) or os.path.islink(tree):
+            return False
+        trash=produtil.fileop.norm_expand_path(self.trash,fullnorm=True)
+        norm=produtil.fileop.norm_expand_path(tree,fullnorm=True)
+        if trash==norm or trash.startswith(norm.rstrip('/')+'/'):
+            self.logger.warning('%s: trash %s is inside this tree; deleting '
+                                'in place'%(tree,trash))
+            return False
+        try:
+            if self.run_trash is None:
+                produtil.fileop.makedirs(trash,logger=self.logger)
+                self.run_trash=tempfile.mkdtemp(dir=trash,prefix=
+                    'run.%s.%d.'%(socket.gethostname(),os.getpid()))
+            target=tempfile.mkdtemp(dir=self.run_trash,prefix=
+                                    os.path.basename(norm.rstrip('/'))+'.')
+            os.rename(norm,os.path.join(target,'tree'))
+        except EnvironmentError as e:
+            self.logger.info('%s: cannot move to trash %s (%s); deleting '
+                             'in place'%(tree,trash,str(e)))
+            return False
+        self.logger.info('%s: moved to %s'%(tree,target))
+        return True
+
+    def empty_trash(self):
+        """!Deletes the trees this run moved to the trash.  Other runs
+        may be using the same trash, so nothing else is touched."""
+        if self.run_trash is None: return
+        self.validate_path(self.run_trash)
+        self.rmtree(self.run_trash)
+        self.run_trash=None
+
+    def empty_stale_trash(self):
+        """!Deletes the run.* subdirectories of the trash directory
+        older than trash_age seconds.  These were left by runs that
+        were killed before they emptied their part of the trash.
+        Nothing else in the trash directory is touched."""
+        if not self.trash or self.trash_age is None or \
+                not os.path.isdir(self.trash):
+            return
+        self.validate_path(self.trash)
+        cutoff=time.time()-self.trash_age
+        stale=list()
+        with os.scandir(self.trash) as it:
+            for entry in it:
+                try:
+                    if entry.name.startswith('run.') and \
+                            entry.path!=self.run_trash and \
+                            entry.is_dir(follow_symlinks=False) and \
+                            entry.stat(follow_symlinks=False).st_mtime<cutoff:
+                        stale.append(entry.path)
+                except EnvironmentError:
+                    pass
+        for entry in stale:
+            self.logger.info('%s: removing stale trash'%(entry,))
+            self.rmtree(entry)
+
+    def report(self,start):
+        """!Logs the number of files, directories and bytes removed and
+        the rates.
+        @param start the time.time() at which deletion started"""
+        elapsed=max(time.time()-start,1e-6)
+        self.logger.info(
+            'Removed %d files, %d directories and %d bytes in %.1f seconds: '
+            '%.1f files/s, %.2f MB/s'%(
+                self.files,self.dirs,self.bytes,elapsed,
+                (self.files+self.dirs)/elapsed,self.bytes/elapsed/1048576.0))
 
     def have_dirs(self):
         """!Are there any directories to delete (ones passed to add())
@@ -142,17 +413,43 @@ class Deleter(object):
         self.__rmdirs=set()
         return dirs
 
-    def go(self,max_rmdir_loop=30):
+    def go(self,max_rmdir_loop=30,detach=False):
         """!Deletes all directories sent to add()
 
         @param max_rmdir_loop The maximum number of directories to
         delete before returning.  This is a safeguard against
-        accidents."""
+        accidents.
+        @param detach If True and there is a trash directory, empty
+        this run's trash in a detached child process instead of waiting
+        for it.  If the child is killed, a later run removes what it
+        left once that is older than trash_age."""
         logger=self.logger
-        logger.info('Delete files: first pass.')
+        start=time.time()
         self.badflag=False
+        if self.trash:
+            logger.info('Move trees to the trash: %s'%(self.trash,))
+            for tree in self.__rmtrees:
+                self.to_trash(tree)
+        trashed=self.run_trash is not None
+        forked=False
+        if trashed and detach:
+            # Fork now, before any deletion threads exist.
+            if os.fork()==0:
+                # Detached child: empty the trash after the parent exits.
+                try:
+                    os.setsid()
+                    self.empty_trash()
+                    self.empty_stale_trash()
+                finally:
+                    os._exit(0)
+            logger.info('%s: emptying the trash in the background.'
+                        %(self.trash,))
+            self.run_trash=None
+            forked=True
+        logger.info('Delete files: first pass.')
         for tree in self.__rmtrees:
-            self.rmtree(tree)
+            if os.path.lexists(tree):
+                self.rmtree(tree)
 
         if self.badflag:
             logger.warning('Some deletions failed.  Will try again.')
@@ -190,6 +487,13 @@ class Deleter(object):
                 'Hit maximum loop count of %d.  Some ancestor directories '
                 'may still exist.'%(max_rmdir_loop,))
 
+        if trashed and not forked:
+            logger.info('Empty the trash: %s'%(self.trash,))
+            self.empty_trash()
+        if not forked:
+            self.empty_stale_trash()
+        self.report(start)
+
     def add_tmpdir_check(self,parent_dir,child_dir):
         """!Simple check to determine if the child_dir should be scrubbed
            based on the number of entries in the parent directory.
@@ -203,7 +507,13 @@ class Deleter(object):
         # parent_dir dir listing < 2 assume parent_dir was previously scrubbed
         # so lets clean up the child_dir.
         if os.path.isdir(parent_dir):
-            if len(os.listdir(parent_dir)) < 2:
+            # Stop listing after two entries; the directory may be huge.
+            count=0
+            with os.scandir(parent_dir) as it:
+                for entry in it:
+                    count+=1
+                    if count>=2: break
+            if count < 2:
                 if os.path.isdir(child_dir):
                     return True
         else:
@@ -212,7 +522,13 @@ class Deleter(object):
 def main():
     """!Main program: parses arguments, sends them to Deleter.add() and calls Deleter.go()"""
     logger=logging.getLogger('hafs_scrub')
-    scrubber=Deleter(logger)
+    scrubber=Deleter(logger,
+        threads=int(os.environ.get('HAFS_SCRUB_THREADS','8') or '8'),
+        rate=float(os.environ.get('HAFS_SCRUB_RATE','0') or '0'),
+        trash=os.environ.get('HAFS_SCRUB_TRASH','') or None,
+        trash_age=float(os.environ.get('HAFS_SCRUB_TRASH_AGE','86400')
+                        or '86400'))
+    detach=os.environ.get('HAFS_SCRUB_DETACH','NO').upper()=='YES'
 
     # NOTE:
     # Multistorm &WORKhafs;, &COMhafs; and &CONFhafs;  passed in from the entity
@@ -243,7 +559,7 @@ def main():
             logger.info('Only the scrub flag %s was passed to hafs_scrub, provide some dirs to scrub.'%(do_scrub))
         else:
             scrubber.add(sys.argv[1])
-            scrubber.go()
+            scrubber.go(detach=detach)
     # hafs_scrub.py  YES|NO WORK|COM
     else:
         do_scrub=sys.argv[1].upper()
@@ -270,20 +586,20 @@ def main():
                         scrubber.add(tmpdir)
                         logger.info('Scrub job: %s , Removing %s since it was created by this task.'%(scrub_job,tmpdir))
                 logger.info('Used conf file to determine scrub dir: %s : %s'%(scrubdir,environ_CONFhafs))
-                scrubber.go()
+                scrubber.go(detach=detach)
             else:
                 if scrub_job == 'COM':
                     if scrubber.add_tmpdir_check(environ_WORKhafs,tmpdir):
                         scrubber.add(tmpdir)
                         logger.info('Scrub job: %s , Removing %s since it was created by this task.'%(scrub_job,tmpdir))
-                        scrubber.go()
+                        scrubber.go(detach=detach)
                 logger.info('Scrub job: %s , Not scrubbing since arg for scrub action is: %s'%(scrub_job,do_scrub))
 
         # hafs_scrub.py  YES|NO /directory/one [/directory/two [...]]
         elif do_scrub=='YES':
             for arg in sys.argv[2:]:
                 scrubber.add(arg)
-            scrubber.go()
+            scrubber.go(detach=detach)
 
         elif do_scrub=='NO':
             logger.info('Scrub job: %s , Not scrubbing since arg for scrub action is not YES: %s'%(scrub_job,do_scrub))
@@ -291,7 +607,7 @@ def main():
         else:
             for arg in sys.argv[1:]:
                 scrubber.add(arg)
-            scrubber.go()
+            scrubber.go(detach=detach)
 
 
 if __name__=='__main__':
@@ -1,6 +1,8 @@
 #! /usr/bin/env python3
 
+import os
 import numpy as np
+import hafs.gridindex
 
 def distance_on_unit_sphere(lat1, long1, lat2, long2):
     ''' compute the distance on the sphere between points (or arrays)'''
@@ -30,9 +32,11 @@ def distance_on_unit_sphere(lat1, long1, lat2, long2):
 
     return dist
 
-def find_subset(target_grid, lon_src, lat_src):
+def find_subset(target_grid, lon_src, lat_src, source=None):
     ''' for a given regional target grid, find the subset of the source grid
-    (usually global) containing the target grid to reduce compute time '''
+    (usually global) containing the target grid to reduce compute time.
+    source is the file the source coordinates came from, as for
+    hafs.gridindex.source_key, so they are not hashed on every call '''
     ny, nx = lon_src.shape
 
     lon_bl_tgt = target_grid.coords[0][0][0, 0]
@@ -44,26 +48,18 @@ def find_subset(target_grid, lon_src, lat_src):
     lon_ur_tgt = target_grid.coords[0][0][-1, -1]
     lat_ur_tgt = target_grid.coords[0][1][-1, -1]  # upper right
 
-    dist_2_bottom_left_corner = distance_on_unit_sphere(lon_bl_tgt, lat_bl_tgt,
-                                                        lon_src, lat_src)
-    j_bl_src, i_bl_src = np.unravel_index(dist_2_bottom_left_corner.argmin(),
-                                           dist_2_bottom_left_corner.shape)
-
-    dist_2_bottom_right_corner = distance_on_unit_sphere(lon_br_tgt,
-                                                         lat_br_tgt,
-                                                         lon_src, lat_src)
-    j_br_src, i_br_src = np.unravel_index(dist_2_bottom_right_corner.argmin(),
-                                           dist_2_bottom_right_corner.shape)
-
-    dist_2_upper_left_corner = distance_on_unit_sphere(lon_ul_tgt, lat_ul_tgt,
-                                                       lon_src, lat_src)
-    j_ul_src, i_ul_src = np.unravel_index(dist_2_upper_left_corner.argmin(),
-                                           dist_2_upper_left_corner.shape)
-
-    dist_2_upper_right_corner = distance_on_unit_sphere(lon_ur_tgt, lat_ur_tgt,
-                                                        lon_src, lat_src)
-    j_ur_src, i_ur_src = np.unravel_index(dist_2_upper_right_corner.argmin(),
-                                           dist_2_upper_right_corner.shape)
+    # The nearest source point to each corner, with the source grid
+    # index built once per grid.  Longitudes and latitudes are passed
+    # in the order distance_on_unit_sphere was called with, which
+    # gives the same nearest points.
+    index = hafs.gridindex.cached(lon_src, lat_src,
+                                  directory=os.environ.get('HAFS_GRIDINDEX_DIR'),
+                                  source=source)
+    j_src, i_src = index.nearest(
+        np.array([lon_bl_tgt, lon_br_tgt, lon_ul_tgt, lon_ur_tgt]),
+        np.array([lat_bl_tgt, lat_br_tgt, lat_ul_tgt, lat_ur_tgt]))
+    j_bl_src, j_br_src, j_ul_src, j_ur_src = j_src
+    i_bl_src, i_br_src, i_ul_src, i_ur_src = i_src
 
     imin = min(i_bl_src, i_ul_src)
     imax = max(i_br_src, i_ur_src)
@@ -294,10 +294,12 @@ class obc_variable():
                 self.kew = -1  # -1 = non periodic for drown sosie
         else:
             # Allow to provide lon/lat from existing array
+            source = None
             if x_coords is not None and y_coords is not None:
                 lon_src = x_coords
                 lat_src = y_coords
             else:
+                source = (filename,) + tuple(coord_names)
                 lons = ncdf.read_field(filename, coord_names[0])
                 lats = ncdf.read_field(filename, coord_names[1])
                 if len(lons.shape) == 1:
@@ -309,7 +311,7 @@ class obc_variable():
             # autocrop
             if autocrop:
                 self.imin_src, self.imax_src, self.jmin_src, self.jmax_src = \
-                    lc.find_subset(self.grid_target, lon_src, lat_src)
+                    lc.find_subset(self.grid_target, lon_src, lat_src, source)
                 lon_src = lon_src[self.jmin_src:self.jmax_src,
                                   self.imin_src:self.imax_src]
                 lat_src = lat_src[self.jmin_src:self.jmax_src,
@@ -337,10 +337,12 @@ class obc_vectvariable():
         # so that we know the periodicity
 
         # Allow to provide lon/lat from existing array
+        source = None
         if x_coords is not None and y_coords is not None:
             lon_src = x_coords
             lat_src = y_coords
         else:
+            source = (filename,) + tuple(coord_names)
             lons = ncdf.read_field(filename, coord_names[0])
             lats = ncdf.read_field(filename, coord_names[1])
             if len(lons.shape) == 1:
@@ -352,7 +354,7 @@ class obc_vectvariable():
         # autocrop
         if autocrop:
             imin_src, imax_src, jmin_src, jmax_src = \
-                lc.find_subset(self.grid_target, lon_src, lat_src)
+                lc.find_subset(self.grid_target, lon_src, lat_src, source)
             lon_src = lon_src[jmin_src:jmax_src, imin_src:imax_src]
             lat_src = lat_src[jmin_src:jmax_src, imin_src:imax_src]
 
@@ -173,7 +173,7 @@ class ACL(object):
         @param acl the access control list description"""
         if self.__acl is not None: self.free()
         sacl=str(acl)
-        cacl=ctypes.c_char_p(sacl)
+        cacl=ctypes.c_char_p(sacl.encode('ascii'))
         self.__acl=self.__libacl.acl_from_text(cacl)
         errno=get_errno()
         if self.__acl is None or self.__acl==0:
@@ -196,8 +196,8 @@ class ACL(object):
         @returns self"""
         if self.__acl is not None: self.free()
         sfilename=str(filename)
-        cfilename=ctypes.c_char_p(sfilename)
-        self.__acl=self.__libacl.acl_get_file(filename,which)
+        cfilename=ctypes.c_char_p(os.fsencode(sfilename))
+        self.__acl=self.__libacl.acl_get_file(cfilename,which)
         errno=get_errno()
         if self.__acl is None or self.__acl==0:
             self.__acl=None
@@ -260,7 +260,7 @@ class ACL(object):
                 "Tried to set a file's ACL, while providing an invalid ACL.",
                 errno)
         sfn=str(filename)
-        cfn=ctypes.c_char_p(sfn)
+        cfn=ctypes.c_char_p(os.fsencode(sfn))
         r=self.__libacl.acl_set_file(cfn,access,self.__acl)
         errno=get_errno()
         if r is not None and r!=0:
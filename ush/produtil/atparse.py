@@ -1,9 +1,17 @@
 #! /usr/bin/env python3
 
 """!ATParser is a text parser that replaces strings with variables and
-function output."""
+function output.
 
-import sys, os, re, io, logging
+Files parsed with ATParser.parse_file are first compiled into a list
+of instructions (literal text, variable lookups, @@[...] expansions and
+@@** if/elseif/else blocks) by compile_lines.  The compiled form is
+cached by file path, modification time and size, so a template that
+is rendered many times is only read and scanned once.  Rendering
+walks the instructions in a single pass.  Other input (parse_lines,
+parse_stream and parse_line) is interpreted line by line."""
+
+import sys, os, re, io, logging, threading
 
 ##@var functions
 # List of functions recognized
@@ -15,6 +23,8 @@ functions=dict(lc=lambda x:str(x).lower(),
 
 class ParserSyntaxError(Exception): 
     """!Raised when the parser encounters a syntax error."""
+class ParserLineLimit(Exception):
+    """!Raised when the parser reads more than max_lines lines."""
 class ScriptAssertion(Exception):
     """!Raised when a script @[VARNAME:?message] is encountered, and
     the variable does not exist."""
@@ -63,6 +73,53 @@ def replace_backslashed(text):
     else:
         return text
 
+# Regular expressions for the parser.  These are compiled once here
+# rather than on every line.
+
+##@var re_if
+# Matches an "@** if" directive
+re_if=re.compile(r'^\s*\@\*\*\s*if\s+([A-Za-z_][A-Za-z_0-9.]*)\s*([!=])=\s*(.*?)\s*$')
+
+##@var re_abort
+# Matches an "@** abort" directive
+re_abort=re.compile(r'^\s*\@\*\*\s*abort\s+(.*)$')
+
+##@var re_warn
+# Matches an "@** warn" directive
+re_warn=re.compile(r'^\s*\@\*\*\s*warn\s+(.*)$')
+
+##@var re_elseif
+# Matches an "@** elseif" directive
+re_elseif=re.compile(r'^\s*\@\*\*\s*else\s*if\s+([A-Za-z_][A-Za-z_0-9.]*)\s*([!=])=\s*(.*?)\s*\Z')
+
+##@var re_else
+# Matches an "@** else" directive
+re_else=re.compile(r'^\s*\@\*\*\s*else\s*(?:\#.*)?$')
+
+##@var re_endif
+# Matches an "@** endif" directive
+re_endif=re.compile(r'^\s*\@\*\*\s*endif\s*(?:\#.*)?$')
+
+##@var re_insert
+# Matches an "@** insert" directive
+re_insert=re.compile(r'^\s*\@\*\*\s*insert\s*(\S.*?)\s*$')
+
+##@var re_include
+# Matches an "@** include" directive
+re_include=re.compile(r'^\s*\@\*\*\s*include\s*(\S.*?)\s*$')
+
+##@var re_directive
+# Matches any "@**" directive
+re_directive=re.compile(r'^\s*\@\*\*.*')
+
+##@var re_at_block
+# Matches an @[...] block
+re_at_block=re.compile(r'\@\[((?:\n|[^\]])*)\]')
+
+##@var re_plain_var
+# Matches the contents of an @[...] block that is only a variable name
+re_plain_var=re.compile(r'\A[a-z_A-Z][a-zA-Z_0-9]*\Z')
+
 # Parser states:
 
 ##@var outer 
@@ -270,7 +327,16 @@ class ATParser:
             lineno+=1
 
     def parse_file(self,filename):
-        """!Read a file and parse its contents.
+        """!Read a file and parse its contents.  The file is compiled
+        with compile_file, which reuses the cached compiled form if
+        the file has not changed, and the result is rendered.
+        @param filename the name of this file for error messages"""
+        self.render(compile_file(filename,self.max_lines))
+
+    def interpret_file(self,filename):
+        """!Read a file and parse its contents line by line, without
+        compiling it.  This gives the same output as parse_file, and
+        is kept for comparison and benchmarking.
         @param filename the name of this file for error messages"""
         lineno=1
         with open(filename,'rt') as f:
@@ -278,6 +344,68 @@ class ATParser:
                 self.parse_line(line,filename,lineno)
                 lineno+=1
 
+    def render(self,template):
+        """!Writes the output of a compiled template to the stream.
+        The output is written once at the end, or when an exception
+        is raised, whatever was produced before the exception.
+        @param template a CompiledTemplate"""
+        out=list()
+        try:
+            self._render(template.instructions,out)
+        finally:
+            if out: self._write(''.join(out))
+
+    def _render(self,instructions,out):
+        """!Internal implementation function; do not call directly.
+        Appends the output of a list of compiled instructions to a list.
+        @param instructions the instructions from a CompiledTemplate
+        @param out the list of output strings
+        @protected"""
+        varhash=self.varhash
+        for inst in instructions:
+            op=inst[0]
+            if op==OP_TEXT:
+                out.append(inst[1])
+            elif op==OP_LINE:
+                for (kind,value) in inst[1]:
+                    if kind==OP_TEXT:
+                        out.append(value)
+                    elif kind==OP_VAR:
+                        if value in varhash:
+                            out.append(varhash[value])
+                        else:
+                            raise NoSuchVariable(self.infile,value)
+                    else:
+                        # Assignments return None, which re.subn in
+                        # parse_line treats as an empty string.
+                        value=self.require_data(value)
+                        if value: out.append(value)
+            elif op==OP_IF:
+                # As in parse_line, the elseif conditions after the
+                # chosen branch are still evaluated, so they raise
+                # NoSuchVariable the same way.
+                used=False
+                for (left,comp,right,body) in inst[1]:
+                    if left is None:
+                        if not used: self._render(body,out)
+                        break
+                    match = self.optional_var(left)==self.replace_vars(right)
+                    if not used and match == (comp=='='):
+                        self._render(body,out)
+                        used=True
+            elif op==OP_ABORT:
+                raise ScriptAbort('Found an abort directive on line %d: %s'%(
+                    inst[2], inst[1]))
+            elif op==OP_WARN:
+                self.warn(self.replace_vars(inst[1]))
+            elif op==OP_INSERT:
+                out.append(self.require_file(inst[1]))
+            elif op==OP_INCLUDE:
+                contents=self.require_file(inst[1])
+                included=compile_lines(contents.splitlines(),inst[1],
+                                       self.max_lines)
+                self._render(included.instructions,out)
+
     def require_file(self,filename_pattern):
         """!Read the contents of a file and return it.
         @param filename_pattern a filename with ${} or @@[] blocks in it.
@@ -470,7 +598,7 @@ class ATParser:
         top_state=self.top_state
         replace_state=self.replace_state
 
-        m=re.match(r'^\s*\@\*\*\s*if\s+([A-Za-z_][A-Za-z_0-9.]*)\s*([!=])=\s*(.*?)\s*$',line)
+        m=re_if.match(line)
         if m:
             # This is the beginning of an IF block
             if not self.active:
@@ -495,20 +623,20 @@ class ATParser:
 #                self.push_state( if_unused_if if(comp=='=') else if_active_if )
             return
 
-        m=re.match(r'^\s*\@\*\*\s*abort\s+(.*)$',line)
+        m=re_abort.match(line)
         if m:
             if self.active:
                 raise ScriptAbort('Found an abort directive on line %d: %s'%(
                     lineno, m.group(1)))
             return
 
-        m=re.match(r'^\s*\@\*\*\s*warn\s+(.*)$',line)
+        m=re_warn.match(line)
         if m:
             if self.active:
                 self.warn(self.replace_vars(m.group(1)))
             return
 
-        m=re.match('^\s*\@\*\*\s*else\s*if\s+([A-Za-z_][A-Za-z_0-9.]*)\s*([!=])=\s*(.*?)\s*\Z',line)
+        m=re_elseif.match(line)
         if m:
             if top_state('ignore'): return
             (left, comp, right) = m.groups()
@@ -539,7 +667,7 @@ class ATParser:
                     replace_state(if_active_if)
             return
 
-        m=re.match(r'^\s*\@\*\*\s*else\s*(?:\#.*)?$',line)
+        m=re_else.match(line)
         if m:
             if top_state("used_if"):
                 replace_state(if_inactive_else)
@@ -557,7 +685,7 @@ class ATParser:
                 replace_state(if_inactive_else)
             return
 
-        m=re.match(r'^\s*\@\*\*\s*endif\s*(?:\#.*)?$',line)
+        m=re_endif.match(line)
         if m:
             if top_state('in_if_block') or top_state('in_ifelse_block'):
                 self.pop_state()
@@ -565,14 +693,14 @@ class ATParser:
                 raise ParserSyntaxError('Found an endif without matching if at line %d'%lineno)
             return
 
-        m=re.match(r'^\s*\@\*\*\s*insert\s*(\S.*?)\s*$',line)
+        m=re_insert.match(line)
         if m:
             if self.active:
                 contents=self.require_file(m.group(1))
                 self._write(contents)
             return
 
-        m=re.match(r'^\s*\@\*\*\s*include\s*(\S.*?)\s*$',line)
+        m=re_include.match(line)
         if m:
             if self.active:
                 ffilename=m.group(1)
@@ -580,7 +708,7 @@ class ATParser:
                 self.parse_lines(contents,ffilename)
             return
 
-        m=re.match(r'^\s*\@\*\*.*',line)
+        m=re_directive.match(line)
         if m:
             raise ParserSyntaxError('Invalid \@** directive in line \"%s\".  Ignoring line.\n'%(line,))
         
@@ -589,7 +717,7 @@ class ATParser:
 
         # Replace text of the form @[VARNAME] with the contents of the
         # respective environment variable:
-        (outline,n)=re.subn(r'\@\[((?:\n|[^\]])*)\]',
+        (outline,n)=re_at_block.subn(
                     lambda x: self.require_data(x.group(0)[2:-1]),
                     line)
         if not isinstance(outline,str):
@@ -597,3 +725,222 @@ class ATParser:
         self._write(outline)
         if lineno>self.max_lines:
             raise ParserLineLimit('Read past max_lines=%d lines from input file.  Something is probably wrong.'%self.max_lines)
+
+########################################################################
+
+# Instruction codes for compiled templates:
+
+##@var OP_TEXT
+# Compiled instruction: literal text
+OP_TEXT=0
+
+##@var OP_VAR
+# Compiled instruction: insert the value of a plain variable
+OP_VAR=1
+
+##@var OP_DATA
+# Compiled instruction: expand the contents of an @[...] block
+OP_DATA=2
+
+##@var OP_LINE
+# Compiled instruction: a line of OP_TEXT, OP_VAR and OP_DATA parts
+OP_LINE=3
+
+##@var OP_IF
+# Compiled instruction: an if/elseif/else/endif block
+OP_IF=4
+
+##@var OP_ABORT
+# Compiled instruction: an @** abort directive
+OP_ABORT=5
+
+##@var OP_WARN
+# Compiled instruction: an @** warn directive
+OP_WARN=6
+
+##@var OP_INSERT
+# Compiled instruction: an @** insert directive
+OP_INSERT=7
+
+##@var OP_INCLUDE
+# Compiled instruction: an @** include directive
+OP_INCLUDE=8
+
+class CompiledTemplate(object):
+    """!A template compiled by compile_lines or compile_file.  Pass
+    it to ATParser.render to produce output.  The object does not
+    depend on any variables, so one CompiledTemplate can be rendered
+    by many ATParser objects."""
+    def __init__(self,instructions,filename):
+        """!CompiledTemplate constructor.  Do not call this directly:
+        use compile_lines or compile_file.
+        @param instructions the list of instructions
+        @param filename the name of the source file"""
+        self.instructions=instructions
+        self.filename=filename
+    ##@var instructions
+    # The list of instructions.  Each is a tuple whose first element
+    # is one of the OP_* constants.
+
+    ##@var filename
+    # The source file name, for error messages.
+
+def _compile_text(line):
+    """!Internal implementation function; do not call directly.
+    Compiles a line of text that is not a directive.
+    @param line the line of text
+    @returns an OP_TEXT or OP_LINE instruction"""
+    if line.find('@[')<0:
+        return (OP_TEXT,line)
+    parts=list()
+    start=0
+    for m in re_at_block.finditer(line):
+        if m.start()>start:
+            parts.append((OP_TEXT,line[start:m.start()]))
+        data=m.group(1)
+        if re_plain_var.match(data):
+            parts.append((OP_VAR,data))
+        else:
+            parts.append((OP_DATA,data))
+        start=m.end()
+    if start<len(line):
+        parts.append((OP_TEXT,line[start:]))
+    return (OP_LINE,parts)
+
+def compile_lines(lines,filename='(string)',max_lines=1000000):
+    """!Compiles a template into a CompiledTemplate.
+    @param lines an iterable of lines of text.  Line endings, if
+      present, are passed through to the output.
+    @param filename the name of the source, for error messages
+    @param max_lines the maximum number of lines to read
+    @returns a new CompiledTemplate
+    @raise ParserSyntaxError for mismatched if, elseif, else and
+      endif directives, or unknown @** directives
+    @raise ParserLineLimit if there are more than max_lines lines"""
+    top=list()
+    # Stack of open if blocks.  Each entry is [branches, body, saw_else]
+    stack=list()
+    body=top
+    lineno=0
+    for line in lines:
+        lineno+=1
+        if lineno>max_lines:
+            raise ParserLineLimit('Read past max_lines=%d lines from input file.  Something is probably wrong.'%max_lines)
+        if line.find('@**')<0:
+            body.append(_compile_text(line))
+            continue
+        m=re_if.match(line)
+        if m:
+            (left,comp,right)=m.groups()
+            ifbody=list()
+            branches=[(left,comp,right,ifbody)]
+            body.append((OP_IF,branches))
+            stack.append([branches,body,False])
+            body=ifbody
+            continue
+        m=re_abort.match(line)
+        if m:
+            body.append((OP_ABORT,m.group(1),lineno))
+            continue
+        m=re_warn.match(line)
+        if m:
+            body.append((OP_WARN,m.group(1)))
+            continue
+        m=re_elseif.match(line)
+        if m:
+            if not stack:
+                raise ParserSyntaxError(
+                    'Found an elseif without a matching if at line %d'%lineno)
+            if stack[-1][2]:
+                raise ParserSyntaxError(
+                    'Unexpected elseif after an else at line %d'%lineno)
+            (left,comp,right)=m.groups()
+            body=list()
+            stack[-1][0].append((left,comp,right,body))
+            continue
+        m=re_else.match(line)
+        if m:
+            if not stack:
+                raise ParserSyntaxError('Found an else outside an if at line %d'%lineno)
+            if stack[-1][2]:
+                raise ParserSyntaxError('Found an extra else at line %d'%lineno)
+            body=list()
+            stack[-1][0].append((None,None,None,body))
+            stack[-1][2]=True
+            continue
+        m=re_endif.match(line)
+        if m:
+            if not stack:
+                raise ParserSyntaxError('Found an endif without matching if at line %d'%lineno)
+            body=stack.pop()[1]
+            continue
+        m=re_insert.match(line)
+        if m:
+            body.append((OP_INSERT,m.group(1)))
+            continue
+        m=re_include.match(line)
+        if m:
+            body.append((OP_INCLUDE,m.group(1)))
+            continue
+        m=re_directive.match(line)
+        if m:
+            raise ParserSyntaxError('Invalid \@** directive in line \"%s\".  Ignoring line.\n'%(line,))
+        body.append(_compile_text(line))
+    return CompiledTemplate(top,filename)
+
+##@var _compiled_files
+# Cache of compiled files, used by compile_file.  Maps from the file's
+# real path and max_lines to a tuple ((mtime, size), CompiledTemplate).
+_compiled_files=dict()
+
+##@var _compiled_files_lock
+# Lock for _compiled_files.
+_compiled_files_lock=threading.Lock()
+
+def compile_file(filename,max_lines=1000000):
+    """!Compiles a file into a CompiledTemplate, or returns the cached
+    one if the file's modification time and size have not changed.
+    @param filename the file to compile
+    @param max_lines the maximum number of lines to read
+    @returns a CompiledTemplate"""
+    path=os.path.realpath(filename)
+    key=(path,max_lines)
+    st=os.stat(path)
+    stamp=(st.st_mtime_ns,st.st_size)
+    with _compiled_files_lock:
+        cached=_compiled_files.get(key,None)
+    if cached is not None and cached[0]==stamp:
+        return cached[1]
+    with open(filename,'rt') as f:
+        template=compile_lines(f,filename,max_lines)
+    with _compiled_files_lock:
+        _compiled_files[key]=(stamp,template)
+    return template
+
+def benchmark(filename,varhash=None,repeat=100):
+    """!Compares the time taken to render a file with the compiled
+    template (parse_file) and the line-by-line interpreter
+    (interpret_file).  Checks that both produce the same output.
+    @param filename the template file
+    @param varhash the variables; if None, os.environ is used
+    @param repeat how many times to render the file with each method
+    @returns a dict with the seconds per render for "compiled" and
+      "interpreted" and their ratio as "speedup"
+    @raise AssertionError if the outputs differ"""
+    import time
+    results=dict()
+    outputs=dict()
+    for (name,method) in ( ('interpreted','interpret_file'),
+                           ('compiled','parse_file') ):
+        start=time.time()
+        for i in range(repeat):
+            stream=io.StringIO()
+            parser=ATParser(stream,varhash=varhash)
+            getattr(parser,method)(filename)
+        results[name]=(time.time()-start)/repeat
+        outputs[name]=stream.getvalue()
+    if outputs['compiled']!=outputs['interpreted']:
+        raise AssertionError('%s: compiled and interpreted output differ'
+                             %(filename,))
+    results['speedup']=results['interpreted']/max(results['compiled'],1e-9)
+    return results
@@ -0,0 +1,347 @@
+#! /usr/bin/env python3
+
+"""!Remembers content digests of files so they need not be re-read.
+
+Deciding whether two products are identical, or whether a product
+already delivered is intact, normally requires reading every byte.
+This module stores a digest of each file's contents in a sidecar
+index in the file's directory (a JSON file named ".produtil-checksums")
+keyed by the file name.  Each record also holds the size, modification
+time, inode and device of the file when the digest was computed.  A
+record is only used if all of those still match, so a file that was
+rewritten, truncated or replaced is re-read.
+
+@code
+import produtil.checksum
+if produtil.checksum.same_content('a.grb2','b.grb2'):
+    print('identical')
+produtil.checksum.digests(list_of_files,threads=8) # parallel
+@endcode
+
+Digests are computed with xxhash (xxh3_128) if that module is
+installed, otherwise with BLAKE2b from hashlib.  The index is
+advisory, like produtil.jobcache: problems reading or writing it are
+logged at debug level and ignored, and at worst a digest is computed
+again.  produtil.fileop.deliver_file records the digest of each
+delivered file when checksums are enabled: set $PRODUTIL_CHECKSUMS to
+"yes", or pass checksum=True.  Unless checksums are enabled, digest()
+and same_content() never write an index, so comparing files does not
+leave sidecars in the directories compared.
+
+New records are kept in memory and written in batches by flush(),
+which happens after every flush_every records to the same index, at
+the end of digests(), and when Python exits.  Each flush holds a
+produtil.locking lock on ".produtil-checksums.lock" while it merges
+its records into the current index and renames the result into
+place, so concurrent jobs do not lose each other's records."""
+
+##@var __all__
+# List of symbols exported by "from produtil.checksum import *"
+__all__=['enabled','sidecar','compute','lookup','check','record','digest',
+         'digests','same_content','propagate','flush']
+
+import os, json, hashlib, threading, tempfile, logging, atexit
+
+try:
+    import xxhash
+except ImportError:
+    xxhash=None
+
+##@var enabled
+# If True, produtil.fileop.deliver_file records digests of delivered
+# files by default.  Initialized from $PRODUTIL_CHECKSUMS.
+enabled=os.environ.get('PRODUTIL_CHECKSUMS','').lower() in ('1','yes','true')
+
+##@var algorithm
+# The digest algorithm used for new digests.
+algorithm='xxh3_128' if xxhash is not None and hasattr(xxhash,'xxh3_128') \
+    else 'blake2b'
+
+##@var sidecar_name
+# The name of the sidecar index in each directory.
+sidecar_name='.produtil-checksums'
+
+##@var module_logger
+# Logger used for messages about the index itself.
+module_logger=logging.getLogger('produtil.checksum')
+
+##@var _lock
+# Protects the in-memory indexes between threads.
+_lock=threading.Lock()
+
+##@var flush_every
+# Number of new records for one index kept in memory before they are
+# written.
+flush_every=64
+
+##@var _write_lock
+# Serializes updates of sidecar indexes by threads of this process, so
+# they do not overwrite each other's records.
+_write_lock=threading.Lock()
+
+##@var _pending
+# Mapping from sidecar path to a dict of records not yet written.
+# Protected by _lock.
+_pending=dict()
+
+##@var _indexes
+# Mapping from sidecar path to (signature,data) where the signature
+# identifies the version of the sidecar file that was read.
+_indexes=dict()
+
+def sidecar(filename):
+    """!Returns the path to the sidecar index that holds the record
+    of a file.
+    @param filename the file"""
+    return os.path.join(os.path.dirname(os.path.abspath(filename)),
+                        sidecar_name)
+
+def _key(st):
+    """!Internal function; do not call directly.  Returns the part of
+    a record that must match the file's current os.stat result."""
+    return [ int(st.st_size), int(st.st_mtime_ns), int(st.st_ino),
+             int(st.st_dev) ]
+
+def _hasher(algo):
+    """!Internal function; do not call directly.  Returns a new hash
+    object for the given algorithm name."""
+    if algo.startswith('xxh'):
+        if xxhash is None:
+            raise ValueError('%s: xxhash is not installed'%(algo,))
+        return getattr(xxhash,algo)()
+    return hashlib.new(algo)
+
+def compute(filename,algo=None,blocksize=4194304):
+    """!Reads a file and returns its digest, without using the index.
+    @param filename the file to read
+    @param algo the algorithm; default: the module's algorithm
+    @param blocksize read this many bytes at a time"""
+    h=_hasher(algo or algorithm)
+    with open(filename,'rb') as f:
+        while True:
+            block=f.read(blocksize)
+            if not block: break
+            h.update(block)
+    return h.hexdigest()
+
+def _read(path):
+    """!Internal function; do not call directly.  Returns the contents
+    of a sidecar index as a dict, using the in-memory copy if the file
+    has not changed."""
+    try:
+        st=os.stat(path)
+    except EnvironmentError:
+        return dict()
+    signature=(st.st_size,st.st_mtime_ns,st.st_ino)
+    with _lock:
+        cached=_indexes.get(path,None)
+        if cached is not None and cached[0]==signature:
+            return cached[1]
+    try:
+        with open(path,'rt') as f:
+            data=json.load(f)
+        if not isinstance(data,dict): data=dict()
+    except (EnvironmentError,ValueError) as e:
+        module_logger.debug('%s: cannot read: %s'%(path,str(e)))
+        data=dict()
+    with _lock:
+        _indexes[path]=(signature,data)
+    return data
+
+def _get(filename):
+    """!Internal function; do not call directly.  Returns the record of
+    a file, whether still pending or in its index, without checking
+    it against the file."""
+    path=sidecar(filename)
+    name=os.path.basename(filename)
+    with _lock:
+        rec=_pending.get(path,{}).get(name,None)
+    if rec is None:
+        rec=_read(path).get(name,None)
+    return rec
+
+def _record_for(filename,st=None):
+    """!Internal function; do not call directly.  Returns the record of
+    a file if it matches the file's current state, otherwise None.
+    @param filename the file
+    @param st the os.stat of the file, if known"""
+    if st is None:
+        st=os.stat(filename)
+    rec=_get(filename)
+    if isinstance(rec,dict) and rec.get('key',None)==_key(st):
+        return rec
+    return None
+
+def lookup(filename,algo=None):
+    """!Returns the recorded digest of a file, or None if there is no
+    valid record for it.  Only the file's metadata is read.
+    @param filename the file
+    @param algo the algorithm; default: the module's algorithm"""
+    try:
+        rec=_record_for(filename)
+    except EnvironmentError:
+        return None
+    if rec is not None and rec.get('algorithm',None)==(algo or algorithm):
+        return rec.get('digest',None)
+    return None
+
+def check(filename):
+    """!Checks a file against its record without reading it.
+    @param filename the file
+    @returns True if the file is unchanged since its digest was
+      recorded, False if it was recorded but has changed (or no longer
+      exists), or None if there is no record"""
+    rec=_get(filename)
+    if not isinstance(rec,dict):
+        return None
+    try:
+        return rec.get('key',None)==_key(os.stat(filename))
+    except EnvironmentError:
+        return False
+
+def _write(path,records):
+    """!Internal function; do not call directly.  Merges records into
+    a sidecar index while holding its lock file, and atomically
+    replaces the index.
+    @param path the sidecar index
+    @param records a dict of records to add"""
+    import produtil.locking
+    if not produtil.locking.locks_okay:
+        return # exiting after a fatal signal
+    try:
+        with produtil.locking.LockFile(path+'.lock',logger=module_logger,
+                                       max_tries=20,sleep_time=0.5,
+                                       giveup_quiet=True):
+            data=dict(_read(path))
+            data.update(records)
+            (fd,tmp)=tempfile.mkstemp(prefix=sidecar_name+'.',
+                                      dir=os.path.dirname(path))
+            try:
+                with os.fdopen(fd,'wt') as f:
+                    json.dump(data,f,sort_keys=True)
+                os.chmod(tmp,0o644)
+                os.rename(tmp,path)
+            except:
+                os.unlink(tmp)
+                raise
+    except (EnvironmentError,TypeError,ValueError,
+            produtil.locking.LockHeld) as e:
+        module_logger.debug('%s: cannot write: %s'%(path,str(e)))
+
+def flush(path=None):
+    """!Writes records kept in memory to their sidecar indexes.
+    @param path the sidecar index to write, or None for all of them"""
+    with _write_lock:
+        with _lock:
+            if path is None:
+                todo=list(_pending.items())
+                _pending.clear()
+            else:
+                todo=[(path,_pending.pop(path,{}))]
+        for (p,records) in todo:
+            if records: _write(p,records)
+
+atexit.register(flush)
+
+def record(filename,digest_value=None,algo=None,st=None,flush_now=None):
+    """!Records a file's digest in its sidecar index.  The record is
+    kept in memory, and written with others for the same index by
+    flush().  Other records written to the index since it was read
+    are kept.
+    @param filename the file
+    @param digest_value the digest; if None, it is computed
+    @param algo the algorithm of the digest; default: the module's
+      algorithm
+    @param st the os.stat of the file when the digest was computed,
+      if known
+    @param flush_now if True, write the index now; if False, do not;
+      if None, write it once flush_every records are waiting
+    @returns the digest"""
+    algo=algo or algorithm
+    if st is None:
+        st=os.stat(filename)
+    if digest_value is None:
+        digest_value=compute(filename,algo)
+    path=sidecar(filename)
+    rec={ 'key':_key(st), 'algorithm':algo, 'digest':digest_value }
+    with _lock:
+        records=_pending.setdefault(path,dict())
+        records[os.path.basename(filename)]=rec
+        if flush_now is None:
+            flush_now=len(records)>=flush_every
+    if flush_now:
+        flush(path)
+    return digest_value
+
+def digest(filename,algo=None,save=None):
+    """!Returns the digest of a file: the recorded one if it is still
+    valid, otherwise a new one.
+    @param filename the file
+    @param algo the algorithm; default: the module's algorithm
+    @param save if True, record a new digest; the default is the
+      value of enabled"""
+    algo=algo or algorithm
+    if save is None: save=enabled
+    st=os.stat(filename)
+    rec=_record_for(filename,st)
+    if rec is not None and rec.get('algorithm',None)==algo:
+        return rec['digest']
+    value=compute(filename,algo)
+    if save: record(filename,value,algo,st)
+    return value
+
+def digests(filenames,threads=8,algo=None,save=None):
+    """!Returns the digests of many files, reading those without
+    valid records in parallel.  Any new records are written before
+    returning.
+    @param filenames a list of files
+    @param threads the number of files to read at once
+    @param algo the algorithm; default: the module's algorithm
+    @param save if True, record new digests; the default is the
+      value of enabled
+    @returns a dict mapping from file name to digest"""
+    import concurrent.futures
+    filenames=list(filenames)
+    if len(filenames)<2 or threads<=1:
+        result=dict([ (f,digest(f,algo,save)) for f in filenames ])
+    else:
+        with concurrent.futures.ThreadPoolExecutor(
+                max_workers=min(threads,len(filenames))) as pool:
+            futures=[ (f,pool.submit(digest,f,algo,save))
+                      for f in filenames ]
+        result=dict([ (f,future.result()) for (f,future) in futures ])
+    for path in set([ sidecar(f) for f in filenames ]):
+        flush(path)
+    return result
+
+def same_content(file1,file2,algo=None,save=None):
+    """!Returns True if two files have the same contents.  Files of
+    different sizes are never read.  Otherwise, their digests are
+    compared, using recorded ones when valid.
+    @param file1,file2 the files to compare
+    @param algo the algorithm; default: the module's algorithm
+    @param save if True, record new digests; the default is the
+      value of enabled"""
+    st1=os.stat(file1)
+    st2=os.stat(file2)
+    if os.path.samestat(st1,st2):
+        return True
+    if st1.st_size!=st2.st_size:
+        return False
+    return digest(file1,algo,save)==digest(file2,algo,save)
+
+def propagate(fromfile,tofile):
+    """!Records the digest of a file that was just copied or moved from
+    another file, if the source has a valid record, without reading
+    either file.
+    @param fromfile the source file, which must still exist; for a
+      move, use lookup() before the move and record() after it
+    @param tofile the new file
+    @returns True if a record was written"""
+    try:
+        rec=_record_for(fromfile)
+    except EnvironmentError:
+        return False
+    if rec is None: return False
+    record(tofile,rec['digest'],rec['algorithm'])
+    return True
@@ -11,6 +11,7 @@ __all__=['Cluster','where','longname','name','group_quotas','acl_support',
          'MSUOrion','NOAAJet','NOAAGAEA','NOAAHera','NOAAWCOSS']
 
 import time, socket, os, re
+import produtil.jobcache
 
 ##@var DO_NOT_SET
 # Special values for parameters that should not be set.
@@ -84,9 +85,16 @@ def set_cluster(there):
 def where():
     """!Guesses what cluster the program is running on, and if it
     cannot, returns a cluster named "noname" with reasonable defaults.
-    The result is stored in the module scope "here" variable."""
+    The result is stored in the module scope "here" variable.  The
+    name of the detected Cluster class is shared with later processes
+    in the same batch allocation through produtil.jobcache, so they
+    can skip the filesystem probes."""
     global here
     if here is None:
+        cached=produtil.jobcache.get('cluster_class')
+        if cached in _where_classes:
+            here=_where_classes[cached]()
+            return here
         if os.path.exists('/lfs3'):
             here=NOAAJet()
         elif os.path.exists('/glade'):
@@ -104,6 +112,8 @@ def where():
             here=NOAAGAEA()
         else:
             here=Cluster(False,False,False,'noname','noname')
+        if type(here).__name__ in _where_classes:
+            produtil.jobcache.put('cluster_class',type(here).__name__)
     return here
 
 def longname():
@@ -263,6 +273,13 @@ class NOAAWCOSS(Cluster):
         now=int(time.time())
         if self._production is None or \
                 now-self._lastprod>self._prod_cache_time:
+            # Another process in this batch allocation may have
+            # checked recently enough:
+            cached=produtil.jobcache.get('production:'+str(self.name))
+            if cached and now-int(cached[1])<=self._prod_cache_time:
+                self._production=bool(cached[0])
+                self._lastprod=int(cached[1])
+                return self._production
             prod=False
             if os.path.exists('/lfs/h1/ops/prod/config/prodmachinefile'):
                 with open('/lfs/h1/ops/prod/config/prodmachinefile','rt') as f:
@@ -273,6 +290,8 @@ class NOAAWCOSS(Cluster):
                                 break
             self._production=prod
             self._lastprod=int(time.time())
+            produtil.jobcache.put('production:'+str(self.name),
+                                  [prod,self._lastprod])
             return prod
         else:
             return self._production
@@ -293,3 +312,10 @@ class WCOSS2(NOAAWCOSS):
             elif host1=='s':        name='dogwood'
             else:                   name='cactus'
         super(WCOSS2,self).__init__(name=name)
+
+##@var _where_classes
+# Cluster classes that where() may detect and cache by name.  Each
+# must be constructible with no arguments.
+_where_classes=dict( [ (c.__name__,c) for c in (
+            NOAAJet, UCARYellowstone, WisconsinS4, NOAAHera, WCOSS2,
+            NOAAGAEA ) ] )
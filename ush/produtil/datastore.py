@@ -8,7 +8,7 @@ created by some Task.  Both Product and Task classes derive from
 Datum, which is the base class of anything that can be stored in the
 Datastore."""
 
-import sqlite3, threading, collections, re, contextlib, time, random,\
+import threading, collections, re, contextlib, time, random,\
     traceback, datetime, logging, os, time
 import produtil.fileop, produtil.locking, produtil.sigsafety, produtil.log
 
@@ -178,7 +178,8 @@ class Datastore(object):
         if logger is not None:
             logger.debug('Lockfile is %s for database %s'%(lockfile,filename))
         self._file_lock=produtil.locking.LockFile(
-            lockfile,logger=logger,max_tries=300,sleep_time=0.1,first_warn=50)
+            lockfile,logger=logger,max_tries=None,timeout=600,sleep_time=0.1,
+            first_warn=50)
         self._transtack=collections.defaultdict(list)
         with self.transaction() as tx:
             self._createdb(self._connection())
@@ -196,6 +197,7 @@ class Datastore(object):
             if tid in self._connections:
                 return self._connections[tid]
             else:
+                import sqlite3
                 c=sqlite3.connect(self.filename)
                 self._connections[tid]=c
                 return c
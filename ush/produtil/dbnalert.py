@@ -1,17 +1,41 @@
 #! /usr/bin/env python3
 
 """!This module runs the NCO dbn_alert program, or logs dbn_alert messages
-if run with dbn alerts disabled."""
+if run with dbn alerts disabled.
+
+A DBNAlert normally runs dbn_alert and waits for it.  A job that
+delivers many products can instead give its DBNAlert objects an
+AlertDispatcher, which queues the alerts and sends them from
+background threads.  Alerts of the same product type (the second
+dbn_alert argument) are always sent in the order they were queued.
+In batch mode, queued alerts of one type are sent by a single
+dbn_alert process that reads one record per line from stdin.  The
+dispatcher() function returns a shared dispatcher that is flushed when
+the program exits.
+
+@code
+alerter=DBNAlert(['MODEL','{type}','{job}','{location}'],
+                 dispatcher=produtil.dbnalert.dispatcher())
+for prod in products:
+    prod.deliver()
+    alerter(type='HAFS_GB2',location=prod.location) # returns at once
+produtil.dbnalert.dispatcher().flush() # wait for every alert
+@endcode
+
+The ush/produtil_dbn_alert_stub.py program accepts the same
+arguments as dbn_alert, and the batch mode, and records the alerts in
+a file, for testing."""
 
 ##@var __all__
 # Symbols exported by "from produtil.dbnalert import *"
-__all__=["DBNAlert"]
+__all__=["DBNAlert","AlertDispatcher","dispatcher"]
 
-import logging, os
-import produtil.run
+import logging, os, collections, threading, atexit, shlex
 
-from produtil.prog import Runner
-from produtil.run import checkrun, batchexe, alias, run
+# The produtil.run module, and the MPI implementation detection it
+# brings in, is imported on first use instead of here.  This module is
+# imported by produtil.setup, so every job would otherwise pay for
+# that import, even if it never sends an alert.
 
 # Globals:
 
@@ -31,10 +55,19 @@ send_dbn_alerts=True
 # True = I have already warned that $DBNROOT is unset
 no_DBNROOT_warn=False
 
+##@var _dispatcher
+# The shared AlertDispatcher returned by dispatcher(), or None
+_dispatcher=None
+
+##@var _dispatcher_lock
+# Protects _dispatcher
+_dispatcher_lock=threading.Lock()
+
 def find_dbn_alert():
     """!Locates the dbn_alert executable based on environment
     variables, and returns it as a produtil.prog.Runner object."""
     global no_DBNROOT_warn
+    from produtil.run import batchexe, alias
     ENV=os.environ
     if ENV.get('DBNROOT','')!='':
         return alias(batchexe(os.path.join(ENV['DBNROOT'],'bin/dbn_alert')))
@@ -51,13 +84,19 @@ class DBNAlert(object):
     object.  It allows the instructions on how to make the call to be
     stored for later use by a produtil.datastore.Product object's
     add_callback and call_callbacks functions."""
-    def __init__(self,args,loglevel=logging.WARNING,alert_exe=None):
+    def __init__(self,args,loglevel=logging.WARNING,alert_exe=None,
+                 dispatcher=None):
         """!Create a new DBNAlert object that can be used to send an
         alert later on.
         @param args The arguments to dbn_alert.
         @param alert_exe The dbn_alert executable name.
         @param loglevel A Python logging level to log messages before each
-        alert."""
+        alert.
+        @param dispatcher Optional: an AlertDispatcher that sends the
+        alerts in the background, instead of running dbn_alert and
+        waiting for it."""
+        from produtil.prog import Runner
+        from produtil.run import alias
         if not isinstance(args,list) and not isinstance(args,tuple):
             raise TypeError('In DBNAlert(), the first argument must be a list or tuple of arguments to send to dbn_alert')
         if alert_exe is not None and not isinstance(alert_exe,str) \
@@ -69,6 +108,7 @@ class DBNAlert(object):
         self.alert_exe=alert_exe
         if self.alert_exe is None: self.alert_exe=find_dbn_alert()
         self.loglevel=loglevel
+        self.dispatcher=dispatcher
     ##@var alert_args
     # Array of arguments to the alert function
 
@@ -78,6 +118,10 @@ class DBNAlert(object):
     ##@var alert_exe
     # Alert executable
 
+    ##@var dispatcher
+    # The AlertDispatcher that sends the alerts, or None to send them
+    # immediately
+
     def __call__(self,**kwargs):
         """!Expands strings specified in the constructor and calls
         dbn_alert with the results.  If dbn alerts are disabled, then
@@ -87,7 +131,10 @@ class DBNAlert(object):
         assert(job is not None)
         kwargs['job']=str(job)
         alert_args=[ s.format(**kwargs) for s in self.alert_args ]
-        if send_dbn_alerts:
+        if send_dbn_alerts and self.dispatcher is not None:
+            self.dispatcher.submit(self.alert_exe,alert_args)
+        elif send_dbn_alerts:
+            from produtil.run import batchexe, run
             if isinstance(self.alert_exe,str):
                 cmd=batchexe(self.alert_exe)[alert_args]
             else:
@@ -100,6 +147,181 @@ class DBNAlert(object):
             log.log(self.loglevel,'dbn_alert is disabled')
             log.log(self.loglevel,'would run: dbn_alert '+( " ".join(alert_args) ))
 
+########################################################################
+class AlertDispatcher(object):
+    """!Sends dbn_alerts from background threads.
+
+    Queued alerts are kept in one queue per product type.  Each
+    worker thread takes the next alert, or in batch mode the next
+    alerts, of a type that no other worker is sending, so alerts of one type are sent in order,
+    and up to "workers" types are sent at once."""
+    def __init__(self,workers=4,batch=False,batch_size=100,
+                 batch_args=('--batch',),logger=None):
+        """!AlertDispatcher constructor.
+        @param workers the maximum number of dbn_alert processes at once
+        @param batch if True, send several alerts of one type with one
+          dbn_alert process, which reads one record per line from stdin
+        @param batch_size the maximum number of alerts in one batch
+        @param batch_args the arguments that put dbn_alert in batch mode
+        @param logger a logging.Logger for messages; default: the
+          module's logger"""
+        self.workers=max(1,int(workers))
+        self.batch=bool(batch)
+        self.batch_size=max(1,int(batch_size))
+        self.batch_args=[ str(a) for a in batch_args ]
+        self._logger=logger
+        self._cond=threading.Condition()
+        self._queues=collections.OrderedDict()
+        self._busy=set()
+        self._pending=0
+        self._failed=0
+        self._threads=list()
+        self._closing=False
+
+    ##@var workers
+    # The maximum number of dbn_alert processes at once
+
+    ##@var batch
+    # If True, send several alerts of one type with one dbn_alert process
+
+    ##@var batch_size
+    # The maximum number of alerts in one batch
+
+    ##@var batch_args
+    # The arguments that put dbn_alert in batch mode
+
+    @property
+    def logger(self):
+        """!The logging.Logger for messages."""
+        if self._logger is not None: return self._logger
+        return log if log is not None else logging.getLogger('dbn_alert')
+
+    def submit(self,alert_exe,alert_args):
+        """!Queues an alert.  Called by DBNAlert.__call__.
+        @param alert_exe the dbn_alert executable name or
+          produtil.prog.Runner
+        @param alert_args the expanded arguments"""
+        key=alert_args[1] if len(alert_args)>1 else ''
+        exekey=alert_exe if isinstance(alert_exe,str) else repr(alert_exe)
+        with self._cond:
+            if self._closing:
+                raise RuntimeError('AlertDispatcher is closed')
+            queue=self._queues.get(key,None)
+            if queue is None:
+                queue=self._queues[key]=collections.deque()
+            queue.append((alert_exe,exekey,list(alert_args)))
+            self._pending+=1
+            if len(self._threads)<self.workers and \
+                    len(self._threads)<len(self._queues):
+                thread=threading.Thread(target=self._work,
+                                        name='dbn_alert-%d'%(len(self._threads),))
+                thread.daemon=True
+                self._threads.append(thread)
+                thread.start()
+            self._cond.notify_all()
+
+    def _take(self):
+        """!Internal function; do not call directly.  Waits for a
+        product type with queued alerts that no worker is sending.
+        @returns (key,list of alerts), or None when closing with no
+          alerts left"""
+        with self._cond:
+            while True:
+                for (key,queue) in self._queues.items():
+                    if queue and key not in self._busy:
+                        # A batch only has alerts for one executable.
+                        alerts=[ queue.popleft() ]
+                        while self.batch and queue and \
+                                len(alerts)<self.batch_size and \
+                                queue[0][1]==alerts[0][1]:
+                            alerts.append(queue.popleft())
+                        self._busy.add(key)
+                        return (key,alerts)
+                if self._closing and not self._pending:
+                    return None
+                self._cond.wait()
+
+    def _work(self):
+        """!Internal function; do not call directly.  The worker
+        thread's main loop."""
+        while True:
+            taken=self._take()
+            if taken is None: return
+            (key,alerts)=taken
+            failed=0
+            try:
+                failed=self._send(alerts)
+            except Exception as e:
+                self.logger.error('Cannot send dbn_alert: %s'%(str(e),),
+                                  exc_info=True)
+                failed=len(alerts)
+            finally:
+                with self._cond:
+                    self._busy.discard(key)
+                    self._pending-=len(alerts)
+                    self._failed+=failed
+                    self._cond.notify_all()
+
+    def _send(self,alerts):
+        """!Internal function; do not call directly.  Runs dbn_alert
+        for a list of alerts of one product type.
+        @returns the number of alerts that failed"""
+        from produtil.run import batchexe, run
+        alert_exe=alerts[0][0]
+        if isinstance(alert_exe,str):
+            alert_exe=batchexe(alert_exe)
+        if self.batch and len(alerts)>1:
+            records=''.join([ ' '.join([ shlex.quote(a) for a in args ])+'\n'
+                              for (exe,exekey,args) in alerts ])
+            cmd=alert_exe[self.batch_args] << records
+        else:
+            cmd=alert_exe[alerts[0][2]]
+        self.logger.info('DBN Alert: %s (%d alerts)'%(repr(cmd),len(alerts)))
+        ret=run(cmd)
+        if ret!=0:
+            self.logger.error('Exit status %s from dbn_alert for: %s'%(
+                repr(ret),'; '.join([ ' '.join(args)
+                                      for (exe,exekey,args) in alerts ])))
+            return len(alerts)
+        return 0
+
+    def flush(self):
+        """!Waits until every queued alert was sent.
+        @returns the number of alerts that failed since the last flush"""
+        with self._cond:
+            while self._pending:
+                self._cond.wait()
+            failed=self._failed
+            self._failed=0
+        return failed
+
+    def close(self):
+        """!Sends every queued alert, then stops the worker threads.
+        No more alerts can be queued.
+        @returns the number of alerts that failed since the last flush"""
+        failed=self.flush()
+        with self._cond:
+            self._closing=True
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join()
+        return failed
+
+def dispatcher():
+    """!Returns the shared AlertDispatcher, creating it the first time.
+    Its number of workers is $PRODUTIL_DBN_WORKERS (default 4) and it
+    uses batch mode if $PRODUTIL_DBN_BATCH is "yes".  It is closed,
+    sending all queued alerts, when the program exits."""
+    global _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher is None:
+            ENV=os.environ
+            _dispatcher=AlertDispatcher(
+                workers=int(ENV.get('PRODUTIL_DBN_WORKERS','4') or 4),
+                batch=ENV.get('PRODUTIL_DBN_BATCH','NO').upper()=='YES')
+            atexit.register(_dispatcher.close)
+        return _dispatcher
+
 ########################################################################
 def init_logging(logger=None):
     """!Initializes logging for this module.  The argument is either a
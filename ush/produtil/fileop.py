@@ -17,13 +17,37 @@ __all__=['FileOpError','FileOpErrors','CannotLinkMulti',
          'make_symlink','replace_symlink','unblock','fortcopy',
          'norm_expand_path','norm_abs_path','check_last_lines',
          'wait_for_files','FileWaiter','call_fcntrl','gribver',
-         'netcdfver','touch']
+         'netcdfver','touch','copy_fd','deliver_files']
 
 import os,sys,tempfile,filecmp,stat,shutil,errno,random,time,fcntl,math,logging
-import produtil.cluster, produtil.pipeline
+import produtil.cluster, produtil.pipeline, produtil.checksum
 
 module_logger=logging.getLogger('produtil.fileop')
 
+##@var copy_methods
+# Kernel copy methods tried, in order, by copy_fd before falling back
+# to a read/write loop.  Remove entries to disable them.
+# * ficlone --- share the data blocks with a reflink (btrfs, XFS)
+# * copy_file_range --- copy within the kernel, server-side on NFS 4.2
+# * sendfile --- copy within the kernel
+copy_methods=[ 'ficlone', 'copy_file_range', 'sendfile' ]
+
+##@var FICLONE
+# The Linux ioctl request number that makes a reflink of a whole file.
+FICLONE=0x40049409
+
+##@var _unsupported_copy
+# Copy methods the kernel or Python does not provide; these are not
+# retried.
+_unsupported_copy=set()
+
+##@var _copy_fallback_errors
+# Errors from kernel copy methods that mean "use the next method"
+# rather than a failed copy.
+_copy_fallback_errors=set([ errno.EXDEV, errno.EINVAL, errno.ENOSYS,
+    errno.EOPNOTSUPP, errno.ENOTTY, errno.EBADF, errno.EPERM,
+    getattr(errno,'ENOTSUP',errno.EOPNOTSUPP) ])
+
 ########################################################################
 class FileOpError(Exception):
     """!This is the superclass of several exceptions relating to
@@ -342,12 +366,130 @@ def isnonempty(filename):
     ret=s is not None and s.st_size>0
     return ret
 
-########################################################################    
+########################################################################
+def copy_fd(infd,outfd,blocksize=1048576,size=None):
+    """!Copies the rest of one open file to another, without passing
+    the data through user space when possible.
+
+    The methods in copy_methods are tried in order: a reflink
+    (FICLONE), which only works at the start of an empty output file,
+    then os.copy_file_range, then os.sendfile.  If the kernel or
+    filesystem does not support one, the next is tried, resuming where
+    the previous one stopped.  The last resort is an os.read/os.write
+    loop.  Both file positions are advanced past the copied data.
+
+    @param infd the input file descriptor, positioned where the copy
+      starts
+    @param outfd the output file descriptor
+    @param blocksize bytes per system call
+    @param size the input file size, if known; used to recognize
+      files (like those in /proc) that report a size of zero but
+      still have data
+    @returns the name of the method that finished the copy"""
+    if size is None:
+        size=os.fstat(infd).st_size
+    # Bytes the copy must move.  Zero means the size is unknown.
+    expect=max(0,size-os.lseek(infd,0,os.SEEK_CUR)) if size>0 else 0
+    for method in copy_methods:
+        if method in _unsupported_copy: continue
+        try:
+            if method=='ficlone':
+                if size<=0 or os.lseek(infd,0,os.SEEK_CUR)!=0 or \
+                        os.lseek(outfd,0,os.SEEK_CUR)!=0:
+                    continue
+                fcntl.ioctl(outfd,FICLONE,infd)
+                os.lseek(infd,size,os.SEEK_SET)
+                os.lseek(outfd,size,os.SEEK_SET)
+                return method
+            elif method=='copy_file_range':
+                if not hasattr(os,'copy_file_range'):
+                    _unsupported_copy.add(method)
+                    continue
+                copied=0
+                while True:
+                    n=os.copy_file_range(infd,outfd,blocksize)
+                    if n<=0: break
+                    copied+=n
+                expect-=copied
+                if (size>0 and expect<=0) or (size<=0 and copied>0):
+                    return method
+                # A short copy resumes with the next method.  Files in
+                # /proc report size zero but have data that only
+                # read() returns.
+            elif method=='sendfile':
+                if not hasattr(os,'sendfile'):
+                    _unsupported_copy.add(method)
+                    continue
+                copied=0
+                while True:
+                    n=os.sendfile(outfd,infd,None,blocksize)
+                    if n<=0: break
+                    copied+=n
+                expect-=copied
+                if (size>0 and expect<=0) or (size<=0 and copied>0):
+                    return method
+        except EnvironmentError as e:
+            if e.errno==errno.ENOSYS:
+                _unsupported_copy.add(method)
+            if e.errno not in _copy_fallback_errors:
+                raise
+    while True:
+        data=os.read(infd,blocksize)
+        if not data: break
+        while data:
+            n=os.write(outfd,data)
+            data=data[n:]
+    return 'read/write'
+
+########################################################################
+def deliver_files(pairs,threads=8,logger=None,**kwargs):
+    """!Delivers many files concurrently with deliver_file.
+
+    Each delivery is still done in a unit operation: a copy to a
+    temporary file in the target directory, then a rename into place
+    (or a single rename if keep=False and the files are on the same
+    filesystem).  Up to "threads" deliveries run at once.  All
+    deliveries are attempted even if some fail.
+
+    @param pairs an iterable of (infile,outfile) tuples
+    @param threads maximum number of deliveries at once
+    @param logger the logging.Logger for log messages
+    @param kwargs other keyword arguments for deliver_file
+    @raise DeliveryFailed,VerificationFailed,EnvironmentError if one
+      delivery fails: the exception from deliver_file
+    @raise FileOpErrors if more than one delivery fails.  The "more"
+      list has a (from,to,message) tuple for each failure."""
+    import concurrent.futures
+    pairs=list(pairs)
+    if not pairs: return
+    if len(pairs)==1 or threads<=1:
+        for (infile,outfile) in pairs:
+            deliver_file(infile,outfile,logger=logger,**kwargs)
+        return
+    errors=list()
+    with concurrent.futures.ThreadPoolExecutor(
+            max_workers=min(threads,len(pairs))) as pool:
+        futures=[ (infile,outfile,pool.submit(deliver_file,infile,outfile,
+                                              logger=logger,**kwargs))
+                  for (infile,outfile) in pairs ]
+        for (infile,outfile,future) in futures:
+            try:
+                future.result()
+            except Exception as e:
+                errors.append((infile,outfile,e))
+    if len(errors)==1:
+        raise errors[0][2]
+    elif errors:
+        raise FileOpErrors('%d of %d deliveries failed'%(
+                len(errors),len(pairs)),errors[0][0],
+            [ (i,o,str(e)) for (i,o,e) in errors ])
+
+########################################################################
 def deliver_file(infile,outfile,keep=True,verify=False,blocksize=1048576,
                  tempprefix=None,permmask=0o02,removefailed=True,
                  logger=None,preserve_perms=True,preserve_times=True,
                  preserve_group=None,copy_acl=None,moveok=True, 
-                 force=True, copier=None):
+                 force=True, copier=None, checksum=None):
     """!This moves or copies the file "infile" to "outfile" in a unit
     operation; outfile will never be seen in an incomplete state.
 
@@ -379,7 +521,8 @@ def deliver_file(infile,outfile,keep=True,verify=False,blocksize=1048576,
       verify they are the same.  Note that providing a copier will 
       break the verification functionality if the copier changes the
       contents of the destination file (such as a copier that compresses).
-    @param blocksize block size during copy operations
+    @param blocksize block size during copy operations.  Data are
+      copied with copy_fd, in the kernel when possible.
     @param tempprefix Prefix for temporary files during copy operations.
       Do not include directory paths in the tempprefix.
     @param permmask Permission bits to remove Default: world write (002)
@@ -403,7 +546,13 @@ def deliver_file(infile,outfile,keep=True,verify=False,blocksize=1048576,
            copier(infile,temp_file_name,temp_file_object)
       Where the temp_file_name is the name of the destination file and
       the temp_file_object is an object that can be used to write to 
-      the file.  The copier should NOT close the temp_file_object. """
+      the file.  The copier should NOT close the temp_file_object. 
+    @param checksum If True, record the digest of the delivered file
+      in its produtil.checksum sidecar index.  The source's recorded
+      digest is reused when valid; otherwise the file is read.  The
+      default is produtil.checksum.enabled."""
+    if checksum is None:
+        checksum=produtil.checksum.enabled
     if preserve_group is None:
         preserve_group = not produtil.cluster.group_quotas()
     if copy_acl is None:
@@ -488,7 +637,10 @@ def deliver_file(infile,outfile,keep=True,verify=False,blocksize=1048576,
             if logger is not None:
                 logger.info('%s: move from %s'%(actual_outfile,infile))
             try:
+                known=produtil.checksum.lookup(infile) if checksum else None
                 os.rename(infile,actual_outfile)
+                if checksum:
+                    produtil.checksum.record(actual_outfile,known)
                 return
             except EnvironmentError as e:
                 if logger is not None:
@@ -511,8 +663,11 @@ def deliver_file(infile,outfile,keep=True,verify=False,blocksize=1048576,
         if logger is not None:
             logger.info('%s: copy to temporary %s'%(infile,tempname))
         if copier is None:
-            with open(infile,'rb') as indata:
-                shutil.copyfileobj(indata,temp,length=blocksize)
+            with open(infile,'rb',buffering=0) as indata:
+                method=copy_fd(indata.fileno(),temp.fileno(),blocksize,
+                               size=istat.st_size)
+            if logger is not None:
+                logger.debug('%s: copied with %s'%(tempname,method))
         else:
             copier(infile,tempname,temp)
         temp.close()
@@ -547,6 +702,10 @@ def deliver_file(infile,outfile,keep=True,verify=False,blocksize=1048576,
             os.utime(tempname,(istat.st_atime,istat.st_mtime))
         os.rename(tempname,actual_outfile)
         tempname=None
+        if checksum:
+            if copier is not None or \
+                    not produtil.checksum.propagate(infile,actual_outfile):
+                produtil.checksum.record(actual_outfile)
     except Exception as e:
         if logger is not None:
             logger.error('%s: delivery failed: %s'%(infile,str(e)))
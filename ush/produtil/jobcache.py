@@ -0,0 +1,192 @@
+#! /usr/bin/env python3
+
+"""!Caches detection results for the lifetime of a batch allocation.
+
+Detecting the MPI implementation, the cluster and the nodes of the
+current job requires searching the $PATH, probing the filesystem and
+running programs like "scontrol show hostnames."  The answers do not
+change during a batch allocation, but every process in the job pays
+for them again.  This module stores such results in a small JSON
+file keyed by the batch job ID and a fingerprint of the environment
+variables that can affect detection.  Later processes in the same
+allocation (with the same environment) reuse them.
+
+Outside of a batch job, or if $PRODUTIL_JOBCACHE is set to "0" or
+"no", nothing is cached and get() always returns the default.  The
+cache files are kept in a private directory, readable only by the
+user, inside $PRODUTIL_JOBCACHE_DIR if set, otherwise $TMPDIR,
+otherwise /tmp.  Since those are usually shared, the private directory
+and the cache file are only used if they belong to the user and no
+one else can write to them; otherwise nothing is cached.
+
+@code
+import produtil.jobcache
+nodes=produtil.jobcache.get('srun_nodes')
+if nodes is None:
+    nodes=expensive_detection()
+    produtil.jobcache.put('srun_nodes',nodes)
+@endcode
+
+Values must be representable in JSON.  The cache is advisory: any
+problem reading or writing the file is logged at debug level and
+ignored, and a racing writer at worst causes a result to be
+detected twice."""
+
+##@var __all__
+# List of symbols exported by "from produtil.jobcache import *"
+__all__=['get','put','cache_file','disable','allocation_id']
+
+import os, stat, json, hashlib, threading, tempfile, logging
+import produtil.batchsystem
+
+##@var fingerprint_vars
+# Environment variables whose values are part of the cache key.  If
+# any of these change, detection results are not reused.
+fingerprint_vars=[ 'PATH', 'SLURM_NODELIST', 'SLURM_JOB_CPUS_PER_NODE',
+                   'SLURM_PACK_SIZE', 'SLURM_HET_SIZE', 'PBS_NODEFILE',
+                   'LSB_HOSTS', 'INSIDE_APRUN', 'TOTAL_TASKS', 'PBS_NP',
+                   'PBS_NUM_PPN', 'MPI_IMPL', 'LOADEDMODULES' ]
+
+##@var module_logger
+# Logger used for messages about the cache itself.
+module_logger=logging.getLogger('produtil.jobcache')
+
+##@var _lock
+# Protects the module-level cache state between threads.
+_lock=threading.Lock()
+
+##@var _data
+# The in-memory copy of the cache, or None if it has not been read.
+_data=None
+
+##@var _disabled
+# If True, caching is turned off for this process.
+_disabled=False
+
+def disable():
+    """!Turns off caching for this process.  Later calls to get()
+    return the default, and put() does nothing."""
+    global _disabled
+    _disabled=True
+
+def allocation_id():
+    """!Returns the batch system's ID for the current allocation, or
+    None if this process is not in a batch job.  Unlike
+    produtil.batchsystem.jobid(), this ignores the NCO $pid, which
+    differs between processes in the same job."""
+    return produtil.batchsystem.getenvs(
+        ['SLURM_JOB_ID','PBS_JOBID','LSB_JOBID','MOAB_JOBID',
+         'COBALT_JOBID'])
+
+def fingerprint():
+    """!Returns a short hash of the environment variables in
+    fingerprint_vars."""
+    h=hashlib.sha1()
+    for var in fingerprint_vars:
+        h.update(('%s=%s\n'%(var,os.environ.get(var,''))).encode('utf-8'))
+    return h.hexdigest()[0:16]
+
+def cache_file():
+    """!Returns the path to the cache file for this allocation and
+    environment, or None if caching is disabled."""
+    if _disabled: return None
+    if os.environ.get('PRODUTIL_JOBCACHE','').lower() in ('0','no','false'):
+        return None
+    jobid=allocation_id()
+    if jobid is None: return None
+    cachedir=_private_dir(produtil.batchsystem.getenvs(
+        ['PRODUTIL_JOBCACHE_DIR','TMPDIR'],'/tmp'))
+    if cachedir is None: return None
+    safeid=''.join([ c if c.isalnum() or c in '.-_' else '_'
+                     for c in str(jobid) ])
+    return os.path.join(cachedir,'produtil-jobcache.%s.%s.json'%(
+            safeid,fingerprint()))
+
+def _trusted(st):
+    """!Internal implementation function; do not call directly.
+    Returns True if an os.stat result is of something owned by this
+    user that no one else can write to."""
+    return st.st_uid==os.getuid() and not st.st_mode&(stat.S_IWGRP|stat.S_IWOTH)
+
+def _private_dir(parent):
+    """!Internal implementation function; do not call directly.
+    Returns this user's private cache directory in a parent directory,
+    creating it with mode 0700 if needed, or None if it cannot be
+    created or is not private.
+    @param parent the parent directory, such as $TMPDIR"""
+    path=os.path.join(parent,'produtil-jobcache.%d'%(os.getuid(),))
+    try:
+        try:
+            os.mkdir(path,0o700)
+        except FileExistsError:
+            pass
+        st=os.lstat(path)
+    except EnvironmentError as e:
+        module_logger.debug('%s: cannot create: %s'%(path,str(e)))
+        return None
+    if not stat.S_ISDIR(st.st_mode) or not _trusted(st) or \
+            st.st_mode&(stat.S_IRWXG|stat.S_IRWXO):
+        module_logger.debug('%s: not a private directory; not caching'
+                            %(path,))
+        return None
+    return path
+
+def _read(filename):
+    """!Internal implementation function; do not call directly.
+    Reads the cache file and returns its contents as a dict.  A file
+    that is a symbolic link, belongs to another user, or that others
+    can write to is ignored."""
+    try:
+        fd=os.open(filename,os.O_RDONLY|getattr(os,'O_NOFOLLOW',0))
+        with os.fdopen(fd,'rt') as f:
+            if not _trusted(os.fstat(fd)):
+                module_logger.debug('%s: not trusted; ignoring'%(filename,))
+                return dict()
+            data=json.load(f)
+        if isinstance(data,dict): return data
+    except (EnvironmentError,ValueError) as e:
+        if not isinstance(e,FileNotFoundError):
+            module_logger.debug('%s: cannot read: %s'%(filename,str(e)))
+    return dict()
+
+def get(key,default=None):
+    """!Returns a cached value, or the default if the key is not in
+    the cache or caching is disabled.
+    @param key the string key
+    @param default the value to return if nothing is cached"""
+    global _data
+    filename=cache_file()
+    if filename is None: return default
+    with _lock:
+        if _data is None:
+            _data=_read(filename)
+        return _data.get(key,default)
+
+def put(key,value):
+    """!Stores a value in the cache.  The file is updated atomically
+    by writing a temporary file and renaming it into place.  Values
+    written by other processes since the file was read are kept.
+    @param key the string key
+    @param value a value representable in JSON"""
+    global _data
+    filename=cache_file()
+    if filename is None: return
+    with _lock:
+        data=_read(filename)
+        if _data is not None:
+            for k,v in _data.items():
+                data.setdefault(k,v)
+        data[key]=value
+        _data=data
+        try:
+            (fd,tmp)=tempfile.mkstemp(prefix=os.path.basename(filename)+'.',
+                                      dir=os.path.dirname(filename))
+            try:
+                with os.fdopen(fd,'wt') as f:
+                    json.dump(data,f)
+                os.rename(tmp,filename)
+            except:
+                os.unlink(tmp)
+                raise
+        except (EnvironmentError,TypeError,ValueError) as e:
+            module_logger.debug('%s: cannot write: %s'%(filename,str(e)))
@@ -14,15 +14,45 @@ import produtil.locking
 with produtil.locking.LockFile("some.lockfile"):
     ... do things while the file is locked...
 ...  the file is now unlocked ...
+@endcode
+
+A LockFile can wait for a lock in two ways.  The default is to poll
+with a non-blocking lock attempt, sleeping between attempts with a
+jittered exponential backoff that starts at a fraction of a second
+and grows towards the requested sleep_time.  That works on
+filesystems whose blocking locks are unreliable.  Alternatively,
+blocking=True waits for the lock in a helper thread using a blocking
+lock call, which is woken by the kernel the moment the lock is
+freed.  Either way, a timeout can be given to bound the total wait.
+Errors other than contention, such as a transient ENOLCK from a
+network filesystem, are retried the same way.
+
+Where the kernel supports them, the locks are Linux open file
+description locks (F_OFD_SETLK), which belong to the LockFile's own
+open file rather than to the whole process.  Hence two LockFile
+objects in one process exclude each other, and closing one file never
+releases a lock held through another.  Elsewhere, or on filesystems
+that reject them, POSIX lockf locks are used instead.
+
+Each LockFile keeps contention statistics (LockStats) and the module
+keeps process-wide totals, which can be sent to a logger with
+log_lock_stats():
+
+@code
+with produtil.locking.LockFile("x.lock",logger=logger,blocking=True,
+                               timeout=600):
+    ... do things while the file is locked ...
+produtil.locking.log_lock_stats(logger)
 @endcode"""
 
-import fcntl, time, errno, os.path
+import fcntl, time, errno, os, os.path, random, threading, logging, struct
 import produtil.retry as retry
 import produtil.fileop
 
 ##@var __all__
 # Symbols exported by "from produtil.locking import *"
-__all__=['LockingDisabled','disable_locking','LockFile','LockHeld']
+__all__=['LockingDisabled','disable_locking','LockFile','LockHeld',
+         'LockStats','lock_stats','log_lock_stats']
 
 ##@var locks
 # Part of the internal implementation of this module: the list of
@@ -35,6 +65,41 @@ locks=set()
 # False, LockingDisabled is raised on any attempt to acquire a lock.
 locks_okay=True
 
+##@var held_errnos
+# Part of the internal implementation of this module: errno values
+# from a non-blocking lock attempt that mean someone else holds the
+# lock.  POSIX allows either EACCES or EAGAIN.
+held_errnos=frozenset([errno.EACCES,errno.EAGAIN,errno.EWOULDBLOCK])
+
+def _lock_fd(fd,blocking):
+    """!Internal implementation function; do not call directly.
+    Places an exclusive lock on a whole file.  Uses an open file
+    description lock if possible, and a POSIX lockf lock otherwise.
+    @param fd the file descriptor
+    @param blocking if True, wait for the lock
+    @returns True if an open file description lock was used"""
+    if hasattr(fcntl,'F_OFD_SETLK'):
+        cmd=fcntl.F_OFD_SETLKW if blocking else fcntl.F_OFD_SETLK
+        try:
+            fcntl.fcntl(fd,cmd,struct.pack('hhqqi',fcntl.F_WRLCK,
+                                           os.SEEK_SET,0,0,0))
+            return True
+        except EnvironmentError as e:
+            if e.errno!=errno.EINVAL: raise
+    fcntl.lockf(fd,fcntl.LOCK_EX if blocking else fcntl.LOCK_EX|fcntl.LOCK_NB)
+    return False
+
+def _unlock_fd(fd,ofd):
+    """!Internal implementation function; do not call directly.
+    Releases a lock placed by _lock_fd.
+    @param fd the file descriptor
+    @param ofd the return value from _lock_fd"""
+    if ofd:
+        fcntl.fcntl(fd,fcntl.F_OFD_SETLK,struct.pack(
+                'hhqqi',fcntl.F_UNLCK,os.SEEK_SET,0,0,0))
+    else:
+        fcntl.lockf(fd,fcntl.LOCK_UN)
+
 def disable_locking():
     """!Entirely disables all locking in this module.  
 
@@ -54,6 +119,88 @@ def disable_locking():
             lock.release_impl()
         except (Exception,LockingDisabled) as l: pass
 
+class LockStats(object):
+    """!Counters of lock wait time and contention.
+
+    One of these is kept by every LockFile, and another holds the
+    totals for all LockFile objects in this process.  Wait times are
+    in seconds, measured from the start of acquire() until the lock
+    was obtained or the LockFile gave up.  An acquisition is
+    "contended" if the first attempt found the lock held by someone
+    else."""
+    def __init__(self):
+        """!Creates a LockStats with all counters set to zero."""
+        self._lock=threading.Lock()
+        self.acquired=0
+        self.contended=0
+        self.failed=0
+        self.attempts=0
+        self.total_wait=0.0
+        self.max_wait=0.0
+    ##@var acquired
+    # Number of times the lock was successfully acquired.
+
+    ##@var contended
+    # Number of acquire() calls that found the lock already held.
+
+    ##@var failed
+    # Number of acquire() calls that gave up without the lock.
+
+    ##@var attempts
+    # Total number of lock attempts, including the successful ones.
+
+    ##@var total_wait
+    # Total seconds spent inside acquire()
+
+    ##@var max_wait
+    # Longest time, in seconds, spent in a single acquire() call.
+
+    def add(self,attempts,wait,contended,acquired):
+        """!Records the outcome of one acquire() call.
+        @param attempts number of lock attempts made
+        @param wait seconds spent waiting
+        @param contended True if the lock was held by someone else
+        @param acquired True if the lock was obtained"""
+        with self._lock:
+            self.attempts+=attempts
+            self.total_wait+=wait
+            self.max_wait=max(self.max_wait,wait)
+            if contended: self.contended+=1
+            if acquired:
+                self.acquired+=1
+            else:
+                self.failed+=1
+    def as_dict(self):
+        """!Returns the counters as a dict."""
+        with self._lock:
+            return dict(acquired=self.acquired,contended=self.contended,
+                        failed=self.failed,attempts=self.attempts,
+                        total_wait=self.total_wait,max_wait=self.max_wait)
+    def __str__(self):
+        """!Returns a one-line human-readable summary."""
+        d=self.as_dict()
+        return ('acquired=%(acquired)d contended=%(contended)d '
+                'failed=%(failed)d attempts=%(attempts)d '
+                'total_wait=%(total_wait).3fs max_wait=%(max_wait).3fs'%d)
+
+##@var total_stats
+# Part of the internal implementation of this module: the LockStats
+# summed over all LockFile objects in this process.
+total_stats=LockStats()
+
+def lock_stats():
+    """!Returns a dict of process-wide lock statistics: the number of
+    locks acquired, contended and failed, the number of attempts, and
+    the total and maximum wait time in seconds."""
+    return total_stats.as_dict()
+
+def log_lock_stats(logger,level=logging.INFO):
+    """!Sends the process-wide lock statistics to a logger.
+    @param logger a logging.Logger
+    @param level the logging level for the message"""
+    if logger is not None:
+        logger.log(level,'file lock statistics: %s'%(str(total_stats),))
+
 class LockHeld(Exception):
     """!This exception is raised when a LockFile cannot lock a file
     because another process or thread has locked it already."""
@@ -79,18 +226,30 @@ class LockFile(object):
     def __eq__(self,other):
         """!Is this lock the same as that lock?"""
         return self is other
-    def __init__(self,filename,until=None,logger=None,max_tries=10,sleep_time=3,first_warn=0,giveup_quiet=False):
+    def __init__(self,filename,until=None,logger=None,max_tries=10,sleep_time=3,first_warn=0,giveup_quiet=False,
+                 blocking=False,timeout=None,min_sleep=0.05,backoff=1.5):
         """!Creates an object that will lock the specified file.  
         @param filename the file to lock
         @param until Unused.
         @param logger Optional: a logging.Logger to log messages
-        @param max_tries Optional: maximum tries before giving up on locking
-        @param sleep_time Optional: approximate sleep time between
+        @param max_tries Optional: maximum tries before giving up on
+          locking, or None for no limit.  If blocking=True, this only
+          limits retries of errors other than contention.
+        @param sleep_time Optional: maximum sleep time between
           locking attempts.
         @param first_warn Optional: first locking failure at which to
           write warnings to the logger
         @param giveup_quiet Optional: if True, do not log the final
-          failure to lock"""
+          failure to lock
+        @param blocking Optional: if True, wait for the lock with a
+          blocking lock call in a helper thread instead of polling.
+        @param timeout Optional: maximum total seconds to wait for the
+          lock, or None for no limit.  A blocking lock with no timeout
+          waits forever.
+        @param min_sleep Optional: the first sleep time between
+          polling attempts
+        @param backoff Optional: the factor by which the polling sleep
+          time grows after each failed attempt"""
         if not locks_okay:
             raise LockingDisabled('Attempted to create a LockFile object while the process was exiting.')
         self._logger=logger
@@ -101,7 +260,25 @@ class LockFile(object):
         self._sleep_time=sleep_time
         self._first_warn=first_warn
         self._giveup_quiet=giveup_quiet
+        self._blocking=bool(blocking)
+        self._timeout=timeout
+        self._min_sleep=min_sleep
+        self._backoff=backoff
         self._fd=None
+        self._ofd=False
+        self.stats=LockStats()
+    ##@var stats
+    # LockStats for this LockFile
+
+    def _record(self,attempts,wait,contended,acquired):
+        """!Internal implementation function; do not call directly.
+        Records the outcome of an acquire() call in this lock's
+        statistics and the process-wide totals."""
+        self.stats.add(attempts,wait,contended,acquired)
+        total_stats.add(attempts,wait,contended,acquired)
+        if contended and acquired and self._logger is not None:
+            self._logger.debug('%s: locked after %d attempts and %.3f '
+                               'seconds'%(self._filename,attempts,wait))
     def acquire_impl(self):
         """!Internal implementation function; do not call directly.
         Does the actual work of acquiring the lock, without retries,
@@ -116,9 +293,9 @@ class LockFile(object):
         if self._fd is None:
             self._fd=open(self._filename,'wb')
         try:
-            fcntl.lockf(self._fd.fileno(),fcntl.LOCK_EX|fcntl.LOCK_NB)
+            self._ofd=_lock_fd(self._fd.fileno(),False)
         except EnvironmentError as e:
-            if e.errno == errno.EAGAIN or e.errno == errno.EWOULDBLOCK:
+            if e.errno in held_errnos:
                 raise LockHeld('%s: already locked by another process or '
                                'thread: %s'% ( self._filename, str(e)))
             raise
@@ -127,21 +304,174 @@ class LockFile(object):
         Does the actual work of releasing the lock, without retries,
         logging or sleeping."""
         if self._fd is not None:
-            fcntl.lockf(self._fd.fileno(),fcntl.LOCK_UN)
+            _unlock_fd(self._fd.fileno(),self._ofd)
             self._fd.close()
             self._fd=None
     def acquire(self):
         """!Acquire the lock.  Will try for a while, and will raise
         LockHeld when giving up."""
         locks.add(self)
-        return retry.retry_io(self._max_tries,self._sleep_time,self.acquire_impl,
-                              fail=self._filename+': cannot lock',logger=self._logger,
-                              first_warn=self._first_warn,giveup_quiet=self._giveup_quiet)
+        if self._blocking:
+            return self._acquire_blocking()
+        else:
+            return self._acquire_polling()
+    def _giveup(self,attempts,start,why):
+        """!Internal implementation function; do not call directly.
+        Records and logs a failure to acquire the lock, and raises
+        LockHeld.
+        @param attempts number of lock attempts made
+        @param start time.time() at the start of acquire()
+        @param why a LockHeld exception or a message string"""
+        wait=time.time()-start
+        self._record(attempts,wait,True,False)
+        if self._logger is not None and not self._giveup_quiet:
+            self._logger.warning('%s: cannot lock (giving up after %d '
+                                 'tries and %.3f seconds): %s'%(
+                    self._filename,attempts,wait,str(why)))
+        if isinstance(why,LockHeld):
+            raise why
+        raise LockHeld('%s: %s'%(self._filename,str(why)))
+    def _acquire_polling(self,start=None,until_held=False):
+        """!Internal implementation function; do not call directly.
+        Acquires the lock by repeated non-blocking attempts with a
+        jittered exponential backoff between them.  Contention and
+        other errors are both retried.  Gives up after max_tries
+        attempts or when the timeout is reached, whichever comes
+        first, raising LockHeld if the lock was held or the last error
+        otherwise.
+        @param start time.time() at the start of acquire()
+        @param until_held if True, return the LockHeld exception and
+          the number of attempts made instead of retrying it, and
+          record nothing in that case
+        @returns None if the lock was acquired"""
+        if start is None: start=time.time()
+        deadline=None
+        if self._timeout is not None:
+            deadline=start+self._timeout
+        sleepmax=max(0.001,min(self._min_sleep,self._sleep_time or 0.1))
+        attempts=0
+        contended=False
+        while True:
+            attempts+=1
+            try:
+                self.acquire_impl()
+                self._record(attempts,time.time()-start,contended,True)
+                return
+            except Exception as e:
+                held=isinstance(e,LockHeld)
+                if held and until_held: return (e,attempts)
+                contended=contended or held
+                now=time.time()
+                if (self._max_tries is not None and \
+                        attempts>=self._max_tries) or \
+                        (deadline is not None and now>=deadline):
+                    if held: self._giveup(attempts,start,e)
+                    self._record(attempts,now-start,contended,False)
+                    raise
+                sleepme=random.uniform(sleepmax/2.0,sleepmax)
+                if deadline is not None:
+                    sleepme=min(sleepme,deadline-now)
+                if self._logger is not None and attempts>self._first_warn:
+                    self._logger.info('%s: cannot lock (try %d; sleep %.3f '
+                                      'and retry): %s'%(self._filename,
+                                      attempts,sleepme,str(e)))
+                time.sleep(max(0.0,sleepme))
+                sleepmax=min(self._sleep_time or 0.1,sleepmax*self._backoff)
+    def _acquire_blocking(self):
+        """!Internal implementation function; do not call directly.
+        Acquires the lock with a blocking lock call in a helper
+        thread, so that the lock is obtained as soon as it is freed.
+        Errors other than contention are retried with a backoff, up to
+        max_tries times.  If the timeout expires first, the helper
+        thread is abandoned: it takes ownership of its file descriptor
+        and releases the lock as soon as it gets it.
+
+        @warning The abandoned helper's lock is an open file
+        description lock, so closing its file releases nothing else.
+        Where only POSIX lockf locks are available, those belong to
+        the process, and closing the file also releases any lock
+        another LockFile in this process holds on the same file.  On
+        such systems, a timed-out blocking lock should be treated as a
+        fatal error."""
+        start=time.time()
+        # Fast path: no contention.  This also retries other errors.
+        lh=self._acquire_polling(start,until_held=True)
+        if lh is None: return
+        (lh,polled)=lh
+        if self._timeout is not None and self._timeout<=0:
+            self._giveup(polled,start,lh)
+        if self._logger is not None and self._first_warn<=1:
+            self._logger.info('%s: lock held; waiting%s'%(
+                    self._filename, '' if self._timeout is None
+                    else ' up to %.3f seconds'%(self._timeout,)))
+        fd=self._fd
+        max_tries=self._max_tries
+        if max_tries is None: max_tries=10
+        sleep_time=self._sleep_time or 0.1
+        state=dict(done=False,abandoned=False,error=None,ofd=False,tries=0)
+        statelock=threading.Lock()
+        event=threading.Event()
+        def waiter():
+            tries=0
+            while True:
+                tries+=1
+                with statelock:
+                    state['tries']=tries
+                try:
+                    ofd=_lock_fd(fd.fileno(),True)
+                    break
+                except Exception as e:
+                    with statelock:
+                        abandoned=state['abandoned']
+                        if tries>=max_tries or abandoned:
+                            state['error']=e
+                    if tries>=max_tries or abandoned:
+                        event.set()
+                        if abandoned: fd.close()
+                        return
+                    time.sleep(random.uniform(sleep_time/2.0,sleep_time))
+            with statelock:
+                state['done']=True
+                state['ofd']=ofd
+                abandoned=state['abandoned']
+            if abandoned:
+                # acquire() gave up on us, so release the lock now.
+                try:
+                    _unlock_fd(fd.fileno(),ofd)
+                finally:
+                    fd.close()
+            event.set()
+        thread=threading.Thread(target=waiter,name='lock '+self._filename)
+        thread.daemon=True
+        thread.start()
+        event.wait(self._timeout)
+        with statelock:
+            done=state['done']
+            error=state['error']
+            attempts=polled+state['tries']
+            if done: self._ofd=state['ofd']
+            if not done and error is None:
+                state['abandoned']=True
+                self._fd=None # the helper thread now owns the file
+        if done:
+            if not locks_okay:
+                self.release_impl()
+                raise LockingDisabled('Acquired a lock while the process '
+                                      'was exiting.')
+            self._record(attempts,time.time()-start,True,True)
+            return
+        elif error is not None:
+            self._record(attempts,time.time()-start,True,False)
+            raise error
+        self._giveup(attempts,start,'timed out after %.3f seconds'%(
+                self._timeout,))
     def release(self):
         """!Release the lock.  May raise exceptions on unexpected
         failures."""
         try:
-            return retry.retry_io(self._max_tries,self._sleep_time,self.release_impl,
+            max_tries=self._max_tries
+            if max_tries is None: max_tries=10
+            return retry.retry_io(max_tries,self._sleep_time,self.release_impl,
                                   fail=self._filename+': cannot unlock',logger=self._logger,
                                   first_warn=self._first_warn,giveup_quiet=self._giveup_quiet)
         except:
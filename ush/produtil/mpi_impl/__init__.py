@@ -128,6 +128,7 @@
 import logging
 import produtil.fileop
 import produtil.cluster
+import produtil.jobcache
 
 ##@var __all__
 # An empty list that indicates no symbols are exported by "from
@@ -348,8 +349,21 @@ def get_mpi(mpi_name=NO_NAME,force=False,logger=None,**kwargs):
                                       'is not available.'%(mpi_name,))
         return impl
 
-    # Finally, handle the case where auto-detection is requested:
-    for name in detection_order:
+    # Finally, handle the case where auto-detection is requested.
+    # Another process in this batch allocation may have done the work
+    # already, in which case produtil.jobcache knows the answer.  An
+    # empty string means no implementation was detected.
+    cached=produtil.jobcache.get('mpi_impl')
+    if cached=='':
+        return no_mpi.Implementation.detect(
+            force=force,logger=logger,**kwargs)
+    order=list(detection_order)
+    if cached in detectors:
+        # Try the cached implementation first.  If it fails, the
+        # normal detection order is used.
+        order.remove(cached)
+        order.insert(0,cached)
+    for name in order:
         detect=detectors[name]
         result=None
         try:
@@ -367,6 +381,9 @@ def get_mpi(mpi_name=NO_NAME,force=False,logger=None,**kwargs):
             pass
         if result:
             # Detection succeeded.
+            if name!=cached:
+                produtil.jobcache.put('mpi_impl',name)
             return result
+    produtil.jobcache.put('mpi_impl','')
     return no_mpi.Implementation.detect(
         force=force,logger=logger,**kwargs)
@@ -5,7 +5,7 @@
 import os, sys, logging
 import produtil.fileop,produtil.prog,produtil.mpiprog,produtil.run
 
-from .mpi_impl_base import MPIMixed,CMDFGen,ImplementationBase, \
+from .mpi_impl_base import find_exe,MPIMixed,CMDFGen,ImplementationBase, \
                            MPIThreadsMixed,MPILocalOptsMixed, \
                            guess_total_tasks
 from produtil.pipeline import NoMoreProcesses
@@ -57,7 +57,7 @@ class Implementation(ImplementationBase):
             if force:
                 mpirun_path='mpirun'
             else:
-                mpirun_path=produtil.fileop.find_exe('mpirun',raise_missing=True)
+                mpirun_path=find_exe('mpirun',raise_missing=True)
 
         if force:
             return Implementation(mpirun_path,mpiserial_path,total_tasks,logger,force,silent)
@@ -10,7 +10,7 @@
 import os, socket, logging, sys
 import produtil.fileop,produtil.prog,produtil.mpiprog, produtil.run
 
-from .mpi_impl_base import MPIMixed,CMDFGen,ImplementationBase
+from .mpi_impl_base import find_exe,MPIMixed,CMDFGen,ImplementationBase
 
 class Implementation(ImplementationBase):
     """!Adds support for LSF+aprun with the Intel OpenMP to produtil.run
@@ -56,7 +56,7 @@ class Implementation(ImplementationBase):
           and will use "mpirun" as the mpirun path if mpirun_path is missing"""
 
         if aprun_path is None:
-            aprun_path=produtil.fileop.find_exe('aprun',raise_missing=not force)
+            aprun_path=find_exe('aprun',raise_missing=not force)
             if force: aprun_path='aprun'
         detected=aprun_path is not None
         if detected:
@@ -95,7 +95,7 @@ class Implementation(ImplementationBase):
         self.logger=logger
 
         if aprun_path is None:
-            aprun_path=produtil.fileop.find_exe('aprun',raise_missing=True)
+            aprun_path=find_exe('aprun',raise_missing=True)
         self.aprun_path=aprun_path
         
         if not hyperthreads:
@@ -323,7 +323,7 @@ class Implementation(ImplementationBase):
                         raise MPIMixed('Trying to run aprun within aprun.  In mpiserial, you must run batchexe() programs only.')
                 except KeyError as ke: pass
             lines=[a for a in arg.to_arglist(to_shell=True,expand=True)]
-            if produtil.fileop.find_exe('mpiserial') is None:
+            if find_exe('mpiserial') is None:
                 raise MPISerialMissing(
                     'Attempting to run a serial program via aprun mpiserial but '
                     'the mpiserial program is not in your $PATH.')
@@ -16,10 +16,35 @@ import tempfile,stat,os, logging, io, re
 
 import produtil.prog
 import produtil.pipeline
+import produtil.fileop
+import produtil.jobcache
 from produtil.prog import shbackslash
 
 module_logger=logging.getLogger('produtil.mpi_impl')
 
+def find_exe(name,raise_missing=True):
+    """!Searches the $PATH for an executable, like
+    produtil.fileop.find_exe, but reuses the answer found by earlier
+    processes in the same batch allocation via produtil.jobcache.
+    Both found and missing executables are cached, since failed
+    searches are the common case during MPI implementation detection.
+    Only absolute paths are cached, so a relative $PATH entry cannot
+    point later processes elsewhere.
+    @param name the executable name
+    @param raise_missing if True, raise
+      produtil.fileop.CannotFindExe for missing executables;
+      otherwise return None"""
+    key='find_exe:'+name
+    path=produtil.jobcache.get(key)
+    if path is None or ( path and ( not os.path.isabs(path) or
+                                    not os.access(path,os.X_OK) ) ):
+        path=produtil.fileop.find_exe(name,raise_missing=False)
+        if path: path=os.path.abspath(path)
+        produtil.jobcache.put(key,path or '')
+    if path: return path
+    if not raise_missing: return None
+    raise produtil.fileop.CannotFindExe('cannot find executable',name)
+
 def guess_total_tasks(logger=None,silent=False):
     result=guess_total_tasks_impl(logger,silent)
     if logger and not silent:
@@ -123,8 +148,7 @@ class ImplementationBase(object):
         if not mpiserial_path or \
            not os.path.exists(mpiserial_path) or \
            not os.access(mpiserial_path,os.X_OK):
-            mpiserial_path=produtil.fileop.find_exe(
-                'mpiserial',raise_missing=False)
+            mpiserial_path=find_exe('mpiserial',raise_missing=False)
 
         if not mpiserial_path or \
            not os.path.exists(mpiserial_path) or \
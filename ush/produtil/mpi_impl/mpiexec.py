@@ -18,7 +18,7 @@
 import os, logging
 import produtil.fileop,produtil.prog,produtil.mpiprog,produtil.pipeline
 
-from .mpi_impl_base import MPIMixed,CMDFGen,ImplementationBase, \
+from .mpi_impl_base import find_exe,MPIMixed,CMDFGen,ImplementationBase, \
                            MPIThreadsMixed,MPILocalOptsMixed, \
                            guess_total_tasks
 from produtil.mpiprog import MIXED_VALUES
@@ -59,7 +59,7 @@ class Implementation(ImplementationBase):
         if logger is None:
             logger=logging.getLogger('mpi_impl')
         if mpiexec_path is None:
-            mpiexec_path=produtil.fileop.find_exe('mpiexec',raise_missing=not force)
+            mpiexec_path=find_exe('mpiexec',raise_missing=not force)
         if force and mpiexec_path is None:
             mpiexec_path='mpiexec'
         if mpiexec_path is None:
@@ -16,7 +16,7 @@
 import os, logging
 import produtil.fileop,produtil.prog,produtil.mpiprog,produtil.pipeline
 
-from .mpi_impl_base import CMDFGen,MPIMixed,MPIThreadsMixed, \
+from .mpi_impl_base import find_exe,CMDFGen,MPIMixed,MPIThreadsMixed, \
                            MPILocalOptsMixed,ImplementationBase
 from produtil.mpiprog import MIXED_VALUES
 
@@ -44,7 +44,7 @@ class Implementation(ImplementationBase):
             if force:
                 mpiexec_mpt_path='mpiexec_mpt'
             else:
-                mpiexec_mpt_path=produtil.fileop.find_exe( \
+                mpiexec_mpt_path=find_exe( \
                     'mpiexec_mpt',raise_missing=True)
 
         if logger is None:
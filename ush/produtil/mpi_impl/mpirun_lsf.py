@@ -17,7 +17,7 @@
 import os, socket, logging, io
 import produtil.fileop,produtil.prog,produtil.mpiprog,produtil.pipeline
 
-from .mpi_impl_base import MPIMixed,CMDFGen,ImplementationBase, \
+from .mpi_impl_base import find_exe,MPIMixed,CMDFGen,ImplementationBase, \
                            MPIThreadsMixed,MPILocalOptsMixed
 from produtil.mpiprog import MIXED_VALUES
 
@@ -52,7 +52,7 @@ class Implementation(ImplementationBase):
             if force:
                 mpirun_lsf_path='mpirun.lsf'
             else:
-                mpirun_lsf_path=produtil.fileop.find_exe(
+                mpirun_lsf_path=find_exe(
                     'mpirun.lsf',raise_missing=True)
         return Implementation(mpirun_lsf_path,mpiserial_path,logger,silent,force)
 
@@ -11,7 +11,7 @@
 import os, socket, logging, sys
 import produtil.fileop,produtil.prog,produtil.mpiprog, produtil.run
 
-from .mpi_impl_base import MPIMixed,CMDFGen,ImplementationBase
+from .mpi_impl_base import find_exe,MPIMixed,CMDFGen,ImplementationBase
 
 class Implementation(ImplementationBase):
     """!Adds support for PBS+mpiexec with the Intel OpenMP to produtil.run
@@ -55,7 +55,7 @@ class Implementation(ImplementationBase):
           and will use "mpirun" as the mpirun path if mpirun_path is missing"""
 
         if mpiexec_path is None:
-            mpiexec_path=produtil.fileop.find_exe('mpiexec',raise_missing=not force)
+            mpiexec_path=find_exe('mpiexec',raise_missing=not force)
             if force: mpiexec_path='mpiexec'
         detected=mpiexec_path is not None
         if detected:
@@ -94,7 +94,7 @@ class Implementation(ImplementationBase):
         self.logger=logger
 
         if mpiexec_path is None:
-            mpiexec_path=produtil.fileop.find_exe('mpiexec',raise_missing=True)
+            mpiexec_path=find_exe('mpiexec',raise_missing=True)
         self.mpiexec_path=mpiexec_path
         
         if not hyperthreads:
@@ -313,7 +313,7 @@ class Implementation(ImplementationBase):
                         raise MPIMixed('Trying to run mpiexec within mpiexec.  In mpiserial, you must run batchexe() programs only.')
                 except KeyError as ke: pass
             lines=[a for a in arg.to_arglist(to_shell=True,expand=True)]
-            if produtil.fileop.find_exe('mpiserial') is None:
+            if find_exe('mpiserial') is None:
                 raise MPISerialMissing(
                     'Attempting to run a serial program via mpiexec mpiserial but '
                     'the mpiserial program is not in your $PATH.')
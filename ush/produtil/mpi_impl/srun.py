@@ -9,8 +9,9 @@
 
 import os, logging, re
 import produtil.fileop,produtil.prog,produtil.mpiprog,produtil.pipeline
+import produtil.jobcache
 
-from .mpi_impl_base import MPIMixed,CMDFGen,ImplementationBase, \
+from .mpi_impl_base import find_exe,MPIMixed,CMDFGen,ImplementationBase, \
                            MPIThreadsMixed,MPILocalOptsMixed,MPITooManyRanks
 from produtil.pipeline import NoMoreProcesses
 from produtil.mpiprog import MIXED_VALUES
@@ -39,12 +40,12 @@ class Implementation(ImplementationBase):
             if force:
                 srun_path='srun'
             else:
-                srun_path=produtil.fileop.find_exe('srun',raise_missing=True)
+                srun_path=find_exe('srun',raise_missing=True)
         if scontrol_path is None:
             if force:
                 scontrol_path='scontrol'
             else:
-                scontrol_path=produtil.fileop.find_exe('scontrol',raise_missing=True)
+                scontrol_path=find_exe('scontrol',raise_missing=True)
         if 'SLURM_NODELIST' not in os.environ and not force:
             return None
         return Implementation(srun_path,scontrol_path,mpiserial_path,logger,silent,force)
@@ -106,6 +107,12 @@ class Implementation(ImplementationBase):
         return f
 
     def _get_available_nodes(self):
+        """!Returns the list of unique node names in $SLURM_NODELIST.
+        The list is obtained from "scontrol show hostnames" once per
+        batch allocation, and then reused from produtil.jobcache."""
+        key='srun_nodes:'+os.environ['SLURM_NODELIST']
+        available_nodes=produtil.jobcache.get(key)
+        if available_nodes: return list(available_nodes)
         available_nodes=list()
         nodeset=set()
         scontrol=produtil.prog.Runner([
@@ -121,6 +128,8 @@ class Implementation(ImplementationBase):
             if node in nodeset: next
             nodeset.add(node)
             available_nodes.append(node)
+        if status==0 and available_nodes:
+            produtil.jobcache.put(key,available_nodes)
         return available_nodes
     
     def mpirunner_impl(self,arg,allranks=False,rewrite_nodefile=True,label_io=False,**kwargs):
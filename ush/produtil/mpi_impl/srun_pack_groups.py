@@ -10,7 +10,7 @@
 import os, logging, sys
 import produtil.fileop,produtil.prog,produtil.mpiprog,produtil.pipeline
 
-from .mpi_impl_base import MPIMixed,CMDFGen,ImplementationBase,MPIError, \
+from .mpi_impl_base import find_exe,MPIMixed,CMDFGen,ImplementationBase,MPIError, \
                            MPIThreadsMixed,MPILocalOptsMixed,MPITooManyRanks, \
                            MPIMissingEnvironment,MPIEnvironmentInvalid
 from produtil.pipeline import NoMoreProcesses
@@ -86,7 +86,7 @@ class Implementation(ImplementationBase):
             if force:
                 srun_path='srun'
             else:
-                srun_path=produtil.fileop.find_exe('srun',raise_missing=True)
+                srun_path=find_exe('srun',raise_missing=True)
 
         return Implementation(srun_path,mpiserial_path,logger,silent,force)
 
@@ -9,12 +9,21 @@ one correctly initializes the produtil.cluster module.  The mechanism
 used depends on the cluster, due to varying capabilities throughout.
 Some do not implement access control mechanisms that are usable for
 the restricted data (such as NOAA Jet).  For those systems,
-RstNoAccessControl is raised if one attempts to restrict a file."""
+RstNoAccessControl is raised if one attempts to restrict a file.
+
+Many files can be restricted at once with RestrictionClass.restrict_files
+or a whole directory tree with RestrictionClass.restrict_tree (or
+tag_rstprod_tree).  Those open each file once and restrict it through
+the file descriptor, several files at a time.  Symbolic links are not
+followed, so a file cannot be swapped for a link between the time it
+is listed and the time it is restricted.  Every file is attempted even
+if some fail, and RstRestrictFailed is raised afterwards if any file
+could not be restricted."""
 
 ##@var __all__ 
 # List of symbols exported by "from produtil.rstprod import *"
 __all__= [ 'RestrictionClass', 'tag_rstprod', 'rstprod_tagger', 
-           'make_rstprod_tagger' ]
+           'make_rstprod_tagger', 'tag_rstprod_tree', 'RstRestrictFailed' ]
 
 class RstprodError(Exception):
     """!The base class of all exceptions specific to the rstprod module"""
@@ -22,8 +31,20 @@ class RstNoAccessControl(RstprodError):
     """!Raised when the cluster has no access control mechanisms."""
 class RstBadGroup(RstprodError):
     """!Raised when a group's id or name could not be determined."""
+class RstRestrictFailed(RstprodError):
+    """!Raised when some files of a bulk restriction could not be
+    restricted.  The "failures" member is a list of (filename,message)
+    tuples."""
+    def __init__(self,message,failures):
+        """!RstRestrictFailed constructor.
+        @param message the error message
+        @param failures a list of (filename,message) tuples"""
+        super(RstRestrictFailed,self).__init__(message)
+        self.failures=failures
+    ##@var failures
+    # A list of (filename,message) tuples, one for each failed file
 
-import os, stat, grp
+import os, stat, grp, threading, errno
 import produtil.cluster, produtil.acl
 
 from produtil.acl import ACL, ACL_TYPE_ACCESS, ACL_TYPE_DEFAULT
@@ -60,6 +81,15 @@ def acl_text_for_rstclass(groupname,mode):
         ( 'w' if 0!=imode&stat.S_IWGRP else '-' ),
         ( 'x' if 0!=imode&stat.S_IXGRP else '-' ) )
 
+def _fd_path(fd,filename):
+    """!Internal function; do not call directly.  Returns a path that
+    names the file opened as a file descriptor: its /proc/self/fd path
+    where /proc is available, otherwise the file name.
+    @param fd the file descriptor
+    @param filename the name that was opened"""
+    path='/proc/self/fd/%d'%(fd,)
+    return path if os.path.exists(path) else filename
+
 class RestrictionClass(object):
     """!This is a python class intended to be used to automate
     restricting data to a specific restriction class using access
@@ -129,33 +159,8 @@ class RestrictionClass(object):
                 %(type(group).__name__,repr(group)))
         self.__allowed=stat.S_IRUSR|stat.S_IWUSR|stat.S_IXUSR | \
                        stat.S_IRGRP|stat.S_IWGRP|stat.S_IXGRP
-        if use_acl:
-            self.__acls=self.make_acl_dict()
-    def make_acl_dict(self):
-        """!Internal function that generates the ACL dictionary.
-
-        @protected
-        This is part of the internal implementation of
-        RestrictionClass and should not be used directly.  It returns
-        a dict() that maps from integer permission to an ACL object
-        that will set an access control list appropriate for that
-        permission.  The user and restriction group will match the old
-        user and group permissions, but other groups will have no
-        permissions, and the "world" permissions will be 0."""
-        acls=dict()
-        mode=0o10
-        for IRUSR in ( 0, stat.S_IRUSR ):
-            for IWUSR in ( 0, stat.S_IWUSR ):
-                for IXUSR in ( 0, stat.S_IXUSR ):
-                    for IRGRP in ( 0, stat.S_IRGRP ):
-                        for IWGRP in ( 0, stat.S_IWGRP ):
-                            for IXGRP in ( 0, stat.S_IXGRP ):
-                                mode=IRUSR|IWUSR|IXUSR|IRGRP|IWGRP|IXGRP
-                                txt=acl_text_for_rstclass(self.groupname,mode)
-                                acl=ACL()
-                                acl.from_text(txt)
-                                acls[mode]=acl
-        return acls
+        self.__acls=dict()
+        self.__acl_lock=threading.Lock()
     @property
     def groupname(self):
         """!The name of the group used for the restriction class"""
@@ -172,11 +177,22 @@ class RestrictionClass(object):
 
     def acl_for(self,st_mode):
         """!Returns an produtil.acl.ACL object for the specified access
-        mode.  Will raise an exception if self.use_acl is False.
+        mode.  Will raise an exception if self.use_acl is False.  The
+        ACL for each mode is prepared the first time it is needed and
+        reused after that.
         @param st_mode desired access mode"""
+        if not self.__use_acl:
+            raise RstprodError('%s: this restriction class does not use '
+                               'ACLs'%(self.__groupname,))
         imode = stat.S_IMODE(st_mode)
         amode = imode & self.__allowed # limit to allowed permissions
-        return self.__acls[amode]
+        with self.__acl_lock:
+            acl=self.__acls.get(amode,None)
+            if acl is None:
+                acl=ACL()
+                acl.from_text(acl_text_for_rstclass(self.groupname,amode))
+                self.__acls[amode]=acl
+        return acl
 
     def chgrp_restrict(self,target,st_mode,chown,chmod,logger):
         """!Internal function that uses chgrp to restrict a file's access.
@@ -268,6 +284,114 @@ class RestrictionClass(object):
         else:
             self.chgrp_restrict(fd,st_mode,os.fchown,os.fchmod,logger)
 
+    def _restrict_one(self,filename):
+        """!Internal function; do not call directly.  Restricts one file
+        for restrict_files through a file descriptor, refusing to
+        follow symbolic links.  Operations that need a path, such as a
+        directory's default ACL or an unreadable file, use the
+        /proc/self/fd path of the descriptor, which names the opened
+        file itself."""
+        flags=os.O_NONBLOCK|getattr(os,'O_NOFOLLOW',0)
+        if stat.S_ISDIR(os.lstat(filename).st_mode):
+            flags|=getattr(os,'O_DIRECTORY',0)
+        try:
+            fd=os.open(filename,os.O_RDONLY|flags)
+            readable=True
+        except EnvironmentError as e:
+            if e.errno!=errno.EACCES or not hasattr(os,'O_PATH'): raise
+            # Unreadable, but we may still own it.
+            fd=os.open(filename,os.O_PATH|flags)
+            readable=False
+        try:
+            st_mode=os.fstat(fd).st_mode
+            if stat.S_ISLNK(st_mode):
+                raise RstprodError('%s: is a symbolic link'%(filename,))
+            path=_fd_path(fd,filename)
+            if readable:
+                self.restrict_fd(fd,st_mode)
+                if self.__use_acl and stat.S_ISDIR(st_mode):
+                    self.acl_for(st_mode).to_file(path,ACL_TYPE_DEFAULT)
+            else:
+                self.restrict_file(path,st_mode)
+        finally:
+            os.close(fd)
+
+    def restrict_files(self,filenames,threads=8,logger=None):
+        """!Adds the requested restrictions to many files or
+        directories, several at a time.  Every file is attempted, even
+        if some fail.
+        @param filenames an iterable of files and directories
+        @param threads the number of files to restrict at once
+        @param logger a logging.Logger for log messages
+        @returns the number of files restricted
+        @raise RstRestrictFailed if any file could not be restricted"""
+        filenames=list(filenames)
+        def restrict_chunk(chunk):
+            failed=list()
+            for filename in chunk:
+                try:
+                    self._restrict_one(filename)
+                except (EnvironmentError,RstprodError) as e:
+                    failed.append((filename,str(e)))
+            return failed
+        nchunks=max(1,min(threads,len(filenames)//64))
+        if nchunks==1:
+            failures=restrict_chunk(filenames)
+        else:
+            # Each thread restricts a slice of the list, so the cost of
+            # the pool is paid per slice instead of per file.
+            import concurrent.futures
+            failures=list()
+            with concurrent.futures.ThreadPoolExecutor(
+                    max_workers=nchunks) as pool:
+                for failed in pool.map(restrict_chunk,[
+                        filenames[i::nchunks] for i in range(nchunks) ]):
+                    failures.extend(failed)
+        if logger is not None:
+            logger.info('Restricted %d files to group %s'%(
+                    len(filenames)-len(failures),self.__groupname))
+        if failures:
+            if logger is not None:
+                for (filename,message) in failures:
+                    logger.error('%s: cannot restrict: %s'%(filename,message))
+            raise RstRestrictFailed('%d of %d files could not be restricted '
+                                    'to group %s: first was %s: %s'%(
+                    len(failures),len(filenames),self.__groupname,
+                    failures[0][0],failures[0][1]),failures)
+        return len(filenames)
+
+    def restrict_tree(self,top,threads=8,logger=None):
+        """!Adds the requested restrictions to a directory and
+        everything in it.  The directory itself is restricted first, so
+        its contents cannot be reached while they are restricted.
+        Symbolic links are not followed, and their targets are not
+        restricted.
+        @param top the directory
+        @param threads the number of files to restrict at once
+        @param logger a logging.Logger for log messages
+        @returns the number of files and directories restricted
+        @raise RstRestrictFailed if any file could not be restricted"""
+        self.restrict_files([top],logger=None)
+        failures=list()
+        def onerror(e):
+            failures.append((getattr(e,'filename',top),str(e)))
+        targets=list()
+        for (dirpath,dirnames,filenames) in os.walk(top,onerror=onerror):
+            for name in dirnames+filenames:
+                path=os.path.join(dirpath,name)
+                if not os.path.islink(path):
+                    targets.append(path)
+        try:
+            count=self.restrict_files(targets,threads,logger)
+        except RstRestrictFailed as e:
+            failures.extend(e.failures)
+        if failures:
+            raise RstRestrictFailed('%s: %d files could not be restricted '
+                                    'to group %s: first was %s: %s'%(
+                    top,len(failures),self.__groupname,
+                    failures[0][0],failures[0][1]),failures)
+        return count+1
+
 ##@var rstprod_tagger
 #The RestrictionClass object used for tag_rstprod.  Create this with
 #make_rstprod_tagger
@@ -308,4 +432,16 @@ def tag_rstprod(target,logger=None):
         raise TypeError('The tag_rstprod target argument must be an int, a file '
                         'or a basestring.  You supplied a %s %s'
                         %(type(target).__name__,repr(target)))
+
+def tag_rstprod_tree(top,threads=8,logger=None):
+    """!Places a directory and everything in it under the rstprod
+    restriction class, as tag_rstprod does for one file, several files
+    at a time.  See RestrictionClass.restrict_tree.
+    @param top the directory
+    @param threads the number of files to restrict at once
+    @param logger a logging.Logger for log messages
+    @returns the number of files and directories restricted"""
+    if rstprod_tagger is None:
+        make_rstprod_tagger(logger=logger)
+    return rstprod_tagger.restrict_tree(top,threads,logger)
         
@@ -9,9 +9,9 @@ by every Python process started, immediately after Python starts."""
 # Lists symbols exported by "from produtil.setup import *"
 __all__=['setup']
 
-import logging, threading
+import logging, threading, atexit
 import produtil.sigsafety, produtil.log, produtil.dbnalert, produtil.cluster
-import produtil.batchsystem
+import produtil.batchsystem, produtil.locking
 
 def setup(ignore_hup=False,dbnalert_logger=None,jobname=None,cluster=None,
           send_dbn=None,thread_logger=False,thread_stack=2**24,**kwargs):
@@ -28,6 +28,8 @@ def setup(ignore_hup=False,dbnalert_logger=None,jobname=None,cluster=None,
     function properly
     5. Sets the produtil.cluster's idea of what cluster it is on.  If no
     cluster is specified, the produtil.cluster is instructed to guess.
+    6. Logs the file lock statistics from produtil.locking when the
+    process exits.
 
     This is a wrapper around the produtil.sigsafety, and produtil.log,
     and other module initializers.  Note that one could call each
@@ -79,3 +81,7 @@ def setup(ignore_hup=False,dbnalert_logger=None,jobname=None,cluster=None,
         produtil.cluster.set_cluster(cluster)
     else:
         produtil.cluster.where() # guess cluster
+
+    # Report lock waits and contention at the end of the job:
+    atexit.register(produtil.locking.log_lock_stats,
+                    logging.getLogger('produtil.locking'))
@@ -0,0 +1,287 @@
+#! /usr/bin/env python3
+
+"""!Stages input data once in a directory shared by many jobs.
+
+When several jobs need the same expensive extraction of the same
+input, such as the RTOFS fields of one day that every storm's ocean
+initialization uses, only one of them should do the work.  A
+SharedStage is a directory under a shared root, named by a key that
+identifies its contents.  The first job to call stage() takes a lock
+and runs the extraction in a fresh temporary directory, which is then
+renamed into place.  Other jobs wait for the lock, find the stage
+complete, and use or link its files.  A stage that must be redone is
+never emptied in place: it is renamed aside and replaced, so links
+that other jobs made into it keep working.
+
+A stage is complete when its manifest exists: a JSON file next to the
+directory that lists the size and digest of each staged file.  It is
+written after the extraction succeeds, so a failed or interrupted job
+never leaves a stage that looks complete.  Before a stage is reused,
+each file is checked against the manifest; a truncated or changed
+file causes the stage to be redone.  Digests are computed by
+produtil.checksum, which remembers them, so checking an unchanged
+stage does not re-read the files.
+
+Stages are never deleted by the jobs that use them.  Instead, prune()
+removes stages that have not been used for a given time.  Every use
+of a stage updates its manifest's modification time.
+
+@code
+stage=SharedStage('/path/to/shared','rtofs.20230912.t06z',logger)
+stage.stage(extract)    # runs extract(dir) in a new directory, once
+stage.link_into('./RTOFSDIR')
+produtil.sharedstage.prune('/path/to/shared',2*86400,logger)
+@endcode"""
+
+##@var __all__
+# List of symbols exported by "from produtil.sharedstage import *"
+__all__=['SharedStage','StageError','prune']
+
+import os, json, shutil, tempfile, logging, time
+import produtil.checksum, produtil.locking, produtil.fileop, produtil.cd
+
+##@var manifest_version
+# Incremented when the manifest format changes, so older stages are redone.
+manifest_version=1
+
+class StageError(Exception):
+    """!Raised when a stage cannot be produced."""
+
+class SharedStage(object):
+    """!A directory of input data staged once for many jobs."""
+    def __init__(self,root,key,logger=None,timeout=3600):
+        """!SharedStage constructor.
+        @param root the shared directory that contains the stages
+        @param key the name of this stage, which must identify its
+          contents, such as the data source and date
+        @param logger a logging.Logger for messages
+        @param timeout the maximum seconds to wait for another job
+          that is producing the stage, or None for no limit"""
+        if not key or os.sep in key or key.startswith('.'):
+            raise ValueError('%s: invalid stage key'%(repr(key),))
+        self.root=root
+        self.key=key
+        self.path=os.path.join(root,key)
+        self.manifest=self.path+'.manifest'
+        self.timeout=timeout
+        self.logger=logger if logger is not None \
+            else logging.getLogger('sharedstage')
+
+    ##@var root
+    # The shared directory that contains the stages
+
+    ##@var key
+    # The name of this stage
+
+    ##@var path
+    # The directory with the staged files
+
+    ##@var manifest
+    # The manifest file, which marks the stage as complete
+
+    def _read_manifest(self):
+        """!Internal function; do not call directly.  Returns the dict
+        of files in the manifest, or None if there is no valid one."""
+        try:
+            with open(self.manifest,'rt') as f:
+                data=json.load(f)
+        except FileNotFoundError:
+            return None
+        except (EnvironmentError,ValueError) as e:
+            self.logger.warning('%s: ignoring unreadable manifest: %s'
+                                %(self.manifest,str(e)))
+            return None
+        if not isinstance(data,dict) or \
+                data.get('version',None)!=manifest_version:
+            return None
+        return data.get('files',None)
+
+    def files(self):
+        """!Returns the relative paths of the staged files, or None if
+        the stage is not complete."""
+        files=self._read_manifest()
+        return None if files is None else sorted(files.keys())
+
+    def complete(self):
+        """!Is the stage complete and intact?  Checks the size and
+        digest of every file in the manifest."""
+        files=self._read_manifest()
+        if files is None:
+            return False
+        for (rel,(size,digest)) in files.items():
+            path=os.path.join(self.path,rel)
+            try:
+                if os.path.getsize(path)!=size or \
+                        produtil.checksum.digest(path,save=True)!=digest:
+                    self.logger.warning('%s: differs from the manifest'
+                                        %(path,))
+                    return False
+            except EnvironmentError as e:
+                self.logger.warning('%s: cannot check: %s'%(path,str(e)))
+                return False
+        return True
+
+    def _write_manifest(self,files):
+        """!Internal function; do not call directly.  Writes the
+        manifest atomically.
+        @param files the dict of files from _list_files"""
+        (fd,tmp)=tempfile.mkstemp(prefix='.'+self.key+'.',dir=self.root)
+        try:
+            with os.fdopen(fd,'wt') as f:
+                json.dump({'version':manifest_version,'files':files},f)
+            os.chmod(tmp,0o644)
+            os.rename(tmp,self.manifest)
+        except:
+            os.unlink(tmp)
+            raise
+
+    def _list_files(self,path):
+        """!Internal function; do not call directly.  Returns a dict
+        with the size and digest of every file in a directory, keyed
+        by relative path.
+        @param path the directory"""
+        names=list()
+        for (dirpath,dirnames,filenames) in os.walk(path):
+            dirnames[:]=[ d for d in dirnames if not d.startswith('.') ]
+            names.extend([ os.path.join(dirpath,f) for f in filenames
+                           if not f.startswith('.') ])
+        digests=produtil.checksum.digests(names,save=True)
+        return dict([ (os.path.relpath(f,path),
+                       [os.path.getsize(f),digests[f]]) for f in names ])
+
+    def _touch(self):
+        """!Internal function; do not call directly.  Marks the stage
+        as recently used, so prune() keeps it."""
+        try:
+            os.utime(self.manifest)
+        except EnvironmentError as e:
+            self.logger.debug('%s: cannot update time: %s'
+                              %(self.manifest,str(e)))
+
+    def stage(self,produce):
+        """!Makes sure the stage is complete, producing it if needed.
+
+        If the stage is incomplete, takes the stage lock, waiting for
+        any other job that holds it.  If the stage is still incomplete
+        after that, calls produce(dir) in a new temporary directory
+        under the root.  Once that succeeds, any old stage directory is
+        renamed aside, the new one is renamed into place, the manifest
+        is written, and the old directory is deleted.
+        @param produce a function that fills the directory given as
+          its only argument; the directory is also the current
+          working directory.  It is not the final stage path.
+        @returns the stage directory"""
+        if self.complete():
+            self.logger.info('%s: using complete stage'%(self.path,))
+            self._touch()
+            return self.path
+        produtil.fileop.makedirs(self.root,logger=self.logger)
+        lockfile=os.path.join(self.root,'.'+self.key+'.lock')
+        with produtil.locking.LockFile(lockfile,logger=self.logger,
+                                       blocking=True,timeout=self.timeout):
+            if self.complete():
+                self.logger.info('%s: another job staged this'%(self.path,))
+                self._touch()
+                return self.path
+            newdir=tempfile.mkdtemp(prefix='.'+self.key+'.new.',
+                                    dir=self.root)
+            self.logger.info('%s: producing stage in %s'%(self.path,newdir))
+            try:
+                os.chmod(newdir,0o755)
+                with produtil.cd.NamedDir(newdir,keep=True,
+                                          logger=self.logger,rm_first=False):
+                    produce(newdir)
+                files=self._list_files(newdir)
+            except:
+                shutil.rmtree(newdir,ignore_errors=True)
+                raise
+            if os.path.exists(self.manifest):
+                os.unlink(self.manifest)
+            olddir=None
+            if os.path.lexists(self.path):
+                olddir=tempfile.mkdtemp(prefix='.'+self.key+'.old.',
+                                        dir=self.root)
+                os.rename(self.path,os.path.join(olddir,self.key))
+            os.rename(newdir,self.path)
+            self._write_manifest(files)
+            self.logger.info('%s: staged %d files'%(self.path,len(files)))
+            if olddir is not None:
+                shutil.rmtree(olddir,ignore_errors=True)
+        return self.path
+
+    def link_into(self,targetdir,force=True):
+        """!Creates symbolic links to each staged file.
+        @param targetdir the directory for the links; subdirectories of
+          the stage are recreated in it
+        @param force if True, replace existing files
+        @returns the list of links"""
+        files=self.files()
+        if files is None:
+            raise StageError('%s: stage is not complete'%(self.path,))
+        links=list()
+        for rel in files:
+            link=os.path.join(targetdir,rel)
+            produtil.fileop.makedirs(os.path.dirname(link),logger=self.logger)
+            produtil.fileop.make_symlink(os.path.join(self.path,rel),link,
+                                         force=force,logger=self.logger)
+            links.append(link)
+        return links
+
+def prune(root,max_age,logger=None):
+    """!Deletes the stages under a root that have not been used for a
+    while, and leftovers of interrupted stage() calls.  Stages locked
+    by another job are skipped.  The lock files are kept, since other
+    jobs may be waiting on them.
+    @param root the shared directory that contains the stages
+    @param max_age minimum seconds since a stage was last used
+    @param logger a logging.Logger for messages
+    @returns the number of stages and leftovers deleted"""
+    if logger is None: logger=logging.getLogger('sharedstage')
+    cutoff=time.time()-max_age
+    try:
+        with os.scandir(root) as it:
+            entries=dict([ (e.name,e) for e in it ])
+    except FileNotFoundError:
+        return 0
+    def old(entry):
+        try:
+            return entry.stat(follow_symlinks=False).st_mtime<cutoff
+        except EnvironmentError:
+            return False
+    removed=0
+    for (name,entry) in sorted(entries.items()):
+        if name.startswith('.'):
+            # Temporary files and directories from stage()
+            if ('.new.' in name or '.old.' in name) and old(entry):
+                logger.info('%s: removing leftover'%(entry.path,))
+                if entry.is_dir(follow_symlinks=False):
+                    shutil.rmtree(entry.path,ignore_errors=True)
+                else:
+                    produtil.fileop.remove_file(entry.path,logger=logger)
+                removed+=1
+            continue
+        if name.endswith('.manifest'):
+            key=name[:-len('.manifest')]
+            if not old(entry): continue
+        elif entry.is_dir(follow_symlinks=False):
+            key=name
+            if key+'.manifest' in entries or not old(entry): continue
+        else:
+            continue
+        lockfile=os.path.join(root,'.'+key+'.lock')
+        try:
+            with produtil.locking.LockFile(lockfile,logger=logger,
+                                           max_tries=1,giveup_quiet=True):
+                manifest=os.path.join(root,key+'.manifest')
+                try:
+                    if os.stat(manifest).st_mtime>=cutoff: continue
+                except FileNotFoundError:
+                    pass
+                logger.info('%s: removing unused stage'
+                            %(os.path.join(root,key),))
+                produtil.fileop.remove_file(manifest,logger=logger)
+                shutil.rmtree(os.path.join(root,key),ignore_errors=True)
+                removed+=1
+        except produtil.locking.LockHeld:
+            logger.info('%s: in use; not pruning'%(key,))
+    return removed
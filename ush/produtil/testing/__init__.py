@@ -11,4 +11,6 @@
 # parser, produtil.testing.parse, parses this into an object tree.  A
 # set of compilers (produtil.testing.rocoto and
 # produtil.testing.script) compiles the object tree into a script or
-# set of scripts for testing.
+# set of scripts for testing.  Alternatively, produtil.testing.local
+# runs the tests directly on the local machine, running independent
+# tests concurrently.
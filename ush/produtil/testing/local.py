@@ -0,0 +1,425 @@
+#! /usr/bin/env python3
+
+"""!Runs a test suite on the local machine, running independent tests
+and builds concurrently.
+
+The produtil.testing.script.BashRunner writes one script that runs
+every test in sequence, and every comparison in it is a separate
+program.  The LocalRunner instead builds the dependency graph of the
+Tests and Builds (from their iterdeps() lists) and runs each one as
+soon as its dependencies succeed, as long as it fits in a budget of
+processors and memory.  A test needs as many processors as the MPI
+ranks of its "execute" step, and the memory in its optional "memory"
+variable (in MB).  A job larger than the whole budget is run alone.
+
+Each job's bash code is the same as in the BashRunner script.  In
+execution (verification) mode, the BitCmp, Md5Cmp and NccmpVars
+criteria are evaluated in Python instead of bash, after the test's
+bash steps finish; NccmpVars uses produtil.testing.nccmp.  Other
+criteria are still run in bash.  The test report file is the same as
+that of the bash script.
+
+The timing report is a JSON file with, for each job, its status,
+start and end time, duration, processors, and the duration and result
+of each comparison.  Job logs are written to a directory next to it.
+
+@code
+runner=LocalRunner(cpus=16)
+passed=runner.make_runner(parser,'rt_timing.json')
+@endcode"""
+
+##@var __all__
+# List of symbols exported by "from produtil.testing.local import *"
+__all__=[ 'LocalRunner' ]
+
+import os, io, time, json, shutil, hashlib, threading, datetime, logging
+import concurrent.futures
+import produtil.run, produtil.fileop, produtil.checksum
+import produtil.testing.nccmp
+
+from produtil.testing.utilities import BASELINE, EXECUTION, PTParserError
+from produtil.testing.parsetree import Test, Task, Criteria, BitCmp, \
+    Md5Cmp, NccmpVars, SpawnProcess
+from produtil.testing.script import bash_functions, runner_context_for
+
+class LocalJob(object):
+    """!One Test or Build to be run by the LocalRunner.  The bash code
+    and the list of comparisons are generated when the job is created,
+    in the main thread, so the parse tree is never evaluated by two
+    threads at once."""
+    def __init__(self,name,runme,con,logdir):
+        """!Constructor for LocalJob
+        @param name the test or build name
+        @param runme the produtil.testing.parsetree.Test or Task
+        @param con the Context from which the job was requested
+        @param logdir the directory for job logs and marker files"""
+        self.name=name
+        self.runme=runme
+        self.deps=list()
+        self.status='pending'
+        self.start=None
+        self.end=None
+        self.comparisons=list()
+        self.log=os.path.join(logdir,name+'.log')
+        self.marker=os.path.join(logdir,name+'.state')
+        rcon=runner_context_for(con)
+        self.rcon=rcon
+        self.cpus=1
+        self.memory=0
+        self.checks=list()
+        self.fallback=''
+        if isinstance(runme,Test):
+            self._make_test(runme,rcon)
+        else:
+            self.script=runme.bash_context(rcon)
+
+    ##@var status
+    # One of pending, running, passed, failed or skipped
+
+    ##@var comparisons
+    # A list of dicts with the timing and result of each comparison
+
+    def _make_test(self,test,rcon):
+        """!Internal function; do not call directly.  Generates the
+        bash code of a Test, and the list of comparisons to evaluate in
+        Python.  The bash code is that of Test.bash_context, except that
+        in execution mode, the verification step is left out."""
+        try:
+            execute=test.resolve('execute')
+            if isinstance(execute,SpawnProcess):
+                self.cpus=max(1,int(execute.mpi_comm_size(rcon)))
+        except (KeyError,TypeError,ValueError) as e:
+            pass
+        try:
+            self.memory=max(0,int(test.resolve('memory').numeric_context(rcon)))
+        except (KeyError,TypeError,ValueError) as e:
+            pass
+        verify=None
+        if rcon.run_mode is EXECUTION:
+            for step in [ 'verify', 'output' ]:
+                if test.haslocal(step):
+                    verify=test.getlocal(step)
+                    break
+        if not isinstance(verify,Criteria):
+            self.script=test.bash_context(rcon)
+            return
+        out=io.StringIO()
+        name=test.resolve('TEST_NAME').bash_context(rcon)
+        try:
+            descr=test.resolve('TEST_DESCR').bash_context(rcon)
+        except KeyError as ke:
+            descr='no description'
+        report=os.path.join(test.resolve('COM').bash_context(rcon),
+                            'report.txt')
+        out.write("report_start %s Test %s starting at $( date ) '('%s')'\n"
+                  %(report,name,descr))
+        for step in [ 'prep', 'input', 'prerun', 'execute' ]:
+            try:
+                stepobj=test.getlocal(step)
+            except KeyError as ke:
+                if step in [ 'prerun', 'input' ]: continue
+                raise
+            out.write(stepobj.bash_context(rcon))
+            out.write('\n')
+        self.script=out.getvalue()
+        fallback=io.StringIO()
+        for tgt,callme in verify.itercriteria():
+            if isinstance(callme,(BitCmp,NccmpVars,Md5Cmp)):
+                self.checks.append((
+                        type(callme).__name__,
+                        callme.resolve('src').string_context(rcon),
+                        callme.resolve('tgt').string_context(rcon),
+                        callme.getcom(rcon),
+                        callme.tolerances(rcon)
+                        if isinstance(callme,NccmpVars) else {}))
+            else:
+                fallback.write(callme.bash_context(rcon))
+        self.fallback=fallback.getvalue()
+
+    def as_dict(self):
+        """!Returns the timing report entry of this job."""
+        return { 'name':self.name, 'status':self.status,
+                 'start':self.start, 'end':self.end,
+                 'seconds':(self.end-self.start) if self.end and self.start
+                 else None,
+                 'cpus':self.cpus, 'memory':self.memory,
+                 'deps':[ dep.name for dep in self.deps ],
+                 'comparisons':self.comparisons }
+
+class LocalRunner(object):
+    """!Runs a test suite on the local machine with a pool of
+    concurrent jobs limited by a processor and memory budget."""
+    def __init__(self,cpus=None,memory=None,workers=None,logger=None):
+        """!Constructor for LocalRunner.
+        @param cpus the number of processors to use at once; default:
+          all of them
+        @param memory the memory, in MB, to use at once; default: no limit
+        @param workers the maximum number of jobs at once; default: cpus
+        @param logger a logging.Logger for messages"""
+        super(LocalRunner,self).__init__()
+        self.cpus=max(1,int(cpus or os.cpu_count() or 1))
+        self.memory=memory
+        self.workers=max(1,int(workers or self.cpus))
+        self.logger=logger
+        self.jobs=list()
+
+    ##@var jobs
+    # The list of LocalJob objects from the last make_runner call
+
+    def make_runner(self,parser,output_file='rt_timing.json',dry_run=False,
+                    setarith=None):
+        """!Runs the test suite.
+
+        @param parser The produtil.testing.parse.Parser containing all
+        needed information.
+        @param output_file The timing report file.  Job logs are
+        written to the output_file with its extension replaced by
+        ".logs".
+        @param dry_run If True, only log what would be run.
+        @param setarith Optional: a string recognized by
+        produtil.testing.setarith.arithparse() to select the Tests
+        and Builds to run.  By default, all with "run" blocks are run.
+        @returns True if every job passed, False otherwise"""
+        logger=self.logger or parser.logger
+        logdir=os.path.splitext(output_file)[0]+'.logs'
+        produtil.fileop.makedirs(logdir,logger=logger)
+        runset=parser.setarith(setarith)
+        jobs=list()
+        byobj=dict()
+        for runcon in runset:
+            runme,con=runcon.as_tuple
+            try:
+                name=runme.resolve('TEST_NAME').string_context(con)
+            except KeyError as ke:
+                name=runme.name
+            job=LocalJob(name,runme,con,logdir)
+            jobs.append(job)
+            byobj[id(runme)]=job
+        if not jobs:
+            raise ValueError('ERROR: No "run" statments seen; nothing to do.\n')
+        for job in jobs:
+            for dep in job.runme.iterdeps():
+                if id(dep) in byobj:
+                    job.deps.append(byobj[id(dep)])
+                else:
+                    logger.warning('%s: dependency %s is not in the run set; '
+                                   'ignoring it'%(job.name,dep.name))
+        self.jobs=jobs
+        logger.info('%d jobs, %d processors, %s MB memory, %d workers'%(
+                len(jobs),self.cpus,str(self.memory or 'unlimited'),
+                self.workers))
+        if dry_run:
+            for job in jobs:
+                logger.info('%s: would run on %d processors after %s'%(
+                        job.name,job.cpus,', '.join(
+                            [ dep.name for dep in job.deps ]) or 'nothing'))
+            return True
+        start=time.time()
+        try:
+            self._schedule(jobs,logger)
+        finally:
+            self._write_report(output_file,start,logger)
+        return all([ job.status=='passed' for job in jobs ])
+
+    def _schedule(self,jobs,logger):
+        """!Internal function; do not call directly.  Runs the jobs in
+        dependency order within the budget."""
+        pending=list(jobs)
+        running=dict()
+        used_cpus=0
+        used_memory=0
+        with concurrent.futures.ThreadPoolExecutor(
+                max_workers=self.workers) as pool:
+            while pending or running:
+                for job in list(pending):
+                    if any([ dep.status in ('failed','skipped')
+                             for dep in job.deps ]):
+                        job.status='skipped'
+                        logger.warning('%s: skipped because a dependency '
+                                       'failed'%(job.name,))
+                        pending.remove(job)
+                        continue
+                    if not all([ dep.status=='passed' for dep in job.deps ]):
+                        continue
+                    cpus=min(job.cpus,self.cpus)
+                    memory=min(job.memory,self.memory) if self.memory else 0
+                    if running and ( len(running)>=self.workers or
+                            used_cpus+cpus>self.cpus or ( self.memory and
+                            used_memory+memory>self.memory ) ):
+                        continue
+                    pending.remove(job)
+                    used_cpus+=cpus
+                    used_memory+=memory
+                    job.status='running'
+                    logger.info('%s: start on %d processors'%(job.name,cpus))
+                    running[pool.submit(self._run_job,job,logger)]=\
+                        (job,cpus,memory)
+                if not running:
+                    if pending:
+                        for job in pending:
+                            job.status='skipped'
+                            logger.error('%s: dependencies can never be met'
+                                         %(job.name,))
+                    break
+                done,not_done=concurrent.futures.wait(
+                    list(running.keys()),
+                    return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    (job,cpus,memory)=running.pop(future)
+                    used_cpus-=cpus
+                    used_memory-=memory
+                    try:
+                        job.status='passed' if future.result() else 'failed'
+                    except Exception as e:
+                        logger.error('%s: %s'%(job.name,str(e)),exc_info=True)
+                        job.status='failed'
+                    logger.info('%s: %s in %.1f seconds'%(
+                            job.name,job.status.upper(),
+                            (job.end or time.time())-(job.start or time.time())))
+
+    def _run_bash(self,script,job,append):
+        """!Internal function; do not call directly.  Runs bash code
+        with the test suite's bash functions, logging to the job log.
+        @returns True if bash exits with status 0"""
+        cmd=produtil.run.batchexe('bash') << \
+            '%s\nset -xe\n\n%s\n'%(bash_functions,script)
+        if append:
+            cmd=cmd.err2out() >> job.log
+        else:
+            cmd=cmd >= job.log
+        return produtil.run.run(cmd)==0
+
+    def _run_job(self,job,logger):
+        """!Internal function; do not call directly.  Runs one job:
+        its bash code, then any comparisons.
+        @returns True if the job passed"""
+        job.start=time.time()
+        try:
+            if not job.checks and not job.fallback:
+                return self._run_bash(job.script,job,False)
+            # Record the directory and report file at the end of the
+            # bash steps, so the comparisons can run in the same place.
+            ok=self._run_bash(job.script+'''
+cat > %s <<EOF
+$PWD
+$rt__TEST_REPORT_FILE
+$rt__TEST_SUCCESS
+EOF
+'''%(job.marker,),job,False)
+            if not ok: return False
+            with open(job.marker,'rt') as f:
+                (workdir,report,success)=f.read().splitlines()[0:3]
+            success=(success=='YES')
+            for (kind,src,tgt,comdir,tolerances) in job.checks:
+                cstart=time.time()
+                result=self._check(kind,os.path.join(workdir,src),
+                                   os.path.join(workdir,tgt),src,tgt,
+                                   comdir,report,tolerances,logger)
+                job.comparisons.append({
+                        'kind':kind, 'src':src, 'tgt':tgt,
+                        'passed':result, 'seconds':time.time()-cstart })
+                success=success and result
+            if job.fallback:
+                ok=self._run_bash('''cd %s
+rt__TEST_REPORT_FILE=%s
+rt__TEST_SUCCESS=YES
+%s
+test "$rt__TEST_SUCCESS" == YES
+'''%(_quote(workdir),_quote(report),job.fallback),job,True)
+                success=success and ok
+            with open(report,'at') as f:
+                f.write('TEST %s AT %s\n'%(
+                        'PASSED' if success else 'FAILED',
+                        datetime.datetime.now().strftime(
+                            '%a %b %d %H:%M:%S %Z %Y')))
+            return success
+        finally:
+            job.end=time.time()
+
+    def _check(self,kind,src,tgt,srcname,tgtname,comdir,report,
+               tolerances,logger):
+        """!Internal function; do not call directly.  Evaluates one
+        BitCmp, NccmpVars or Md5Cmp criterion the way the bash
+        functions of the same names do, appending to the test report.
+        @param kind the class name of the criterion
+        @param src,tgt the baseline and output paths
+        @param srcname,tgtname the paths as given in the test
+        @param comdir the test's COM directory
+        @param report the test report file
+        @param tolerances NccmpVars tolerances for
+          produtil.testing.nccmp.compare_files
+        @returns True if the comparison passed"""
+        lines=list()
+        try:
+            if kind=='Md5Cmp':
+                md5sum=os.path.join(comdir,os.path.basename(srcname))
+                h=hashlib.md5()
+                with open(tgt,'rb') as f:
+                    for block in iter(lambda: f.read(1048576),b''):
+                        h.update(block)
+                with open(md5sum,'wt') as f:
+                    f.write('%s  %s\n'%(h.hexdigest(),tgtname))
+                lines.extend([ 'md5sum: %s  %s'%(h.hexdigest(),tgtname),
+                               'md5sum local=%s'%(md5sum,),
+                               'md5sum reference=%s'%(srcname,) ])
+                return True
+            # Copy the output to COM, like "deliver_file $tgt $com/$tgt"
+            comtgt=os.path.join(comdir,tgtname)
+            produtil.fileop.makedirs(os.path.dirname(comtgt),logger=logger)
+            if os.path.isdir(tgt):
+                shutil.rmtree(comtgt,ignore_errors=True)
+                shutil.copytree(tgt,comtgt,symlinks=True)
+            else:
+                produtil.fileop.deliver_file(tgt,comtgt,keep=True)
+            # Same argument order as "bitcmp $tgt $src":
+            (a,b)=(tgt,src)
+            if os.path.isdir(b):
+                b=os.path.join(b,os.path.basename(a))
+            elif os.path.isdir(a):
+                a=os.path.join(a,os.path.basename(b))
+            message='bit-for-bit' if kind=='BitCmp' else 'NetCDF variable data'
+            if not os.path.exists(a):
+                lines.append('%s: MISSING BASELINE FILE'%(b,))
+                return False
+            elif not os.path.exists(b):
+                lines.append('%s: MISSING OUTPUT FILE'%(a,))
+                return False
+            if kind=='BitCmp':
+                same=produtil.checksum.same_content(a,b)
+            else:
+                diffs=produtil.testing.nccmp.compare_files(
+                    a,b,logger=logger,**tolerances)
+                lines.extend([ str(diff) for diff in diffs
+                               if not diff.passed ])
+                same=all([ diff.passed for diff in diffs ])
+            lines.append('%s: %s %s'%(a,message,
+                                      'identical' if same else 'MISMATCH'))
+            return same
+        except EnvironmentError as e:
+            lines.append('%s: %s comparison failed: %s'%(tgtname,kind,str(e)))
+            return False
+        finally:
+            with open(report,'at') as f:
+                f.write(''.join([ line+'\n' for line in lines ]))
+
+    def _write_report(self,output_file,start,logger):
+        """!Internal function; do not call directly.  Writes the JSON
+        timing report and logs a summary."""
+        report={ 'start':start, 'seconds':time.time()-start,
+                 'cpus':self.cpus, 'memory':self.memory,
+                 'jobs':[ job.as_dict() for job in self.jobs ] }
+        with open(output_file,'wt') as f:
+            json.dump(report,f,indent=1)
+            f.write('\n')
+        counts=dict()
+        for job in self.jobs:
+            counts[job.status]=counts.get(job.status,0)+1
+        logger.info('%s: %s in %.1f seconds'%(
+                output_file,', '.join([ '%d %s'%(n,status) for status,n
+                                        in sorted(counts.items()) ]),
+                report['seconds']))
+
+def _quote(s):
+    """!Internal function; do not call directly.  Quotes a string for
+    bash."""
+    return "'"+s.replace("'","'\"'\"'")+"'"
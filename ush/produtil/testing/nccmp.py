@@ -0,0 +1,257 @@
+#! /usr/bin/env python3
+
+"""!Compares the variable data of two NetCDF files, like "nccmp -d".
+
+Variables are read in slabs no larger than a byte budget, so memory
+use is bounded by the chunk size rather than the variable size, and
+several variables are compared at once by separate processes (the
+HDF5 library is not safe to use from several threads).  Values are
+compared as stored in the file: no scaling or masking is applied.
+
+Two values match if they are equal, or both NaN, or if they are
+within any of the tolerances:
+* atol --- absolute difference
+* rtol --- difference relative to the larger magnitude of the two
+* ulps --- units in the last place: the number of representable
+  floating-point values between the two
+
+With fail_fast=True, the comparison stops at the first mismatch.  The
+result is a list of VariableDiff objects with the maximum absolute,
+relative and ULP differences and the number of mismatched values of
+each variable.
+
+@code
+diffs=compare_files('baseline/atmf006.nc','atmf006.nc',rtol=1e-6)
+if all([ d.passed for d in diffs ]): print('identical')
+@endcode
+
+This module requires numpy and netCDF4; they are imported when a
+comparison is requested."""
+
+##@var __all__
+# List of symbols exported by "from produtil.testing.nccmp import *"
+__all__=[ 'VariableDiff', 'compare_variable', 'compare_files', 'same',
+           'slabs' ]
+
+import os, logging, itertools
+import concurrent.futures
+
+##@var default_chunk_bytes
+# The default maximum number of bytes of each variable read at once
+# from each file.
+default_chunk_bytes=67108864
+
+class VariableDiff(object):
+    """!The result of comparing one variable of two NetCDF files."""
+    def __init__(self,name,passed=True,count=0,size=0,max_abs=0.0,
+                 max_rel=0.0,max_ulp=0,message=None):
+        """!Constructor for VariableDiff
+        @param name the variable name
+        @param passed True if every value matched
+        @param count number of mismatched values
+        @param size number of values compared
+        @param max_abs,max_rel,max_ulp the largest absolute, relative
+          and ULP differences
+        @param message a description of a structural mismatch, such as
+          a missing variable or different shapes"""
+        self.name=name
+        self.passed=passed
+        self.count=count
+        self.size=size
+        self.max_abs=max_abs
+        self.max_rel=max_rel
+        self.max_ulp=max_ulp
+        self.message=message
+    def __str__(self):
+        if self.message:
+            return '%s: %s'%(self.name,self.message)
+        return '%s: %s: %d of %d values differ; max abs %g, rel %g, ulp %d'%(
+            self.name,'identical' if self.passed and not self.count
+            else 'within tolerance' if self.passed else 'MISMATCH',
+            self.count,self.size,self.max_abs,self.max_rel,self.max_ulp)
+
+def _ordered_ints(np,a):
+    """!Internal function; do not call directly.  Maps floating-point
+    values to integers with the same order, so the difference of two
+    is the number of representable values between them."""
+    itype=np.int32 if a.dtype.itemsize==4 else np.int64
+    i=a.view(itype).astype(np.int64)
+    return np.where(i<0,np.iinfo(itype).min-i,i)
+
+def _compare_chunk(np,a,b,atol,rtol,ulps,diff):
+    """!Internal function; do not call directly.  Compares one chunk of
+    values and updates the VariableDiff."""
+    a=np.asarray(a).ravel()
+    b=np.asarray(b).ravel()
+    diff.size+=a.size
+    if a.dtype.kind not in 'fiuc' or b.dtype.kind not in 'fiuc':
+        bad=int(np.count_nonzero(a!=b))
+        diff.count+=bad
+        return bad==0
+    if a.dtype.kind=='f' and b.dtype.kind=='f':
+        nan=np.isnan(a)&np.isnan(b)
+    else:
+        nan=np.zeros(a.shape,dtype=bool)
+    differ=(a!=b)&~nan
+    if not differ.any():
+        return True
+    a=a[differ]
+    b=b[differ]
+    absdiff=np.abs(a.astype(np.float64)-b.astype(np.float64))
+    scale=np.maximum(np.abs(a.astype(np.float64)),np.abs(b.astype(np.float64)))
+    with np.errstate(divide='ignore',invalid='ignore'):
+        reldiff=np.where(scale>0,absdiff/scale,0.0)
+    ok=np.zeros(a.shape,dtype=bool)
+    if atol: ok|=absdiff<=atol
+    if rtol: ok|=reldiff<=rtol
+    if a.dtype==b.dtype and a.dtype.kind=='f' and a.dtype.itemsize in (4,8):
+        ulpdiff=np.abs(_ordered_ints(np,a).astype(np.float64)
+                       -_ordered_ints(np,b).astype(np.float64))
+        if ulps: ok|=ulpdiff<=ulps
+        diff.max_ulp=max(diff.max_ulp,int(np.nanmax(ulpdiff)))
+    diff.max_abs=max(diff.max_abs,float(np.nanmax(absdiff)))
+    diff.max_rel=max(diff.max_rel,float(np.nanmax(reldiff)))
+    bad=int(np.count_nonzero(~ok))
+    diff.count+=bad
+    return bad==0
+
+def slabs(shape,itemsize,chunk_bytes=default_chunk_bytes):
+    """!Splits an array into slabs that each fit in a byte budget.
+
+    The trailing dimensions that fit in the budget are read whole.
+    The dimension before them is split into runs that fit, and every
+    dimension before that is read one index at a time.  A variable
+    with a leading dimension of length one, such as a
+    (time,pfull,grid_yt,grid_xt) history variable, is thus split along
+    its levels or rows instead of being read whole.  A slab is larger
+    than the budget only if a single value is.
+    @param shape the array shape
+    @param itemsize bytes per value
+    @param chunk_bytes the maximum bytes per slab
+    @returns an iterator over tuples of slices, one per dimension"""
+    shape=tuple(int(n) for n in shape)
+    if any([ n==0 for n in shape ]):
+        return
+    budget=max(1,int(chunk_bytes)//max(1,int(itemsize)))
+    # Find the first dimension k such that shape[k:] fits.
+    k=len(shape)
+    inner=1
+    while k>0 and inner*shape[k-1]<=budget:
+        k-=1
+        inner*=shape[k]
+    if k==0:
+        yield tuple(slice(0,n) for n in shape)
+        return
+    step=max(1,budget//inner)
+    whole=tuple(slice(0,n) for n in shape[k:])
+    for outer in itertools.product(*[ range(n) for n in shape[:k-1] ]):
+        lead=tuple(slice(i,i+1) for i in outer)
+        for start in range(0,shape[k-1],step):
+            yield lead+(slice(start,min(shape[k-1],start+step)),)+whole
+
+def compare_variable(ds1,ds2,name,atol=0,rtol=0,ulps=0,
+                     chunk_bytes=default_chunk_bytes,fail_fast=False):
+    """!Compares one variable of two open netCDF4.Dataset objects.
+    @param ds1,ds2 the datasets, with automatic masking and scaling
+      turned off
+    @param name the variable name
+    @param atol,rtol,ulps the absolute, relative and ULP tolerances
+    @param chunk_bytes the maximum bytes read at once from each file
+    @param fail_fast if True, stop at the first chunk with a mismatch
+    @returns a VariableDiff"""
+    import numpy as np
+    diff=VariableDiff(name)
+    if name not in ds1.variables or name not in ds2.variables:
+        diff.passed=False
+        diff.message='only in %s'%(ds1.filepath() if name in ds1.variables
+                                   else ds2.filepath())
+        return diff
+    v1=ds1.variables[name]
+    v2=ds2.variables[name]
+    if v1.shape!=v2.shape:
+        diff.passed=False
+        diff.message='shapes differ: %s and %s'%(v1.shape,v2.shape)
+        return diff
+    if not v1.shape:
+        diff.passed=_compare_chunk(np,v1.getValue(),v2.getValue(),
+                                   atol,rtol,ulps,diff)
+        return diff
+    itemsize=max(1,getattr(v1.dtype,'itemsize',8) or 8)
+    for slab in slabs(v1.shape,itemsize,chunk_bytes):
+        if not _compare_chunk(np,v1[slab],v2[slab],atol,rtol,ulps,diff):
+            diff.passed=False
+            if fail_fast: break
+    return diff
+
+def _compare_group(file1,file2,names,atol,rtol,ulps,chunk_bytes,fail_fast):
+    """!Internal function; do not call directly.  Compares a list of
+    variables in a worker process.
+    @returns a list of VariableDiff objects"""
+    import netCDF4
+    diffs=list()
+    with netCDF4.Dataset(file1,'r') as ds1, netCDF4.Dataset(file2,'r') as ds2:
+        ds1.set_auto_maskandscale(False)
+        ds2.set_auto_maskandscale(False)
+        for name in names:
+            diff=compare_variable(ds1,ds2,name,atol,rtol,ulps,chunk_bytes,
+                                  fail_fast)
+            diffs.append(diff)
+            if fail_fast and not diff.passed: break
+    return diffs
+
+def compare_files(file1,file2,variables=None,atol=0,rtol=0,ulps=0,
+                  workers=None,chunk_bytes=default_chunk_bytes,
+                  fail_fast=False,logger=None):
+    """!Compares the variable data of two NetCDF files.
+    @param file1,file2 the files
+    @param variables the variable names to compare; default: every
+      variable in either file
+    @param atol,rtol,ulps the absolute, relative and ULP tolerances
+    @param workers the number of processes; default: the number of
+      processors, at most one per variable
+    @param chunk_bytes the maximum bytes read at once from each file
+    @param fail_fast if True, stop comparing at the first mismatch
+    @param logger a logging.Logger for the per-variable report
+    @returns a list of VariableDiff objects in variable order.  With
+      fail_fast, variables that were not compared are omitted."""
+    import netCDF4
+    if variables is None:
+        with netCDF4.Dataset(file1,'r') as ds1, \
+                netCDF4.Dataset(file2,'r') as ds2:
+            variables=list(ds1.variables)
+            variables.extend([ v for v in ds2.variables
+                               if v not in ds1.variables ])
+    variables=list(variables)
+    workers=max(1,min(len(variables),int(workers or os.cpu_count() or 1)))
+    args=(atol,rtol,ulps,chunk_bytes,fail_fast)
+    if workers<=1:
+        diffs=_compare_group(file1,file2,variables,*args)
+    else:
+        diffs=list()
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) \
+                as pool:
+            futures=[ pool.submit(_compare_group,file1,file2,[name],*args)
+                      for name in variables ]
+            for future in concurrent.futures.as_completed(futures):
+                result=future.result()
+                diffs.extend(result)
+                if fail_fast and not all([ d.passed for d in result ]):
+                    for f in futures: f.cancel()
+                    break
+        order=dict([ (name,i) for (i,name) in enumerate(variables) ])
+        diffs.sort(key=lambda d: order[d.name])
+    if logger is not None:
+        for diff in diffs:
+            if diff.passed:
+                logger.info(str(diff))
+            else:
+                logger.warning(str(diff))
+    return diffs
+
+def same(file1,file2,**kwargs):
+    """!Returns True if the variable data of two NetCDF files match
+    within the tolerances.  Stops at the first mismatch.
+    @param file1,file2 the files
+    @param kwargs other arguments for compare_files"""
+    kwargs.setdefault('fail_fast',True)
+    return all([ d.passed for d in compare_files(file1,file2,**kwargs) ])
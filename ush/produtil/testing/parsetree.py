@@ -11,7 +11,7 @@
 # subclasses use for evaluation to literals.
 
 import sys, re, io, collections, os, datetime, logging, math
-import produtil.run, produtil.log, produtil.setup
+import produtil.run, produtil.log, produtil.setup, produtil.checksum
 
 # This module really does use everything public from utilities and
 # tokenize, hence the "import *"
@@ -1243,28 +1243,9 @@ class BitCmp(Builtin):
         if con.run_mode==BASELINE:
             produtil.fileop.deliver_file(src,tgt)
             return
-        if os.path.samefile(src,tgt):
-            # Same file object in filesystems.
-            return True
-        with open(src,'rt') as srcf:
-            with open(tgt,'rt') as tgtf:
-                srcstat=os.fstat(src.fileno())
-                tgtstat=os.fstat(tgt.fileno())
-                if not srcstat: return False # file stopped existing
-                if not tgtstat: return False # file stopped existing
-                if srcstat.st_size!=tgtstat.st_size:
-                    # Different size according to stat
-                    return False
-                eof=False
-                while not eof:
-                    srcdat=src.read(1048576)
-                    tgtdat=tgt.read(1048576)
-                    if len(srcdat)!=len(tgtdat):
-                        return False # Lengths differ
-                    if srcdat!=tgtdat:
-                        return False # Contents differ
-                    eof=not len(srcdat) or not len(tgtdat)
-                return True
+        # Sizes are compared first, and recorded digests are used
+        # when valid, so unchanged files are not re-read:
+        return produtil.checksum.same_content(src,tgt)
     def bash_context(self,con):
         """!Generates bash code that compares the two files and copies
         the source file to com.
@@ -1305,6 +1286,32 @@ class NccmpVars(Builtin):
         location (defining stack of Scope objects) as self.
         @returns the new BitCmp"""
         return NccmpVars(self.defscopes,empty=True)
+    def tolerances(self,con):
+        """!Returns the comparison tolerances as a dict with keys atol,
+        rtol and ulps, from the optional variables of the same names.
+        Missing tolerances are zero.
+        @param con the Context in which this object is being evaluated"""
+        result=dict()
+        for var in [ 'atol', 'rtol', 'ulps' ]:
+            try:
+                result[var]=self.resolve(var).numeric_context(con)
+            except KeyError as ke:
+                result[var]=0
+        return result
+    def run(self,con):
+        """!Compares the NetCDF variable data with
+        produtil.testing.nccmp, stopping at the first mismatch.
+        @returns True if the files match within the tolerances and
+          False if they do not.
+        @param con the Context in which this object is being evaluated"""
+        src=self.resolve('src').string_context(con)
+        tgt=self.resolve('tgt').string_context(con)
+        if con.run_mode==BASELINE:
+            produtil.fileop.deliver_file(src,tgt)
+            return
+        import produtil.testing.nccmp
+        return produtil.testing.nccmp.same(src,tgt,logger=con.logger,
+                                           **self.tolerances(con))
     def bash_context(self,con):
         """!Generates bash code that compares the two files and copies
         the source file to com.
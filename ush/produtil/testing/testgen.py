@@ -1,9 +1,18 @@
 #! /usr/bin/env python3
 
 """!Utility package for making programs that are wrapped around the
-produtil.testing package."""
+produtil.testing package.
 
-import os, logging
+When run as a program, generates a test suite with the workflow
+generator chosen by --runner.  With "--runner local", the tests are
+run right away on this machine by produtil.testing.local.LocalRunner:
+
+@code
+python3 -m produtil.testing.testgen --runner local --cpus 16 \
+    rt.conf rt_timing.json
+@endcode"""
+
+import os, sys, logging, argparse, functools
 
 import produtil.fileop
 
@@ -12,10 +21,11 @@ from produtil.testing.tokenize import Tokenizer, TokenizeFile
 from produtil.testing.parse import Parser
 from produtil.testing.rocoto import RocotoRunner
 from produtil.testing.script import BashRunner
+from produtil.testing.local import LocalRunner
 from produtil.testing.parsetree import fileless_context
 from produtil.testing.setarith import arithparse
 
-__all__=[ 'TestGen' ]
+__all__=[ 'TestGen', 'main' ]
 
 class TestGen(object):
     """!"""
@@ -31,7 +41,8 @@ class TestGen(object):
         @param OutputType the class that generates the workflow script
         or scripts.  This should be
         produtil.testing.rocoto.RocotoRunner or
-        produtil.testing.script.BashRunner
+        produtil.testing.script.BashRunner, or
+        produtil.testing.local.LocalRunner to run the tests directly
 
         @param outloc The output directory or script filename for the workflow
 
@@ -154,20 +165,77 @@ class TestGen(object):
                 TokenizeFile(tokenizer,fileobj,self.inloc,1),self.scope,
                 unique_id=self.unique_id,morevars=morevars)
     def generate(self):
-        """!Generates the on-disk files used to run the workflow."""
+        """!Generates the on-disk files used to run the workflow.
+        @returns the return value of the OutputType's make_runner: for
+        a LocalRunner, True if every test passed"""
         logger=self.logger
         outputter=self.OutputType()
-        outputter.make_runner(parser=self.parser,dry_run=self.dry_run,
-                              setarith=self.setarith)
+        kwargs=dict(parser=self.parser,dry_run=self.dry_run,
+                    setarith=self.setarith)
+        if not isinstance(outputter,RocotoRunner):
+            # Rocoto finds the outloc in OUTPUT_PATH instead.
+            kwargs['output_file']=self.outloc
+        result=outputter.make_runner(**kwargs)
         con=fileless_context(
             scopes=[self.parse_result],verbose=self.verbose,logger=logger,
             run_mode=self.run_mode)
         self.make_more(self.parse_result,con)
+        return result
     def testgen(self):
         """!Parses input files and generates the workflow scripts.
 
         @see parse()
-        @see generate()"""
+        @see generate()
+        @returns the return value of generate()"""
         self.parse()
-        self.generate()
+        return self.generate()
+
+def main(args=None):
+    """!Command-line interface: parses the arguments, then generates or
+    runs the test suite.
+    @param args the arguments; default: sys.argv[1:]
+    @returns the exit status"""
+    ap=argparse.ArgumentParser(
+        description='Generate or run a produtil.testing test suite.')
+    ap.add_argument('inloc',help='test suite file to parse')
+    ap.add_argument('outloc',help='workflow output location; with '
+                    '--runner local, the timing report file')
+    ap.add_argument('--runner',choices=['rocoto','bash','local'],
+                    default='rocoto',help='workflow generator: a Rocoto '
+                    'workflow, a bash script, or run the tests now on '
+                    'this machine')
+    ap.add_argument('--baseline',action='store_true',
+                    help='generate baselines instead of verifying them')
+    ap.add_argument('--cpus',type=int,default=None,
+                    help='local runner processor budget')
+    ap.add_argument('--memory',type=int,default=None,
+                    help='local runner memory budget in MB')
+    ap.add_argument('--set',dest='setarith',default=None,
+                    help='set arithmetic expression of tests to run')
+    ap.add_argument('--platform',default=None,help='platform name')
+    ap.add_argument('--unique-id',type=int,default=os.getpid(),
+                    help='integer ID of the workflow')
+    ap.add_argument('--dry-run',action='store_true',
+                    help='only log what would be done')
+    opts=ap.parse_args(args)
+    logger=logging.getLogger('testgen')
+    if opts.runner=='local':
+        OutputType=functools.partial(LocalRunner,cpus=opts.cpus,
+                                     memory=opts.memory,logger=logger)
+    elif opts.runner=='bash':
+        OutputType=BashRunner
+    else:
+        OutputType=RocotoRunner
+    gen=TestGen(BASELINE if opts.baseline else EXECUTION,OutputType,
+                opts.outloc,opts.inloc,opts.dry_run,opts.unique_id,
+                logger=logger,setarith=opts.setarith,
+                platform_name=opts.platform)
+    result=gen.testgen()
+    if opts.runner=='local' and not result:
+        return 1
+    return 0
+
+if __name__=='__main__':
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
             
@@ -0,0 +1,69 @@
+#! /usr/bin/env python3
+################################################################################
+# Script Name: produtil_dbn_alert_stub.py
+# Authors: NECP/EMC Hurricane Project Team and UFS Hurricane Application Team
+# Abstract:
+#   This script stands in for the NCO dbn_alert program when testing
+#   produtil.dbnalert.
+################################################################################
+##@namespace produtil_dbn_alert_stub
+# A stand-in for the NCO dbn_alert program, for testing.
+#
+# It records each alert as one line in a file instead of sending it.
+# It is called as follows:
+# @code[.sh]
+#  produtil_dbn_alert_stub.py TYPE SUBTYPE JOB FILE
+#  produtil_dbn_alert_stub.py --batch < records
+# @endcode
+#
+# In batch mode, each line of stdin is one alert: the four arguments,
+# separated by spaces and quoted as by a POSIX shell.  Alerts are
+# appended to $DBN_ALERT_STUB_LOG, or written to stdout if that is
+# unset.  Each line of the log has the time, the process ID and the
+# four arguments, separated by tabs.  If $DBN_ALERT_STUB_DELAY is set,
+# the program sleeps that many seconds before recording, to mimic a
+# slow dbn_alert.  The exit status is 1 if an alert does not have four
+# arguments, and 2 for invalid usage.
+#
+# To use it in place of dbn_alert, set $DBNROOT to a directory with a
+# bin/dbn_alert link to this program.
+
+import sys, os, time, shlex, fcntl
+
+def record(alerts):
+    """!Appends alerts to the log.
+    @param alerts a list of argument lists"""
+    lines=''.join([ '%.6f\t%d\t%s\n'%(time.time(),os.getpid(),'\t'.join(args))
+                    for args in alerts ])
+    logfile=os.environ.get('DBN_ALERT_STUB_LOG','')
+    if not logfile:
+        sys.stdout.write(lines)
+        return
+    with open(logfile,'at') as f:
+        fcntl.lockf(f.fileno(),fcntl.LOCK_EX)
+        f.write(lines)
+
+def main():
+    """!Main program.  Parses the arguments or stdin and records the
+    alerts."""
+    args=sys.argv[1:]
+    if args==['--batch']:
+        alerts=[ shlex.split(line) for line in sys.stdin if line.strip() ]
+    elif args and args[0]!='--batch':
+        alerts=[ args ]
+    else:
+        sys.stderr.write('Usage: %s TYPE SUBTYPE JOB FILE\n'
+                         '       %s --batch < records\n'
+                         %(sys.argv[0],sys.argv[0]))
+        return 2
+    delay=float(os.environ.get('DBN_ALERT_STUB_DELAY','0') or 0)
+    if delay>0: time.sleep(delay)
+    bad=[ a for a in alerts if len(a)!=4 ]
+    for a in bad:
+        sys.stderr.write('dbn_alert stub: need four arguments, not %s\n'
+                         %(repr(a),))
+    record([ a for a in alerts if len(a)==4 ])
+    return 1 if bad else 0
+
+if __name__=='__main__':
+    sys.exit(main())
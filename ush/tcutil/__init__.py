@@ -12,3 +12,7 @@
 #   routines used in the tcutil package
 # * tcutil.rocoto -- utilities to interface between tcutil and the Rocoto
 #   workflow automation system
+# * tcutil.atcf --- reads whole ATCF deck files into columns, for
+#   verification and other uses of many lines
+# * tcutil.vitalsindex --- persistent index of the cycles that have
+#   vitals, used by run_hafs.py to expand cycle ranges
@@ -0,0 +1,376 @@
+#! /usr/bin/env python3
+
+"""!Reads whole ATCF A deck and B deck files into typed columns.
+
+The tcutil.storminfo.StormInfo class parses one line at a time and
+creates an object with every field of the line, which is slow for
+multi-year deck files when only a few fields are needed.  An ATCFDeck
+keeps each field of interest in its own column, one array of the same
+length for each, converted in bulk.  Lines can be filtered by
+technique, cycle and forecast hour while the file is read, before
+anything is converted.  StormInfo objects are only created on request,
+one per technique and cycle.
+
+@code
+deck=tcutil.atcf.read_deck('aal092023.dat',techs=['CARQ','OFCL'],
+                           start='2023082700',end='2023083112')
+for i in range(len(deck)):
+    print(deck.ymdh[i],deck.tech[i],deck.tau[i],deck.vmax[i])
+for vit in deck.storminfos('CARQ'):   # created one at a time
+    print(vit.YMDH,vit.stormtype)
+@endcode
+
+Numeric columns are array.array objects, so they can be given to
+numpy.asarray without copying the data element by element.  Missing
+integers are -999 and missing latitudes and longitudes are NaN."""
+
+##@var __all__
+# List of symbols exported by "from tcutil.atcf import *"
+__all__=[ 'ATCFDeck', 'read_deck', 'missing' ]
+
+import array, collections, gc, re, time
+import tcutil.numerics, tcutil.storminfo
+from tcutil.storminfo import InvalidATCF
+
+##@var missing
+# The value of missing integers in the columns
+missing=-999
+
+##@var int_columns
+# (name,field index,array typecode) of the integer columns
+int_columns=( ('stnum',1,'i'), ('ymdh',2,'q'), ('technum',3,'i'),
+              ('tau',5,'i'), ('vmax',8,'i'), ('mslp',9,'i'),
+              ('rad',11,'i'), ('rad1',13,'i'), ('rad2',14,'i'),
+              ('rad3',15,'i'), ('rad4',16,'i'), ('pouter',17,'i'),
+              ('router',18,'i'), ('rmw',19,'i') )
+
+##@var str_columns
+# (name,field index) of the string columns
+str_columns=( ('basin',0), ('tech',4), ('stormtype',10),
+              ('windcode',12), ('stormname',27) )
+
+##@var latlon_columns
+# (name,field index) of the latitude and longitude columns
+latlon_columns=( ('lat',6), ('lon',7) )
+
+def _ymdh(when):
+    """!Internal function; do not call directly.  Converts a time to a
+    YYYYMMDDHH integer."""
+    return int(tcutil.numerics.to_datetime(when).strftime('%Y%m%d%H'))
+
+##@var nfields
+# The number of fields read from each line: through the storm name
+nfields=28
+
+def _to_int(s):
+    """!Internal function; do not call directly.  Converts a field to an
+    integer, or missing if it is empty."""
+    s=s.strip()
+    return int(s) if s else missing
+
+def _to_latlon(s):
+    """!Internal function; do not call directly.  Converts a field in
+    tenths of a degree with a hemisphere letter, such as "551N", to
+    degrees North or East.  Invalid values are NaN, where
+    tcutil.storminfo.floatlatlon would return None."""
+    s=s.strip()
+    try:
+        value=int(s[:-1])/10.0
+    except (ValueError,IndexError):
+        return float('nan')
+    if value<0 or s[-1] not in 'NnEeSsWw':
+        return float('nan')
+    return -value if s[-1] in 'SsWw' else value
+
+def _convert(values,convert,bad,lines,logger,raise_all):
+    """!Internal function; do not call directly.  Converts a column of
+    fields.  Deck columns have few distinct values, so each distinct
+    value is converted once, and the results are looked up.
+    @param values the fields
+    @param convert the conversion function
+    @param bad the value for fields that cannot be converted
+    @param lines the lines, for error messages
+    @param logger a logging.Logger for messages
+    @param raise_all raise InvalidATCF for fields that cannot be converted
+    @returns an iterator over the converted values"""
+    table=dict()
+    for value in set(values):
+        try:
+            table[value]=convert(value)
+        except ValueError as e:
+            line=lines[values.index(value)]
+            if raise_all:
+                raise InvalidATCF('%s: %s'%(repr(value),str(e)),line)
+            if logger is not None:
+                logger.warning('could not parse %s: %s line: %s'
+                               %(repr(value),str(e),line))
+            table[value]=bad
+    return map(table.__getitem__,values)
+
+class ATCFDeck(object):
+    """!The lines of an ATCF deck, as columns.
+
+    Each column is an attribute that is a list or array with one
+    element per line:
+    * basin, tech, stormtype, windcode, stormname --- strings
+    * stnum, ymdh (YYYYMMDDHH), technum (the technique sort number, or
+      the minutes in a B deck), tau (forecast hour), vmax (knots), mslp
+      (mbar), rad (radius threshold in knots), rad1 through rad4
+      (radii in nautical miles), pouter (outer isobar pressure in
+      mbar), router (its radius in nautical miles), rmw (nautical
+      miles) --- array.array of integers
+    * lat, lon --- array.array of floats, in degrees North and East
+    * lines --- the lines of text, without the end of line"""
+    def __init__(self,lines=(),rows=None,logger=None,raise_all=False):
+        """!Converts lines of a deck to columns.  Use read_deck instead
+        of calling this directly.
+        @param lines the lines of text, without the end of line
+        @param rows the lines split at commas as by _split, if already done
+        @param logger a logging.Logger for messages
+        @param raise_all if True, raise InvalidATCF for bad integer
+          fields; otherwise log them and treat them as missing"""
+        self.lines=list(lines)
+        if rows is None:
+            rows=[ _split(line) for line in self.lines ]
+        # Transpose the rows, so each field is converted as a column.
+        fields=list(zip(*rows)) if rows else [()]*(nfields+1)
+        lines=self.lines
+        d=self.__dict__
+        for (name,i) in str_columns:
+            d[name]=list(_convert(fields[i],str.strip,'',lines,logger,
+                                  raise_all))
+        for (name,i,typecode) in int_columns:
+            d[name]=array.array(typecode,_convert(
+                    fields[i],_to_int,missing,lines,logger,raise_all))
+        for (name,i) in latlon_columns:
+            d[name]=array.array('d',_convert(
+                    fields[i],_to_latlon,float('nan'),lines,logger,raise_all))
+
+    ##@var lines
+    # The lines of text, without the end of line
+
+    def __len__(self):
+        """!The number of lines."""
+        return len(self.lines)
+
+    def take(self,indexes):
+        """!Returns a new ATCFDeck with only some of the lines.
+        @param indexes the indexes of the lines to keep, in order"""
+        indexes=list(indexes)
+        deck=ATCFDeck.__new__(ATCFDeck)
+        d=deck.__dict__
+        d['lines']=[ self.lines[i] for i in indexes ]
+        for (name,i) in str_columns:
+            col=self.__dict__[name]
+            d[name]=[ col[i] for i in indexes ]
+        for (name,i,typecode) in int_columns+tuple(
+                (name,i,'d') for (name,i) in latlon_columns):
+            col=self.__dict__[name]
+            d[name]=array.array(col.typecode,[ col[i] for i in indexes ])
+        return deck
+
+    def select(self,techs=None,start=None,end=None,taus=None):
+        """!Returns a new ATCFDeck with only the lines that match.
+        @param techs optional: an iterable of techniques to keep
+        @param start,end optional: the first and last cycle to keep, as
+          anything accepted by tcutil.numerics.to_datetime
+        @param taus optional: an iterable of forecast hours to keep"""
+        techs=None if techs is None else set(techs)
+        taus=None if taus is None else set(int(t) for t in taus)
+        start=None if start is None else _ymdh(start)
+        end=None if end is None else _ymdh(end)
+        return self.take([ i for i in range(len(self.lines))
+                           if ( techs is None or self.tech[i] in techs )
+                           and ( start is None or self.ymdh[i]>=start )
+                           and ( end is None or self.ymdh[i]<=end )
+                           and ( taus is None or self.tau[i] in taus ) ])
+
+    def times(self,tech=None):
+        """!Returns the sorted YYYYMMDDHH integer cycles in the deck.
+        @param tech optional: only the cycles of this technique"""
+        if tech is None:
+            return sorted(set(self.ymdh))
+        return sorted(set([ self.ymdh[i] for i in range(len(self.lines))
+                            if self.tech[i]==tech ]))
+
+    def groups(self,tech=None):
+        """!Groups the lines by storm, cycle and technique.
+        @param tech optional: only group the lines of this technique
+        @returns an OrderedDict mapping from (basin,stnum,ymdh,tech) to
+          the list of indexes of its lines, in the order each group
+          first appears"""
+        groups=collections.OrderedDict()
+        (basin,stnum,ymdh,techcol)=(self.basin,self.stnum,self.ymdh,self.tech)
+        for i in range(len(self.lines)):
+            if tech is not None and techcol[i]!=tech:
+                continue
+            key=(basin[i],stnum[i],ymdh[i],techcol[i])
+            group=groups.get(key,None)
+            if group is None:
+                groups[key]=[i]
+            else:
+                group.append(i)
+        return groups
+
+    def _storminfo(self,indexes,tech,logger,raise_all):
+        """!Internal function; do not call directly.  Creates the
+        StormInfo of one group of lines."""
+        return tcutil.storminfo.StormInfo(
+            linetype='carq',inputs=[ self.lines[i] for i in indexes ],
+            carq=tech,logger=logger,raise_all=raise_all)
+
+    def storminfo(self,when,tech='CARQ',logger=None,raise_all=True):
+        """!Creates the StormInfo of one cycle of one technique.  The
+        deck should only have one storm.
+        @param when the cycle, as anything accepted by
+          tcutil.numerics.to_datetime
+        @param tech the technique, usually CARQ, or BEST for a B deck
+        @param logger a logging.Logger for messages
+        @param raise_all passed to the StormInfo constructor
+        @returns the StormInfo, or None if the deck has no such lines"""
+        ymdh=_ymdh(when)
+        indexes=[ i for i in range(len(self.lines))
+                  if self.ymdh[i]==ymdh and self.tech[i]==tech ]
+        if not indexes:
+            return None
+        return self._storminfo(indexes,tech,logger,raise_all)
+
+    def storminfos(self,tech='CARQ',logger=None,raise_all=True):
+        """!Iterates over the StormInfo objects of each storm and cycle
+        of one technique, creating each one only when it is reached.
+        @param tech the technique, usually CARQ, or BEST for a B deck
+        @param logger a logging.Logger for messages
+        @param raise_all if True, raise errors from the StormInfo
+          constructor; otherwise skip the cycles that cannot be parsed"""
+        for indexes in self.groups(tech).values():
+            try:
+                yield self._storminfo(indexes,tech,logger,raise_all)
+            except (tcutil.storminfo.StormInfoError,ValueError) as e:
+                if raise_all: raise
+                if logger is not None:
+                    logger.warning('%s: skipping: %s'
+                                   %(self.lines[indexes[0]],str(e)))
+
+def _split(line):
+    """!Internal function; do not call directly.  Splits a line into
+    nfields fields and the rest of the line, adding empty fields if
+    the line has fewer."""
+    r=line.split(',',nfields)
+    if len(r)<=nfields:
+        r.extend(['']*(nfields+1-len(r)))
+    return r
+
+def read_deck(source,techs=None,start=None,end=None,taus=None,
+              logger=None,raise_all=False):
+    """!Reads an ATCF A deck or B deck into an ATCFDeck.
+
+    The filters are applied to the text of each line, so lines that
+    are not kept are never converted.
+    @param source a filename, or an iterable of lines such as an
+      opened file
+    @param techs optional: an iterable of techniques to keep
+    @param start,end optional: the first and last cycle to keep, as
+      anything accepted by tcutil.numerics.to_datetime
+    @param taus optional: an iterable of forecast hours to keep
+    @param logger a logging.Logger for messages
+    @param raise_all if True, raise InvalidATCF for lines that cannot
+      be parsed; otherwise log them and skip them
+    @returns an ATCFDeck"""
+    if isinstance(source,str):
+        with open(source,'rt') as f:
+            source=f.read().splitlines()
+    # Lines without the technique's name are rejected before anything
+    # else is done with them.
+    (onetech,techfind)=(None,None)
+    if techs is not None:
+        techs=set(techs)
+        if len(techs)==1:
+            onetech=next(iter(techs))
+        else:
+            techfind=re.compile('|'.join([ re.escape(t) for t in techs ])).search
+    taus=None if taus is None else set(int(t) for t in taus)
+    start=None if start is None else '%010d'%(_ymdh(start),)
+    end=None if end is None else '%010d'%(_ymdh(end),)
+    lines=list()
+    rows=list()
+    # The deck is millions of small strings and lists, none of which
+    # can be in a reference cycle.  Suspending the cyclic garbage
+    # collector while they are created halves the time.
+    gc_enabled=gc.isenabled()
+    gc.disable()
+    try:
+        for line in source:
+            if onetech is not None:
+                if onetech not in line: continue
+            elif techfind is not None and techfind(line) is None:
+                continue
+            line=line.rstrip('\r\n')
+            if len(line)<40:  # blank or error line
+                continue
+            r=line.split(',',nfields)
+            if len(r)<8:
+                if raise_all:
+                    raise InvalidATCF('ATCF lines must have at least eight '
+                                      'fields (everything through lat & '
+                                      'lon).',line)
+                if logger is not None:
+                    logger.warning('Ignoring line with fewer than eight '
+                                   'fields: %s'%(line,))
+                continue
+            if techs is not None and r[4].strip() not in techs: continue
+            if start is not None or end is not None:
+                ymdh=r[2].strip()
+                if start is not None and ymdh<start: continue
+                if end is not None and ymdh>end: continue
+            if taus is not None:
+                try:
+                    if int(r[5]) not in taus: continue
+                except ValueError:
+                    continue
+            if len(r)<=nfields:
+                r.extend(['']*(nfields+1-len(r)))
+            lines.append(line)
+            rows.append(r)
+        return ATCFDeck(lines,rows,logger,raise_all)
+    finally:
+        if gc_enabled: gc.enable()
+
+def benchmark(filename,repeat=3):
+    """!Compares the time taken to get the StormInfo of every CARQ
+    cycle of an A deck file with tcutil.storminfo.parse_carq and with
+    an ATCFDeck.  Checks that the cycles found by both have the same
+    information.
+    @param filename the deck file
+    @param repeat how many times to read the file with each method
+    @returns a dict with the seconds per file for "parse_carq",
+      "columns" (read the CARQ columns, without creating StormInfo
+      objects) and "storminfos" (read them and create every
+      StormInfo), and the ratio of the first to the third, which
+      both produce the same StormInfo objects, as "speedup"
+    @raise AssertionError if the results differ"""
+    with open(filename,'rt') as f:
+        text=f.readlines()
+    results=dict()
+    start=time.time()
+    for i in range(repeat):
+        old=tcutil.storminfo.parse_carq(text,raise_all=False)
+    results['parse_carq']=(time.time()-start)/repeat
+    start=time.time()
+    for i in range(repeat):
+        deck=read_deck(text,techs=['CARQ'])
+    results['columns']=(time.time()-start)/repeat
+    start=time.time()
+    for i in range(repeat):
+        new=list(read_deck(text,techs=['CARQ']).storminfos(raise_all=False))
+    results['storminfos']=(time.time()-start)/repeat
+    # The lines of parse_carq still end with a newline.
+    def fields(vit):
+        return dict([ (k,v) for (k,v) in vit.__dict__.items() if k!='lines' ])
+    newbytime=dict([ (vit.YMDH,vit) for vit in new ])
+    for vit in old:
+        other=newbytime.get(vit.YMDH,None)
+        if other is None or fields(other)!=fields(vit):
+            raise AssertionError('%s: %s: different StormInfo from the '
+                                 'columns'%(filename,vit.YMDH))
+    results['speedup']=results['parse_carq']/max(results['storminfos'],1e-9)
+    return results
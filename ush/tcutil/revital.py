@@ -44,7 +44,8 @@ class Revital:
     as requested."""
     def __init__(self,logger=None,invest_number_name=False,stormid=None,
                   adeckdir=None,renumberlog=None,
-                  search_dx=200e3, search_dt=None, debug=True,copy=None):
+                  search_dx=200e3, search_dt=None, debug=True,copy=None,
+                  vitals=None):
         """!Creates a Revital object:
 
         @param logger A logging.Logger object for logging or None to
@@ -65,7 +66,10 @@ class Revital:
         @param copy Used by copy() to make a shallow copy of a
             Revital.  If specified, the other arguments are ignored, and
             the copy's contents are copied.  Do not use this argument.
-            If you need a copy, use copy() instead."""
+            If you need a copy, use copy() instead.
+        @param vitals Used with copy: the list of vitals of the new
+            Revital.  They are used as-is instead of copying those of
+            the other Revital."""
         if copy is not None:
             (  self.search_dx, self.search_dt, self.logger, self.debug ) = \
              ( copy.search_dx, copy.search_dt, copy.logger, copy.debug )
@@ -77,7 +81,10 @@ class Revital:
                 for ymdh,card in cdat.items():
                     self.carqdat[key][ymdh]=card.copy()
             self.carqfail=set(copy.carqfail)
-            self.vitals=[ v.copy() for v in copy.vitals ]
+            if vitals is not None:
+                self.vitals=list(vitals)
+            else:
+                self.vitals=[ v.copy() for v in copy.vitals ]
             return
         self.search_dx=float(search_dx)
         self.search_dt=six_hours if(search_dt is None) else search_dt
@@ -454,6 +461,65 @@ class Revital:
                 logger.info('Clean up the vitals again after renumbering...')
             self.vitals=tcutil.storminfo.clean_up_vitals(self.vitals)
 
+    def storm_views(self,keep_condition,renumber=True,threshold=0):
+        """!Returns the renumbered and unrenumbered vitals of one storm.
+
+        This is equivalent to copying this Revital, calling
+        renumber(unrenumber=True) on the copy, discarding all vitals
+        except those for which keep_condition returns True, and then
+        splitting the result into a renumbered view (swap_numbers) and
+        an unrenumbered view with the renumbered vitals mirrored
+        (mirror_renumbered_vitals), cleaning each.  Renumbering needs
+        the whole season, but only Invests (and vitals already
+        renumbered) are modified by it, so only those are copied; all
+        other vitals are shared with this Revital until they pass
+        keep_condition.  This Revital is not modified.
+
+        @param keep_condition A function that receives a StormInfo
+          object, returning True if it is a vital of the storm.  It
+          must give the same answer for the renumbered and
+          unrenumbered versions of a vital.
+        @param renumber If False, Invests are not renumbered, and both
+          views are the same Revital.
+        @param threshold passed to renumber()
+        @returns a tuple (renumbered,unrenumbered) of new Revital objects"""
+        if not renumber:
+            unrenumbered=Revital(copy=self,vitals=[
+                    v.copy() for v in self.vitals if keep_condition(v) ])
+            unrenumbered.clean_up_vitals()
+            return (unrenumbered,unrenumbered)
+
+        mutable=set()
+        vitals=list()
+        for v in self.vitals:
+            if v.stnum>=90 or 'old_stnum' in v.__dict__:
+                v=v.copy()
+                mutable.add(id(v))
+            vitals.append(v)
+        season=Revital(copy=self,vitals=vitals)
+        season.renumber(unrenumber=False,clean=False,threshold=threshold)
+        # swap_numbers only changes the line of the shared vitals, which
+        # cleaning does not look at, so they are swapped after copying.
+        for v in season.vitals:
+            if id(v) in mutable: v.swap_numbers()
+        season.clean_up_vitals()
+        kept=list()
+        for v in season.vitals:
+            if not keep_condition(v): continue
+            if id(v) not in mutable:
+                v=v.copy()
+                v.swap_numbers()
+            kept.append(v)
+
+        unrenumbered=Revital(copy=self,vitals=kept)
+        unrenumbered.clean_up_vitals()
+        renumbered=unrenumbered.copy()
+        renumbered.swap_numbers()
+        renumbered.clean_up_vitals()
+        unrenumbered.mirror_renumbered_vitals()
+        unrenumbered.clean_up_vitals()
+        return (renumbered,unrenumbered)
+
     def delete_invest_duplicates(self):
         """!Deletes Invest entries that have the same location and time
         as non-invest entries."""
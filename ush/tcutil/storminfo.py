@@ -15,7 +15,7 @@ time.  However, it is inherently slow, and should not be used for
 large-scale manipulation of many vitals times such as multiple years
 of tcvitals or deck files.  For example, model forecast verification
 packages should not use StormInfo.  It is better to use compiled
-programs for such purposes.  This slowness is inherent to Python,
+programs, or the columns of tcutil.atcf.ATCFDeck, for such purposes.  This slowness is inherent to Python,
 which is quite slow at creating and modifying objects."""
 
 ##@var __all__
@@ -30,7 +30,6 @@ __all__=[ 'current_century', 'StormInfoError', 'InvalidBasinError',
 
 import re, datetime, math, fractions, logging, copy
 import tcutil.numerics, tcutil.constants
-import pdb
 from functools import cmp_to_key
 
 def cmp(a, b):
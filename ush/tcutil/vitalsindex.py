@@ -0,0 +1,193 @@
+#! /usr/bin/env python3
+
+"""!Remembers which cycles have vitals, so tcvitals files need not be
+re-read and renumbered every time a workflow is generated.
+
+Expanding a cycle range requires reading the syndat_tcvitals file of
+each year, then cleaning and (usually) renumbering every vital in it
+with tcutil.revital.Revital.  The result only depends on the files and
+on how they were processed, so the VitalsIndex stores it in a JSON
+file: for each set of files and processing mode, the storm IDs and
+cycle of every resulting vital, and the size and modification time of
+each file.  A query is answered from the index if none of the files
+changed.
+
+Renumbering and cleaning look at every vital of the season: a vital
+appended today can renumber Invest cycles from last week.  Hence the
+result for a set of files is recomputed whenever one of them changes.
+That happens at most once per new set of vitals (every six hours
+during a season), and every other workflow generation or rocoto
+re-invocation in between is answered from the index.
+
+@code
+index=tcutil.vitalsindex.VitalsIndex('/path/to/vitals_index.json',logger)
+cycles=index.cycles(['syndat_tcvitals.2023'],'renumber:14',['13L'])
+# cycles['13L'] is a sorted list of YYYYMMDDHH strings
+@endcode
+
+The index is advisory: problems reading or writing it are logged and
+ignored, and at worst the vitals are processed again."""
+
+##@var __all__
+# List of symbols exported by "from tcutil.vitalsindex import *"
+__all__=['VitalsIndex','process_vitals']
+
+import os, re, json, tempfile, logging
+import tcutil.revital, produtil.fileop
+
+##@var index_version
+# Incremented when the index format changes, so older indexes are ignored.
+index_version=1
+
+def process_vitals(revit,mode):
+    """!Cleans or renumbers the vitals in a Revital, as run_hafs.py
+    does, according to a mode string.
+    @param revit the tcutil.revital.Revital
+    @param mode one of these:
+    * "renumber:N" --- renumber Invests, with threshold N (0 for none)
+    * "test:ID" --- keep only storm number ID, for fake and test storms
+    * "clean" --- only clean the vitals"""
+    if mode.startswith('renumber:'):
+        threshold=int(mode[9:])
+        if threshold:
+            revit.renumber(threshold=threshold)
+        else:
+            revit.renumber()
+    elif mode.startswith('test:'):
+        stid=mode[5:].upper()
+        def check_test_vitals(vl):
+            for vital in vl:
+                if vital.stormid3.upper()==stid:
+                    yield vital
+        revit.clean_up_vitals(name_number_checker=check_test_vitals)
+    elif mode=='clean':
+        revit.clean_up_vitals()
+    else:
+        raise ValueError('%s: unknown vitals processing mode'%(mode,))
+
+def _id_kind(stormid):
+    """!Internal function; do not call directly.  Returns the index of
+    the storm ID type in each stored vital, using the same rules as
+    tcutil.revital.Revital.each."""
+    if re.search(r'\A\d\d[a-zA-Z]\Z',stormid): return 0
+    if re.search(r'\A[a-zA-Z]{2}\d\d\Z',stormid): return 1
+    if re.search(r'\A[a-zA-Z]{2}\d{6}\Z',stormid): return 2
+    raise tcutil.revital.RevitalError(
+        'Invalid storm id %s.  It must be one of these three formats: '
+        '04L AL04 AL042013'%(str(stormid),))
+
+class VitalsIndex(object):
+    """!A persistent index of the cycles of each storm in processed
+    tcvitals files.
+
+    The index maps from the processing mode and list of files to the
+    [size,mtime] of each file and the
+    [stormid3,stormid4,longstormid,YYYYMMDDHH] of each processed
+    vital."""
+    def __init__(self,filename,logger=None):
+        """!Reads the index, if it exists.
+        @param filename the index file, or None to keep the index in
+          memory only
+        @param logger a logging.Logger for messages"""
+        self.filename=filename
+        self.logger=logger if logger is not None \
+            else logging.getLogger('tcutil.vitalsindex')
+        self.results=dict()
+        self.changed=False
+        if not filename: return
+        try:
+            with open(filename,'rt') as f:
+                data=json.load(f)
+            if isinstance(data,dict) and data.get('version',None)==index_version:
+                self.results=data.get('results',dict())
+        except FileNotFoundError:
+            pass
+        except (EnvironmentError,ValueError) as e:
+            self.logger.warning('%s: ignoring unreadable vitals index: %s'
+                                %(filename,str(e)))
+
+    ##@var filename
+    # The index file, or None
+
+    def _state(self,path):
+        """!Internal function; do not call directly.  Returns [size,mtime]
+        of a file, or None if it does not exist."""
+        try:
+            st=os.stat(path)
+        except EnvironmentError:
+            return None
+        return [ int(st.st_size), int(st.st_mtime_ns) ]
+
+    def vitals(self,files,mode):
+        """!Returns the processed vitals of a list of files.
+        @param files a list of tcvitals files
+        @param mode the processing mode; see process_vitals
+        @returns a list of [stormid3,stormid4,longstormid,YYYYMMDDHH]
+          of each processed vital, in order"""
+        files=sorted(set([ os.path.abspath(f) for f in files ]))
+        key='%s %s'%(mode,' '.join(files))
+        states=dict([ (f,self._state(f)) for f in files ])
+        entry=self.results.get(key,None)
+        if entry is not None and entry.get('states',None)==states:
+            self.logger.info('Using indexed vitals from %s'%(self.filename,))
+            return entry['vitals']
+        revit=tcutil.revital.Revital(logger=self.logger)
+        self.logger.info('List of files to scan: '+(','.join(files)))
+        revit.readfiles(files,raise_all=False)
+        process_vitals(revit,mode)
+        vitals=[ [ vit.stormid3, vit.stormid4, vit.longstormid,
+                   vit.when.strftime('%Y%m%d%H') ] for vit in revit ]
+        # Only record the result if no file changed while it was read.
+        if states==dict([ (f,self._state(f)) for f in files ]):
+            self.results[key]={ 'states':states, 'vitals':vitals }
+            self.changed=True
+        return vitals
+
+    def cycles(self,files,mode,stormids,start=None,end=None):
+        """!Returns the cycles that have vitals for each of a list of
+        storms.
+        @param files a list of tcvitals files
+        @param mode the processing mode; see process_vitals
+        @param stormids a list of storm IDs (04L, AL04 or AL042013)
+        @param start,end optional: only return cycles within this
+          range, inclusive, as YYYYMMDDHH strings
+        @returns a dict mapping from each storm ID to a sorted list of
+          YYYYMMDDHH cycles"""
+        vitals=self.vitals(files,mode)
+        result=dict()
+        for stormid in stormids:
+            sid=str(stormid).upper()
+            kind=_id_kind(sid)
+            found=set([ v[3] for v in vitals if v[kind]==sid
+                        and ( start is None or v[3]>=start )
+                        and ( end is None or v[3]<=end ) ])
+            result[stormid]=sorted(found)
+        self.save()
+        return result
+
+    def save(self):
+        """!Writes the index atomically, if it changed.  Results for
+        files that no longer exist are dropped."""
+        if not self.filename or not self.changed: return
+        for key in list(self.results.keys()):
+            states=self.results[key].get('states',dict())
+            if any([ not os.path.exists(f) for f in states ]):
+                del self.results[key]
+        try:
+            dirname=os.path.dirname(os.path.abspath(self.filename))
+            produtil.fileop.makedirs(dirname,logger=self.logger)
+            (fd,tmp)=tempfile.mkstemp(
+                prefix=os.path.basename(self.filename)+'.',dir=dirname)
+            try:
+                with os.fdopen(fd,'wt') as f:
+                    json.dump({'version':index_version,
+                               'results':self.results},f)
+                os.chmod(tmp,0o644)
+                os.rename(tmp,self.filename)
+            except:
+                os.unlink(tmp)
+                raise
+            self.changed=False
+        except EnvironmentError as e:
+            self.logger.warning('%s: cannot write vitals index: %s'
+                                %(self.filename,str(e)))
@@ -0,0 +1,6 @@
+"""Puts the ush directory, which holds the produtil, hafs and tcutil
+packages, first in the module search path."""
+
+import os, sys
+
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
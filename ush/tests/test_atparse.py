@@ -0,0 +1,47 @@
+import io
+
+import pytest
+
+from produtil.atparse import ATParser, NoSuchVariable, ParserLineLimit, \
+    compile_file, compile_lines
+
+
+TEMPLATE='''@** if NAME==KATRINA
+katrina
+@** elseif NAME==$OTHER
+other
+@** else
+else
+@** endif
+'''
+
+
+def interpret(varhash):
+    out=io.StringIO()
+    ATParser(out,varhash=dict(varhash)).parse_lines(TEMPLATE,'test')
+    return out.getvalue()
+
+
+def render(varhash):
+    out=io.StringIO()
+    ATParser(out,varhash=dict(varhash)).render(
+        compile_lines(TEMPLATE.splitlines(True)))
+    return out.getvalue()
+
+
+@pytest.mark.parametrize('method',[interpret,render])
+def test_later_elseif_needs_its_variables(method):
+    with pytest.raises(NoSuchVariable):
+        method(dict(NAME='KATRINA'))
+    assert method(dict(NAME='KATRINA',OTHER='X')).split()==['katrina']
+    assert method(dict(NAME='X',OTHER='X')).split()==['other']
+    assert method(dict(NAME='Y',OTHER='X')).split()==['else']
+
+
+def test_compile_cache_honors_max_lines(tmp_path):
+    path=str(tmp_path/'template')
+    with open(path,'wt') as f:
+        f.write('one\ntwo\nthree\n')
+    compile_file(path)
+    with pytest.raises(ParserLineLimit):
+        compile_file(path,max_lines=2)
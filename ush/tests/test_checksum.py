@@ -0,0 +1,56 @@
+import json, multiprocessing, os
+
+import pytest
+
+import produtil.checksum as checksum
+
+
+def write(path,data):
+    with open(path,'wb') as f:
+        f.write(data)
+    return str(path)
+
+
+def index(dirname):
+    with open(os.path.join(str(dirname),checksum.sidecar_name),'rt') as f:
+        return json.load(f)
+
+
+def test_compare_leaves_no_sidecar(tmp_path,monkeypatch):
+    monkeypatch.setattr(checksum,'enabled',False)
+    a=write(tmp_path/'a',b'x'*100)
+    b=write(tmp_path/'b',b'x'*100)
+    assert checksum.same_content(a,b)
+    checksum.digests([a,b])
+    checksum.flush()
+    assert sorted(os.listdir(str(tmp_path)))==['a','b']
+
+
+def test_records_are_batched(tmp_path,monkeypatch):
+    monkeypatch.setattr(checksum,'flush_every',1000)
+    names=[ write(tmp_path/('f%02d'%i),b'%d'%i) for i in range(20) ]
+    for name in names:
+        checksum.record(name)
+    assert not os.path.exists(checksum.sidecar(names[0]))
+    assert checksum.lookup(names[3])==checksum.compute(names[3])
+    checksum.flush()
+    assert sorted(index(tmp_path))==[ os.path.basename(n) for n in names ]
+    assert checksum.check(names[5]) is True
+
+
+def _record_many(names):
+    for name in names:
+        checksum.record(name,flush_now=True)
+
+
+def test_concurrent_jobs_keep_all_records(tmp_path):
+    if 'fork' not in multiprocessing.get_all_start_methods():
+        pytest.skip('needs fork')
+    ctx=multiprocessing.get_context('fork')
+    groups=[ [ write(tmp_path/('p%d_%02d'%(p,i)),b'%d %d'%(p,i))
+               for i in range(15) ] for p in range(4) ]
+    procs=[ ctx.Process(target=_record_many,args=(g,)) for g in groups ]
+    for proc in procs: proc.start()
+    for proc in procs: proc.join()
+    assert all(proc.exitcode==0 for proc in procs)
+    assert len(index(tmp_path))==60
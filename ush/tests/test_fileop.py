@@ -0,0 +1,42 @@
+"""Tests of produtil.fileop."""
+
+import os
+import produtil.fileop
+
+def short_copy(monkeypatch,name):
+    """Makes os.<name> copy at most 10 bytes and then report the end of
+    the file, as a filesystem that stops a kernel copy early would."""
+    real=getattr(os,name)
+    state={'copied':0}
+    def fake(*args):
+        if state['copied']>=10: return 0
+        args=list(args)
+        args[-1]=min(args[-1],10-state['copied'])
+        n=real(*args)
+        state['copied']+=n
+        return n
+    monkeypatch.setattr(os,name,fake)
+
+def test_short_kernel_copy_is_completed(tmp_path,monkeypatch):
+    data=os.urandom(100000)
+    src=tmp_path/'src'
+    src.write_bytes(data)
+    monkeypatch.setattr(produtil.fileop,'copy_methods',
+                        ['copy_file_range','sendfile'])
+    monkeypatch.setattr(produtil.fileop,'_unsupported_copy',set())
+    short_copy(monkeypatch,'copy_file_range')
+    short_copy(monkeypatch,'sendfile')
+    with open(src,'rb') as fin, open(tmp_path/'dst','wb') as fout:
+        method=produtil.fileop.copy_fd(fin.fileno(),fout.fileno())
+    assert method=='read/write'
+    assert (tmp_path/'dst').read_bytes()==data
+
+def test_deliver_file_after_short_copy(tmp_path,monkeypatch):
+    data=os.urandom(50000)
+    src=tmp_path/'src'
+    src.write_bytes(data)
+    monkeypatch.setattr(produtil.fileop,'copy_methods',['copy_file_range'])
+    monkeypatch.setattr(produtil.fileop,'_unsupported_copy',set())
+    short_copy(monkeypatch,'copy_file_range')
+    produtil.fileop.deliver_file(str(src),str(tmp_path/'dst'),keep=True)
+    assert (tmp_path/'dst').read_bytes()==data
@@ -0,0 +1,33 @@
+import os
+
+import pytest
+
+pytest.importorskip('numpy')
+from hafs_format_sonde import SondeIndex
+
+
+def strip(instr):
+    return instr.strip()
+
+
+def sonde(path,text):
+    with open(str(path),'wt') as f:
+        f.write(text)
+    return str(path)
+
+
+def test_index_drops_stale_entries(tmp_path):
+    indexfile=str(tmp_path/'index.json')
+    a=sonde(tmp_path/'a',"XXAA 1\n61616 AF302 OB 01\n;\n")
+    b=sonde(tmp_path/'b',"XXAA 2\n61616 AF303 OB 02\n;\n")
+    index=SondeIndex(indexfile,['XXAA'],strip)
+    index.entry(a)
+    index.entry(b)
+    index.prune([a])
+    index.save()
+    index=SondeIndex(indexfile,['XXAA'],strip)
+    assert list(index.files)==[os.path.abspath(a)]
+    os.unlink(a)
+    index.prune([a])
+    index.save()
+    assert SondeIndex(indexfile,['XXAA'],strip).files=={}
@@ -0,0 +1,34 @@
+import logging, os, time
+
+from hafs.gridcache import GridCache
+from produtil.locking import LockFile
+
+
+def entry(directory,name,age):
+    path=os.path.join(directory,name)
+    with open(path,'wb') as f:
+        f.write(b'x')
+    then=time.time()-age
+    os.utime(path,(then,then))
+    return path
+
+
+def test_prune_removes_only_old_entries(tmp_path):
+    directory=str(tmp_path)
+    old=entry(directory,'grid.old.npz',1000)
+    new=entry(directory,'grid.new.npz',10)
+    partial=entry(directory,'.grid.abc.npz',1000)
+    cache=GridCache(directory,logger=logging.getLogger('test'))
+    assert cache.prune(100)==2
+    assert not os.path.exists(old)
+    assert not os.path.exists(partial)
+    assert os.path.exists(new)
+
+
+def test_prune_skips_locked_entries(tmp_path):
+    directory=str(tmp_path)
+    old=entry(directory,'grid.busy.npz',1000)
+    cache=GridCache(directory,logger=logging.getLogger('test'))
+    with LockFile(os.path.join(directory,'grid.busy.lock'),max_tries=1):
+        assert cache.prune(100)==0
+    assert os.path.exists(old)
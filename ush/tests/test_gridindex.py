@@ -0,0 +1,49 @@
+import os
+
+import pytest
+
+import hafs.gridindex as gridindex
+
+
+def test_source_key_tracks_file_version(tmp_path):
+    path=str(tmp_path/'grid.nc')
+    with open(path,'wb') as f:
+        f.write(b'one')
+    key=gridindex.source_key((path,'lon','lat'))
+    assert key==gridindex.source_key((path,'lon','lat'))
+    assert key!=gridindex.source_key((path,'x','y'))
+    with open(path,'ab') as f:
+        f.write(b'two')
+    assert key!=gridindex.source_key((path,'lon','lat'))
+    assert gridindex.source_key(str(tmp_path/'missing')) is None
+
+
+def test_cached_hashes_each_source_once(tmp_path,monkeypatch):
+    np=pytest.importorskip('numpy')
+    path=str(tmp_path/'grid.nc')
+    with open(path,'wb') as f:
+        f.write(b'grid')
+    (lon,lat)=np.meshgrid(np.arange(0,10.0),np.arange(20,30.0))
+    calls=list()
+    real=gridindex.checksum
+    monkeypatch.setattr(gridindex,'checksum',
+                        lambda *a: calls.append(1) or real(*a))
+    first=gridindex.cached(lat,lon,source=path)
+    for i in range(5):
+        assert gridindex.cached(lat,lon,source=path) is first
+    assert len(calls)==1
+    gridindex.cached(lat,lon)
+    assert len(calls)==2
+
+
+def test_saved_index_is_not_pickled(tmp_path):
+    np=pytest.importorskip('numpy')
+    (lon,lat)=np.meshgrid(np.arange(0,10.0),np.arange(20,30.0))
+    path=str(tmp_path/'index.npz')
+    index=gridindex.GridIndex(lat,lon)
+    index.save(path)
+    with np.load(path,allow_pickle=False) as data:
+        assert sorted(data.keys())==['shape','xyz']
+    loaded=gridindex.GridIndex.load(path)
+    assert loaded.shape==(10,10)
+    assert loaded.nearest(25.2,3.9)==index.nearest(25.2,3.9)
@@ -0,0 +1,54 @@
+import json, os
+
+import pytest
+
+import produtil.jobcache as jobcache
+
+
+@pytest.fixture
+def cachedir(tmp_path,monkeypatch):
+    monkeypatch.setenv('SLURM_JOB_ID','1234')
+    monkeypatch.setenv('PRODUTIL_JOBCACHE_DIR',str(tmp_path))
+    monkeypatch.delenv('PRODUTIL_JOBCACHE',raising=False)
+    monkeypatch.setattr(jobcache,'_data',None)
+    return tmp_path
+
+
+def test_cache_is_in_private_directory(cachedir):
+    jobcache.put('answer',42)
+    filename=jobcache.cache_file()
+    assert os.path.dirname(filename)==str(cachedir/(
+        'produtil-jobcache.%d'%os.getuid()))
+    assert os.stat(os.path.dirname(filename)).st_mode&0o777==0o700
+    jobcache._data=None
+    assert jobcache.get('answer')==42
+
+
+def test_writable_cache_file_is_ignored(cachedir):
+    filename=jobcache.cache_file()
+    with open(filename,'wt') as f:
+        json.dump({'find_exe:srun':'/evil/srun'},f)
+    os.chmod(filename,0o666)
+    assert jobcache.get('find_exe:srun') is None
+
+
+def test_shared_directory_disables_cache(cachedir):
+    os.mkdir(str(cachedir/('produtil-jobcache.%d'%os.getuid())),0o777)
+    os.chmod(str(cachedir/('produtil-jobcache.%d'%os.getuid())),0o777)
+    assert jobcache.cache_file() is None
+    jobcache.put('answer',42)
+    assert jobcache.get('answer') is None
+
+
+def test_find_exe_caches_absolute_paths(cachedir,tmp_path,monkeypatch):
+    from produtil.mpi_impl.mpi_impl_base import find_exe
+    bindir=tmp_path/'bin'
+    bindir.mkdir()
+    exe=bindir/'mytool'
+    exe.write_text('#!/bin/sh\n')
+    os.chmod(str(exe),0o755)
+    monkeypatch.chdir(str(tmp_path))
+    monkeypatch.setenv('PATH','bin')
+    monkeypatch.setattr(jobcache,'_data',None)
+    assert find_exe('mytool')==str(exe)
+    assert jobcache.get('find_exe:mytool')==str(exe)
@@ -0,0 +1,97 @@
+import errno, os, threading, time
+
+import pytest
+
+import produtil.locking as locking
+from produtil.locking import LockFile, LockHeld
+
+
+def test_second_lock_in_process_is_held(tmp_path):
+    path=str(tmp_path/'x.lock')
+    with LockFile(path):
+        with pytest.raises(LockHeld):
+            LockFile(path,max_tries=2,sleep_time=0.01).acquire()
+    with LockFile(path,max_tries=1):
+        pass
+
+
+def test_eacces_is_contention(tmp_path,monkeypatch):
+    def held(fd,blocking):
+        raise OSError(errno.EACCES,'Permission denied')
+    monkeypatch.setattr(locking,'_lock_fd',held)
+    lock=LockFile(str(tmp_path/'x.lock'),max_tries=3,sleep_time=0.01)
+    with pytest.raises(LockHeld):
+        lock.acquire()
+    assert lock.stats.contended==1
+    assert lock.stats.attempts==3
+
+
+def test_transient_errors_are_retried(tmp_path,monkeypatch):
+    real=locking._lock_fd
+    calls=[]
+    def flaky(fd,blocking):
+        calls.append(blocking)
+        if len(calls)<3:
+            raise OSError(errno.ENOLCK,'No locks available')
+        return real(fd,blocking)
+    monkeypatch.setattr(locking,'_lock_fd',flaky)
+    lock=LockFile(str(tmp_path/'x.lock'),max_tries=5,sleep_time=0.01)
+    with lock:
+        assert len(calls)==3
+    assert lock.stats.acquired==1
+    assert lock.stats.contended==0
+
+
+@pytest.mark.skipif(not hasattr(locking.fcntl,'F_OFD_SETLK'),
+                    reason='needs open file description locks')
+def test_abandoned_waiter_keeps_other_locks(tmp_path):
+    path=str(tmp_path/'x.lock')
+    first=LockFile(path)
+    first.acquire()
+    waiter=LockFile(path,blocking=True,timeout=0.1,sleep_time=0.01)
+    with pytest.raises(LockHeld):
+        waiter.acquire()
+    first.release()
+    # The abandoned helper thread now gets the lock, releases it and
+    # closes its file.  That must not release a lock held elsewhere.
+    time.sleep(0.1)
+    second=LockFile(path,max_tries=20,sleep_time=0.01)
+    second.acquire()
+    try:
+        time.sleep(0.1)
+        with pytest.raises(LockHeld):
+            LockFile(path,max_tries=1).acquire()
+    finally:
+        second.release()
+
+
+def test_blocking_lock_wakes_when_freed(tmp_path):
+    path=str(tmp_path/'x.lock')
+    first=LockFile(path)
+    first.acquire()
+    timer=threading.Timer(0.2,first.release)
+    timer.start()
+    lock=LockFile(path,blocking=True,timeout=10)
+    with lock:
+        pass
+    timer.join()
+    assert lock.stats.contended==1
+
+
+def test_blocking_lock_counts_every_attempt(tmp_path,monkeypatch):
+    real=locking._lock_fd
+    calls=[]
+    def flaky(fd,blocking):
+        calls.append(blocking)
+        if len(calls)==1:
+            raise OSError(errno.EAGAIN,'Resource temporarily unavailable')
+        if len(calls)<4:
+            raise OSError(errno.ENOLCK,'No locks available')
+        return real(fd,blocking)
+    monkeypatch.setattr(locking,'_lock_fd',flaky)
+    lock=LockFile(str(tmp_path/'x.lock'),blocking=True,timeout=10,
+                  sleep_time=0.01)
+    with lock:
+        pass
+    assert calls==[False,True,True,True]
+    assert lock.stats.attempts==4
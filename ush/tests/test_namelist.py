@@ -0,0 +1,26 @@
+"""Tests of hafs.namelist."""
+
+import hafs.namelist
+from hafs.namelist import Conf2Namelist
+
+def test_copy_into_shared_copy_leaves_source_unchanged():
+    source=Conf2Namelist(None,None)
+    source.nl_set('sec','a',1)
+    copy=source.copy()
+    extra=Conf2Namelist(None,None)
+    extra.nl_set('sec','b',2)
+    extra.copy(other=copy)
+    assert copy.nl_get('sec','b')==2
+    assert 'b' not in source.nl['sec']
+    assert source.nl_get('sec','a')==1
+
+def test_set_in_copy_leaves_source_unchanged():
+    source=Conf2Namelist(None,None)
+    source.nl_set('sec','a',1)
+    copy=source.copy()
+    copy.nl_set('sec','a',5)
+    copy.nl_set('sec','c',3)
+    assert source.nl_get('sec','a')==1
+    assert 'c' not in source.nl['sec']
+    copy.nl_del('sec','a')
+    assert source.nl_get('sec','a')==1
@@ -0,0 +1,65 @@
+"""Tests of produtil.testing.nccmp."""
+
+import itertools
+import pytest
+import produtil.testing.nccmp as nccmp
+
+def covered(shape,chunk_bytes,itemsize=4):
+    """Returns the number of times each index is in a slab, and the
+    largest slab in bytes."""
+    counts=dict()
+    largest=0
+    for slab in nccmp.slabs(shape,itemsize,chunk_bytes):
+        assert len(slab)==len(shape)
+        ranges=[ range(s.start,s.stop) for s in slab ]
+        size=1
+        for r in ranges: size*=len(r)
+        largest=max(largest,size*itemsize)
+        for index in itertools.product(*ranges):
+            counts[index]=counts.get(index,0)+1
+    return (counts,largest)
+
+@pytest.mark.parametrize('shape,chunk_bytes',[
+    ((1,8,10,12),4*10*12),     # one level at a time
+    ((1,8,10,12),4*12*3),      # three rows at a time
+    ((1,8,10,12),4*5),         # less than one row
+    ((1,8,10,12),4*1000000),   # everything at once
+    ((3,),4),
+    ((2,3,0,4),16),
+])
+def test_slabs_cover_array_within_budget(shape,chunk_bytes):
+    (counts,largest)=covered(shape,chunk_bytes)
+    total=1
+    for n in shape: total*=n
+    assert len(counts)==total
+    assert all([ c==1 for c in counts.values() ])
+    assert largest<=chunk_bytes
+
+def test_leading_dimension_of_one_is_split():
+    shape=(1,64,100,200)
+    slabs=list(nccmp.slabs(shape,4,4*100*200*2))
+    assert len(slabs)==32
+    assert slabs[0]==(slice(0,1),slice(0,2),slice(0,100),slice(0,200))
+
+def test_compare_variable_reads_bounded_slabs():
+    np=pytest.importorskip('numpy')
+    data=np.arange(1*6*5*4,dtype=np.float32).reshape(1,6,5,4)
+    other=data.copy()
+    other[0,5,4,3]+=1
+    reads=list()
+    class Variable(object):
+        def __init__(self,array):
+            self.array=array
+            self.shape=array.shape
+            self.dtype=array.dtype
+        def __getitem__(self,key):
+            reads.append(self.array[key].nbytes)
+            return self.array[key]
+    class Dataset(object):
+        def __init__(self,array):
+            self.variables={'v':Variable(array)}
+    diff=nccmp.compare_variable(Dataset(data),Dataset(other),'v',
+                                chunk_bytes=4*4*2)
+    assert not diff.passed
+    assert diff.count==1
+    assert max(reads)<=4*4*2
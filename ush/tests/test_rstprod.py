@@ -0,0 +1,37 @@
+import os, stat
+
+import pytest
+
+import produtil.cluster
+import produtil.rstprod
+from produtil.rstprod import RestrictionClass, RstRestrictFailed
+
+
+@pytest.fixture
+def restricter(monkeypatch):
+    monkeypatch.setattr(produtil.cluster,'no_access_control',lambda: False)
+    monkeypatch.setattr(produtil.cluster,'use_acl_for_rstdata',lambda: False)
+    return RestrictionClass(os.getgid())
+
+
+def mode(path):
+    return stat.S_IMODE(os.lstat(path).st_mode)
+
+
+def test_restrict_files_does_not_follow_links(tmp_path,restricter):
+    target=tmp_path/'target'
+    target.write_text('secret')
+    os.chmod(str(target),0o644)
+    data=tmp_path/'data'
+    data.write_text('data')
+    os.chmod(str(data),0o644)
+    os.mkdir(str(tmp_path/'dir'),0o755)
+    os.symlink(str(target),str(tmp_path/'link'))
+    with pytest.raises(RstRestrictFailed) as info:
+        restricter.restrict_files([str(data),str(tmp_path/'dir'),
+                                   str(tmp_path/'link')])
+    assert [ f for (f,m) in info.value.failures ]==[str(tmp_path/'link')]
+    assert mode(str(data))==0o640
+    assert mode(str(tmp_path/'dir'))==0o2750
+    assert mode(str(target))==0o644
+
@@ -0,0 +1,81 @@
+import logging, os, time
+
+from hafs_scrub import Deleter
+
+
+def tree(path,nfiles=3):
+    os.makedirs(os.path.join(path,'sub'))
+    for i in range(nfiles):
+        with open(os.path.join(path,'sub','f%d'%i),'wt') as f:
+            f.write('x')
+    return path
+
+
+def test_run_only_empties_its_own_trash(tmp_path):
+    trash=str(tmp_path/'trash')
+    os.makedirs(trash)
+    other=tree(os.path.join(trash,'run.otherhost.1.abc'))
+    target=tree(str(tmp_path/'work'/'storm'))
+    deleter=Deleter(logging.getLogger('test'),threads=2,trash=trash)
+    deleter.add(target)
+    deleter.go()
+    assert not os.path.exists(target)
+    assert os.listdir(trash)==['run.otherhost.1.abc']
+    assert os.path.exists(os.path.join(other,'sub','f2'))
+    assert deleter.files==3
+
+
+def test_stale_trash_is_removed(tmp_path):
+    trash=str(tmp_path/'trash')
+    os.makedirs(trash)
+    stale=tree(os.path.join(trash,'run.deadhost.1.abc'))
+    fresh=tree(os.path.join(trash,'run.livehost.2.def'))
+    other=tree(os.path.join(trash,'someone_elses'))
+    then=time.time()-7200
+    os.utime(stale,(then,then))
+    os.utime(other,(then,then))
+    target=tree(str(tmp_path/'work'/'storm'))
+    deleter=Deleter(logging.getLogger('test'),trash=trash,trash_age=3600)
+    deleter.add(target)
+    deleter.go()
+    assert sorted(os.listdir(trash))==['run.livehost.2.def','someone_elses']
+
+
+def test_links_are_not_followed(tmp_path):
+    outside=tree(str(tmp_path/'outside'))
+    target=tree(str(tmp_path/'work'/'storm'))
+    os.symlink(outside,os.path.join(target,'sub','link'))
+    os.symlink(outside,os.path.join(target,'toplink'))
+    deleter=Deleter(logging.getLogger('test'))
+    deleter.add(target)
+    deleter.go()
+    assert not os.path.lexists(target)
+    assert len(os.listdir(os.path.join(outside,'sub')))==3
+
+
+def test_deep_tree_with_few_open_directories(tmp_path):
+    target=str(tmp_path/'work'/'storm')
+    path=target
+    for i in range(30):
+        path=os.path.join(path,'d%d'%i)
+        tree(os.path.join(path,'side'),nfiles=1)
+    deleter=Deleter(logging.getLogger('test'),threads=4)
+    deleter.max_open_dirs=2
+    deleter.add(target)
+    deleter.go()
+    assert not os.path.lexists(target)
+    assert deleter.files==30
+    assert deleter.dirs==91
+
+
+def test_detached_child_empties_trash(tmp_path):
+    trash=str(tmp_path/'trash')
+    target=tree(str(tmp_path/'work'/'storm'))
+    deleter=Deleter(logging.getLogger('test'),trash=trash)
+    deleter.add(target)
+    deleter.go(detach=True)
+    assert not os.path.lexists(target)
+    for i in range(100):
+        if not os.listdir(trash): break
+        time.sleep(0.05)
+    assert os.listdir(trash)==[]
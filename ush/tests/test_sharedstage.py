@@ -0,0 +1,70 @@
+import os, time
+
+import pytest
+
+import produtil.locking
+from produtil.sharedstage import SharedStage, prune
+
+
+def writer(text,seen=None):
+    def produce(path):
+        if seen is not None:
+            seen.append(open(seen[0]).read())
+        os.mkdir(os.path.join(path,'sub'))
+        for name in ('a','sub/b'):
+            with open(os.path.join(path,name),'wt') as f:
+                f.write(text+name)
+    return produce
+
+
+def test_redo_keeps_links_working(tmp_path):
+    root=str(tmp_path/'root')
+    stage=SharedStage(root,'rtofs.20230912.t06z')
+    stage.stage(writer('one'))
+    links=stage.link_into(str(tmp_path/'storm1'))
+    assert open(links[0]).read()=='onea'
+    with open(os.path.join(stage.path,'a'),'at') as f:
+        f.write('corrupt')
+    assert not stage.complete()
+    # While the stage is redone, the old files stay readable.
+    seen=[links[0]]
+    stage.stage(writer('two',seen))
+    assert seen[1]=='oneacorrupt'
+    assert stage.complete()
+    assert [ open(l).read() for l in links ]==['twoa','twosub/b']
+    assert sorted(os.listdir(root))==['.rtofs.20230912.t06z.lock',
+                                      'rtofs.20230912.t06z',
+                                      'rtofs.20230912.t06z.manifest']
+
+
+def test_failed_produce_leaves_no_trace(tmp_path):
+    root=str(tmp_path/'root')
+    stage=SharedStage(root,'key')
+    stage.stage(writer('one'))
+    def fail(path):
+        writer('two')(path)
+        raise RuntimeError('extraction failed')
+    os.unlink(stage.manifest)
+    with pytest.raises(RuntimeError):
+        stage.stage(fail)
+    assert sorted(os.listdir(root))==['.key.lock','key']
+    assert open(os.path.join(stage.path,'a')).read()=='onea'
+
+
+def test_prune_removes_only_old_unlocked_stages(tmp_path):
+    root=str(tmp_path/'root')
+    stages=[ SharedStage(root,key) for key in ('old','new','busy') ]
+    for stage in stages:
+        stage.stage(writer(stage.key))
+    os.mkdir(os.path.join(root,'.gone.new.xyz'))
+    then=time.time()-7200
+    for path in (stages[0].manifest,stages[2].manifest,
+                 os.path.join(root,'.gone.new.xyz')):
+        os.utime(path,(then,then))
+    with produtil.locking.LockFile(os.path.join(root,'.busy.lock')):
+        assert prune(root,3600)==2
+    assert not os.path.exists(stages[0].path)
+    assert not os.path.exists(stages[0].manifest)
+    assert stages[1].complete()
+    assert stages[2].complete()
+    assert not os.path.exists(os.path.join(root,'.gone.new.xyz'))
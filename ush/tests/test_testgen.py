@@ -0,0 +1,15 @@
+import produtil.testing.testgen as testgen
+from produtil.testing.local import LocalRunner
+
+
+def test_local_runner_is_selectable(monkeypatch):
+    seen=dict()
+    def make_runner(self,parser,output_file,dry_run=False,setarith=None):
+        seen.update(cpus=self.cpus,output_file=output_file,dry_run=dry_run)
+        return False
+    monkeypatch.setattr(testgen.TestGen,'parse',lambda self: None)
+    monkeypatch.setattr(LocalRunner,'make_runner',make_runner)
+    status=testgen.main(['--runner','local','--cpus','3','--dry-run',
+                         'suite.rt','timing.json'])
+    assert seen==dict(cpus=3,output_file='timing.json',dry_run=True)
+    assert status==1